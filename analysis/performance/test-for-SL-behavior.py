@@ -39,10 +39,17 @@ def registryToSLTestLanguage(registry):
 ##########
 
 class MyTask(libLF.parallel.ParallelTask):
-  def __init__(self, regex, slTimeout, powerPumps):
+  def __init__(self, regex, slTimeout, powerPumps, useTesterDaemons, cache, detectorBudget, firstVulnWins, measureGrowth, validatorSemaphore, detectorParallelism):
     self.regex = regex
     self.slTimeout = slTimeout
     self.powerPumps = powerPumps
+    self.useTesterDaemons = useTesterDaemons
+    self.cache = cache
+    self.detectorBudget = detectorBudget
+    self.firstVulnWins = firstVulnWins
+    self.measureGrowth = measureGrowth
+    self.validatorSemaphore = validatorSemaphore
+    self.detectorParallelism = detectorParallelism
     self.slra = None
   
   def run(self):
@@ -67,7 +74,10 @@ class MyTask(libLF.parallel.ParallelTask):
     """
     try:
       libLF.log('Testing regex: <{}>'.format(regex.pattern))
-      slra = libLF.SLRegexAnalysis(regex, self.slTimeout, self.powerPumps)
+      testerPool = libLF.regexTesterPool() if self.useTesterDaemons else None
+      slra = libLF.SLRegexAnalysis(regex, self.slTimeout, self.powerPumps, testerPool=testerPool, cache=self.cache,
+        detectorBudget=self.detectorBudget, firstVulnWins=self.firstVulnWins, measureGrowth=self.measureGrowth,
+        detectorParallelism=self.detectorParallelism)
 
       ## Query detectors
       slra.queryDetectors()
@@ -75,9 +85,8 @@ class MyTask(libLF.parallel.ParallelTask):
       ## Check its behavior in all available languages
       # (Not just the ones it appears in)
       # We can identify the "real" vs. "what-if" by looking at the slra.regex object.
-      for lang in allSLTestLanguages():
-        libLF.log('Validating detector opinions in {}'.format(lang))
-        slra.validateDetectorOpinionsInLang(lang)
+      libLF.log('Validating detector opinions in {}'.format(allSLTestLanguages()))
+      slra.validateDetectorOpinionsInLangs(allSLTestLanguages(), self.validatorSemaphore)
       return slra
     except BaseException as err:
       libLF.log('Exception while analyzing: err <{}> libLF.Regex {}'.format(err, regex.toNDJSON()))
@@ -85,9 +94,9 @@ class MyTask(libLF.parallel.ParallelTask):
 
 ################
 
-def getTasks(regexFile, slTimeout, powerPumps):
+def getTasks(regexFile, slTimeout, powerPumps, useTesterDaemons, cache, detectorBudget, firstVulnWins, measureGrowth, validatorSemaphore, detectorParallelism):
   regexes = loadRegexFile(regexFile)
-  tasks = [MyTask(regex, slTimeout, powerPumps) for regex in regexes]
+  tasks = [MyTask(regex, slTimeout, powerPumps, useTesterDaemons, cache, detectorBudget, firstVulnWins, measureGrowth, validatorSemaphore, detectorParallelism) for regex in regexes]
   libLF.log('Prepared {} tasks'.format(len(tasks)))
   return tasks
 
@@ -118,75 +127,93 @@ def loadRegexFile(regexFile):
 
 ################
 
-def main(regexFile, outFile, slTimeout, powerPumps, parallelism):
-  libLF.log('regexFile {} outFile {} slTimeout {} powerPumps {} parallelism {}' \
-    .format(regexFile, outFile, slTimeout, powerPumps, parallelism))
+def main(regexFile, outFile, slTimeout, powerPumps, parallelism, useTesterDaemons, resume, shard, resultCache, detectorBudget, firstVulnWins, measureGrowth, maxValidators, pythonInProcess, detectorParallelism):
+  libLF.log('regexFile {} outFile {} slTimeout {} powerPumps {} parallelism {} useTesterDaemons {} resume {} shard {} resultCache {} detectorBudget {} firstVulnWins {} measureGrowth {} maxValidators {} pythonInProcess {} detectorParallelism {}' \
+    .format(regexFile, outFile, slTimeout, powerPumps, parallelism, useTesterDaemons, resume, shard, resultCache, detectorBudget, firstVulnWins, measureGrowth, maxValidators, pythonInProcess, detectorParallelism))
+
+  if pythonInProcess:
+    libLF.setInProcessTesterLangs(['python'])
+
+  cache = None
+  if resultCache is not None:
+    cache = libLF.ResultCache(resultCache)
+    # Workers only put, so keep the cache within its size here
+    cache.evict()
+    cacheStatsBefore = cache.stats()
+
+  # Each worker validates in all languages at once. Cap the total.
+  validatorSemaphore = libLF.parallel.NodeSemaphore('SL-validators', maxValidators)
+
   #### Load data
-  tasks = getTasks(regexFile, slTimeout, powerPumps)
+  tasks = getTasks(regexFile, slTimeout, powerPumps, useTesterDaemons, cache, detectorBudget, firstVulnWins, measureGrowth, validatorSemaphore, detectorParallelism)
+  tasks = [t for t in tasks if libLF.isInShard(t.regex.pattern, shard)]
+
+  # Skip the regexes we finished last time
+  journal = libLF.ResumeJournal(outFile, resume)
+  tasks = [t for t in tasks if not journal.isDone(t.regex.pattern)]
+  libLF.log('{} tasks to do ({} already done)'.format(len(tasks), journal.nDone()))
   nRegexes = len(tasks)
 
   #### Process data
 
   # CPU-bound, no limits
-  libLF.log('Submitting to map')
-  results = libLF.parallel.map(tasks, parallelism,
+  # Emit each result as it completes, so partial output survives a crash
+  # and we need not hold every result in memory.
+  libLF.log('Submitting to imap_unordered')
+  results = libLF.parallel.imap_unordered(tasks, parallelism,
     libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
     jitter=False)
 
   
-  #### Emit results
+  #### Emit results, and analyze the successful SLRegexAnalysis's as they arrive
 
   libLF.log('Writing results to {}'.format(outFile))
   nSuccesses = 0
   nExceptions = 0
-  with open(outFile, 'w') as outStream:
+  nTimedOut = 0
+  nDiffBehav = 0
+  nDiffBehav_real = 0
+  with journal:
     for slra in results:
         # Emit
         if type(slra) is libLF.SLRegexAnalysis:
           nSuccesses += 1
-          outStream.write(slra.toNDJSON() + '\n')
+          journal.write(slra.regex.pattern, slra.toNDJSON())
+
+          # How many regexes exhibited SL behavior in any language?
+          # TODO Must confirm whether this is testing full-match or partial-match semantics consistently,
+          # or favor the most conservative behavior possible, or try both.
+          if slra.everTimedOut():
+            nTimedOut += 1
+
+          # Did we find any differences in SL regex behavior across languages?
+          # The answer to this is presumably always "yes" since we are including linear-time engines.
+          behaviors = set()
+          for lang in allSLTestLanguages():
+            behaviors.add(slra.predictedPerformanceInLang(lang))
+          if len(behaviors) > 1:
+            nDiffBehav += 1
+
+          # Did we find any differences in SL regex behavior across languages *for those they appeared in*?
+          # This may be a more interesting metric.
+          behaviors = set()
+          for registry in slra.regex.registriesUsedIn():
+            lang = registryToSLTestLanguage(registry)
+            behaviors.add(slra.predictedPerformanceInLang(lang))
+          if len(behaviors) > 1:
+            nDiffBehav_real += 1
         else:
           nExceptions += 1
   libLF.log('Successfully performed SLRegexAnalysis on {} regexes, {} exceptions'.format(nSuccesses, nExceptions))
+  if cache is not None:
+    cache.logStats(cacheStatsBefore)
+    cache.evict()
+
+  #### Summarize the successful SLRegexAnalysis's
 
-  #### Analyze the successful SLRegexAnalysis's
-
-  slras = [
-    res
-    for res in results
-    if type(res) is libLF.SLRegexAnalysis
-  ]
-
-  # How many regexes exhibited SL behavior in any language?
-  # TODO Must confirm whether this is testing full-match or partial-match semantics consistently,
-  # or favor the most conservative behavior possible, or try both.
-  slras_timedOut = list(
-    filter(lambda slra: slra.everTimedOut(), slras)
-  )
-  libLF.log('{} of {} successful analyses timed out in some language'.format(len(slras_timedOut), len(slras)))
-
-  # Did we find any differences in SL regex behavior across languages?
-  # The answer to this is presumably always "yes" since we are including linear-time engines.
-  slras_diffBehav = []
-  for slra in slras:
-    behaviors = set()
-    for lang in allSLTestLanguages():
-      behaviors.add(slra.predictedPerformanceInLang(lang))
-    if len(behaviors) > 1:
-      slras_diffBehav.append(slra)
-  libLF.log('{} of the regexes had different performance in different languages'.format(len(slras_diffBehav)))
-
-  # Did we find any differences in SL regex behavior across languages *for those they appeared in*?
-  # This may be a more interesting metric.
-  slras_diffBehav_real = []
-  for slra in slras:
-    behaviors = set()
-    for registry in slra.regex.registriesUsedIn():
-      lang = registryToSLTestLanguage(registry)
-      behaviors.add(slra.predictedPerformanceInLang(lang))
-    if len(behaviors) > 1:
-      slras_diffBehav_real.append(slra)
-  libLF.log('{} of the regexes had different performance in the languages they actually appeared in'.format(len(slras_diffBehav_real)))
+  libLF.log('{} of {} successful analyses timed out in some language'.format(nTimedOut, nSuccesses))
+  libLF.log('{} of the regexes had different performance in different languages'.format(nDiffBehav))
+  libLF.log('{} of the regexes had different performance in the languages they actually appeared in'.format(nDiffBehav_real))
 
 #####################################################
 
@@ -202,7 +229,28 @@ parser.add_argument('--power-pumps', type=int, help='Number of pumps to trigger
   dest='powerPumps')
 parser.add_argument('--parallelism', type=int, help='Maximum cores to use', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
   dest='parallelism')
+parser.add_argument('--use-tester-daemons', help='Validate evil inputs through a warm tester daemon (libLF.RegexTesterPool) instead of a validate-vuln.pl process per query', required=False, action='store_true', default=False,
+  dest='useTesterDaemons')
+parser.add_argument('--resume', help='Resume an interrupted run: keep the results already journaled in OUT_FILE.journal and skip those regexes', required=False, action='store_true', default=False,
+  dest='resume')
+parser.add_argument('--shard', type=libLF.parseShard, help='i/N: only process the regexes in shard i (0-based) of N. Use a different --out-file per shard', required=False, default=None,
+  dest='shard')
+parser.add_argument('--result-cache', type=str, help='Cache results in this SQLite file (libLF.ResultCache), and reuse those from earlier runs (default: no cache)', required=False, default=None,
+  dest='resultCache')
+parser.add_argument('--detector-budget', type=int, help='Wall-clock seconds for all of the detectors on a regex. See --detector-parallelism (default: 60 seconds per detector)', required=False, default=None,
+  dest='detectorBudget')
+parser.add_argument('--first-vuln-wins', help='Stop querying detectors about a regex once one of them gives a usable evil input', required=False, action='store_true', default=False,
+  dest='firstVulnWins')
+parser.add_argument('--detector-parallelism', type=int, help='Number of detectors to run at once on a regex, in each worker. Each may use 2 GB of memory (default: 1)', required=False, default=None,
+  dest='detectorParallelism')
+parser.add_argument('--measure-growth', help='Time each evil input at a geometric series of pumps and classify the growth curve, instead of waiting for timeouts at fixed pumps. Implies a warm tester daemon per language', required=False, action='store_true', default=False,
+  dest='measureGrowth')
+parser.add_argument('--max-validators', type=int, help='Maximum evil-input validations to run at once on this node, across all workers and languages', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
+  dest='maxValidators')
+parser.add_argument('--python-in-process', help='Validate evil inputs in Python with the Python tester loaded in each worker, matching in a forked child, rather than with validate-vuln.pl or a python3 tester daemon. Python is then validated before the other languages, not alongside them (default: off)', required=False, action='store_true', default=False,
+  dest='pythonInProcess')
 args = parser.parse_args()
 
 # Here we go!
-main(args.regexFile, args.outFile, args.slTimeout, args.powerPumps, args.parallelism)
+main(args.regexFile, args.outFile, args.slTimeout, args.powerPumps, args.parallelism, args.useTesterDaemons, args.resume, args.shard, args.resultCache,
+  args.detectorBudget, args.firstVulnWins, args.measureGrowth, args.maxValidators, args.pythonInProcess, args.detectorParallelism)
@@ -10,7 +10,8 @@ use warnings;
 
 use JSON::PP; # I/O
 use Carp;
-use Time::HiRes qw( gettimeofday tv_interval );
+use Time::HiRes qw( gettimeofday tv_interval sleep );
+use POSIX qw( WNOHANG );
 
 my $DEBUG = 0;
 if ($ENV{REGEX_DEBUG}) {
@@ -70,64 +71,44 @@ my $ulimitMemory = (defined $query->{memoryLimit}) ? "ulimit -m $memoryLimitInBy
 
 my @patternsToTry = &expandPatternSpaceForDetectors($query->{pattern}, \@PATTERN_VARIANTS);
 
-# This will contain N_DETECTORS * scalar(@patternsToTry) opinions.
-my @detectorOpinions;
-# Try each pattern.
+# Each (pattern variant, detector) pair is independent, so we run them concurrently.
+#   budget: wall-clock seconds for the whole matrix. Detectors still running then are killed (TIMEOUT).
+#   firstVulnWins: once any detector reports a vulnerability with a parseable evil input,
+#                  kill the others (CANCELLED). Their opinions would only matter if they found other evil inputs.
+#   parallelism: max detectors to run at once. Default is 1: each detector has a large memory limit,
+#                and a caller may be running many of us.
+my $budget = (defined $query->{budget}) ? $query->{budget} : -1;
+my $firstVulnWins = (defined $query->{firstVulnWins} and $query->{firstVulnWins}) ? 1 : 0;
+
+# Craft a query file for each pattern.
+my @jobs;
+my @queryFiles;
 for my $pattern (@patternsToTry) {
-  &log("Applying detectors to pattern /$pattern/");
-
-  # Craft query file.
   my $newQuery = decode_json(encode_json($query));
   $newQuery->{pattern} = $pattern;
-  my $tmpPatternFile = &makeQueryFile($newQuery);
+  delete $newQuery->{$_} for ("budget", "firstVulnWins", "parallelism");
+  my $tmpPatternFile = &makeQueryFile($newQuery, scalar(@queryFiles));
+  push @queryFiles, $tmpPatternFile;
 
-  # Ask each detector.
   for my $d (@DETECTORS) {
-    &log("Querying detector $d->{name}");
-    my $t0 = [gettimeofday];
-    my $stderrFile = "/tmp/detect-vuln-$$-stderr";
-    my ($rc, $out) = &cmd("$ulimitMemory $limitTime $d->{driver} $tmpPatternFile 2>$stderrFile");
-    my $elapsed = tv_interval($t0);
-    chomp $out;
-
-    # Clean up in case there was a timeout.
-    my $stderr = &readFile("file"=>$stderrFile);
-    my @filesToClean = ($stderr =~ m/CLEANUP: (\S+)/g);
-    &log("Cleaning up @filesToClean");
-    unlink @filesToClean unless $DEBUG;
-    unlink $stderrFile unless $DEBUG;
-
-    my $opinion = { "name"         => $d->{name},
-                    "secToDecide" => sprintf("%.4f", $elapsed),
-                  };
-
-    if ($rc eq 124) {
-      &log("Detector $d->{name} timed out");
-      $opinion->{hasOpinion} = 0;
-      $opinion->{opinion} = "TIMEOUT";
-    }
-    elsif ($rc) {
-      &log("Detector $d->{name} said rc $rc");
-      $opinion->{hasOpinion} = 0;
-      $opinion->{opinion} = "INTERNAL-ERROR";
-    }
-    else {
-      &log("Detector $d->{name} said: $out");
-      my $result = decode_json($out);
-      # Extract the details needed to make the summary.
-      # Otherwise we repeat ourselves too much.
-      $opinion->{hasOpinion} = 1;
-      $opinion->{opinion} = $result->{opinion};
-
-      # Note the pattern we queried about, so we can distinguish from the original.
-      $opinion->{patternVariant} = $pattern;
-    }
-
-    push @detectorOpinions, $opinion;
+    my $id = scalar(@jobs);
+    push @jobs, { "id"         => $id,
+                  "pattern"    => $pattern,
+                  "detector"   => $d,
+                  # exec, so that timeout (which makes its own process group) is the process we launch
+                  "cmd"        => "$ulimitMemory exec $limitTime $d->{driver} $tmpPatternFile",
+                  "outFile"    => "/tmp/detect-vuln-$$-$id-stdout",
+                  "stderrFile" => "/tmp/detect-vuln-$$-$id-stderr",
+                };
   }
-
-  unlink $tmpPatternFile unless $DEBUG;
 }
+my $parallelism = (defined $query->{parallelism} and 0 < $query->{parallelism}) ? $query->{parallelism} : 1;
+&log("Running " . scalar(@jobs) . " detector queries, up to $parallelism at a time (budget $budget, firstVulnWins $firstVulnWins)");
+
+# This will contain N_DETECTORS * scalar(@patternsToTry) opinions, in that order.
+my @detectorOpinions = &runJobs(\@jobs, $parallelism, $budget, $firstVulnWins);
+
+unlink @queryFiles unless $DEBUG;
 
 $query->{detectorOpinions} = \@detectorOpinions;
 
@@ -149,6 +130,207 @@ sub log {
   print STDERR "$msg\n";
 }
 
+# input: (\@jobs, $parallelism, $budget, $firstVulnWins)
+#   budget < 0 means no budget
+# output: (@opinions) in the same order as @jobs
+sub runJobs {
+  my ($jobs, $parallelism, $budget, $firstVulnWins) = @_;
+
+  my $t0 = [gettimeofday];
+  my @pending = @$jobs;
+  my %pid2job;
+  my $stopReason; # Once defined, every unfinished job gets this opinion.
+
+  while (@pending or %pid2job) {
+    # Launch
+    while (@pending and scalar(keys %pid2job) < $parallelism and not defined $stopReason) {
+      my $job = shift @pending;
+      &log("Querying detector $job->{detector}->{name} on /$job->{pattern}/");
+      $job->{t0} = [gettimeofday];
+      my $pid = &launch($job);
+      $pid2job{$pid} = $job;
+    }
+
+    # Reap
+    my $pid = waitpid(-1, WNOHANG);
+    if (0 < $pid and exists $pid2job{$pid}) {
+      my $job = delete $pid2job{$pid};
+      $job->{opinion} = &collectOpinion($job, $?);
+      if ($firstVulnWins and not defined $stopReason and &hasParseableEvilInput($job->{opinion})) {
+        &log("Detector $job->{detector}->{name} found a parseable evil input, cancelling the others");
+        $stopReason = "CANCELLED";
+      }
+    }
+    elsif ($pid <= 0) {
+      sleep(0.05);
+    }
+
+    if (0 <= $budget and not defined $stopReason and $budget <= tv_interval($t0)) {
+      &log("Budget of $budget seconds exhausted");
+      $stopReason = "TIMEOUT";
+    }
+
+    # Kill the rest
+    if (defined $stopReason) {
+      for my $pid (keys %pid2job) {
+        my $job = delete $pid2job{$pid};
+        &killJob($pid);
+        $job->{opinion} = &unfinishedOpinion($job, $stopReason);
+      }
+      for my $job (@pending) {
+        $job->{t0} = [gettimeofday];
+        $job->{opinion} = &unfinishedOpinion($job, $stopReason);
+      }
+      @pending = ();
+    }
+  }
+
+  return map { $_->{opinion} } @$jobs;
+}
+
+# input: ($job)
+# output: ($pid) of a child running $job->{cmd} in its own process group
+sub launch {
+  my ($job) = @_;
+  my $pid = fork();
+  if (not defined $pid) {
+    die "Error, could not fork: $!\n";
+  }
+  if ($pid == 0) {
+    # Own process group, so that we can kill the detector along with its helpers (timeout, java, ...)
+    setpgrp(0, 0);
+    &log("CMD: $job->{cmd}");
+    exec("/bin/sh", "-c", "$job->{cmd} >$job->{outFile} 2>$job->{stderrFile}")
+      or die "Error, could not exec: $!\n";
+  }
+  # The parent too, so that the group exists before we might kill it.
+  # This fails harmlessly if the child has already exec'd.
+  setpgrp($pid, $pid);
+  return $pid;
+}
+
+# input: ($pid) of a child from launch
+# Kills and reaps the child, and waits for the rest of its process group (java, ...) to go
+# so that it does not write to files we are about to clean up.
+sub killJob {
+  my ($pid) = @_;
+  kill('KILL', -$pid);
+  waitpid($pid, 0);
+  # The others were reparented, so we cannot reap them. Wait until none is running.
+  my $t0 = [gettimeofday];
+  while (&groupIsRunning($pid) and tv_interval($t0) < 5) {
+    kill('KILL', -$pid);
+    sleep(0.01);
+  }
+}
+
+# input: ($pgid)
+# output: true if a process in this group is still running (not a zombie)
+sub groupIsRunning {
+  my ($pgid) = @_;
+  if (not -d "/proc/self") {
+    return kill(0, -$pgid);
+  }
+  opendir(my $dh, "/proc") or return kill(0, -$pgid);
+  my @pids = grep { m/^\d+$/ } readdir($dh);
+  closedir($dh);
+  for my $pid (@pids) {
+    open(my $fh, '<', "/proc/$pid/stat") or next;
+    my $stat = <$fh>;
+    close($fh);
+    next if not defined $stat;
+    # pid (comm) state ppid pgrp ...
+    my ($state, $ppid, $pgrp) = (split(' ', substr($stat, rindex($stat, ')') + 1)))[0..2];
+    return 1 if ($pgrp == $pgid and $state ne 'Z');
+  }
+  return 0;
+}
+
+# input: ($job, $status) -- $? from waitpid
+# output: ($opinion)
+sub collectOpinion {
+  my ($job, $status) = @_;
+  my $rc = $status >> 8;
+  my $signal = $status & 127;
+  my $d = $job->{detector};
+  my $opinion = { "name"           => $d->{name},
+                  "secToDecide"    => sprintf("%.4f", tv_interval($job->{t0})),
+                  # Note the pattern we queried about, so we can distinguish from the original.
+                  "patternVariant" => $job->{pattern},
+                };
+  my $out = (-f $job->{outFile}) ? &readFile("file"=>$job->{outFile}) : "";
+  chomp $out;
+  &cleanUp($job);
+
+  if ($signal) {
+    &log("Detector $d->{name} was killed by signal $signal");
+    $opinion->{hasOpinion} = 0;
+    $opinion->{opinion} = "INTERNAL-ERROR";
+  }
+  elsif ($rc eq 124) {
+    &log("Detector $d->{name} timed out");
+    $opinion->{hasOpinion} = 0;
+    $opinion->{opinion} = "TIMEOUT";
+  }
+  elsif ($rc) {
+    &log("Detector $d->{name} said rc $rc");
+    $opinion->{hasOpinion} = 0;
+    $opinion->{opinion} = "INTERNAL-ERROR";
+  }
+  else {
+    &log("Detector $d->{name} said: $out");
+    my $result = eval { decode_json($out) };
+    if (not defined $result) {
+      &log("Detector $d->{name} gave unparseable output");
+      $opinion->{hasOpinion} = 0;
+      $opinion->{opinion} = "INTERNAL-ERROR";
+      return $opinion;
+    }
+    # Extract the details needed to make the summary.
+    # Otherwise we repeat ourselves too much.
+    $opinion->{hasOpinion} = 1;
+    $opinion->{opinion} = $result->{opinion};
+  }
+
+  return $opinion;
+}
+
+# input: ($job, $reason) -- "TIMEOUT" or "CANCELLED"
+# output: ($opinion)
+sub unfinishedOpinion {
+  my ($job, $reason) = @_;
+  &log("Detector $job->{detector}->{name} on /$job->{pattern}/: $reason");
+  &cleanUp($job);
+  return { "name"           => $job->{detector}->{name},
+           "secToDecide"    => sprintf("%.4f", tv_interval($job->{t0})),
+           "patternVariant" => $job->{pattern},
+           "hasOpinion"     => 0,
+           "opinion"        => $reason,
+         };
+}
+
+# Clean up after a detector, in case it timed out or was killed.
+sub cleanUp {
+  my ($job) = @_;
+  if (-f $job->{stderrFile}) {
+    my $stderr = &readFile("file"=>$job->{stderrFile});
+    my @filesToClean = ($stderr =~ m/CLEANUP: (\S+)/g);
+    &log("Cleaning up @filesToClean");
+    unlink @filesToClean unless $DEBUG;
+  }
+  unlink $job->{stderrFile}, $job->{outFile} unless $DEBUG;
+}
+
+# input: ($opinion)
+# output: true if the detector said vulnerable and gave at least one evil input we can use
+sub hasParseableEvilInput {
+  my ($opinion) = @_;
+  return 0 if not $opinion->{hasOpinion};
+  my $o = $opinion->{opinion};
+  return 0 if not (ref($o) eq "HASH" and $o->{canAnalyze} and defined $o->{isSafe} and $o->{isSafe} eq "0");
+  return scalar(grep { ref($_) eq "HASH" } @{$o->{evilInput} || []});
+}
+
 
 # input: ()
 # output: (@detectors) fields: name driver
@@ -179,8 +361,8 @@ sub getDetectors {
 }
 
 sub makeQueryFile {
-  my ($query) = @_;
-  my $tmpFile = "/tmp/detect-vuln-$$.json";
+  my ($query, $i) = @_;
+  my $tmpFile = "/tmp/detect-vuln-$$-$i.json";
   &writeToFile("file"=>$tmpFile, "contents"=>encode_json($query));
   return $tmpFile;
 }
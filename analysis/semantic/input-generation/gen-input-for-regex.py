@@ -14,6 +14,8 @@ import argparse
 import traceback
 import shutil
 import random
+import time
+import concurrent.futures
 
 #######################
 
@@ -22,19 +24,39 @@ DEFAULT_REX_NUM_INPUTS = 1000
 
 DELETE_TMP_FILES = True
 
+# The generators for a regex run concurrently, with a shared deadline of --generator-timeout
+# plus this much, for driver startup (e.g. the JVM) and for scraping a timed-out generator's output.
+GENERATOR_DEADLINE_SLACK_SEC = 30
+
+# A driver that can stop itself at the deadline (query-rex.py --deadline) gets this much less,
+# to write out what it has before we would kill it
+DRIVER_DEADLINE_MARGIN_SEC = 10
+
+# A driver exits with this when the deadline cut it short. Its inputs are usable, but depend on load, so we do not cache them.
+DRIVER_RC_CUT_SHORT = 3
+
 #######################
 
+# Generated inputs are cached (libLF.ResultCache) under this kind
+INPUTS_CACHE_KIND = 'inputs'
+
 # Python-y wrappers for the input generators
 class Generator:
   """Represents one of the generators we query"""
-  def __init__(self, name, driver):
+  def __init__(self, name, driver, tool):
     self.name = name
     self.driver = driver
+    self.tool = tool
 
   def driverExists(self):
     return shutil.which(self.driver) is not None
+
+  def version(self):
+    """A libLF.ResultCache toolVersion covering the driver and the generator it wraps"""
+    # If the generator is not built, the driver fails, and nothing is cached anyway
+    return libLF.fileVersion(*[f for f in [self.driver, self.tool] if os.path.exists(f)])
   
-  def queryHelper(self, regex, commandToRunFmt):
+  def queryHelper(self, regex, commandToRunFmt, params, deadline=None, cache=None):
     """query() might benefit from this
 
     regex: the libLF.regex to query
@@ -42,8 +64,24 @@ class Generator:
       We apply commandToRun.format(inFile, outFile)
       inFile: contains a libLF.Regex, NDJSON formatted
       outFile: contains a libLF.RegexPatternAndInput, NDJSON formatted
+      Its stderr goes to a file of its own, since the generators run concurrently.
+      If it fails, we log the tail.
+    params: dict: the query arguments that affect the inputs (seed, limits, timeout), for the cache key
+    deadline: time.time() by which the driver must finish, or None.
+      A driver still running then is killed, and we get no inputs from it.
+      A driver that stops itself short of the deadline exits DRIVER_RC_CUT_SHORT, and we use what it wrote.
+    cache: libLF.ResultCache, or None.
+      Responses are cached compressed. A driver that failed or was cut short by the deadline is not cached.
     @returns: GeneratorQueryResponse[]
     """
+    if cache is not None:
+      toolVersion = self.version()
+      cacheParams = dict(params, generator=self.name)
+      stringsByProducer = cache.get(INPUTS_CACHE_KIND, regex.pattern, '', toolVersion, cacheParams)
+      if stringsByProducer is not None:
+        libLF.log('queryHelper for {}: cached inputs for /{}/'.format(self.name, regex.pattern))
+        return [GeneratorQueryResponse(producer, inputs) for producer, inputs in stringsByProducer.items()]
+
     libLF.log('queryHelper for {}:\n  regex /{}/\n  command {}' \
       .format(self.name, regex.pattern, commandToRunFmt))
     gqrs = []
@@ -52,75 +90,130 @@ class Generator:
                                      delete=DELETE_TMP_FILES) as inFile, \
           tempfile.NamedTemporaryFile(prefix='GenInput-DriverOutFile-',
                                      suffix='.json',
-                                     delete=DELETE_TMP_FILES) as outFile:
+                                     delete=DELETE_TMP_FILES) as outFile, \
+          tempfile.NamedTemporaryFile(prefix='GenInput-DriverErrFile-{}-'.format(self.name),
+                                     suffix='.log',
+                                     delete=DELETE_TMP_FILES) as errFile:
       libLF.writeToFile(inFile.name, regex.toNDJSON())
-      rc, out = libLF.runcmd(commandToRunFmt.format(inFile.name, outFile.name))
-      if rc == 0:
+      try:
+        timeout = None if deadline is None else deadline - time.time()
+        rc, out = libLF.runcmd("{} 2>'{}'".format(commandToRunFmt.format(inFile.name, outFile.name), errFile.name), timeout=timeout)
+      except TimeoutError as err:
+        libLF.log('{} missed the deadline for /{}/: {}\n{}'.format(self.name, regex.pattern, err, _tail(errFile.name)))
+        return gqrs
+      if rc not in [0, DRIVER_RC_CUT_SHORT]:
+        libLF.log('{} failed on /{}/ (rc {})\n{}'.format(self.name, regex.pattern, rc, _tail(errFile.name)))
+      else:
+        if rc == DRIVER_RC_CUT_SHORT:
+          libLF.log('{} was cut short by the deadline for /{}/; not caching its inputs'.format(self.name, regex.pattern))
         with open(outFile.name, 'r') as inStream:
           contents = inStream.read()
           rpai = libLF.RegexPatternAndInputs().initFromNDJSON(contents)
           for producer in rpai.stringsByProducer:
             gqr = GeneratorQueryResponse(producer, rpai.stringsByProducer[producer])
             gqrs.append(gqr)
+        if cache is not None and rc == 0:
+          cache.put(INPUTS_CACHE_KIND, regex.pattern, '', toolVersion, cacheParams,
+            rpai.stringsByProducer, compress=True)
     return gqrs
 
-  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
     """Override me. I suggest you use queryHelper.
     
     regex: a libLF.Regex
     rngSeed: if generator supports it, use this seed
     inputsPerGenerator: return at most this many inputs
     generatorTimeout: if generator supports it, ask it to take no more than this long
+    deadline, cache: see queryHelper
 
     @return GeneratorQueryResponse[]
     """
     libLF.log('Error, you must override query for {}'.format(self.name))
     sys.exit(1)
 
+def _tail(path, nLines=10):
+  """The last lines of this file, indented for the log"""
+  with open(path, 'r', errors='replace') as inStream:
+    lines = inStream.read().splitlines()[-nLines:]
+  return '\n'.join('  ' + line for line in lines)
+
 class GeneratorQueryResponse:
   def __init__(self, name, inputs):
     self.name = name
     self.inputs = inputs
 
 class Generator_Rex(Generator):
-  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
+    params = { 'rngSeed': rngSeed, 'inputsPerGenerator': inputsPerGenerator, 'generatorTimeout': generatorTimeout }
     if inputsPerGenerator < 0:
       inputsPerGenerator = DEFAULT_REX_NUM_INPUTS
-    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --seed 1 --num-inputs {} --seed {} --timeout {} 2>/tmp/gen-input.log' \
-        .format(self.driver, inputsPerGenerator, rngSeed, generatorTimeout))
+    # Each of Rex's modes gets generatorTimeout once it has a wine slot. Under load that adds up,
+    # so it must stop itself at the deadline, keeping the modes that finished.
+    deadlineArg = ''
+    if deadline is not None:
+      deadlineArg = ' --deadline {}'.format(deadline - DRIVER_DEADLINE_MARGIN_SEC)
+    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --seed 1 --num-inputs {} --seed {} --timeout {}{}' \
+        .format(self.driver, inputsPerGenerator, rngSeed, generatorTimeout, deadlineArg), params, deadline, cache)
 
 class Generator_EGRET(Generator):
-  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
+    params = { 'rngSeed': rngSeed, 'inputsPerGenerator': inputsPerGenerator, 'generatorTimeout': generatorTimeout }
     # rngSeed: AFAIK EGRET is deterministic
-    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --timeout {} 2>/tmp/gen-input.log' \
-        .format(self.driver, generatorTimeout))
+    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --timeout {}' \
+        .format(self.driver, generatorTimeout), params, deadline, cache)
 
 class Generator_ReScue(Generator):
-  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
+    params = { 'rngSeed': rngSeed, 'inputsPerGenerator': inputsPerGenerator, 'generatorTimeout': generatorTimeout }
     # TODO: ReScue does not support RNG
-    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --timeout {} 2>/tmp/gen-input.log' \
-        .format(self.driver, generatorTimeout))
+    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --timeout {}' \
+        .format(self.driver, generatorTimeout), params, deadline, cache)
 
 class Generator_MutRex(Generator):
-  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
+    params = { 'rngSeed': rngSeed, 'inputsPerGenerator': inputsPerGenerator, 'generatorTimeout': generatorTimeout }
     # TODO: MutRex does not support RNG
-    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --timeout {} 2>/tmp/gen-input.log' \
-        .format(self.driver, generatorTimeout))
+    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --timeout {}' \
+        .format(self.driver, generatorTimeout), params, deadline, cache)
 
 class Generator_Brics(Generator):
-  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
-    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --seed {} --timeout {} 2>/tmp/gen-input.log' \
-        .format(self.driver, rngSeed, generatorTimeout))
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
+    params = { 'rngSeed': rngSeed, 'inputsPerGenerator': inputsPerGenerator, 'generatorTimeout': generatorTimeout }
+    return self.queryHelper(regex, '{} --regex-file {{}} --out-file {{}} --seed {} --timeout {}' \
+        .format(self.driver, rngSeed, generatorTimeout), params, deadline, cache)
+
+class Generator_SRE(Generator):
+  """In-process: walks Python's parse tree for the regex (libLF.structuralInputs)
+
+  No driver subprocess, so we neither cache nor honor the deadline. It takes microseconds.
+  """
+  def __init__(self, name):
+    super().__init__(name, libLF.lf_structuralInputs.__file__, libLF.lf_structuralInputs.__file__)
+
+  def driverExists(self):
+    return True
+
+  def query(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, deadline=None, cache=None):
+    try:
+      inputs = libLF.structuralInputs(regex.pattern, seed=rngSeed if 0 <= rngSeed else None, maxInputs=inputsPerGenerator)
+    except ValueError as err:
+      # Not Python syntax. Leave it to the others.
+      libLF.log('{}: no inputs for /{}/: {}'.format(self.name, regex.pattern, err))
+      return []
+    return [GeneratorQueryResponse(self.name, inputs)]
 
 # Verify that the generators can be found
 DRIVER_PATH = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'analysis', 'semantic', 'input-generation', 'generators', 'drivers')
+TOOL_PATH = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin')
 INPUT_GENERATORS = [
-  Generator_Rex('Rex', os.path.join(DRIVER_PATH, 'query-rex.py')),
-  Generator_EGRET('EGRET', os.path.join(DRIVER_PATH, 'query-egret.py')),
-  Generator_ReScue('ReScue', os.path.join(DRIVER_PATH, 'query-rescue.py')),
-  Generator_MutRex('MutRex', os.path.join(DRIVER_PATH, 'query-mutrex.py')),
-  Generator_Brics('Brics', os.path.join(DRIVER_PATH, 'query-brics.py')),
+  Generator_Rex('Rex', os.path.join(DRIVER_PATH, 'query-rex.py'), os.path.join(TOOL_PATH, 'RexInputGenerator.exe')),
+  Generator_EGRET('EGRET', os.path.join(DRIVER_PATH, 'query-egret.py'), os.path.join(TOOL_PATH, 'EgretInputGenerator.py')),
+  Generator_ReScue('ReScue', os.path.join(DRIVER_PATH, 'query-rescue.py'), os.path.join(TOOL_PATH, 'ReScueInputGenerator.jar')),
+  Generator_MutRex('MutRex', os.path.join(DRIVER_PATH, 'query-mutrex.py'), os.path.join(TOOL_PATH, 'MutRexInputGenerator.jar')),
+  Generator_Brics('Brics', os.path.join(DRIVER_PATH, 'query-brics.py'), os.path.join(TOOL_PATH, 'BricsInputGenerator.jar')),
 ]
+# Opt-in (--sre-fast-path), so that the producers in existing runs' output do not change
+SRE_GENERATOR = Generator_SRE('SRE')
 for inputGen in INPUT_GENERATORS:
   if not inputGen.driverExists():
     libLF.log('Error, cannot find driver for {} ({})'.format(inputGen.name, inputGen.driver))
@@ -129,24 +222,44 @@ for inputGen in INPUT_GENERATORS:
 ##########
 
 class MyTask(libLF.parallel.ParallelTask):
-  def __init__(self, regex, rngSeed, inputsPerGenerator, generatorTimeout):
+  def __init__(self, regex, rngSeed, inputsPerGenerator, generatorTimeout, cache, sreFastPath):
     self.regex = regex
     self.rngSeed = rngSeed
     self.inputsPerGenerator = inputsPerGenerator
     self.generatorTimeout = generatorTimeout
+    self.cache = cache
+    self.sreFastPath = sreFastPath
   
   def run(self):
     try:
       libLF.log('Working on regex: /{}/'.format(self.regex.pattern))
 
-      # Drive the various input generators
+      # The structural generator covers simple regexes on its own.
+      # Otherwise it goes last, so that it does not perturb the sampling of the others' inputs.
+      inputGens = INPUT_GENERATORS
+      if self.sreFastPath:
+        if libLF.isStructurallyCovered(self.regex.pattern):
+          libLF.log('Fast path: only {} for /{}/'.format(SRE_GENERATOR.name, self.regex.pattern))
+          inputGens = [SRE_GENERATOR]
+        else:
+          inputGens = INPUT_GENERATORS + [SRE_GENERATOR]
+
+      # Drive the various input generators, concurrently.
+      # They spend their time in driver subprocesses, so threads will do.
+      deadline = None
+      if 0 <= self.generatorTimeout:
+        deadline = time.time() + self.generatorTimeout + GENERATOR_DEADLINE_SLACK_SEC
+      with concurrent.futures.ThreadPoolExecutor(max_workers=len(inputGens)) as executor:
+        futures = []
+        for inputGen in inputGens:
+          libLF.log('Getting inputs from {}'.format(inputGen.name))
+          futures.append(executor.submit(inputGen.query, self.regex, self.rngSeed, self.inputsPerGenerator, self.generatorTimeout, deadline, self.cache))
+
+      # Unpack the responses in generator order, so that sampling does not depend on who finished first
       stringsByProducer = {}
       nStrings = 0
-      for inputGen in INPUT_GENERATORS:
-        libLF.log('Getting inputs from {}'.format(inputGen.name))
-        # Query the generator
-        gqrs = inputGen.query(self.regex, self.rngSeed, self.inputsPerGenerator, self.generatorTimeout)
-        # Unpack the responses
+      for inputGen, future in zip(inputGens, futures):
+        gqrs = future.result()
         for gqr in gqrs:
           # Enforce inputsPerGenerator
           _inputs = gqr.inputs
@@ -175,9 +288,9 @@ class MyTask(libLF.parallel.ParallelTask):
 
 ################
 
-def getTasks(regexFile, rngSeed, inputsPerGenerator, generatorTimeout):
+def getTasks(regexFile, rngSeed, inputsPerGenerator, generatorTimeout, cache, sreFastPath):
   regexes = loadRegexFile(regexFile)
-  tasks = [MyTask(regex, rngSeed, inputsPerGenerator, generatorTimeout) for regex in regexes]
+  tasks = [MyTask(regex, rngSeed, inputsPerGenerator, generatorTimeout, cache, sreFastPath) for regex in regexes]
   libLF.log('Prepared {} tasks'.format(len(tasks)))
   return tasks
 
@@ -208,22 +321,40 @@ def loadRegexFile(regexFile):
 
 ################
 
-def main(regexFile, outFile, parallelism, rngSeed, inputsPerGenerator, generatorTimeout):
-  libLF.log('regexFile {} outFile {} parallelism {} rngSeed {} inputsPerGenerator {} generatorTimeout {}' \
-    .format(regexFile, outFile, parallelism, rngSeed, inputsPerGenerator, generatorTimeout))
+def main(regexFile, outFile, parallelism, rngSeed, inputsPerGenerator, generatorTimeout, resume, shard, resultCache, sreFastPath):
+  libLF.log('regexFile {} outFile {} parallelism {} rngSeed {} inputsPerGenerator {} generatorTimeout {} resume {} shard {} resultCache {} sreFastPath {}' \
+    .format(regexFile, outFile, parallelism, rngSeed, inputsPerGenerator, generatorTimeout, resume, shard, resultCache, sreFastPath))
   
   if 0 <= rngSeed:
     random.seed(rngSeed)
 
+  cache = None
+  if resultCache is not None and rngSeed < 0:
+    # Unseeded inputs are meant to differ from run to run. Caching them would freeze them.
+    libLF.log('No seed, so not using the result cache {}'.format(resultCache))
+  elif resultCache is not None:
+    cache = libLF.ResultCache(resultCache)
+    # put() does not evict, and we may be one of many short runs. Keep the cache within its size here.
+    cache.evict()
+    cacheStatsBefore = cache.stats()
+
   #### Load data
-  tasks = getTasks(regexFile, rngSeed, inputsPerGenerator, generatorTimeout)
+  tasks = getTasks(regexFile, rngSeed, inputsPerGenerator, generatorTimeout, cache, sreFastPath)
+  tasks = [t for t in tasks if libLF.isInShard(t.regex.pattern, shard)]
+
+  # Skip the regexes we finished last time
+  journal = libLF.ResumeJournal(outFile, resume)
+  tasks = [t for t in tasks if not journal.isDone(t.regex.pattern)]
+  libLF.log('{} tasks to do ({} already done)'.format(len(tasks), journal.nDone()))
   nRegexes = len(tasks)
 
   #### Process data
 
   # CPU-bound, no limits
-  libLF.log('Submitting to map')
-  results = libLF.parallel.map(tasks, parallelism,
+  # Emit each result as it completes, so partial output survives a crash
+  # and we need not hold every result in memory.
+  libLF.log('Submitting to imap_unordered')
+  results = libLF.parallel.imap_unordered(tasks, parallelism,
     libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
     jitter=False)
   
@@ -232,17 +363,20 @@ def main(regexFile, outFile, parallelism, rngSeed, inputsPerGenerator, generator
   libLF.log('Writing results to {}'.format(outFile))
   nSuccesses = 0
   nExceptions = 0
-  with open(outFile, 'w') as outStream:
+  with journal:
     for rpai in results:
         # Emit
         if type(rpai) is libLF.RegexPatternAndInputs:
           nSuccesses += 1
           libLF.log('  Generated {} unique inputs for regex /{}/' \
             .format(len(rpai.getUniqueInputs()), rpai.pattern))
-          outStream.write(rpai.toNDJSON() + '\n')
+          journal.write(rpai.pattern, rpai.toNDJSON())
         else:
           nExceptions += 1
   libLF.log('Successfully performed input generation for {} regexes, {} exceptions'.format(nSuccesses, nExceptions))
+  if cache is not None:
+    cache.logStats(cacheStatsBefore)
+    cache.evict()
 
 #####################################################
 
@@ -260,7 +394,15 @@ parser.add_argument('--max-inputs-per-generator', type=int, help='At most N inpu
   dest='inputsPerGenerator')
 parser.add_argument('--generator-timeout', type=float, help='Time out generator if it takes more than T seconds, and scrape the output for the strings generated so far (default 10, give -1 for no limit)', required=False, default=10,
   dest='generatorTimeout')
+parser.add_argument('--resume', help='Resume an interrupted run: keep the results already journaled in OUT_FILE.journal and skip those regexes', required=False, action='store_true', default=False,
+  dest='resume')
+parser.add_argument('--shard', type=libLF.parseShard, help='i/N: only process the regexes in shard i (0-based) of N. Use a different --out-file per shard', required=False, default=None,
+  dest='shard')
+parser.add_argument('--result-cache', type=str, help='Cache generated inputs in this SQLite file (libLF.ResultCache), and reuse those from earlier runs with the same seed and limits. Ignored with --seed -1 (default: no cache)', required=False, default=None,
+  dest='resultCache')
+parser.add_argument('--sre-fast-path', help='Also run the structural generator (SRE). For a regex whose every feature it covers -- no backreferences, lookaround, or conditionals -- use only it, skipping the external generators (default: do not run SRE)', required=False, action='store_true', default=False,
+  dest='sreFastPath')
 args = parser.parse_args()
 
 # Here we go!
-main(args.regexFile, args.outFile, args.parallelism, args.seed, args.inputsPerGenerator, args.generatorTimeout)
+main(args.regexFile, args.outFile, args.parallelism, args.seed, args.inputsPerGenerator, args.generatorTimeout, args.resume, args.shard, args.resultCache, args.sreFastPath)
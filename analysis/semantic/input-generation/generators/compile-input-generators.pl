@@ -9,6 +9,9 @@ print "Configuring/Compiling the input generators\n";
 print "Configuring ReScue\n";
 system("cd ReScue/; mvn package; cd -");
 
+print "Configuring the JVM generator server\n";
+system("cd jvm-server/; mvn package; cd -");
+
 print "Configuring Egret\n";
 system("cd egret/src; make; cd -");
 
@@ -49,32 +49,26 @@ def convertPatternToBrics(pattern):
 
 def getBricsInputs(pattern, seed, timeout):
   """Return inputs: str[]"""
-  # Use subprocess.run directly instead of libLF.runcmd because the regex is delivered on command line
-  # and might be unescaped, contain newlines, etc.
-  # Also, we want to be able to capture stderr cleanly with a timeout.
+  # The regex is delivered on the command line and might be unescaped, contain newlines, etc.
   bricsPattern = convertPatternToBrics(pattern)
   libLF.log('Pattern conversion:\n before /{}/\n after  /{}/'.format(pattern, bricsPattern))
   # (My fork of) Brics treats -1 as "no seed internally"
-  cmd = ["java", "-jar", BRICS_PATH, bricsPattern, str(MAX_STRING_LEN), str(PROB_EXCESSIVE_STRINGS), str(seed)]
-  libLF.log('Command: ' + str(cmd))
+  argv = [bricsPattern, str(MAX_STRING_LEN), str(PROB_EXCESSIVE_STRINGS), str(seed)]
+  libLF.log('Brics args: ' + str(argv))
 
-  rc = 0
   inputs = []
   try:
-    tmo = None if timeout < 0 else timeout
-    completedProcess = subprocess.run(
-      cmd,
-      stderr=subprocess.PIPE, timeout=tmo)
-    rc = completedProcess.returncode
+    # In the JVM generator server if it is running, else java -jar
+    rc, out, err, timedOut = libLF.runJarGenerator('brics', BRICS_PATH, argv, timeout)
     libLF.log('rc: {}'.format(rc))
-    if rc == 0:
-      inputs = processBricsOutput(completedProcess.stderr.decode('utf-8'))
-  except subprocess.TimeoutExpired as to:
-    libLF.log("Timeout, let's see if we can salvage using the stderr stream")
-    try:
-      inputs = processBricsOutput(to.stderr.decode('utf-8'))
-    except:
-      pass
+    if timedOut:
+      libLF.log("Timeout, let's see if we can salvage using the stderr stream")
+      try:
+        inputs = processBricsOutput(err)
+      except:
+        pass
+    elif rc == 0:
+      inputs = processBricsOutput(err)
   except Exception as err:
     libLF.log('Exception: {}'.format(err))
   return inputs
@@ -12,6 +12,8 @@ import tempfile
 import argparse
 import re
 import json
+import time
+import concurrent.futures
 
 ################
 # Dependencies
@@ -20,6 +22,16 @@ import json
 EGRET_PATH = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin', 'EgretInputGenerator.py')
 libLF.checkShellDependencies([EGRET_PATH], mustBeExecutable=False)
 
+# For --in-process. The Makefile puts the extension next to the EGRET CLI.
+sys.path.append(os.path.dirname(os.path.realpath(EGRET_PATH)))
+try:
+  import egret_ext
+except ImportError:
+  egret_ext = None
+
+# The EGRET CLI's default
+EGRET_BASE_SUBSTRING = 'evil'
+
 ################
 # Globals
 ################
@@ -67,53 +79,135 @@ def getEGRETInputs(pattern, timeout):
     return inputs
 
 def processEGRETOutFile(rawEGRETFile):
+  """Collect the strings the EGRET CLI listed under Matches: and Non-matches:"""
   inputs = set()
+  inSection = False
   with open(rawEGRETFile, 'r') as f:
     for line in f:
-      line = line.strip()
+      line = line.rstrip('\n')
       libLF.log('LINE: {}'.format(line))
-      if line.startswith("Matches:") or line.startswith("Non-matches:"):
-        match = re.search(r"^[\w\-]+atches: (\[.*\])$", line)
-        if match:
-          inputs.update(json.loads(match.group(1)))
+      if line in ["Matches:", "Non-matches:"]:
+        inSection = True
+      elif line == "":
+        inSection = False
+      elif inSection:
+        inputs.add("" if line == "<empty>" else line)
   return sorted(list(inputs))
 
+def getEGRETInputsInProcess(patterns, parallelism, chunkSize, timeout):
+  """Return inputs: str[][], one per pattern, using egret_ext in this process
+
+  Chunks of patterns go to egret_ext.run_batch, which releases the GIL,
+  so up to parallelism chunks run at once.
+  The engine cannot be interrupted, so a chunk gets timeout seconds per pattern.
+  The patterns of a chunk that overruns are run through the CLI instead, each under the timeout.
+  Returns (inputs, nAbandoned): the number of engine threads still running an overdue chunk.
+  """
+  chunks = [patterns[i:i+chunkSize] for i in range(0, len(patterns), chunkSize)]
+  chunk2start = {}
+  def runChunk(i):
+    chunk2start[i] = time.time()
+    # EGRET's CLI refuses patterns that Python cannot compile. So do we.
+    compiles = [_compilesInPython(p) for p in chunks[i]]
+    results = egret_ext.run_batch([p for p, ok in zip(chunks[i], compiles) if ok],
+      EGRET_BASE_SUBSTRING, False, False, False, False)
+    results = iter(results)
+    return [processEGRETEngineOutput(next(results)) if ok else [] for ok in compiles]
+
+  chunk2inputs = {}
+  overdue = set()
+  executor = concurrent.futures.ThreadPoolExecutor(max_workers=parallelism)
+  future2chunk = { executor.submit(runChunk, i): i for i in range(len(chunks)) }
+  pending = set(future2chunk)
+  while pending:
+    done, pending = concurrent.futures.wait(pending, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED)
+    for future in done:
+      chunk2inputs[future2chunk[future]] = future.result()
+    if 0 <= timeout:
+      for future in list(pending):
+        i = future2chunk[future]
+        if i in chunk2start and timeout * len(chunks[i]) < time.time() - chunk2start[i]:
+          libLF.log('EGRET chunk {} timed out, falling back to the CLI for its {} regexes'.format(i, len(chunks[i])))
+          overdue.add(i)
+          pending.remove(future)
+  executor.shutdown(wait=False)
+
+  for i in overdue:
+    chunk2inputs[i] = [getEGRETInputs(p, timeout) for p in chunks[i]]
+  return [inputs for i in range(len(chunks)) for inputs in chunk2inputs[i]], len(overdue)
+
+def processEGRETEngineOutput(engineOutput):
+  """Strings from egret_ext.run: [status] or [alert..., 'BEGIN', string...], as handled by the EGRET CLI"""
+  if engineOutput[0].startswith("ERROR"):
+    libLF.log('EGRET: {}'.format(engineOutput[0]))
+    return []
+  return sorted(set(engineOutput[engineOutput.index("BEGIN")+1:]))
+
+def _compilesInPython(pattern):
+  try:
+    re.compile(pattern)
+    return True
+  except Exception:
+    return False
+
 ################
 # Main
 ################
       
-def main(regexFile, outFile, timeout):
-  libLF.log('regexFile {} outFile {} timeout {}' \
-    .format(regexFile, outFile, timeout))
+def main(regexFile, outFile, timeout, inProcess, parallelism, chunkSize):
+  libLF.log('regexFile {} outFile {} timeout {} inProcess {} parallelism {} chunkSize {}' \
+    .format(regexFile, outFile, timeout, inProcess, parallelism, chunkSize))
 
-  # Get the libLF.Regex
+  # Get the libLF.Regex's. Usually one, but --in-process can handle a chunk of the corpus.
   with open(regexFile, 'r') as inStream:
-    regex = libLF.Regex().initFromNDJSON(inStream.read())
-  libLF.log('Generating inputs for regex /{}/'.format(regex.pattern))
-  
-  # Query Rex
-  inputs = getEGRETInputs(regex.pattern, timeout)
-  libLF.log('EGRET generated {} inputs for regex /{}/'.format(len(inputs), regex.pattern))
+    regexes = [libLF.Regex().initFromNDJSON(line) for line in inStream.read().split('\n') if len(line.strip())]
+  libLF.log('Generating inputs for {} regexes'.format(len(regexes)))
+
+  # Query EGRET
+  nAbandoned = 0
+  if inProcess and egret_ext is None:
+    libLF.log('Cannot import egret_ext (build it with make in the EGRET src/), using the CLI')
+    inProcess = False
+  if inProcess:
+    allInputs, nAbandoned = getEGRETInputsInProcess([regex.pattern for regex in regexes], parallelism, chunkSize, timeout)
+  else:
+    allInputs = [getEGRETInputs(regex.pattern, timeout) for regex in regexes]
+
+  rpaiLines = []
+  for regex, inputs in zip(regexes, allInputs):
+    libLF.log('EGRET generated {} inputs for regex /{}/'.format(len(inputs), regex.pattern))
+    stringsByProducer = { "EGRET": inputs }
+    rpai = libLF.RegexPatternAndInputs().initFromRaw(regex.pattern, stringsByProducer)
+    rpaiLines.append(rpai.toNDJSON())
 
   # Emit
-  stringsByProducer = { "EGRET": inputs }
   with open(outFile, 'w') as outStream:
-    rpai = libLF.RegexPatternAndInputs().initFromRaw(regex.pattern, stringsByProducer)
-    outStream.write(rpai.toNDJSON())
+    outStream.write('\n'.join(rpaiLines))
+
+  if nAbandoned:
+    # Do not wait for the engine threads of overdue chunks
+    libLF.log('Exiting without waiting for {} overdue EGRET chunks'.format(nAbandoned))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0)
 
 ################################
 
 # Parse args
 parser = argparse.ArgumentParser(description='Given a libLF.Regex, ask EGRET for inputs to try')
-parser.add_argument('--regex-file', help='File containing a libLF.Regex', required=True,
+parser.add_argument('--regex-file', help='File containing a libLF.Regex, or several (NDJSON) to query them all with one driver', required=True,
   dest='regexFile')
-parser.add_argument('--out-file', type=str, help='Out: File of one libLF.RegexPatternAndInputs object containing the inputs found using rex', required=True,
+parser.add_argument('--out-file', type=str, help='Out: File of one libLF.RegexPatternAndInputs object per regex (NDJSON, in the same order) containing the inputs found using EGRET', required=True,
   dest='outFile')
-parser.add_argument('--timeout', type=float, help='Maximum time to run for, in seconds (default 30, -1 means no limit)', required=False, default=30,
+parser.add_argument('--timeout', type=float, help='Maximum time to run for, in seconds per regex (default 30, -1 means no limit)', required=False, default=30,
   dest='timeout')
+parser.add_argument('--in-process', help='Run EGRET in this process through its egret_ext module, instead of one EGRET CLI per regex', required=False, action='store_true', default=False,
+  dest='inProcess')
+parser.add_argument('--parallelism', type=int, help='With --in-process: run this many chunks of regexes at once (default: one per core)', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
+  dest='parallelism')
+parser.add_argument('--chunk-size', type=int, help='With --in-process: regexes per egret_ext.run_batch call (default 10)', required=False, default=10,
+  dest='chunkSize')
 
 args = parser.parse_args()
 # Here we go!
-main(args.regexFile, args.outFile, args.timeout)
-
-args = parser.parse_args()
+main(args.regexFile, args.outFile, args.timeout, args.inProcess, args.parallelism, args.chunkSize)
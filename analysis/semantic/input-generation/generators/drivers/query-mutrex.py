@@ -30,25 +30,21 @@ libLF.checkShellDependencies([MUTREX_PATH], mustBeExecutable=False)
 def getMutRexInputs(pattern, timeout):
   """Return inputs: str[]"""
 
-  # Build command to run
-  cmd = ["java", "-jar", MUTREX_PATH, pattern]
-  libLF.log('cmd: ' + " ".join(cmd))
+  argv = [pattern]
+  libLF.log('MutRex args: ' + str(argv))
 
   # Get inputs, guarded by a timeout
-  tmo = None if timeout < 0 else timeout
   inputs = []
   try:
-    completedProcess = subprocess.run(cmd, stdout=subprocess.PIPE, timeout=tmo)
-    libLF.log('rc {}'.format(completedProcess.returncode))
-    if completedProcess.returncode == 0:
-      inputs = processMutRexOutput(completedProcess.stdout.decode('utf-8'))
-  except subprocess.TimeoutExpired:
-    libLF.log("MutRex timed out")
-    try:
+    # In the JVM generator server if it is running, else java -jar
+    rc, out, err, timedOut = libLF.runJarGenerator('mutrex', MUTREX_PATH, argv, timeout)
+    libLF.log('rc {}'.format(rc))
+    if timedOut:
+      libLF.log("MutRex timed out")
       libLF.log("Salvaging any strings streamed by MutRex before the timeout")
-      inputs = processMutRexOutput(tmo.stdout.decode('utf-8'))
-    except Exception:
-      pass
+      inputs = processMutRexOutput(out)
+    elif rc == 0:
+      inputs = processMutRexOutput(out)
   except Exception as err:
     libLF.log('Exception: ' + str(err))
   return inputs
@@ -32,24 +32,16 @@ MUTATE_PROBABILITY = 10
 
 def getReScueInputs(pattern, timeout):
   """Return inputs: str[]"""
-  # Use subprocess.run directly instead of libLF.runcmd because the regex is delivered on command line
-  # and might be unescaped, contain newlines, etc.
-  # Also, we want to be able to capture stderr cleanly with a timeout.
-  libLF.log('Command: ' + str(["java", "-jar", RESCUE_PATH, "--regex", pattern, "--crossPossibility", CROSSOVER_PROBABILITY, "--mutatePossibility", MUTATE_PROBABILITY]))
-
-  rc = 0
-  try:
-    tmo = None if timeout < 0 else timeout
-    completedProcess = subprocess.run(
-      ["java", "-jar", RESCUE_PATH, "--regex", pattern, "--crossPossibility", str(CROSSOVER_PROBABILITY), "--mutatePossibility", str(MUTATE_PROBABILITY)],
-      stderr=subprocess.PIPE, timeout=tmo)
-    outputToUse = completedProcess.stderr.decode('utf-8')
-    rc = completedProcess.returncode
-  except subprocess.TimeoutExpired as to:
+  # The regex is delivered on the command line and might be unescaped, contain newlines, etc.
+  argv = ["--regex", pattern, "--crossPossibility", str(CROSSOVER_PROBABILITY), "--mutatePossibility", str(MUTATE_PROBABILITY)]
+  libLF.log('ReScue args: ' + str(argv))
+
+  # In the JVM generator server if it is running, else java -jar
+  rc, out, outputToUse, timedOut = libLF.runJarGenerator('rescue', RESCUE_PATH, argv, timeout)
+  if timedOut:
     libLF.log("Timeout, let's see if we can salvage using the stderr stream")
-    outputToUse = to.stderr.decode('utf-8')
 
-  if rc == 0:
+  if timedOut or rc == 0:
     try:
       return processReScueOutput(outputToUse)
     except Exception as err:
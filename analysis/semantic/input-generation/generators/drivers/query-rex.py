@@ -14,12 +14,15 @@ import argparse
 import shutil
 import itertools
 import json
+import time
+import concurrent.futures
 
 ################
 # Dependencies
 ################
 
 WINE_PATH = shutil.which("wine")
+WINESERVER_PATH = shutil.which("wineserver") # Optional, see startWineServer
 REX_PATH = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin', 'RexInputGenerator.exe')
 libLF.checkShellDependencies([REX_PATH, WINE_PATH], mustBeExecutable=False)
 
@@ -45,63 +48,117 @@ encodings = ['ASCII', 'Unicode']
 rexOptionsToTry = ['IgnoreCase','ECMAScript','CultureInvariant']
 rexOptionsPowerSet = list(itertools.chain.from_iterable(itertools.combinations(rexOptionsToTry, r) for r in range(len(rexOptionsToTry)+1)))
 
+# Most of the cost of a Rex query is wine startup, chiefly booting the wineserver.
+# A persistent wineserver is shared by every wine process (in this and other drivers)
+# until it has been idle this long.
+WINESERVER_PERSIST_SEC = 300
+
+# Regex-level parallelism runs many drivers at once, each with --parallel-modes wine processes.
+# Drivers share this many slots (libLF.parallel.NodeSemaphore) on the node.
+WINE_SEMAPHORE_NAME = 'rex-wine'
+
+# Exit code when --deadline cut some modes short. The output is usable, but depends on load,
+# so gen-input-for-regex.py does not cache it.
+DEADLINE_RC = 3
+
 ################
 # Helpers
 ################
 
-# This will run for each of a set of option combinations 
-def getRexInputs(pattern, seed, nInputs, timeout):
-  """Return stringsByProducer for use as an RPAI member"""
-  nModes = len(encodings) * len(rexOptionsPowerSet)
-  inputsPerMode = int(nInputs / nModes)
-
+def startWineServer():
+  """Start a persistent wineserver, or keep the running one alive. Best-effort."""
+  if WINESERVER_PATH is None:
+    libLF.log('No wineserver found; each Rex query will pay for wine startup')
+    return
+  try:
+    # Starts one if needed, else just updates the persistence of the running one.
+    rc = subprocess.run([WINESERVER_PATH, '-p{}'.format(WINESERVER_PERSIST_SEC)], timeout=60).returncode
+    libLF.log('wineserver -p{}: rc {}'.format(WINESERVER_PERSIST_SEC, rc))
+  except Exception as err:
+    libLF.log('Could not start a persistent wineserver: {}'.format(err))
+
+def getRexModes():
+  """Returns [(encoding, rexOptions), ...]: each way we run Rex on a regex"""
+  return [(encoding, rexOptions) for encoding in encodings for rexOptions in rexOptionsPowerSet]
+
+def getRexInputs(pattern, seed, nInputs, timeout, parallelModes, wineSemaphore, deadline=None):
+  """Return (stringsByProducer for use as an RPAI member, whether the deadline cut any mode short)
+
+  Runs Rex in each mode, up to parallelModes at a time, each holding a slot of wineSemaphore.
+  Each mode gets its own timeout, after which we keep whatever it has emitted.
+  deadline: time.time() by which every mode must finish, or None.
+    A mode still waiting for a slot then gets no inputs. One still running is stopped as if it timed out.
+  """
+  modes = getRexModes()
+  inputsPerMode = int(nInputs / len(modes))
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max(parallelModes, 1)) as executor:
+    futures = [executor.submit(getRexInputsInMode, pattern, seed, inputsPerMode, timeout, encoding, rexOptions, wineSemaphore, deadline)
+               for encoding, rexOptions in modes]
+
+  # Producers in mode order, however the modes finished
   stringsByProducer = {}
-  for encoding in encodings:
-    for rexOptions in rexOptionsPowerSet:
-
-      libLF.log("Encoding: {}".format(encoding))
-      libLF.log("Options: {}".format(rexOptions))
-
-      with tempfile.NamedTemporaryFile(prefix='GenInput-QueryRex-RegexFile-', suffix='.dat', delete=DELETE_TMP_FILES) as rexInFile, \
-          tempfile.NamedTemporaryFile(prefix='GenInput-QueryRex-ResponseFile-', suffix='.dat', delete=DELETE_TMP_FILES) as rexOutFile:
-
-        # Build input file
-        libLF.writeToFile(rexInFile.name, pattern)
-        # Build command to run
-        cmd = [WINE_PATH, REX_PATH,
-               "/regexfile:"+rexInFile.name, "/k:"+str(inputsPerMode),
-               "/encoding:"+encoding, "/seed:"+str(seed),
-               "/file:"+rexOutFile.name]
-        for opt in rexOptions:
-          cmd.append("/options:"+opt)
-        libLF.log('cmd: ' + " ".join(cmd))
-        #inputs = []
-        #producerName = 'rex-Encoding{}-Options{}'.format(encoding, '-'.join(rexOptions)) 
-        #stringsByProducer[producerName] = inputs
-        #continue
-
-        # Get inputs, guarded by a timeout
-        tmo = None if timeout < 0 else timeout
-        inputs = []
-        try:
-          completedProcess = subprocess.run(cmd, timeout=tmo)
-          rc = completedProcess.returncode
-          libLF.log("rc: " + str(rc))
-          if rc == 0:
-            inputs = processRexOutFile(rexOutFile.name)
-        except subprocess.TimeoutExpired:
-          libLF.log("Rex timed out")
-          try:
-            libLF.log("Salvaging any strings streamed by Rex before the timeout")
-            inputs = processRexOutFile(rexOutFile.name)
-          except Exception:
-            pass
-        except Exception as err:
-          libLF.log("Exception: " + str(err))
-        libLF.log("{} inputs from: encoding {} options {}".format(len(inputs), encoding, rexOptions))
-        producerName = 'rex-Encoding{}-Options{}'.format(encoding, '-'.join(rexOptions)) 
-        stringsByProducer[producerName] = inputs
-  return stringsByProducer
+  cutShort = False
+  for (encoding, rexOptions), future in zip(modes, futures):
+    producerName = 'rex-Encoding{}-Options{}'.format(encoding, '-'.join(rexOptions)) 
+    stringsByProducer[producerName], modeCutShort = future.result()
+    cutShort = cutShort or modeCutShort
+  return stringsByProducer, cutShort
+
+def getRexInputsInMode(pattern, seed, inputsPerMode, timeout, encoding, rexOptions, wineSemaphore, deadline=None):
+  """Return (the inputs Rex generates for pattern in this mode, whether the deadline cut it short)
+
+  The timeout starts once we hold a slot of wineSemaphore.
+  """
+  libLF.log("Encoding: {}".format(encoding))
+  libLF.log("Options: {}".format(rexOptions))
+
+  with tempfile.NamedTemporaryFile(prefix='GenInput-QueryRex-RegexFile-', suffix='.dat', delete=DELETE_TMP_FILES) as rexInFile, \
+      tempfile.NamedTemporaryFile(prefix='GenInput-QueryRex-ResponseFile-', suffix='.dat', delete=DELETE_TMP_FILES) as rexOutFile:
+
+    # Build input file
+    libLF.writeToFile(rexInFile.name, pattern)
+    # Build command to run
+    cmd = [WINE_PATH, REX_PATH,
+           "/regexfile:"+rexInFile.name, "/k:"+str(inputsPerMode),
+           "/encoding:"+encoding, "/seed:"+str(seed),
+           "/file:"+rexOutFile.name]
+    for opt in rexOptions:
+      cmd.append("/options:"+opt)
+    libLF.log('cmd: ' + " ".join(cmd))
+
+    # Get inputs, guarded by a timeout
+    tmo = None if timeout < 0 else timeout
+    cutShort = False
+    inputs = []
+    deadlineFirst = False
+    slot = wineSemaphore.acquire(None if deadline is None else max(deadline - time.time(), 0))
+    if slot is None:
+      libLF.log("No wine slot before the deadline: skipping encoding {} options {}".format(encoding, rexOptions))
+      return inputs, True
+    try:
+      if deadline is not None and (tmo is None or deadline - time.time() < tmo):
+        tmo = max(deadline - time.time(), 0)
+        deadlineFirst = True
+      completedProcess = subprocess.run(cmd, timeout=tmo)
+      rc = completedProcess.returncode
+      libLF.log("rc: " + str(rc))
+      if rc == 0:
+        inputs = processRexOutFile(rexOutFile.name)
+    except subprocess.TimeoutExpired:
+      libLF.log("Rex hit the deadline" if deadlineFirst else "Rex timed out")
+      cutShort = deadlineFirst
+      try:
+        libLF.log("Salvaging any strings streamed by Rex before the timeout")
+        inputs = processRexOutFile(rexOutFile.name)
+      except Exception:
+        pass
+    except Exception as err:
+      libLF.log("Exception: " + str(err))
+    finally:
+      wineSemaphore.release(slot)
+    libLF.log("{} inputs from: encoding {} options {}".format(len(inputs), encoding, rexOptions))
+    return inputs, cutShort
 
 def processRexOutFile(rawRexFile):
   inputs = set()
@@ -121,40 +178,58 @@ def processRexOutFile(rawRexFile):
 # Main
 ################
       
-def main(regexFile, outFile, seed, nInputs, timeout):
-  libLF.log('regexFile {} outFile {} seed {} nInputs {} timeout {}' \
-    .format(regexFile, outFile, seed, nInputs, timeout))
+def main(regexFile, outFile, seed, nInputs, timeout, parallelModes, maxWineProcesses, deadline):
+  libLF.log('regexFile {} outFile {} seed {} nInputs {} timeout {} parallelModes {} maxWineProcesses {} deadline {}' \
+    .format(regexFile, outFile, seed, nInputs, timeout, parallelModes, maxWineProcesses, deadline))
 
-  # Get the libLF.Regex
+  # Get the libLF.Regex's. Usually one, but a batch saves on startup costs.
   with open(regexFile, 'r') as inStream:
-    regex = libLF.Regex().initFromNDJSON(inStream.read())
-  libLF.log('Generating inputs for regex /{}/'.format(regex.pattern))
-  
-  # Query Rex
-  stringsByProducer = getRexInputs(regex.pattern, seed, nInputs, timeout)
-
-  # Emit
-  rpai = libLF.RegexPatternAndInputs().initFromRaw(regex.pattern, stringsByProducer)
-  libLF.log('Rex generated {} unique inputs for regex /{}/ ({} including duplicates)' \
-    .format(len(rpai.getUniqueInputs()), regex.pattern, rpai.getNTotalInputs()))
+    regexes = [libLF.Regex().initFromNDJSON(line) for line in inStream.read().split('\n') if len(line.strip())]
+  libLF.log('Generating inputs for {} regexes'.format(len(regexes)))
+
+  startWineServer()
+  wineSemaphore = libLF.parallel.NodeSemaphore(WINE_SEMAPHORE_NAME, maxWineProcesses)
+
+  # Emit each regex's inputs as soon as we have them, so a crash loses only the regex in progress
+  anyCutShort = False
   with open(outFile, 'w') as outStream:
-    outStream.write(rpai.toNDJSON())
+    for regex in regexes:
+      libLF.log('Generating inputs for regex /{}/'.format(regex.pattern))
+      # Query Rex
+      stringsByProducer, cutShort = getRexInputs(regex.pattern, seed, nInputs, timeout, parallelModes, wineSemaphore, deadline)
+      anyCutShort = anyCutShort or cutShort
+
+      rpai = libLF.RegexPatternAndInputs().initFromRaw(regex.pattern, stringsByProducer)
+      libLF.log('Rex generated {} unique inputs for regex /{}/ ({} including duplicates)' \
+        .format(len(rpai.getUniqueInputs()), regex.pattern, rpai.getNTotalInputs()))
+      outStream.write(rpai.toNDJSON() + '\n')
+      outStream.flush()
+
+  if anyCutShort:
+    libLF.log('The deadline cut some modes short')
+    sys.exit(DEADLINE_RC)
 
 ################################
 
 # Parse args
 parser = argparse.ArgumentParser(description='Given a libLF.Regex, ask Rex for inputs to try')
-parser.add_argument('--regex-file', help='File containing a libLF.Regex', required=True,
+parser.add_argument('--regex-file', help='File containing a libLF.Regex, or several (NDJSON) to query them all with one driver', required=True,
   dest='regexFile')
-parser.add_argument('--out-file', type=str, help='Out: File of one libLF.RegexPatternAndInputs object containing the inputs found using rex', required=True,
+parser.add_argument('--out-file', type=str, help='Out: File of one libLF.RegexPatternAndInputs object per regex (NDJSON, in the same order) containing the inputs found using rex', required=True,
   dest='outFile')
 parser.add_argument('--seed', type=int, help='Seed to use for reproducibility (default: random)', required=False, default=-1,
   dest='seed')
 parser.add_argument('--num-inputs', type=int, help='Rough estimate of the total number of input strings to create, divided across various modes (default: 1K)', required=False, default=1000,
   dest='nInputs')
-parser.add_argument('--timeout', type=float, help='Maximum time to run for, in seconds (default 30, -1 means no limit)', required=False, default=30,
+parser.add_argument('--timeout', type=float, help='Maximum time to run each mode for, in seconds (default 30, -1 means no limit)', required=False, default=30,
   dest='timeout')
+parser.add_argument('--parallel-modes', type=int, help='Run Rex in this many encoding/option modes at once (default: all {})'.format(len(getRexModes())), required=False, default=len(getRexModes()),
+  dest='parallelModes')
+parser.add_argument('--max-wine-processes', type=int, help='Maximum Rex (wine) processes to run at once on this node, across every query-rex.py (default: #CPUs)', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
+  dest='maxWineProcesses')
+parser.add_argument('--deadline', type=float, help='Finish by this time (seconds since the epoch). Modes still waiting for wine then get no inputs, and running ones stop as at --timeout. If any did, we exit {} after writing OUT_FILE (default: no deadline)'.format(DEADLINE_RC), required=False, default=None,
+  dest='deadline')
 
 args = parser.parse_args()
 # Here we go!
-main(args.regexFile, args.outFile, args.seed, args.nInputs, args.timeout) 
+main(args.regexFile, args.outFile, args.seed, args.nInputs, args.timeout, args.parallelModes, args.maxWineProcesses, args.deadline)
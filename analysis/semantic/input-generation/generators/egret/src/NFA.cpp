@@ -32,7 +32,8 @@
 using namespace std;
 
 // TODO: No location information for epsilon edge.  OK?
-static Edge EPSILON = Edge(EPSILON_EDGE);
+// Edges are marked as processed, so each thread gets its own
+static thread_local Edge EPSILON = Edge(EPSILON_EDGE);
 
 NFA::NFA(unsigned int _size, unsigned int _initial, unsigned int  _final)
 {
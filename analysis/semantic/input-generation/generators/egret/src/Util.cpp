@@ -24,8 +24,8 @@
 #include "Util.h"
 using namespace std;
 
-// global static pointer for singleton class
-Util* Util::inst = NULL;
+// per-thread static pointer for singleton class
+thread_local Util* Util::inst = NULL;
 
 Util *
 Util::get() 
@@ -88,7 +88,7 @@ public:
 // TODO: Possibly create a new regex class where the "fixing" functions reside?
 private:
   Util() {};            // singleton class, private constructor
-  static Util *inst;
+  static thread_local Util *inst;  // one per thread, so threads can run the engine concurrently
 
   // Global options
   bool check_mode;
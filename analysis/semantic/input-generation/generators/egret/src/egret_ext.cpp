@@ -27,6 +27,40 @@ using namespace std;
 
 static PyObject *EgretExtError;
 
+// Run the engine, reporting unexpected C++ exceptions as EGRET errors.
+// Does not touch Python objects, so it may run without the GIL.
+static vector <string>
+run_engine_safely(string regex, string base_substring,
+    bool check_mode, bool web_mode, bool debug_mode, bool stat_mode)
+{
+  try {
+    return run_engine(regex, base_substring, check_mode, web_mode, debug_mode, stat_mode);
+  }
+  catch (exception const &e) {
+    vector <string> result;
+    result.push_back(string("ERROR (internal error): ") + e.what());
+    return result;
+  }
+}
+
+// Returns a new list of str, or NULL with an exception set
+static PyObject *
+to_list(const vector <string> &strs)
+{
+  PyObject *list = PyList_New(strs.size());
+  if (list == NULL)
+    return NULL;
+  for (size_t i = 0; i < strs.size(); i++) {
+    PyObject *str = PyUnicode_FromString(strs[i].c_str());
+    if (str == NULL) {
+      Py_DECREF(list);
+      return NULL;
+    }
+    PyList_SET_ITEM(list, i, str);  // steals the reference
+  }
+  return list;
+}
+
 static PyObject *
 egret_run(PyObject *self, PyObject *args)
 {
@@ -41,20 +75,85 @@ egret_run(PyObject *self, PyObject *args)
         &check_mode, &web_mode, &debug_mode, &stat_mode))
     return NULL;
 
-  vector <string> tests =
-    run_engine(regex, base_substring, check_mode, web_mode, debug_mode, stat_mode);
+  string regex_str(regex);
+  string base_str(base_substring);
+  vector <string> tests;
+
+  // The engine can take a while. Let other Python threads run.
+  Py_BEGIN_ALLOW_THREADS
+  tests = run_engine_safely(regex_str, base_str, check_mode, web_mode, debug_mode, stat_mode);
+  Py_END_ALLOW_THREADS
+
+  return to_list(tests);
+}
+
+static PyObject *
+egret_run_batch(PyObject *self, PyObject *args)
+{
+  PyObject *regexes;
+  const char *base_substring;
+  int check_mode;
+  int web_mode;
+  int debug_mode;
+  int stat_mode;
+
+  if (!PyArg_ParseTuple(args, "Ospppp", &regexes, &base_substring,
+        &check_mode, &web_mode, &debug_mode, &stat_mode))
+    return NULL;
+
+  // Copy the patterns out while we hold the GIL
+  PyObject *seq = PySequence_Fast(regexes, "run_batch: regexes must be a sequence of str");
+  if (seq == NULL)
+    return NULL;
+  vector <string> regex_strs;
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  for (Py_ssize_t i = 0; i < n; i++) {
+    Py_ssize_t len;
+    const char *regex = PyUnicode_AsUTF8AndSize(PySequence_Fast_GET_ITEM(seq, i), &len);
+    if (regex == NULL) {
+      Py_DECREF(seq);
+      return NULL;
+    }
+    regex_strs.push_back(string(regex, len));
+  }
+  Py_DECREF(seq);
+
+  string base_str(base_substring);
+  vector <vector <string> > results;
 
-  PyObject *list = PyList_New(0);
+  Py_BEGIN_ALLOW_THREADS
   vector <string>::iterator it;
-  for (it = tests.begin(); it != tests.end(); it++) {
-    PyList_Append(list, PyUnicode_FromString((*it).c_str()));
+  for (it = regex_strs.begin(); it != regex_strs.end(); it++) {
+    results.push_back(run_engine_safely(*it, base_str, check_mode, web_mode, debug_mode, stat_mode));
   }
+  Py_END_ALLOW_THREADS
 
+  PyObject *list = PyList_New(results.size());
+  if (list == NULL)
+    return NULL;
+  for (size_t i = 0; i < results.size(); i++) {
+    PyObject *tests = to_list(results[i]);
+    if (tests == NULL) {
+      // One bad result should not sink the batch
+      PyErr_Clear();
+      vector <string> error;
+      error.push_back("ERROR (internal error): EGRET generated a string that is not valid UTF-8");
+      tests = to_list(error);
+      if (tests == NULL) {
+        Py_DECREF(list);
+        return NULL;
+      }
+    }
+    PyList_SET_ITEM(list, i, tests);  // steals the reference
+  }
   return list;
 }
 
 static PyMethodDef EgretExtMethods[] = {
   {"run", egret_run, METH_VARARGS, "Run EGRET."},
+  {"run_batch", egret_run_batch, METH_VARARGS,
+   "Run EGRET on each of a sequence of regexes. Returns a list of run() results, in order.\n"
+   "Releases the GIL while the engine runs, so threads may run batches concurrently."},
   {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
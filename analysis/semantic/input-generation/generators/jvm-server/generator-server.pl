@@ -0,0 +1,39 @@
+#!/usr/bin/env perl
+# Launch the JVM server for the jar-based input generators (Brics, ReScue, MutRex).
+# Usage: generator-server.pl [--port P] [--slots N]
+
+use strict;
+use warnings;
+
+use File::Basename;
+use File::Spec;
+use Cwd qw(abs_path);
+
+# The dirname() thing will only work if this script is invoked directly, not via symlink
+my $toolDirname = dirname(abs_path($0));
+my $jar = File::Spec->catfile($toolDirname, "target", "generator-server-1.0-shaded.jar");
+
+my $binDir = File::Spec->catdir($ENV{ECOSYSTEM_REGEXP_PROJECT_ROOT}, "bin");
+my @generators = (
+  "brics=" . File::Spec->catfile($binDir, "BricsInputGenerator.jar"),
+  "rescue=" . File::Spec->catfile($binDir, "ReScueInputGenerator.jar"),
+  "mutrex=" . File::Spec->catfile($binDir, "MutRexInputGenerator.jar"),
+);
+
+# The server stops runaway generators with Thread.stop, which Java 20 removed,
+# and traps System.exit from the generators with a SecurityManager.
+# From Java 12 on, the JVM only lets us install one if asked to.
+my $maxJavaVersion = 19;
+my @jvmFlags = ();
+my $versionOut = `java -version 2>&1`;
+if ($versionOut =~ m/version "(?:1\.)?(\d+)/) {
+  my $javaVersion = $1;
+  if ($maxJavaVersion < $javaVersion) {
+    die "$0: Java $javaVersion cannot stop a runaway generator. Use Java 8-$maxJavaVersion, or do without the server (the drivers run java -jar)\n";
+  }
+  if (12 <= $javaVersion) {
+    push @jvmFlags, "-Djava.security.manager=allow";
+  }
+}
+
+exec("java", @jvmFlags, "-jar", $jar, (map { ("--generator", $_) } @generators), @ARGV);
@@ -0,0 +1,442 @@
+package InputGenerators;
+
+/* A long-lived JVM that hosts the jar-based input generators (Brics, ReScue, MutRex).
+ *
+ * Running "java -jar GENERATOR.jar ARGS" once per regex pays for JVM startup and JIT warmup every time.
+ * Instead, this server loads each generator jar once and calls its main(ARGS) per request,
+ * capturing what it prints to stdout and stderr.
+ *
+ * Protocol: NDJSON over TCP on localhost, one request line and one response line at a time per connection.
+ *   Request:  { "generator": "brics", "argv": [ ... ], "timeout": 10 }
+ *             argv is what follows "java -jar GENERATOR.jar" on the command line.
+ *             timeout is in seconds; negative means no limit.
+ *   Response: { "generator": "brics", "exitCode": 0, "timedOut": false, "stdout": "...", "stderr": "...", "error": null }
+ *             On a timeout, stdout and stderr hold whatever the generator printed before it was stopped.
+ *             error is set if the request could not be run at all (e.g. unknown generator).
+ *
+ * Each generator has several slots. A slot is a private class loader for the jar,
+ * so concurrent requests do not share the generator's static state.
+ * A slot whose generator will not stop after a timeout is discarded and replaced.
+ *
+ * Stopping a generator needs Thread.stop (gone in Java 20), and trapping its System.exit needs
+ * a SecurityManager (gone in Java 24). Without them one runaway or exiting generator would take down
+ * the requests of every client, so on such a JVM the server refuses to start, and clients use the CLI.
+ */
+
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.io.OutputStreamWriter;
+import java.io.UnsupportedEncodingException;
+import java.io.File;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.HashMap;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.concurrent.ArrayBlockingQueue;
+import java.util.concurrent.BlockingQueue;
+import java.util.concurrent.atomic.AtomicInteger;
+import java.util.jar.JarFile;
+
+/* I/O. */
+import com.google.gson.Gson;
+
+public class GeneratorServer {
+  static final int DEFAULT_PORT = 7349;
+  static final int DEFAULT_SLOTS = Runtime.getRuntime().availableProcessors();
+  /* After a timeout, how long to wait for the generator to notice an interrupt or stop(). */
+  static final long STOP_GRACE_MS = 1000;
+  /* Runaway generator threads burn CPU forever. Past this many, exit; clients fall back to the CLI. */
+  static final int MAX_LEAKED_THREADS = 16;
+  /* The last Java with a working Thread.stop */
+  static final int MAX_JAVA_VERSION = 19;
+
+  /* The output streams of the request running on this thread (and the threads it starts), if any. */
+  static final InheritableThreadLocal<Capture> capture = new InheritableThreadLocal<Capture>();
+  static final AtomicInteger nLeakedThreads = new AtomicInteger(0);
+
+  public static void main(String[] args)
+    throws IOException
+  {
+    int port = DEFAULT_PORT;
+    int nSlots = DEFAULT_SLOTS;
+    Map<String, String> name2jar = new LinkedHashMap<String, String>();
+    for (int i = 0; i < args.length; i++) {
+      if (args[i].equals("--port") && i + 1 < args.length) {
+        port = Integer.parseInt(args[++i]);
+      } else if (args[i].equals("--slots") && i + 1 < args.length) {
+        nSlots = Integer.parseInt(args[++i]);
+      } else if (args[i].equals("--generator") && i + 1 < args.length) {
+        // NAME=JAR
+        String[] nameAndJar = args[++i].split("=", 2);
+        if (nameAndJar.length != 2) {
+          usage();
+        }
+        name2jar.put(nameAndJar[0], nameAndJar[1]);
+      } else {
+        usage();
+      }
+    }
+    if (name2jar.isEmpty() || nSlots < 1) {
+      usage();
+    }
+    int javaVersion = javaFeatureVersion();
+    if (MAX_JAVA_VERSION < javaVersion) {
+      log(String.format("Java %d cannot stop a runaway generator (no Thread.stop). Use Java 8-%d.", javaVersion, MAX_JAVA_VERSION));
+      System.exit(2);
+    }
+    Map<String, Generator> name2generator = new HashMap<String, Generator>();
+    for (Map.Entry<String, String> e : name2jar.entrySet()) {
+      name2generator.put(e.getKey(), new Generator(e.getKey(), e.getValue(), nSlots));
+    }
+
+    installStreamsAndExitTrap();
+
+    ServerSocket server = new ServerSocket(port, 50, InetAddress.getLoopbackAddress());
+    log(String.format("listening on localhost:%d with %d slots for each of %s", port, nSlots, name2generator.keySet()));
+    while (true) {
+      Socket client = server.accept();
+      Thread t = new Thread(() -> serve(client, name2generator));
+      t.setDaemon(true);
+      t.start();
+    }
+  }
+
+  /* 8 for "1.8", 17 for "17" */
+  static int javaFeatureVersion() {
+    String v = System.getProperty("java.specification.version");
+    if (v.startsWith("1.")) {
+      v = v.substring(2);
+    }
+    int dot = v.indexOf('.');
+    return Integer.parseInt(dot < 0 ? v : v.substring(0, dot));
+  }
+
+  static void usage() {
+    System.out.println("Usage: INVOCATION --generator NAME=JAR [--generator NAME=JAR ...] [--port P] [--slots N]");
+    System.exit(-1);
+  }
+
+  /* Answer one NDJSON request per line until the client hangs up. */
+  static void serve(Socket client, Map<String, Generator> name2generator) {
+    Gson gson = new Gson();
+    try (Socket s = client;
+         BufferedReader reader = new BufferedReader(new InputStreamReader(s.getInputStream(), StandardCharsets.UTF_8));
+         PrintWriter writer = new PrintWriter(new OutputStreamWriter(s.getOutputStream(), StandardCharsets.UTF_8))) {
+      String line;
+      while ((line = reader.readLine()) != null) {
+        if (line.trim().isEmpty()) {
+          continue;
+        }
+        Response response;
+        try {
+          Request request = gson.fromJson(line, Request.class);
+          Generator generator = name2generator.get(request.generator);
+          if (generator == null) {
+            response = Response.error(request.generator, "Unknown generator " + request.generator);
+          } else {
+            response = generator.run(request);
+          }
+        } catch (Exception e) {
+          response = Response.error(null, e.toString());
+        }
+        writer.println(gson.toJson(response));
+        writer.flush();
+      }
+    } catch (IOException e) {
+      log("client: " + e);
+    }
+  }
+
+  /* Route System.out and System.err to the Capture of the current thread, and trap System.exit from generators. */
+  static void installStreamsAndExitTrap()
+    throws UnsupportedEncodingException
+  {
+    System.setOut(new PrintStream(new RoutingStream(System.out, false), true, "UTF-8"));
+    System.setErr(new PrintStream(new RoutingStream(System.err, true), true, "UTF-8"));
+
+    try {
+      System.setSecurityManager(new ExitTrap());
+    } catch (UnsupportedOperationException | SecurityException e) {
+      // Java 24+ has no SecurityManager, and 18+ needs -Djava.security.manager=allow.
+      // A generator that calls System.exit (ReScue does) would take us down.
+      log("Cannot trap System.exit, refusing to serve: " + e);
+      System.exit(2);
+    }
+  }
+
+  static void log(String msg) {
+    System.err.println("GeneratorServer: " + msg);
+  }
+
+  /****************
+   * Generators
+   ****************/
+
+  static class Generator {
+    final String name;
+    final String jar;
+    final BlockingQueue<Slot> slots;
+
+    Generator(String name, String jar, int nSlots)
+      throws IOException
+    {
+      this.name = name;
+      this.jar = jar;
+      this.slots = new ArrayBlockingQueue<Slot>(nSlots);
+      for (int i = 0; i < nSlots; i++) {
+        slots.add(new Slot(jar));
+      }
+    }
+
+    Response run(Request request)
+      throws Exception
+    {
+      Slot slot = slots.take();
+      boolean keepSlot = true;
+      Capture c = new Capture();
+      int[] exitCode = { 0 };
+      try {
+        Thread t = new Thread(() -> {
+          capture.set(c);
+          exitCode[0] = slot.runMain(request.argv == null ? new String[0] : request.argv, c);
+        });
+        t.setContextClassLoader(slot.loader);
+        t.setDaemon(true);
+        t.start();
+        if (request.timeout < 0) {
+          t.join();
+        } else {
+          t.join(Math.max((long) (request.timeout * 1000), 1));
+        }
+
+        boolean timedOut = t.isAlive();
+        if (timedOut) {
+          keepSlot = stop(t);
+        }
+        return new Response(name, timedOut ? -1 : exitCode[0], timedOut, c.stdout(), c.stderr());
+      } finally {
+        slots.add(keepSlot ? slot : replace(slot));
+      }
+    }
+
+    Slot replace(Slot slot) {
+      try {
+        return new Slot(jar);
+      } catch (IOException e) {
+        log(String.format("%s: cannot make a new slot, reusing the old one: %s", name, e));
+        return slot;
+      }
+    }
+
+    /* Stop a timed-out generator. Returns true if its slot is safe to reuse. */
+    @SuppressWarnings("deprecation")
+    boolean stop(Thread t)
+      throws InterruptedException
+    {
+      t.interrupt();
+      t.join(STOP_GRACE_MS);
+      if (t.isAlive()) {
+        // main() made sure that this JVM still has it
+        t.stop();
+        t.join(STOP_GRACE_MS);
+      }
+      if (t.isAlive()) {
+        int nLeaked = nLeakedThreads.incrementAndGet();
+        log(String.format("%s: abandoning a generator thread that will not stop (%d so far)", name, nLeaked));
+        if (MAX_LEAKED_THREADS < nLeaked) {
+          log("Too many runaway generator threads, exiting");
+          Runtime.getRuntime().halt(1);
+        }
+      }
+      // Even a stopped generator may have left its static state inconsistent
+      return false;
+    }
+  }
+
+  /* A private instance of a generator jar */
+  static class Slot {
+    final URLClassLoader loader;
+    final Method main;
+
+    Slot(String jar)
+      throws IOException
+    {
+      String mainClass;
+      try (JarFile jf = new JarFile(jar)) {
+        mainClass = jf.getManifest().getMainAttributes().getValue("Main-Class");
+      }
+      // Parent is the bootstrap loader, so the jars do not see each other (or gson)
+      this.loader = new URLClassLoader(new URL[] { new File(jar).toURI().toURL() }, null);
+      try {
+        this.main = loader.loadClass(mainClass).getMethod("main", String[].class);
+      } catch (ClassNotFoundException | NoSuchMethodException e) {
+        throw new IOException("Cannot find main in " + mainClass + " in " + jar, e);
+      }
+    }
+
+    /* Returns the exit code, as if the generator ran as a process. */
+    int runMain(String[] argv, Capture c) {
+      try {
+        main.invoke(null, (Object) argv);
+        return 0;
+      } catch (InvocationTargetException e) {
+        Throwable cause = e.getCause();
+        if (cause instanceof ExitTrappedException) {
+          return ((ExitTrappedException) cause).status;
+        }
+        // An uncaught exception in main: the JVM would print it and exit 1
+        StringWriter sw = new StringWriter();
+        cause.printStackTrace(new PrintWriter(sw));
+        c.appendStderr(sw.toString());
+        return 1;
+      } catch (ExitTrappedException e) {
+        return e.status;
+      } catch (ThreadDeath e) {
+        return -1;
+      } catch (Exception e) {
+        c.appendStderr(e.toString());
+        return 1;
+      }
+    }
+  }
+
+  /****************
+   * Output capture and exit trapping
+   ****************/
+
+  static class Capture {
+    final ByteArrayOutputStream out = new ByteArrayOutputStream();
+    final ByteArrayOutputStream err = new ByteArrayOutputStream();
+
+    synchronized void write(boolean isErr, byte[] b, int off, int len) {
+      (isErr ? err : out).write(b, off, len);
+    }
+
+    synchronized void appendStderr(String s) {
+      byte[] b = s.getBytes(StandardCharsets.UTF_8);
+      err.write(b, 0, b.length);
+    }
+
+    synchronized String stdout() {
+      return new String(out.toByteArray(), StandardCharsets.UTF_8);
+    }
+
+    synchronized String stderr() {
+      return new String(err.toByteArray(), StandardCharsets.UTF_8);
+    }
+  }
+
+  /* Writes to the Capture of the current thread, or else to the real stream */
+  static class RoutingStream extends OutputStream {
+    final OutputStream real;
+    final boolean isErr;
+
+    RoutingStream(OutputStream real, boolean isErr) {
+      this.real = real;
+      this.isErr = isErr;
+    }
+
+    @Override
+    public void write(int b)
+      throws IOException
+    {
+      write(new byte[] { (byte) b }, 0, 1);
+    }
+
+    @Override
+    public void write(byte[] b, int off, int len)
+      throws IOException
+    {
+      Capture c = capture.get();
+      if (c != null) {
+        c.write(isErr, b, off, len);
+      } else {
+        real.write(b, off, len);
+      }
+    }
+
+    @Override
+    public void flush()
+      throws IOException
+    {
+      if (capture.get() == null) {
+        real.flush();
+      }
+    }
+  }
+
+  static class ExitTrappedException extends SecurityException {
+    final int status;
+
+    ExitTrappedException(int status) {
+      super("System.exit(" + status + ")");
+      this.status = status;
+    }
+  }
+
+  /* Permits everything, except System.exit from a generator */
+  static class ExitTrap extends SecurityManager {
+    @Override
+    public void checkPermission(Permission perm) {
+    }
+
+    @Override
+    public void checkPermission(Permission perm, Object context) {
+    }
+
+    @Override
+    public void checkExit(int status) {
+      if (capture.get() != null) {
+        throw new ExitTrappedException(status);
+      }
+    }
+  }
+
+  /****************
+   * Protocol
+   ****************/
+
+  static class Request {
+    String generator;
+    String[] argv;
+    double timeout = -1;
+  }
+
+  static class Response {
+    String generator;
+    int exitCode;
+    boolean timedOut;
+    String stdout;
+    String stderr;
+    String error;
+
+    Response(String generator, int exitCode, boolean timedOut, String stdout, String stderr) {
+      this.generator = generator;
+      this.exitCode = exitCode;
+      this.timedOut = timedOut;
+      this.stdout = stdout;
+      this.stderr = stderr;
+      this.error = null;
+    }
+
+    static Response error(String generator, String error) {
+      Response r = new Response(generator, -1, false, "", "");
+      r.error = error;
+      return r;
+    }
+  }
+}
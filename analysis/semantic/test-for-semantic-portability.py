@@ -19,81 +19,103 @@ import subprocess
 ##########
 
 DELETE_TMP_FILES = True
-MAX_REGEX_QUERY_TIME_SEC = 30 # Querying a lot of inputs is still quite fast. Any timeouts are due to SL behavior.
+# The testers give up on any one input after --timeout-per-input seconds, and report it as timedOut.
+# In case a tester wedges anyway, we kill it after this many seconds, plus --timeout-per-input for each input.
+QUERY_TIMEOUT_BASE_SEC = 30
 
 # Dependencies
 INPUT_GENERATOR = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin', 'gen-input-for-regex.py')
 libLF.log('Config:\n  INPUT_GENERATOR {}'.format(INPUT_GENERATOR))
 
-langCLIDir = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin')
-lang2cli = {
-  'go':     os.path.join(langCLIDir, 'check-regex-behavior-in-go'),
-  'java':   os.path.join(langCLIDir, 'check-regex-behavior-in-java.pl'),
-  'javascript':   os.path.join(langCLIDir, 'check-regex-behavior-in-node.js'),
-  'perl':   os.path.join(langCLIDir, 'check-regex-behavior-in-perl.pl'),
-  'php':    os.path.join(langCLIDir, 'check-regex-behavior-in-php.php'),
-  'python': os.path.join(langCLIDir, 'check-regex-behavior-in-python.py'),
-  'ruby':   os.path.join(langCLIDir, 'check-regex-behavior-in-ruby.rb'),
-  'rust':   os.path.join(langCLIDir, 'check-regex-behavior-in-rust'),
-}
+lang2cli = libLF.RegexTesterPool.LANG2CLI
 libLF.log('Config:\n  language CLIs: {}'.format(json.dumps(lang2cli)))
 
 libLF.checkShellDependencies([INPUT_GENERATOR] + list(lang2cli.values()))
 
-class MyTask(libLF.parallel.ParallelTask):
-  def __init__(self, regex, maxInputsPerGenerator, rngSeed, timeoutPerGenerator):
+class MyTask(libLF.parallel.PipelineTask):
+  def __init__(self, regex, maxInputsPerGenerator, rngSeed, timeoutPerGenerator, cache, inputsPerClass, auditReduction,
+               adaptiveSample, adaptiveMinAgreement, timeoutPerInput):
     self.regex = regex
     self.maxInputsPerGenerator = maxInputsPerGenerator
     self.rngSeed = rngSeed
     self.timeoutPerGenerator = timeoutPerGenerator
-
-  def _queryRegexInLang(self, pattern, queryFile, language):
+    self.cache = cache
+    # Input reduction: keep inputsPerClass inputs per behavioral signature (-1: no reduction)
+    self.inputsPerClass = inputsPerClass
+    # Audit: test every input anyway, and report whether the reduced inputs find the same witnesses
+    self.auditReduction = auditReduction
+    # The reduced inputs, when auditing
+    self.reducedInputs = None
+    # Adaptive testing: first test adaptiveSample inputs per generator (-1: test every input at once)
+    self.adaptiveSample = adaptiveSample
+    self.adaptiveMinAgreement = adaptiveMinAgreement
+    # producer -> the inputs from it that we may test. Set by _getInputs.
+    self.producer2inputs = {}
+    # The inputs to test, if prepare() got them already
+    self.inputs = None
+    # Per-input match deadline in the testers, in seconds
+    self.timeoutPerInput = timeoutPerInput
+    # lang -> inputs that timed out in it
+    self.lang2timedOutInputs = {}
+
+  def _queryRegexInLang(self, pattern, testStrings, language):
     """Query behavior of <pattern, input[]> in language
 
     pattern: str: regex pattern
-    queryFile: str: name of file containing the query to use
+    testStrings: str[]: inputs to try
     language: str: name of language to test in
 
     @returns libLF.RegexEvaluationResult[]
-    May throw a timeout exception
+      Inputs that timed out get no result. They are recorded in lang2timedOutInputs.
+    May throw a timeout exception, if the tester wedges
     """
     language = language.lower()
-    driver = lang2cli[language]
-
-    # The output can be quite verbose when using lists of inputs,
-    # so redirect to a temp file to ensure buffering and piping aren't problematic
-    # in the shell. 
-    with tempfile.NamedTemporaryFile(prefix='SemanticAnalysis-queryRegexInLang-OutFile-', 
-                                     suffix='.json',
-                                     delete=DELETE_TMP_FILES) as outFile:
-      cmd = [driver, queryFile]
-      libLF.log("Command: {} > {}".format(" ".join(cmd), outFile.name))
+
+    queryResult = None
+    if self.cache is not None:
+      toolVersion = libLF.testerVersion(language)
+      cacheParams = { 'inputs': sorted(testStrings), 'timeoutPerInput': self.timeoutPerInput }
+      queryResult = self.cache.get('semantic', pattern, language, toolVersion, cacheParams)
+      # Caches from before we stopped caching timeouts may still have some. Query again.
+      if queryResult is not None and any(result.get('timedOut') for result in queryResult['results']):
+        queryResult = None
+
+    if queryResult is None:
+      # The language's tester daemon stays warm across queries from this worker.
       # This may throw -- catch higher up
-      completedProcess = subprocess.run(cmd, stdout=outFile, stderr=subprocess.DEVNULL, timeout=MAX_REGEX_QUERY_TIME_SEC)
-      outFile.seek(0) # Rewind so we can read
-
-      libLF.log("language {} rc {}".format(language, completedProcess.returncode))
-      if completedProcess.returncode == 0:
-        queryResult = json.loads(outFile.read().decode('utf-8'))
-
-        rers = []
-        for result in queryResult["results"]:
-          matched = result["matched"]
-          if matched:
-            rawMC = result["matchContents"]
-          else:
-            rawMC = { "matchedString": "", "captureGroups": [] }
-
-          mc = libLF.MatchContents().initFromRaw(rawMC["matchedString"], rawMC["captureGroups"])
-          matchResult = libLF.MatchResult().initFromRaw(matched, mc)
-          rer = libLF.RegexEvaluationResult(pattern, result["input"], language, matchResult)
-          rers.append(rer)
-        return rers
+      backstop = QUERY_TIMEOUT_BASE_SEC + len(testStrings) * self.timeoutPerInput
+      queryResult = libLF.regexTesterPool().query(language, pattern, testStrings,
+        timeout=backstop, timeoutPerInput=self.timeoutPerInput)
+      # Whether an input times out depends on the machine's load. Cached, a timeout would come back in every later run.
+      if self.cache is not None and not any(result.get('timedOut') for result in queryResult['results']):
+        self.cache.put('semantic', pattern, language, toolVersion, cacheParams,
+          { 'validPattern': queryResult['validPattern'], 'results': queryResult['results'] })
+    libLF.log("language {} validPattern {}".format(language, queryResult["validPattern"]))
+
+    rers = []
+    for result in queryResult["results"]:
+      if result.get("timedOut"):
+        # Not a match result. It must not look like a difference from the languages that finished.
+        self.lang2timedOutInputs.setdefault(language, []).append(result["input"])
+        continue
+      matched = result["matched"]
+      if matched:
+        rawMC = result["matchContents"]
       else:
-        return []
+        rawMC = { "matchedString": "", "captureGroups": [] }
+
+      mc = libLF.MatchContents().initFromRaw(rawMC["matchedString"], rawMC["captureGroups"])
+      matchResult = libLF.MatchResult().initFromRaw(matched, mc)
+      rer = libLF.RegexEvaluationResult(pattern, result["input"], language, matchResult)
+      rers.append(rer)
+    return rers
   
   def _getInputs(self):
-    """inputs: unique str[], collapsing the result from INPUT_GENERATOR"""
+    """inputs: unique str[], collapsing the result from INPUT_GENERATOR
+
+    If inputsPerClass is set, reduce them to a few per behavioral signature (libLF.reduceInputs).
+    When auditing, returns every input, and sets reducedInputs.
+    """
 
     # For testing
     #return ["abc"] # TODO
@@ -104,14 +126,19 @@ class MyTask(libLF.parallel.ParallelTask):
     with tempfile.NamedTemporaryFile(prefix='SemanticAnalysis-genInputs-', suffix='.json', delete=DELETE_TMP_FILES) as queryFile, \
          tempfile.NamedTemporaryFile(prefix='SemanticAnalysis-outFile-', suffix='.json', delete=DELETE_TMP_FILES) as outFile:
       libLF.writeToFile(queryFile.name, self.regex.toNDJSON())
-      rc, out = libLF.runcmd("'{}' --regex-file '{}' --out-file '{}' --parallelism 1 --seed {} --max-inputs-per-generator {} --generator-timeout {} 2>/dev/null" \
+      # Share our cache, so that generated inputs are reused across runs
+      cacheArg = '' if self.cache is None else "--result-cache '{}'".format(self.cache.path)
+      rc, out = libLF.runcmd("'{}' --regex-file '{}' --out-file '{}' --parallelism 1 --seed {} --max-inputs-per-generator {} --generator-timeout {} {} 2>/dev/null" \
         .format(INPUT_GENERATOR, queryFile.name, outFile.name,
                 self.rngSeed, # Propagate reproducibility into the generators
                 self.maxInputsPerGenerator, # Reduce the size of intermediate tmp files
                 self.timeoutPerGenerator, # Ensure reasonable time is taken
-                ))
+                cacheArg))
       out = out.strip()
       rpaiFileContents = outFile.read().decode("utf-8")
+      # INPUT_GENERATOR journals its progress next to its out-file. We do not resume it.
+      if DELETE_TMP_FILES and os.path.exists(outFile.name + '.journal'):
+        os.remove(outFile.name + '.journal')
       #libLF.log('Got rc {} scriptOut {} rpai as JSON {}'.format(rc, out, rpaiFileContents))
     # This should never fail
     assert(rc == 0)
@@ -130,6 +157,18 @@ class MyTask(libLF.parallel.ParallelTask):
 
       # Add these inputs
       inputs += producerInputs
+      self.producer2inputs[producer] = producerInputs
+    inputs = sorted(set(inputs))
+
+    if 0 < self.inputsPerClass:
+      reduced = libLF.reduceInputs(self.regex.pattern, inputs, perClass=self.inputsPerClass,
+        seed=self.rngSeed if 0 <= self.rngSeed else None)
+      if self.auditReduction:
+        self.reducedInputs = set(reduced + ["a"])
+      else:
+        inputs = reduced
+        keep = set(reduced)
+        self.producer2inputs = { p: [i for i in pis if i in keep] for p, pis in self.producer2inputs.items() }
     return list(set(inputs + ["a"])) # Always test at least one string
 
   def _evaluateRegex(self, pattern, testStrings, languages):
@@ -140,38 +179,142 @@ class MyTask(libLF.parallel.ParallelTask):
     languages: str[]
     @returns dict { lang: libLF.RegexEvaluationResult[], ... } for this request
     """
-    with tempfile.NamedTemporaryFile(prefix='SemanticAnalysis-evaluateRegex-queryFile-',
-                                     suffix='.json',
-                                     delete=DELETE_TMP_FILES) as queryFile:
-      # We can use the same queryFile for each language
-      query = {
-        "pattern": pattern,
-        "inputs": testStrings,
-      }
-      libLF.writeToFile(queryFile.name, json.dumps(query))
-
-      lang2rers = {}
-      for lang in languages:                                    
-        try: # Might time out -- if so, just ignore the language 
-          lang2rers[lang] = self._queryRegexInLang(pattern, queryFile.name, lang)
-        except Exception as err:
-          libLF.log('_evaluateRegex: exception in {}: {}'.format(lang, err))
-
-      return lang2rers
-  
+    lang2rers = {}
+    for lang in languages:                                    
+      try: # Might time out -- if so, just ignore the language 
+        lang2rers[lang] = self._queryRegexInLang(pattern, testStrings, lang)
+      except Exception as err:
+        libLF.log('_evaluateRegex: exception in {}: {}'.format(lang, err))
+
+    return lang2rers
+
+  def _evaluateRegexAdaptively(self, pattern, testStrings, languages):
+    """Like _evaluateRegex, but spend the input budget (testStrings) where languages disagree
+
+    1. Test a stratified sample -- adaptiveSample inputs from each producer -- in every language,
+       topped up to adaptiveMinAgreement inputs.
+    2. If every language agrees on every input, stop.
+    3. Else test the rest in rounds, nearest the witnesses first: inputs with a witness's
+       behavioral signature (libLF.inputSignatures), then those from a producer that yielded a witness, then the others.
+       Inputs with a witness's signature are only tested in the languages that disagreed (and a reference language
+       from each majority); the others in every language.
+       So by design, we miss a near input on which only the languages of a majority disagree among themselves.
+       Stop after a round of inputs from the other producers yields no new witness.
+
+    @returns (lang2rers, nInputsTested)
+    """
+    rng = random.Random(self.rngSeed if 0 <= self.rngSeed else None)
+    untested = set(testStrings)
+
+    # Stratified sample
+    sample = set(["a"]) & untested
+    for producer in sorted(self.producer2inputs):
+      candidates = sorted(set(self.producer2inputs[producer]) & untested - sample)
+      sample.update(rng.sample(candidates, min(self.adaptiveSample, len(candidates))))
+    if len(sample) < self.adaptiveMinAgreement:
+      candidates = sorted(untested - sample)
+      sample.update(rng.sample(candidates, min(self.adaptiveMinAgreement - len(sample), len(candidates))))
+
+    lang2rers = {}
+    def test(inputs, langs):
+      untested.difference_update(inputs)
+      for lang, rers in self._evaluateRegex(pattern, sorted(inputs), langs).items():
+        lang2rers.setdefault(lang, []).extend(rers)
+      return self._disagreements(lang2rers)
+
+    input2lang2mr = test(sample, languages)
+    libLF.log('  Adaptive: {} disagreements on a sample of {} of {} inputs'.format(len(input2lang2mr), len(sample), len(testStrings)))
+    if not input2lang2mr:
+      return lang2rers, len(sample)
+
+    input2sig = libLF.inputSignatures(pattern, testStrings)
+    input2producers = {}
+    for producer, inputs in self.producer2inputs.items():
+      for i in inputs:
+        input2producers.setdefault(i, set()).add(producer)
+
+    roundSize = max(len(sample), 1)
+    while untested:
+      witnessSigs = set(input2sig.get(w) for w in input2lang2mr)
+      witnessProducers = set().union(*[input2producers.get(w, set()) for w in input2lang2mr])
+      def tier(i):
+        if input2sig.get(i) in witnessSigs:
+          return 0
+        if input2producers.get(i, set()) & witnessProducers:
+          return 1
+        return 2
+      candidates = sorted(untested)
+      rng.shuffle(candidates)
+      candidates.sort(key=tier) # Stable: random within a tier
+      batch = candidates[:roundSize]
+
+      nWitnessesBefore = len(input2lang2mr)
+      near = [i for i in batch if tier(i) == 0]
+      far = batch[len(near):]
+      disagreeingLanguages = self._disagreeingLanguages(input2lang2mr)
+      if near:
+        input2lang2mr = test(near, disagreeingLanguages)
+      if far:
+        input2lang2mr = test(far, languages)
+      libLF.log('  Adaptive: {} disagreements after testing {} more inputs (tier {})' \
+        .format(len(input2lang2mr), len(batch), tier(batch[-1])))
+      if tier(batch[-1]) == 2 and len(input2lang2mr) == nWitnessesBefore:
+        break
+
+    return lang2rers, len(testStrings) - len(untested)
+
+  def _disagreements(self, lang2rers):
+    """Returns { input: { lang: MatchResult } } for the inputs on which languages disagree"""
+    input2lang2mr = {}
+    for lang, rers in lang2rers.items():
+      for rer in rers:
+        input2lang2mr.setdefault(rer.input, {})[lang] = rer.matchResult
+    return { i: l2mr for i, l2mr in input2lang2mr.items() if len(set(l2mr.values())) > 1 }
+
+  def _disagreeingLanguages(self, input2lang2mr):
+    """The languages in the minority on some witness, plus one from each majority for reference"""
+    langs = set()
+    for lang2mr in input2lang2mr.values():
+      mr2langs = {}
+      for lang, mr in lang2mr.items():
+        mr2langs.setdefault(mr, []).append(lang)
+      groups = sorted(mr2langs.values(), key=lambda ls: (-len(ls), sorted(ls)))
+      langs.add(sorted(groups[0])[0])
+      for group in groups[1:]:
+        langs.update(group)
+    return sorted(langs)
+
+  def prepare(self):
+    """Get the inputs. In a pipeline (imap_pipeline), this runs in the generation pool."""
+    try:
+      libLF.log('Generating inputs for regex /{}/'.format(self.regex.pattern))
+      self.inputs = self._getInputs()
+    except KeyboardInterrupt:
+      raise
+    except BaseException as err:
+      libLF.log('Error generating inputs for regex /{}/: {}'.format(self.regex.pattern, err))
+      sys.stderr.flush()
+      raise
+
   def run(self):
     try:
       libLF.log('Working on regex /{}/'.format(self.regex.pattern))
 
-      # Get inputs
-      inputs = self._getInputs()
+      # Get inputs, unless prepare() did
+      inputs = self.inputs
+      if inputs is None:
+        inputs = self._getInputs()
 
       libLF.log('  Got {} inputs to test'.format(len(inputs)))
       libLF.log('  Testing each input in {} langs'.format(len(self.regex.supportedLangs)))
 
       # Check its behavior on each input in each lang
       #lang2rers = self._evaluateRegex(self.regex.pattern, inputs, ["python", "perl", "php", "ruby", "javascript", "java", "go", "rust"]) # TODO
-      lang2rers = self._evaluateRegex(self.regex.pattern, inputs, self.regex.supportedLangs)
+      if 0 < self.adaptiveSample:
+        lang2rers, nInputsTested = self._evaluateRegexAdaptively(self.regex.pattern, inputs, self.regex.supportedLangs)
+      else:
+        lang2rers = self._evaluateRegex(self.regex.pattern, inputs, self.regex.supportedLangs)
+        nInputsTested = len(inputs)
 
       # Build SDW's based on each RER
       possibleWitnesses = {} # keyed by inputString
@@ -189,9 +332,22 @@ class MyTask(libLF.parallel.ParallelTask):
           libLF.log("  Got a witness!")
           trueWitnesses.append(pw)
       
-      self.regex.nUniqueInputsTested = len(inputs)
+      self.regex.nUniqueInputsTested = nInputsTested
+      self.regex.lang2timedOutInputs = self.lang2timedOutInputs
+      for lang, timedOutInputs in sorted(self.lang2timedOutInputs.items()):
+        libLF.log('  {} inputs timed out in {}'.format(len(timedOutInputs), lang))
       self.regex.semanticDifferenceWitnesses = trueWitnesses
 
+      if self.reducedInputs is not None:
+        # Not part of the NDJSON. main() summarizes it.
+        self.regex.reductionAudit = {
+          'nInputs': len(inputs),
+          'nReducedInputs': len(self.reducedInputs),
+          'nWitnesses': len(trueWitnesses),
+          'nReducedWitnesses': len([w for w in trueWitnesses if w.input in self.reducedInputs]),
+        }
+        libLF.log('  Reduction audit: {}'.format(self.regex.reductionAudit))
+
       # Return
       libLF.log('Completed regex /{}/ ({} witnesses out of {} inputs)' \
         .format(self.regex.pattern, len(self.regex.semanticDifferenceWitnesses), self.regex.nUniqueInputsTested))
@@ -206,9 +362,14 @@ class MyTask(libLF.parallel.ParallelTask):
 
 ################
 
-def getTasks(regexFile, maxInputsPerGenerator, rngSeed, generatorTimeout):
+def getTasks(regexFile, maxInputsPerGenerator, rngSeed, generatorTimeout, cache, inputsPerClass, auditReduction,
+             adaptiveSample, adaptiveMinAgreement, timeoutPerInput):
   regexes = loadRegexFile(regexFile)
-  tasks = [MyTask(regex, maxInputsPerGenerator, rngSeed, generatorTimeout) for regex in regexes]
+  # Audit a stable subset: shard 0 of auditReduction
+  tasks = [MyTask(regex, maxInputsPerGenerator, rngSeed, generatorTimeout, cache, inputsPerClass,
+                  0 < auditReduction and libLF.isInShard(regex.pattern, (0, auditReduction)),
+                  adaptiveSample, adaptiveMinAgreement, timeoutPerInput)
+           for regex in regexes]
   libLF.log('Prepared {} tasks'.format(len(tasks)))
   return tasks
 
@@ -239,15 +400,34 @@ def loadRegexFile(regexFile):
 
 ################
 
-def main(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, generatorTimeout):
-  libLF.log('regexFile {} outFile {} parallelism {} maxInputsPerGenerator {} rngSeed {} generatorTimeout {}' \
-    .format(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, generatorTimeout))
+def main(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, generatorTimeout, resume, shard, resultCache, inputsPerClass, auditReduction,
+         adaptiveSample, adaptiveMinAgreement, generationParallelism, pipelineQueueSize, timeoutPerInput, pythonInProcess):
+  libLF.log('regexFile {} outFile {} parallelism {} maxInputsPerGenerator {} rngSeed {} generatorTimeout {} resume {} shard {} resultCache {} inputsPerClass {} auditReduction {} adaptiveSample {} adaptiveMinAgreement {} generationParallelism {} pipelineQueueSize {} timeoutPerInput {} pythonInProcess {}' \
+    .format(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, generatorTimeout, resume, shard, resultCache, inputsPerClass, auditReduction,
+            adaptiveSample, adaptiveMinAgreement, generationParallelism, pipelineQueueSize, timeoutPerInput, pythonInProcess))
+
+  if pythonInProcess:
+    libLF.setInProcessTesterLangs(['python'])
+
+  cache = None
+  if resultCache is not None:
+    cache = libLF.ResultCache(resultCache)
+    # Workers only put, so keep the cache within its size here
+    cache.evict()
+    cacheStatsBefore = cache.stats()
 
   #### Load data
   libLF.log('\n\n-----------------------')
   libLF.log('Loading regexes from {}'.format(regexFile))
 
-  tasks = getTasks(regexFile, maxInputsPerGenerator, rngSeed, generatorTimeout)
+  tasks = getTasks(regexFile, maxInputsPerGenerator, rngSeed, generatorTimeout, cache, inputsPerClass, auditReduction,
+                   adaptiveSample, adaptiveMinAgreement, timeoutPerInput)
+  tasks = [t for t in tasks if libLF.isInShard(t.regex.pattern, shard)]
+
+  # Skip the regexes we finished last time
+  journal = libLF.ResumeJournal(outFile, resume)
+  tasks = [t for t in tasks if not journal.isDone(t.regex.pattern)]
+  libLF.log('{} tasks to do ({} already done)'.format(len(tasks), journal.nDone()))
   nRegexes = len(tasks)
 
   #### Process data
@@ -255,10 +435,18 @@ def main(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, genera
   libLF.log('Testing for semantic portability problems')
 
   # CPU-bound, no limits
-  libLF.log('Submitting to map')
-  results = libLF.parallel.map(tasks, parallelism,
-    libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
-    jitter=False)
+  # Emit each result as it completes, so partial output survives a crash
+  # and we need not hold every result in memory.
+  if 0 < generationParallelism:
+    # Input generation mostly waits (on JVMs, wine, generator timeouts), and testing computes.
+    # Pipeline them in separate pools, so that testing need not stall while generators do.
+    libLF.log('Submitting to imap_pipeline: {} generating, {} testing'.format(generationParallelism, parallelism))
+    results = libLF.parallel.imap_pipeline(tasks, generationParallelism, parallelism, pipelineQueueSize)
+  else:
+    libLF.log('Submitting to imap_unordered')
+    results = libLF.parallel.imap_unordered(tasks, parallelism,
+      libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
+      jitter=False)
 
   #### Emit results
 
@@ -266,17 +454,24 @@ def main(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, genera
   libLF.log('Writing results to {}'.format(outFile))
   nSuccesses = 0
   nExceptions = 0
-  completedRegexes = []
-  with open(outFile, 'w') as outStream:
+  nRegexesWithDifferences = 0
+  audits = []
+  with journal:
     for regex in results:
         # Emit
         if type(regex) is libLF.Regex:
           nSuccesses += 1
-          outStream.write(regex.toNDJSON() + '\n')
-          completedRegexes.append(regex)
+          journal.write(regex.pattern, regex.toNDJSON())
+          if len(regex.semanticDifferenceWitnesses) > 0:
+            nRegexesWithDifferences += 1
+          if hasattr(regex, 'reductionAudit'):
+            audits.append(regex.reductionAudit)
         else:
           nExceptions += 1
   libLF.log('Successfully performed cross-language semantic equivalence testing on {} regexes, {} exceptions'.format(nSuccesses, nExceptions))
+  if cache is not None:
+    cache.logStats(cacheStatsBefore)
+    cache.evict()
 
   #### Analyze the successful XXX's for a quick summary
 
@@ -287,34 +482,70 @@ def main(regexFile, outFile, parallelism, maxInputsPerGenerator, rngSeed, genera
   libLF.log('Summary')
   libLF.log('--------------------')
 
-  nRegexesWithDifferences = 0
-  for regex in completedRegexes:
-    if len(regex.semanticDifferenceWitnesses) > 0:
-      nRegexesWithDifferences += 1
   libLF.log('\n  {} ({:.2f}%) of the {} completed regexes had at least one witness for different behavior' \
-    .format(nRegexesWithDifferences, 100 * (nRegexesWithDifferences/len(completedRegexes)), len(completedRegexes)))
+    .format(nRegexesWithDifferences, 100 * (nRegexesWithDifferences/max(nSuccesses, 1)), nSuccesses))
+
+  if audits:
+    nInputs = sum(a['nInputs'] for a in audits)
+    nReducedInputs = sum(a['nReducedInputs'] for a in audits)
+    nWithWitnesses = len([a for a in audits if a['nWitnesses'] > 0])
+    nReducedWithWitnesses = len([a for a in audits if a['nReducedWitnesses'] > 0])
+    libLF.log('\n  Input reduction audit on {} regexes: reduction keeps {} of {} inputs ({:.2f}%)' \
+      .format(len(audits), nReducedInputs, nInputs, 100 * nReducedInputs / max(nInputs, 1)))
+    libLF.log('  {} regexes had a witness; with reduced inputs, {} would ({} lost)' \
+      .format(nWithWitnesses, nReducedWithWitnesses, nWithWitnesses - nReducedWithWitnesses))
+    libLF.log('  Witnesses: {} of {} survive reduction' \
+      .format(sum(a['nReducedWitnesses'] for a in audits), sum(a['nWitnesses'] for a in audits)))
 
 #####################################################
 
-# Parse args
-parser = argparse.ArgumentParser(description='Test a set of libLF.Regex\'s for different behavior in different languages')
-parser.add_argument('--regex-file', type=str, help='In: File of libLF.Regex objects that have supportedLangs populated', required=True,
-  dest='regexFile')
-parser.add_argument('--out-file', type=str, help='Out: File of libLF.Regex objects with the semanticDifferenceWitnesses field populated', required=True,
-  dest='outFile')
-parser.add_argument('--parallelism', type=int, help='Maximum cores to use', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
-  dest='parallelism')
-parser.add_argument('--max-inputs-per-generator', type=int, help='Maximum inputs to use from each generator (default 100; -1 means "all")', required=False, default=100,
-  dest='maxInputsPerGenerator')
-parser.add_argument('--rngSeed', type=int, help='Seed to use for reproducibility (default -1: random seed)', required=False, default=-1,
-  dest='rngSeed')
-parser.add_argument('--generator-timeout', type=float, help='Time out input generators if they takes more than T seconds, and scrape the output for the strings generated so far (default 10, give -1 for no limit)', required=False, default=10,
-  dest='generatorTimeout')
-args = parser.parse_args()
-
-if args.rngSeed != -1:
-  libLF.log("SEED: {}".format(args.rngSeed))
-  random.seed(args.rngSeed)
-
-# Here we go!
-main(args.regexFile, args.outFile, args.parallelism, args.maxInputsPerGenerator, args.rngSeed, args.generatorTimeout)
+# test-test-for-semantic-portability.py imports us
+if __name__ == '__main__':
+  # Parse args
+  parser = argparse.ArgumentParser(description='Test a set of libLF.Regex\'s for different behavior in different languages')
+  parser.add_argument('--regex-file', type=str, help='In: File of libLF.Regex objects that have supportedLangs populated', required=True,
+    dest='regexFile')
+  parser.add_argument('--out-file', type=str, help='Out: File of libLF.Regex objects with the semanticDifferenceWitnesses field populated', required=True,
+    dest='outFile')
+  parser.add_argument('--parallelism', type=int, help='Maximum cores to use', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
+    dest='parallelism')
+  parser.add_argument('--max-inputs-per-generator', type=int, help='Maximum inputs to use from each generator (default 100; -1 means "all")', required=False, default=100,
+    dest='maxInputsPerGenerator')
+  parser.add_argument('--rngSeed', type=int, help='Seed to use for reproducibility (default -1: random seed)', required=False, default=-1,
+    dest='rngSeed')
+  parser.add_argument('--generator-timeout', type=float, help='Time out input generators if they takes more than T seconds, and scrape the output for the strings generated so far (default 10, give -1 for no limit)', required=False, default=10,
+    dest='generatorTimeout')
+  parser.add_argument('--resume', help='Resume an interrupted run: keep the results already journaled in OUT_FILE.journal and skip those regexes', required=False, action='store_true', default=False,
+    dest='resume')
+  parser.add_argument('--shard', type=libLF.parseShard, help='i/N: only process the regexes in shard i (0-based) of N. Use a different --out-file per shard', required=False, default=None,
+    dest='shard')
+  parser.add_argument('--result-cache', type=str, help='Cache results in this SQLite file (libLF.ResultCache), and reuse those from earlier runs. Generated inputs are only cached with a --rngSeed (default: no cache)', required=False, default=None,
+    dest='resultCache')
+  parser.add_argument('--inputs-per-class', type=int, help='Group the inputs by behavioral signature (Python match features and character-class membership) and test only this many per group. This finds fewer witnesses per regex, though rarely fewer regexes with a witness; measure it with --audit-reduction (default -1: test every input)', required=False, default=-1,
+    dest='inputsPerClass')
+  parser.add_argument('--audit-reduction', type=int, help='With --inputs-per-class: for 1 in N regexes (a stable subset), test every input anyway and report how many witnesses the reduced inputs would have found (default 0: no audit)', required=False, default=0,
+    dest='auditReduction')
+  parser.add_argument('--adaptive-sample', type=int, help='Adaptive testing: first test N inputs from each generator in every language, and only test the rest if some languages disagree -- nearest the witnesses first. Inputs with a witness\'s signature are only tested in the disagreeing languages plus one reference language, so a new disagreement among the other languages on them is missed (default -1: test every input in every language)', required=False, default=-1,
+    dest='adaptiveSample')
+  parser.add_argument('--adaptive-min-agreement', type=int, help='With --adaptive-sample: a regex stops early only if every language agrees on at least this many inputs (default 50)', required=False, default=50,
+    dest='adaptiveMinAgreement')
+  parser.add_argument('--generation-parallelism', type=int, help='Pipeline the work: generate inputs in a pool of this many workers, and test them in a separate pool of --parallelism workers (default 0: each worker generates and then tests)', required=False, default=0,
+    dest='generationParallelism')
+  parser.add_argument('--pipeline-queue-size', type=int, help='With --generation-parallelism: at most this many regexes with generated inputs wait for a testing worker (default 2 * --parallelism)', required=False, default=None,
+    dest='pipelineQueueSize')
+  parser.add_argument('--timeout-per-input', type=float, help='Each language tester gives up on an input after T seconds and records it as timed out, rather than losing the results for every input (default 1)', required=False, default=1,
+    dest='timeoutPerInput')
+  parser.add_argument('--python-in-process', help='Answer Python tester queries from the Python tester loaded in each worker, matching in a forked child, rather than from a python3 tester daemon. A worker with other threads running still uses the daemon (default: use the daemon)', required=False, action='store_true', default=False,
+    dest='pythonInProcess')
+  args = parser.parse_args()
+
+  if args.pipelineQueueSize is None:
+    args.pipelineQueueSize = 2 * args.parallelism
+
+  if args.rngSeed != -1:
+    libLF.log("SEED: {}".format(args.rngSeed))
+    random.seed(args.rngSeed)
+
+  # Here we go!
+  main(args.regexFile, args.outFile, args.parallelism, args.maxInputsPerGenerator, args.rngSeed, args.generatorTimeout, args.resume, args.shard, args.resultCache, args.inputsPerClass, args.auditReduction,
+       args.adaptiveSample, args.adaptiveMinAgreement, args.generationParallelism, args.pipelineQueueSize, args.timeoutPerInput, args.pythonInProcess)
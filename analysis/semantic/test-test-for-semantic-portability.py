@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Tests for test-for-semantic-portability.py's adaptive testing, with stub testers
+
+# Import our lib
+import os
+import sys
+sys.path.append('{}/lib'.format(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT']))
+import libLF
+
+import importlib.util
+import shutil
+import tempfile
+
+import unittest
+
+# test-for-semantic-portability.py is not a legal module name
+_spec = importlib.util.spec_from_file_location('semanticPortability',
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-for-semantic-portability.py'))
+semanticPortability = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(semanticPortability)
+
+LANGUAGES = ['go', 'javascript', 'perl', 'python', 'ruby']
+
+class StubTask(semanticPortability.MyTask):
+  """Answers queries with isMatch(lang, input), and records them"""
+  def __init__(self, producer2inputs, isMatch, adaptiveSample, adaptiveMinAgreement):
+    regex = libLF.Regex().initFromRaw('x', {}, {})
+    super().__init__(regex, -1, 1, 10, None, -1, False, adaptiveSample, adaptiveMinAgreement, 1)
+    self.producer2inputs = producer2inputs
+    self.isMatch = isMatch
+    # (inputs, languages) per query round
+    self.queries = []
+
+  def _evaluateRegex(self, pattern, testStrings, languages):
+    self.queries.append((list(testStrings), list(languages)))
+    lang2rers = {}
+    for lang in languages:
+      for s in testStrings:
+        mr = libLF.MatchResult().initFromRaw(self.isMatch(lang, s), libLF.MatchContents().initFromRaw('', []))
+        lang2rers.setdefault(lang, []).append(libLF.RegexEvaluationResult(pattern, s, lang, mr))
+    return lang2rers
+
+  def evaluate(self):
+    inputs = sorted(set(i for pis in self.producer2inputs.values() for i in pis))
+    return self._evaluateRegexAdaptively('x', inputs, LANGUAGES)
+
+  def languagesFor(self, s):
+    """The languages s was tested in"""
+    return [langs for inputs, langs in self.queries if s in inputs]
+
+class AdaptiveTest(unittest.TestCase):
+  def test_agreementStopsAfterSample(self):
+    producer2inputs = {
+      'P0': ['a'] + ['p' * n for n in range(2, 22)],
+      'P1': ['q' * n for n in range(2, 22)],
+    }
+    task = StubTask(producer2inputs, lambda lang, s: False, 3, 10)
+    lang2rers, nInputsTested = task.evaluate()
+    # 'a', 3 per producer, then topped up to adaptiveMinAgreement
+    self.assertEqual(nInputsTested, 10)
+    self.assertEqual(len(task.queries), 1)
+    self.assertEqual(sorted(lang2rers.keys()), LANGUAGES)
+
+  def test_tiers(self):
+    # Ruby disagrees on one-character inputs. The sample is just 'a', a witness.
+    producer2inputs = {
+      'P0': ['a', 'kk', 'mm'],
+      'P1': ['b', 'c', 'd'],
+      'P2': ['vvvv', 'wwww', 'yyyy', 'zzzz'],
+    }
+    task = StubTask(producer2inputs, lambda lang, s: lang == 'ruby' and len(s) == 1, 0, 1)
+    lang2rers, nInputsTested = task.evaluate()
+
+    self.assertEqual(task.queries[0], (['a'], LANGUAGES))
+    tested = [inputs[0] for inputs, _ in task.queries[1:]]
+    # Rounds of one input: nearest (same signature as 'a'), then the witness's producer, then the others
+    self.assertEqual(sorted(tested[0:3]), ['b', 'c', 'd'])
+    self.assertEqual(sorted(tested[3:5]), ['kk', 'mm'])
+    # One other-producer round finds nothing new, so we stop
+    self.assertEqual(len(tested), 6)
+    self.assertIn(tested[5], producer2inputs['P2'])
+    self.assertEqual(nInputsTested, 7)
+
+    # Near inputs run only in the disagreeing language and a reference from the majority
+    for s in ['b', 'c', 'd']:
+      self.assertEqual(task.languagesFor(s), [['go', 'ruby']])
+    for s in ['kk', 'mm', tested[5]]:
+      self.assertEqual(task.languagesFor(s), [LANGUAGES])
+
+  def test_nearInputsMissMajorityDisagreements(self):
+    # By design: on a near input, only the disagreeing languages and a reference are tested,
+    # so perl and python disagreeing on 'b' goes unseen
+    producer2inputs = { 'P0': ['a', 'b'] }
+    def isMatch(lang, s):
+      if s == 'a':
+        return lang == 'ruby'
+      return lang == 'perl'
+    task = StubTask(producer2inputs, isMatch, 0, 1)
+    lang2rers, nInputsTested = task.evaluate()
+    self.assertEqual(nInputsTested, 2)
+    self.assertEqual(task.languagesFor('b'), [['go', 'ruby']])
+    self.assertEqual(task._disagreements(lang2rers).keys(), set(['a']))
+
+class CacheTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp(prefix='test-test-for-semantic-portability-')
+    self.cache = libLF.ResultCache(os.path.join(self.dir, 'cache.sqlite'))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _task(self):
+    regex = libLF.Regex().initFromRaw('x', {}, {})
+    return semanticPortability.MyTask(regex, -1, 1, 10, self.cache, -1, False, -1, 1, 0.2)
+
+  def _nCached(self):
+    return self.cache.stats().get('semantic', {}).get('nEntries', 0)
+
+  def test_cachesCompletedQuery(self):
+    rers = self._task()._queryRegexInLang('^(a|a)+$', ['aa', 'b'], 'python')
+    self.assertEqual(len(rers), 2)
+    self.assertEqual(self._nCached(), 1)
+
+  def test_doesNotCacheTimeouts(self):
+    task = self._task()
+    rers = task._queryRegexInLang('^(a|a)+$', ['aa', 'a' * 40 + '!'], 'python')
+    self.assertEqual([rer.input for rer in rers], ['aa'])
+    self.assertEqual(task.lang2timedOutInputs, { 'python': ['a' * 40 + '!'] })
+    self.assertEqual(self._nCached(), 0)
+
+  def test_ignoresCachedTimeouts(self):
+    task = self._task()
+    inputs = ['aa', 'b']
+    cacheParams = { 'inputs': sorted(inputs), 'timeoutPerInput': task.timeoutPerInput }
+    self.cache.put('semantic', '^(a|a)+$', 'python', libLF.testerVersion('python'), cacheParams,
+      { 'validPattern': 1, 'results': [ { 'input': 'aa', 'timedOut': 1 }, { 'input': 'b', 'timedOut': 1 } ] })
+    rers = task._queryRegexInLang('^(a|a)+$', inputs, 'python')
+    self.assertEqual(len(rers), 2)
+    self.assertEqual(task.lang2timedOutInputs, {})
+
+###########################################################
+
+if __name__ == '__main__':
+  unittest.main()
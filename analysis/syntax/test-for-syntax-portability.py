@@ -30,30 +30,37 @@ reg2lang = {
 ##########
 
 class MyTask(libLF.parallel.ParallelTask):
-  def __init__(self, regex):
-    self.regex = regex
+  """Check a chunk of regexes, with one batched tester call per language"""
+  def __init__(self, regexes, cache):
+    self.regexes = regexes
+    self.cache = cache
   
   def run(self):
+    """Returns a list with, for each regex, the Regex or the exception we hit"""
     try:
-      libLF.log('Working on regex: /{}/'.format(self.regex.pattern))
+      libLF.log('Working on {} regexes: /{}/ ...'.format(len(self.regexes), self.regexes[0].pattern))
+      results = list(self.regexes)
       # Run the analysis
       for lang in reg2lang.values():
-        self.regex.isSupportedInLanguage(lang.lower())
+        for i, res in enumerate(libLF.regexesSupportedInLanguage(self.regexes, lang.lower(), cache=self.cache)):
+          if isinstance(res, BaseException):
+            libLF.log('Error handling regex /{}/ in {}: {}'.format(self.regexes[i].pattern, lang, res))
+            results[i] = res
       # Return
-      libLF.log('Completed regex')
-      return self.regex
+      libLF.log('Completed {} regexes'.format(len(self.regexes)))
+      return results
     except KeyboardInterrupt:
       raise
     except BaseException as err:
-      libLF.log('Error handling regex /{}/: {}'.format(self.regex.pattern, err))
-      return err
+      libLF.log('Error handling regexes /{}/ ...: {}'.format(self.regexes[0].pattern, err))
+      return [err for _ in self.regexes]
 
 ################
 
-def getTasks(regexFile):
+def getTasks(regexFile, batchSize, cache):
   regexes = loadRegexFile(regexFile)
-  tasks = [MyTask(regex) for regex in regexes]
-  libLF.log('Prepared {} tasks'.format(len(tasks)))
+  tasks = [MyTask(regexes[i:i+batchSize], cache) for i in range(0, len(regexes), batchSize)]
+  libLF.log('Prepared {} tasks of up to {} regexes'.format(len(tasks), batchSize))
   return tasks
 
 def loadRegexFile(regexFile):
@@ -83,71 +90,72 @@ def loadRegexFile(regexFile):
 
 ################
 
-def main(regexFile, outFile, parallelism):
-  libLF.log('regexFile {} outFile {} parallelism {}' \
-    .format(regexFile, outFile, parallelism))
+def main(regexFile, outFile, parallelism, batchSize, resultCache, pythonInProcess):
+  libLF.log('regexFile {} outFile {} parallelism {} batchSize {} resultCache {} pythonInProcess {}' \
+    .format(regexFile, outFile, parallelism, batchSize, resultCache, pythonInProcess))
+
+  if pythonInProcess:
+    libLF.setInProcessTesterLangs(['python'])
+
+  cache = None
+  if resultCache is not None:
+    cache = libLF.ResultCache(resultCache)
+    # Workers only put, so keep the cache within its size here
+    cache.evict()
+    cacheStatsBefore = cache.stats()
 
   #### Load data
   libLF.log('\n\n-----------------------')
   libLF.log('Loading regexes from {}'.format(regexFile))
 
-  tasks = getTasks(regexFile)
-  nRegexes = len(tasks)
+  tasks = getTasks(regexFile, batchSize, cache)
+  # Each task is a chunk of regexes
+  nRegexes = sum(len(t.regexes) for t in tasks)
 
   #### Process data
   libLF.log('\n\n-----------------------')
   libLF.log('Computing syntax support in {}'.format(reg2lang.values()))
 
   # CPU-bound, no limits
-  libLF.log('Submitting to map')
-  results = libLF.parallel.map(tasks, parallelism,
+  # Emit each result as it completes, so partial output survives a crash
+  # and we need not hold every result in memory.
+  libLF.log('Submitting to imap_unordered')
+  chunkResults = libLF.parallel.imap_unordered(tasks, parallelism,
     libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
     jitter=False)
+  results = (res for chunk in chunkResults for res in chunk)
 
-  #### Emit results
+  #### Emit results, and tally the successful Regex's for a quick summary
 
   libLF.log('\n\n-----------------------')
   libLF.log('Writing results to {}'.format(outFile))
   nSuccesses = 0
   nExceptions = 0
+  lang2SupportCounts = {}
+  nSuppLangs2Counts = {}
+  nProblematicRegexes = 0
   with open(outFile, 'w') as outStream:
     for regex in results:
         # Emit
         if type(regex) is libLF.Regex:
           nSuccesses += 1
           outStream.write(regex.toNDJSON() + '\n')
+          outStream.flush()
+          _tallySupport(regex, lang2SupportCounts, nSuppLangs2Counts)
+          if _isProblematic(regex):
+            nProblematicRegexes += 1
         else:
           nExceptions += 1
-  libLF.log('Successfully performed language compatibility testing on {} regexes, {} exceptions'.format(nSuccesses, nExceptions))
+  libLF.log('Successfully performed language compatibility testing on {} of {} regexes, {} exceptions'.format(nSuccesses, nRegexes, nExceptions))
+  if cache is not None:
+    cache.logStats(cacheStatsBefore)
+    cache.evict()
 
-  #### Analyze the successful Regex's for a quick summary
+  #### Quick summary
 
   libLF.log('\n\n-----------------------')
   libLF.log('Generating a quick summary of regex syntax support')
-  regexes = [
-    res
-    for res in results
-    if type(res) is libLF.Regex
-  ]
 
-  lang2SupportCounts = {}
-  nSuppLangs2Counts = {}
-  
-  for regex in regexes:
-    for lang in regex.supportedLangs:
-      if lang not in lang2SupportCounts:
-        lang2SupportCounts[lang] = 0
-      lang2SupportCounts[lang] += 1
-
-    nLangs = len(regex.supportedLangs) 
-    if nLangs not in nSuppLangs2Counts:
-      nSuppLangs2Counts[nLangs] = 0
-    nSuppLangs2Counts[nLangs] += 1
-
-    if nLangs == 0:
-      libLF.log('Regex /{}/ was supported in 0 langs? (registries {})' \
-        .format(regex.pattern, regex.registriesUsedIn()))
-  
   tableFormat = '%30s %20s'
   libLF.log(tableFormat % ('Number of supporting languages', 'Number of regexes'))
   for count in sorted(nSuppLangs2Counts.keys()):
@@ -161,29 +169,40 @@ def main(regexFile, outFile, parallelism):
 
   #### Sanity check: Every regex works in the registry in which it was found
   
-  problematicRegexes = []
   libLF.log('\n\n-----------------------')
   libLF.log('Confirming that every regex works in the registry in which it was found')
-  for regex in regexes:
-    # Check this regex
-    #libLF.log('  Checking that /{}/ works in the languages for registries {} (it worked in {})' \
-    #  .format(regex.pattern, regex.registriesUsedIn(), regex.supportedLangs))
-    isProblem = False
-    for registry in regex.registriesUsedIn():
-      if reg2lang[registry].lower() not in [l.lower() for l in regex.supportedLangs]:
-        # Surprise! Why wasn't it supported?
-        libLF.log('    Warning: regex /{}/ not supported in {} but it was found in {}' \
-          .format(regex.pattern, reg2lang[registry], regex.registriesUsedIn()))
-        isProblem = True
-    if isProblem:
-      problematicRegexes.append(regex)
-
-  if len(problematicRegexes):
+  if nProblematicRegexes:
     libLF.log('Uh oh, {} regexes did not work in at least one of the registries in which they were found' \
-      .format(len(problematicRegexes)))
+      .format(nProblematicRegexes))
   else:
     libLF.log('Good, all regexes worked in the registries in which they were found')
 
+def _tallySupport(regex, lang2SupportCounts, nSuppLangs2Counts):
+  for lang in regex.supportedLangs:
+    if lang not in lang2SupportCounts:
+      lang2SupportCounts[lang] = 0
+    lang2SupportCounts[lang] += 1
+
+  nLangs = len(regex.supportedLangs) 
+  if nLangs not in nSuppLangs2Counts:
+    nSuppLangs2Counts[nLangs] = 0
+  nSuppLangs2Counts[nLangs] += 1
+
+  if nLangs == 0:
+    libLF.log('Regex /{}/ was supported in 0 langs? (registries {})' \
+      .format(regex.pattern, regex.registriesUsedIn()))
+
+def _isProblematic(regex):
+  """True if regex is not supported in a registry in which it was found"""
+  isProblem = False
+  for registry in regex.registriesUsedIn():
+    if reg2lang[registry].lower() not in [l.lower() for l in regex.supportedLangs]:
+      # Surprise! Why wasn't it supported?
+      libLF.log('    Warning: regex /{}/ not supported in {} but it was found in {}' \
+        .format(regex.pattern, reg2lang[registry], regex.registriesUsedIn()))
+      isProblem = True
+  return isProblem
+
 #####################################################
 
 # Parse args
@@ -194,7 +213,13 @@ parser.add_argument('--out-file', type=str, help='Out: File of libLF.Regex objec
   dest='outFile')
 parser.add_argument('--parallelism', type=int, help='Maximum cores to use', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
   dest='parallelism')
+parser.add_argument('--batch-size', type=int, help='Check this many regexes per tester process (default 200)', required=False, default=200,
+  dest='batchSize')
+parser.add_argument('--result-cache', type=str, help='Cache results in this SQLite file (libLF.ResultCache), and reuse those from earlier runs (default: no cache)', required=False, default=None,
+  dest='resultCache')
+parser.add_argument('--python-in-process', help='Answer Python tester queries from the Python tester loaded in each worker, matching in a forked child, rather than from a python3 tester daemon. A worker with other threads running still uses the daemon (default: use the daemon)', required=False, action='store_true', default=False,
+  dest='pythonInProcess')
 args = parser.parse_args()
 
 # Here we go!
-main(args.regexFile, args.outFile, args.parallelism)
+main(args.regexFile, args.outFile, args.parallelism, args.batchSize, args.resultCache, args.pythonInProcess)
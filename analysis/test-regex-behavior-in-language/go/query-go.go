@@ -8,16 +8,21 @@ package main
 ///////////
 
 import (
+  "bufio"
   "fmt"
   "os"
+  "io"
   "io/ioutil"
   "encoding/json"
   "regexp"
+  "strings"
 )
 
 type Query struct {
   Pattern string     `json:"pattern"`
   Inputs []string    `json:"inputs"`
+  // Go's regexp matches in linear time, so we need not enforce this
+  TimeoutPerInput float64 `json:"timeoutPerInput"`
 }
 
 type MatchContents struct {
@@ -28,6 +33,7 @@ type MatchContents struct {
 type MatchResult struct {
   Input string            `json:"input"`
   Matched bool            `json:"matched"`
+  TimedOut bool           `json:"timedOut"` // Always false
   MC MatchContents        `json:"matchContents"`
 }
 
@@ -54,29 +60,8 @@ func check(e error) {
   }
 }
 
-///////////
-// main
-///////////
-
-func main() {
-  if len(os.Args) <= 1 {
-    fmt.Printf("Usage: query-go query.json\n")
-    os.Exit(1)
-  }
-
-  // Load file contents
-  queryFile := os.Args[1]
-  myLog("queryFile " + queryFile)
-  fd, err := os.Open(queryFile)
-  check(err)
-  byteValue, _ := ioutil.ReadAll(fd)
-
-  // Load into a Query
-  var query Query
-  json.Unmarshal(byteValue, &query)
-  myLog("Query: pattern /" + query.Pattern + "/")
-
-  // Evaluate the Query as a QueryResult
+// Evaluate the Query as a QueryResult
+func evaluateQuery(query Query) QueryResult {
   var queryResult QueryResult
   queryResult.Pattern = query.Pattern
   queryResult.Inputs = query.Inputs
@@ -113,7 +98,58 @@ func main() {
     queryResult.ValidGoPattern = false
   }
 
+  return queryResult
+}
+
+// Answer one NDJSON query per line on stdin until EOF
+func daemon() {
+  reader := bufio.NewReader(os.Stdin)
+  for {
+    // ReadString has no line-length limit, unlike bufio.Scanner
+    line, err := reader.ReadString('\n')
+    if strings.TrimSpace(line) != "" {
+      var query Query
+      check(json.Unmarshal([]byte(line), &query))
+
+      str, _ := json.Marshal(evaluateQuery(query))
+      fmt.Println(string(str))
+    }
+
+    if err == io.EOF {
+      return
+    }
+    check(err)
+  }
+}
+
+///////////
+// main
+///////////
+
+func main() {
+  if len(os.Args) <= 1 {
+    fmt.Printf("Usage: query-go query.json | --daemon\n")
+    os.Exit(1)
+  }
+
+  if os.Args[1] == "--daemon" {
+    daemon()
+    return
+  }
+
+  // Load file contents
+  queryFile := os.Args[1]
+  myLog("queryFile " + queryFile)
+  fd, err := os.Open(queryFile)
+  check(err)
+  byteValue, _ := ioutil.ReadAll(fd)
+
+  // Load into a Query
+  var query Query
+  json.Unmarshal(byteValue, &query)
+  myLog("Query: pattern /" + query.Pattern + "/")
+
   // Emit
-  str, _ := json.Marshal(queryResult)
+  str, _ := json.Marshal(evaluateQuery(query))
   fmt.Println(string(str))
 }
@@ -18,17 +18,47 @@ import java.nio.file.Files;
 import java.nio.file.Paths;
 import java.nio.charset.Charset;
 import java.io.IOException;
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
 
 public class QueryJava {
   public static void main(String[] args)
     throws IOException
   {
-    if (args.length == 1) {
+    if (args.length == 1 && args[0].equals("--daemon")) {
+      daemon();
+    } else if (args.length == 1) {
    		// Trust input is valid.
 		  String cont = readFile(args[0], Charset.defaultCharset());
 
 			MyQuery query = new Gson().fromJson(cont, MyQuery.class);
 
+      // Emit
+      System.out.println(new Gson().toJson(evaluateQuery(query)));
+    } else {
+      System.out.println("Usage: INVOCATION query.json | --daemon");
+      System.exit(-1);
+    }
+  }
+
+	/* Answer one NDJSON query per line on stdin until EOF. */
+	static void daemon()
+		throws IOException
+	{
+		BufferedReader reader = new BufferedReader(new InputStreamReader(System.in, Charset.defaultCharset()));
+		Gson gson = new Gson();
+		String line;
+		while ((line = reader.readLine()) != null) {
+			if (line.trim().isEmpty()) {
+				continue;
+			}
+			MyQuery query = gson.fromJson(line, MyQuery.class);
+			System.out.println(gson.toJson(evaluateQuery(query)));
+			System.out.flush();
+		}
+	}
+
+	static MyQueryResult evaluateQuery(MyQuery query) {
       log(String.format("matching: pattern /%s/ against %d inputs", query.pattern, query.inputs.length));
 
       // Try to create regex
@@ -44,15 +74,28 @@ public class QueryJava {
 
 			List<MyMatchResult> matchResults = new ArrayList<MyMatchResult>();
 
+			// Per-input match deadline, if any
+			long timeoutNanos = 0 < query.timeoutPerInput ? (long) (query.timeoutPerInput * 1e9) : 0;
+
 			if (validPattern) {
 				// Attempt matches
 				for (int i = 0; i < query.inputs.length; i++) {
 					int matched = 0;
+					int timedOut = 0;
 					String matchedString = "";
 					List<String> captureGroups = new ArrayList<String>();
 
-					Matcher matcher = p.matcher(query.inputs[i]);
-					matched = matcher.find() ? 1 : 0; // Partial match
+					CharSequence input = query.inputs[i];
+					if (0 < timeoutNanos) {
+						input = new DeadlineCharSequence(query.inputs[i], System.nanoTime() + timeoutNanos);
+					}
+					Matcher matcher = p.matcher(input);
+					try {
+						matched = matcher.find() ? 1 : 0; // Partial match
+					} catch (DeadlineCharSequence.DeadlineExceeded e) {
+						log("Timed out");
+						timedOut = 1;
+					}
 
 					if (matched == 1) {
 						matchedString = matcher.group();
@@ -66,20 +109,13 @@ public class QueryJava {
 							}
 						}
 					}
-					MyMatchResult mmr = new MyMatchResult(query.inputs[i], matched, matchedString, captureGroups);
+					MyMatchResult mmr = new MyMatchResult(query.inputs[i], matched, timedOut, matchedString, captureGroups);
 					matchResults.add(mmr);
 				}
 			}
 
-			MyQueryResult mqr = new MyQueryResult(query.pattern, query.inputs, validPattern, matchResults);
-
-      // Emit
-      System.out.println(new Gson().toJson(mqr));
-    } else {
-      System.out.println("Usage: INVOCATION query.json");
-      System.exit(-1);
-    }
-  }
+			return new MyQueryResult(query.pattern, query.inputs, validPattern, matchResults);
+	}
 
  	/* https://stackoverflow.com/a/326440 */
 	static String readFile(String path, Charset encoding)
@@ -94,10 +130,53 @@ public class QueryJava {
 	}
 }
 
+/* A String whose charAt() throws once a deadline passes.
+ * java.util.regex reads the input through charAt() as it backtracks,
+ * so this bounds the time of a match without another thread. */
+class DeadlineCharSequence implements CharSequence {
+	static class DeadlineExceeded extends RuntimeException {
+		DeadlineExceeded() {
+			super("Match deadline exceeded", null, false, false);
+		}
+	}
+
+	// Checking the clock on every charAt() would be slow
+	private static final int CHECK_INTERVAL = 1 << 12;
+
+	private final String s;
+	private final long deadlineNanos;
+	private int nReads = 0;
+
+	public DeadlineCharSequence(String s, long deadlineNanos) {
+		this.s = s;
+		this.deadlineNanos = deadlineNanos;
+	}
+
+	public char charAt(int index) {
+		if (++nReads % CHECK_INTERVAL == 0 && deadlineNanos < System.nanoTime()) {
+			throw new DeadlineExceeded();
+		}
+		return s.charAt(index);
+	}
+
+	public int length() {
+		return s.length();
+	}
+
+	public CharSequence subSequence(int start, int end) {
+		return s.subSequence(start, end);
+	}
+
+	public String toString() {
+		return s;
+	}
+}
+
 // Represents overall query response
 class MyQuery {
 	public String pattern;
 	public String[] inputs;
+	public double timeoutPerInput; // Seconds. 0 (absent) means no limit.
 
 	public MyQuery(String pattern, String[] inputs) {
 		this.pattern = pattern;
@@ -126,11 +205,13 @@ class MyQueryResult {
 class MyMatchResult {
 	private String input;
 	private int matched; // 0 or 1
+	private int timedOut; // 0 or 1
 	private MyMatchContents matchContents;
 
-	public MyMatchResult (String input, int matched, String matchedString, List<String> captureGroups) {
+	public MyMatchResult (String input, int matched, int timedOut, String matchedString, List<String> captureGroups) {
 		this.input = input;
 		this.matched = matched;
+		this.timedOut = timedOut;
 		this.matchContents = new MyMatchContents(matchedString, captureGroups);
 	}
 }
@@ -3,72 +3,118 @@
 // Description: Test regex in Node.js
 
 var fs = require('fs');
+var readline = require('readline');
+var vm = require('vm');
+
+// For per-input match deadlines: V8 can only interrupt a match run under vm with a timeout
+var matchScript = new vm.Script('input.match(re)');
 
 // Arg parsing.
 var queryFile = process.argv[2];
 if (!queryFile) {
-  console.log(`Error, usage: ${process.argv[1]} query-file.json`);
+  console.log(`Error, usage: ${process.argv[1]} query-file.json | --daemon`);
   process.exit(1);
 }
 
-// Load query from file.
-var query = JSON.parse(fs.readFileSync(queryFile, 'utf-8'));
+if (queryFile === '--daemon') {
+  // Answer one NDJSON query per line on stdin until EOF
+  var rl = readline.createInterface({ input: process.stdin, terminal: false });
+  rl.on('line', (line) => {
+    if (line.trim().length === 0) {
+      return;
+    }
+    var query = JSON.parse(line);
+    if (!isValidQuery(query)) {
+      process.exit(1);
+    }
+    process.stdout.write(JSON.stringify(evaluateQuery(query)) + '\n');
+  });
+} else {
+  // Load query from file.
+  var query = JSON.parse(fs.readFileSync(queryFile, 'utf-8'));
+  if (!isValidQuery(query)) {
+    process.exit(1);
+  }
+  console.log(JSON.stringify(evaluateQuery(query)));
+  process.exit(0);
+}
 
 // Check query is valid.
-var validQuery = true;
-var requiredQueryKeys = ['pattern', 'inputs'];
-requiredQueryKeys.forEach((k) => {
-  if (typeof(query[k]) === 'undefined') {
-    validQuery = false;
+function isValidQuery(query) {
+  var validQuery = true;
+  var requiredQueryKeys = ['pattern', 'inputs'];
+  requiredQueryKeys.forEach((k) => {
+    if (typeof(query[k]) === 'undefined') {
+      validQuery = false;
+    }
+  });
+  if (!validQuery) {
+    console.error(`Error, invalid query. Need keys ${JSON.stringify(requiredQueryKeys)}. Got ${JSON.stringify(query)}`);
   }
-});
-if (!validQuery) {
-  console.error(`Error, invalid query. Need keys ${JSON.stringify(requiredQueryKeys)}. Got ${JSON.stringify(query)}`);
-  process.exit(1);
+  return validQuery;
 }
 
-// Try to match string against pattern.
-var result = query;
+// Try to match each input against pattern.
+// If query has timeoutPerInput (seconds), a match that takes longer is abandoned and reported as timedOut.
+function evaluateQuery(query) {
+  var result = query;
+
+  var results = [];
+  try {
+    var re = new RegExp(query.pattern);
+    result.validPattern = 1;
 
-results = [];
-try {
-	var re = new RegExp(query.pattern);
-	result.validPattern = 1;
+    var timeoutMs = 0 < query.timeoutPerInput ? Math.max(1, Math.round(1000 * query.timeoutPerInput)) : 0;
+    var context = timeoutMs ? vm.createContext({ re: re, input: '' }) : null;
 
-  query['inputs'].forEach(input => {
-    console.error(`matching: pattern /${query.pattern}/ inputStr: len ${input.length}`);
+    query['inputs'].forEach(input => {
+      console.error(`matching: pattern /${query.pattern}/ inputStr: len ${input.length}`);
 
-    var jsMatch = input.match(re); // Partial-match semantics
-    //console.error(`pattern /${query.pattern}/ input <${input}> jsMatch <${jsMatch}>`);
-    var matched = jsMatch ? 1 : 0;
-    var matchedString = '';
-    var captureGroups = [];
-    if (matched) {
-      matchedString = jsMatch[0];
-      captureGroups = jsMatch.slice(1).map(g => {
-        // Convert unused groups (null) to empty captures ("") for cross-language consistency
-        if (g == null) { 
-          return '';
-        } else {
-          return g;
+      var jsMatch = null;
+      var timedOut = 0;
+      if (context) {
+        context.input = input;
+        try {
+          jsMatch = matchScript.runInContext(context, { timeout: timeoutMs }); // Partial-match semantics
+        } catch (e) {
+          if (e.code !== 'ERR_SCRIPT_EXECUTION_TIMEOUT') {
+            throw e;
+          }
+          timedOut = 1;
         }
+      } else {
+        jsMatch = input.match(re); // Partial-match semantics
+      }
+      //console.error(`pattern /${query.pattern}/ input <${input}> jsMatch <${jsMatch}>`);
+      var matched = jsMatch ? 1 : 0;
+      var matchedString = '';
+      var captureGroups = [];
+      if (matched) {
+        matchedString = jsMatch[0];
+        captureGroups = jsMatch.slice(1).map(g => {
+          // Convert unused groups (null) to empty captures ("") for cross-language consistency
+          if (g == null) {
+            return '';
+          } else {
+            return g;
+          }
+        });
+      }
+      results.push({
+        "input": input,
+        "matched": matched,
+        "timedOut": timedOut,
+        "matchContents": {
+          "matchedString": matchedString,
+          "captureGroups": captureGroups,
+        },
       });
-    }
-    results.push({
-      "input": input,
-      "matched": matched,
-      "matchContents": {
-        "matchedString": matchedString,
-        "captureGroups": captureGroups,
-      },
     });
-  });
-} catch (e) {
-  console.error(e);
-	result.validPattern = 0;
-}
-result.results = results;
-
-console.log(JSON.stringify(result));
+  } catch (e) {
+    console.error(e);
+    result.validPattern = 0;
+  }
+  result.results = results;
 
-process.exit(0);
+  return result;
+}
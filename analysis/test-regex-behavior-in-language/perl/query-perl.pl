@@ -7,59 +7,48 @@ use warnings;
 
 use JSON::PP; # I/O
 use Carp;
+use POSIX ();
+use Time::HiRes ();
+
+# Per-input match deadlines.
+# Perl defers ("safe") signals until the current op finishes, and a match is one op.
+# A handler installed with sigaction is unsafe, so the alarm interrupts the match.
+my $MATCH_TIMEOUT = "MATCH_TIMEOUT\n";
+POSIX::sigaction(POSIX::SIGALRM(), POSIX::SigAction->new(sub { die $MATCH_TIMEOUT }));
 
 # Arg parsing.
 my $queryFile = $ARGV[0];
 if (not defined($queryFile)) {
-  print "Error, usage: $0 query-file.json\n";
+  print "Error, usage: $0 query-file.json | --daemon\n";
   exit 1;
 }
 
+if ($queryFile eq "--daemon") {
+  # Answer one NDJSON query per line on STDIN until EOF
+  $| = 1;
+  while (my $line = <STDIN>) {
+    chomp $line;
+    next if ($line =~ m/^\s*$/);
+    my $query = decode_json($line);
+    if (not &isValidQuery($query)) {
+      exit 1;
+    }
+    print encode_json(&evaluateQuery($query)) . "\n";
+  }
+  exit 0;
+}
+
 # Load query from file.
 my $query = decode_json(&readFile("file"=>$queryFile));
 
 # Check query is valid.
-my $validQuery = 1;
-my @requiredQueryKeys = ('pattern', 'inputs');
-for my $k (@requiredQueryKeys) {
-  if (not defined($query->{$k})) {
-    $validQuery = 0;
-  }
-};
-if (not $validQuery) {
-  &log("Error, invalid query. Need keys <@requiredQueryKeys>. Got " . encode_json($query));
+if (not &isValidQuery($query)) {
   exit 1;
 }
 
 &log("Query is valid");
 
-# Try to match string against pattern.
-
-
-my @resultObjs;
-
-my $result = $query;
-for my $input (@{$query->{inputs}}) {
-  my ($validPattern, $matched, $matchedString, $captureGroups) = &getResult($query->{pattern}, $input);
-  if ($validPattern) {
-    $result->{validPattern} = 1;
-    my $resultObj = {
-      "input" => $input,
-      "matched" => $matched,
-      "matchContents" => {
-        "matchedString" => $matchedString,
-        "captureGroups" => $captureGroups,
-      },
-    };
-    push @resultObjs, $resultObj;
-  } else {
-    $result->{validPattern} = 0;
-    last;
-  }
-}
-$result->{results} = \@resultObjs;
-
-print encode_json($result) . "\n";
+print encode_json(&evaluateQuery($query)) . "\n";
 exit 0;
 
 ##################
@@ -70,6 +59,64 @@ sub log {
   print STDERR "$now: $msg\n";
 }
 
+# input: ($query)
+# output: true if $query has the required keys, else false
+sub isValidQuery {
+  my ($query) = @_;
+
+  my $validQuery = 1;
+  my @requiredQueryKeys = ('pattern', 'inputs');
+  for my $k (@requiredQueryKeys) {
+    if (not defined($query->{$k})) {
+      $validQuery = 0;
+    }
+  };
+  if (not $validQuery) {
+    &log("Error, invalid query. Need keys <@requiredQueryKeys>. Got " . encode_json($query));
+  }
+
+  return $validQuery;
+}
+
+# Try to match each input against pattern.
+# input: ($query)
+# output: $result: $query with validPattern and results populated
+#   If $query has timeoutPerInput (seconds), a match that takes longer is abandoned and reported as timedOut.
+sub evaluateQuery {
+  my ($query) = @_;
+
+  my @resultObjs;
+
+  my $timeout = $query->{timeoutPerInput};
+  if (defined($timeout) and $timeout <= 0) {
+    $timeout = undef;
+  }
+
+  my $result = $query;
+  for my $input (@{$query->{inputs}}) {
+    my ($validPattern, $matched, $matchedString, $captureGroups, $timedOut) = &getResult($query->{pattern}, $input, $timeout);
+    if ($validPattern) {
+      $result->{validPattern} = 1;
+      my $resultObj = {
+        "input" => $input,
+        "matched" => $matched,
+        "timedOut" => $timedOut,
+        "matchContents" => {
+          "matchedString" => $matchedString,
+          "captureGroups" => $captureGroups,
+        },
+      };
+      push @resultObjs, $resultObj;
+    } else {
+      $result->{validPattern} = 0;
+      last;
+    }
+  }
+  $result->{results} = \@resultObjs;
+
+  return $result;
+}
+
 # input: %args: keys: file
 # output: $contents
 sub readFile {
@@ -82,9 +129,10 @@ sub readFile {
   return $contents;
 }
 
-# returns: ($validPattern, $matched, $matchedString, $captureGroups)
+# input: ($pattern, $input, $timeout): $timeout in seconds, or undef for no limit
+# returns: ($validPattern, $matched, $matchedString, $captureGroups, $timedOut)
 sub getResult {
-  my ($pattern, $input) = @_;
+  my ($pattern, $input, $timeout) = @_;
 
   my $len = length($input);
   &log("matching: pattern /$pattern/ inputStr: len $len");
@@ -93,9 +141,11 @@ sub getResult {
   my $matched = 0;
   my $matchedString = "";
   my $captureGroups = [];
+  my $timedOut = 0;
 
-  # Eval in case the regex is invalid
+  # Eval in case the regex is invalid, or the match times out
   eval {
+    Time::HiRes::alarm($timeout) if (defined($timeout));
     # Perform the match
     # TODO Match by variable interpolation works with most escaped directives but has problems with \Q and \E.
     if ($input =~ m/$pattern/) {
@@ -112,16 +162,22 @@ sub getResult {
         $captureGroups = \@matches;
       }
     }
+    Time::HiRes::alarm(0) if (defined($timeout));
   };
+  Time::HiRes::alarm(0) if (defined($timeout));
 
   # this just catches all warnings -- can we specify by anything other than string text?
-  if ($@) {
+  if ($@ eq $MATCH_TIMEOUT) {
+    # Valid, but too slow
+    &log("Timed out");
+    ($validPattern, $timedOut, $matched, $matchedString, $captureGroups) = (1, 1, 0, "", []);
+  } elsif ($@) {
     $validPattern = 0;
   } else {
     # No exceptions -- valid pattern
     $validPattern = 1;
   }
 
-  return ($validPattern, $matched, $matchedString, $captureGroups);
+  return ($validPattern, $matched, $matchedString, $captureGroups, $timedOut);
 }
 
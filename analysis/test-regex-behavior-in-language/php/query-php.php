@@ -31,8 +31,14 @@ function patternAsPHPRegex($pat) {
   return NULL;
 }
 
-# returns: ($validPattern, $matched, $matchedString, $captureGroups)
+// PCRE gives up on a match that exceeds these limits. We report that as a timeout.
+// PHP cannot interrupt a match on a clock, so timeoutPerInput has no other effect here.
+$PCRE_LIMIT_ERRORS = [PREG_BACKTRACK_LIMIT_ERROR, PREG_RECURSION_LIMIT_ERROR, PREG_JIT_STACKLIMIT_ERROR];
+
+# returns: ($validPattern, $matched, $matchedString, $captureGroups, $timedOut)
 function getResult($pattern, $input) {
+  global $PCRE_LIMIT_ERRORS;
+
   my_log('matching: Pattern ' . $pattern . ', input: len ' . strlen($input));
 
   $validPattern = 0;
@@ -48,6 +54,7 @@ function getResult($pattern, $input) {
   // will return OK even if there's compilation problems.
   // PHP 7.4-dev emits a warning unless we @ to ignore it.
   $except = @array_flip(get_defined_constants(true)['pcre'])[preg_last_error()];
+  $timedOut = in_array(preg_last_error(), $PCRE_LIMIT_ERRORS) ? 1 : 0;
 
   // check for compilation
   $compilation_failed_message = 'preg_match(): Compilation failed:';
@@ -74,18 +81,11 @@ function getResult($pattern, $input) {
     $captureGroups = array_slice($matches, 1);
   }
 
-  return [$validPattern, $matched, $matchedString, $captureGroups];
+  return [$validPattern, $matched, $matchedString, $captureGroups, $timedOut];
 }
 
-function main() {
-  // Assume args are correct, this is a horrible language.
-  global $argc, $argv;
-  $FH = fopen($argv[1], "r") or die("Unable to open file!");
-  $cont = fread($FH, filesize($argv[1]));
-  fclose($FH);
-
-  $query = json_decode($cont);
-
+// Returns $query, with validPattern and results populated
+function evaluateQuery($query) {
   // Get a suitable regex string for PHP: /pattern/ etc.
   $phpPattern = patternAsPHPRegex($query->{'pattern'});
 
@@ -102,6 +102,7 @@ function main() {
       $matched = $res[1];
       $matchedString = $res[2];
       $captureGroups = $res[3];
+      $timedOut = $res[4];
 
       if (!$validPattern) {
         $query->{'validPattern'} = 0;
@@ -110,6 +111,7 @@ function main() {
         $resultObj = array(
           "input" => $input,
           "matched" => $matched,
+          "timedOut" => $timedOut,
           "matchContents" => array(
             "matchedString" => $matchedString,
             "captureGroups" => $captureGroups,
@@ -122,7 +124,37 @@ function main() {
     $query->{'results'} = $results;
   }
 
-  fwrite(STDOUT, json_encode($query) . "\n");
+  return $query;
+}
+
+// Answer one NDJSON query per line on STDIN until EOF
+function daemon() {
+  while (($line = fgets(STDIN)) !== false) {
+    if (trim($line) === '') {
+      continue;
+    }
+    // Each query gets a clean slate for the compilation check in getResult
+    error_clear_last();
+    fwrite(STDOUT, json_encode(evaluateQuery(json_decode($line))) . "\n");
+    fflush(STDOUT);
+  }
+}
+
+function main() {
+  // Assume args are correct, this is a horrible language.
+  global $argc, $argv;
+  if ($argv[1] === '--daemon') {
+    daemon();
+    exit(0);
+  }
+
+  $FH = fopen($argv[1], "r") or die("Unable to open file!");
+  $cont = fread($FH, filesize($argv[1]));
+  fclose($FH);
+
+  $query = json_decode($cont);
+
+  fwrite(STDOUT, json_encode(evaluateQuery($query)) . "\n");
 
   // Whew.
   exit(0);
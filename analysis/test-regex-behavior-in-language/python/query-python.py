@@ -5,13 +5,19 @@
 import sys
 import json
 import re
+import signal
+import threading
 
 def main():
   # Arg parsing.
   if len(sys.argv) != 2:
-    print("Error, usage: {} query-file.json".format(sys.argv[0]))
+    print("Error, usage: {} query-file.json | --daemon".format(sys.argv[0]))
     sys.exit(1)
 
+  if sys.argv[1] == '--daemon':
+    daemon()
+    return
+
   queryFile = sys.argv[1]
 
   with open(queryFile, 'r', encoding='utf-8') as FH:
@@ -19,10 +25,55 @@ def main():
     log("Contents of {}: {}".format(queryFile, cont))
     obj = json.loads(cont)
 
+  sys.stdout.write(json.dumps(evaluateQuery(obj)) + '\n')
+
+def daemon():
+  """Answer one NDJSON query per line on stdin until EOF"""
+  for line in sys.stdin:
+    line = line.strip()
+    if len(line) == 0:
+      continue
+    sys.stdout.write(json.dumps(evaluateQuery(json.loads(line))) + '\n')
+    sys.stdout.flush()
+
+class MatchTimeout(Exception):
+  pass
+
+def onAlarm(signum, frame):
+  raise MatchTimeout()
+
+def searchWithTimeout(regexp, stringToTry, timeout):
+  """regexp.search(stringToTry), giving up after timeout seconds (None: no limit)
+
+  re checks for signals as it matches, so SIGALRM interrupts a runaway match.
+  Raises MatchTimeout.
+  """
+  # Only the main thread receives signals
+  if timeout is None or threading.current_thread() is not threading.main_thread():
+    return regexp.search(stringToTry)
+
+  oldHandler = signal.signal(signal.SIGALRM, onAlarm)
+  signal.setitimer(signal.ITIMER_REAL, timeout)
+  try:
+    return regexp.search(stringToTry)
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, oldHandler)
+
+def evaluateQuery(obj, compile=re.compile):
+  """Returns obj, with validPattern and results populated
+
+  compile: how to compile obj['pattern']. libLF passes a caching re.compile.
+  If obj has timeoutPerInput (seconds), a match that takes longer is abandoned and reported as timedOut.
+  """
+  timeout = obj.get('timeoutPerInput')
+  if timeout is not None and timeout <= 0:
+    timeout = None
+
   # Prepare a regexp
   resultObjects = []
   try:
-    regexp = re.compile(obj['pattern'])
+    regexp = compile(obj['pattern'])
     obj['validPattern'] = True
 
     for stringToTry in obj['inputs']:
@@ -31,7 +82,12 @@ def main():
       # Try a match
       log("matching: pattern /{}/ input: length {}".format(obj['pattern'], len(stringToTry)))
       #matchResult = regexp.match(obj['input']) # Full-match semantics -- better case
-      matchResult = regexp.search(stringToTry) # Partial-match semantics -- worse case
+      try:
+        matchResult = searchWithTimeout(regexp, stringToTry, timeout) # Partial-match semantics -- worse case
+        resultObj['timedOut'] = 0
+      except MatchTimeout:
+        matchResult = None
+        resultObj['timedOut'] = 1
 
       # Print result
       resultObj['inputLength'] = len(stringToTry)
@@ -49,13 +105,15 @@ def main():
   except BaseException as e:
     log('Exception: ' + str(e))
     obj['validPattern'] = False
-  
+
   obj['results'] = resultObjects
-  sys.stdout.write(json.dumps(obj) + '\n')
+  return obj
 
 def log(msg):
   sys.stderr.write(msg + '\n')
 
 ############
 
-main()
+# libLF imports evaluateQuery to test Python regexes in-process
+if __name__ == '__main__':
+  main()
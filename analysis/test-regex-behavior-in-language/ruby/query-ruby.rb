@@ -3,24 +3,47 @@
 # Description: Test regex in Ruby
 
 require 'json'
+require 'timeout'
 
 def my_log(msg)
   STDERR.puts msg + "\n"
 end
 
-def main()
-  # Assume args are correct.
-  file = ARGV[0]
+# Ruby 3.2 added Regexp match timeouts. Before that, Timeout can interrupt a match.
+HAS_REGEXP_TIMEOUT = Regexp.respond_to?(:timeout)
+TIMEOUT_ERRORS = HAS_REGEXP_TIMEOUT ? [Regexp::TimeoutError, Timeout::Error] : [Timeout::Error]
 
-  cont = File.read(file)
-  query = JSON.parse(cont)
+# Match input against regexp, giving up after timeout seconds (nil: no limit).
+# Returns [MatchData or nil, timedOut]
+def matchWithTimeout(pattern, input, timeout)
+  if timeout.nil?
+    return [/#{pattern}/.match(input), false]
+  end
+  begin
+    if HAS_REGEXP_TIMEOUT
+      return [Regexp.new(/#{pattern}/, timeout: timeout).match(input), false]
+    end
+    Timeout.timeout(timeout) { return [/#{pattern}/.match(input), false] }
+  rescue *TIMEOUT_ERRORS
+    return [nil, true]
+  end
+end
+
+# Try to match each input against query['pattern'].
+# Returns query with validPattern and results populated.
+# If query has timeoutPerInput (seconds), a match that takes longer is abandoned and reported as timedOut.
+def evaluateQuery(query)
+  timeout = query['timeoutPerInput']
+  if timeout and timeout <= 0
+    timeout = nil
+  end
 
   # Query regexp.
   results = []
   begin
     query['inputs'].each { |input|
       my_log("matching: pattern /" + query['pattern'] + "/ input: length " + input.length.to_s)
-      md = /#{query['pattern']}/.match(input) # Partial match
+      md, timedOut = matchWithTimeout(query['pattern'], input, timeout) # Partial match
       query['validPattern'] = 1
 
       input = input
@@ -55,6 +78,7 @@ def main()
       results.push({
         "input" => input,
         "matched" => matched,
+        "timedOut" => timedOut ? 1 : 0,
         "matchContents" => {
           "matchedString" => matchedString,
           "captureGroups" => captureGroups,
@@ -68,8 +92,32 @@ def main()
   end
   query['results'] = results
 
+  return query
+end
+
+# Answer one NDJSON query per line on STDIN until EOF.
+def daemon()
+  STDOUT.sync = true
+  STDIN.each_line { |line|
+    next if line.strip.empty?
+    STDOUT.puts JSON.generate(evaluateQuery(JSON.parse(line)))
+  }
+end
+
+def main()
+  # Assume args are correct.
+  if ARGV[0] == "--daemon"
+    daemon()
+    exit(0)
+  end
+
+  file = ARGV[0]
+
+  cont = File.read(file)
+  query = JSON.parse(cont)
+
   # Compose output.
-  str = JSON.generate(query)
+  str = JSON.generate(evaluateQuery(query))
   STDOUT.puts str + "\n"
 
   # Whew.
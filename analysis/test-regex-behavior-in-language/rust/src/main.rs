@@ -8,6 +8,7 @@ use std::env;
 // File I/O
 use std::fs::File;
 use std::io::prelude::*;
+use std::io;
 
 // JSON
 extern crate serde;
@@ -40,6 +41,8 @@ struct MatchContents {
 struct MatchResult {
   input: String,
   matched: bool,
+  // The regex crate matches in linear time, so we ignore timeoutPerInput and never time out
+  timedOut: bool,
   matchContents: MatchContents,
 }
 
@@ -51,25 +54,8 @@ struct QueryResult {
   results: Vec<MatchResult>,
 }
 
-fn main() {
-	// Get file from command-line args
-	let args: Vec<String> = env::args().collect();
-	let filename = &args[1];
-	eprintln!("File: {}", filename);
-
-	// Read file contents into string
-	let mut f = File::open(filename).expect("file not found");
-
-	let mut contents = String::new();
-	f.read_to_string(&mut contents)
-			.expect("something went wrong reading the file");
-
-	eprintln!("File contents:\n{}", contents);
-
-	// Parse as JSON
-	let query: Query = serde_json::from_str(&contents).unwrap();
-  eprintln!("The pattern is: {}", query.pattern);
-
+// Evaluate the Query as a QueryResult
+fn evaluate_query(query: &Query) -> QueryResult {
   // Prep a QueryResult
 	let mut queryResult: QueryResult = QueryResult{
 		pattern: query.pattern.clone(),
@@ -116,6 +102,7 @@ fn main() {
 				let mr: MatchResult = MatchResult{
 					input: input.to_string(),
 					matched: matched,
+					timedOut: false,
 					matchContents: MatchContents{
 						matchedString: matchedString,
 						captureGroups: captureGroups,
@@ -131,5 +118,48 @@ fn main() {
 		}
 	};
 
-	println!("{}", serde_json::to_string(&queryResult).unwrap());
+	queryResult
+}
+
+// Answer one NDJSON query per line on stdin until EOF
+fn daemon() {
+	let stdin = io::stdin();
+	let stdout = io::stdout();
+	for line in stdin.lock().lines() {
+		let line = line.expect("something went wrong reading stdin");
+		if line.trim().is_empty() {
+			continue;
+		}
+
+		let query: Query = serde_json::from_str(&line).unwrap();
+		let mut out = stdout.lock();
+		writeln!(out, "{}", serde_json::to_string(&evaluate_query(&query)).unwrap()).unwrap();
+		out.flush().unwrap();
+	}
+}
+
+fn main() {
+	// Get file from command-line args
+	let args: Vec<String> = env::args().collect();
+	let filename = &args[1];
+	if filename == "--daemon" {
+		daemon();
+		return;
+	}
+	eprintln!("File: {}", filename);
+
+	// Read file contents into string
+	let mut f = File::open(filename).expect("file not found");
+
+	let mut contents = String::new();
+	f.read_to_string(&mut contents)
+			.expect("something went wrong reading the file");
+
+	eprintln!("File contents:\n{}", contents);
+
+	// Parse as JSON
+	let query: Query = serde_json::from_str(&contents).unwrap();
+  eprintln!("The pattern is: {}", query.pattern);
+
+	println!("{}", serde_json::to_string(&evaluate_query(&query)).unwrap());
 }
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# Extract regexes from each GitHubProject in a list, by running regex-extractor.py on its tarball.
+# Output: the same GHPs, with regexPath populated.
+# Projects run a few at a time, largest tarball first: the big ones start early,
+# so that no single project runs on long after the rest are done.
+
+# Import libLF
+import os
+import sys
+import re
+sys.path.append('{}/lib'.format(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT']))
+import libLF
+import argparse
+import subprocess
+import signal
+import shutil
+import time
+
+#######
+# Globals
+#######
+
+REGEX_EXTRACTOR = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'data', 'production-regexes', 'static-extractors', 'regex-extractor.py')
+
+# regex-extractor.py streams source files through <parent>/regex-extractor/<pid>.
+# If we kill it, we clean up after it.
+EXTRACTOR_SCRATCH_PARENT_DIRS = [os.path.join(os.sep, 'dev', 'shm'), os.path.join(os.sep, 'tmp')]
+
+# On a timeout, regex-extractor.py gets SIGTERM, and this long to stop its extractor daemons, before SIGKILL
+PROJECT_KILL_GRACE_SEC = 5
+
+#######
+# Tasks
+#######
+
+def ghpKey(ghp):
+  """Identifies ghp in the journal"""
+  return '{}/{}/{}'.format(ghp.registry, ghp.owner, ghp.name)
+
+def defaultRegexPath(ghp, regexDir):
+  """Where to put ghp's regexes: in regexDir/<registry>/, or else next to its tarball"""
+  if regexDir is None:
+    return re.sub(r'(\.tar\.gz|\.tgz|\.tar)$', '', ghp.tarballPath) + '.json'
+  return os.path.join(regexDir, ghp.registry, '{}-{}.json'.format(ghp.owner, ghp.name))
+
+class ExtractProjectTask(libLF.parallel.ParallelTask):
+  def __init__(self, ghp, regexPath, regexExtractor, filesParallelism, noDaemons, resultCache, projectTimeout):
+    self.ghp = ghp
+    self.regexPath = regexPath
+    self.regexExtractor = regexExtractor
+    self.filesParallelism = filesParallelism
+    self.noDaemons = noDaemons
+    self.resultCache = resultCache
+    self.projectTimeout = projectTimeout
+
+  def run(self):
+    """Returns ghp, with regexPath populated if the extraction succeeded
+
+    ghp.extractStatus is one of 'ok', 'failed', 'timedOut'
+    """
+    # Write to a temp file, so a regexPath never names a partial extraction
+    tmpRegexPath = self.regexPath + '.tmp'
+    os.makedirs(os.path.dirname(os.path.abspath(self.regexPath)), exist_ok=True)
+    cmd = [self.regexExtractor, '--registry', self.ghp.registry, '--src-path', self.ghp.tarballPath,
+      '--out-file', tmpRegexPath, '--parallelism', str(self.filesParallelism)]
+    if self.noDaemons:
+      cmd.append('--no-daemons')
+    if self.resultCache is not None:
+      cmd += ['--result-cache', self.resultCache]
+
+    libLF.log('Extracting from {} ({})'.format(ghpKey(self.ghp), self.ghp.tarballPath))
+    startTime = time.time()
+    # Own session, so that on timeout we can signal regex-extractor.py and its workers together
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, close_fds=True, start_new_session=True)
+    try:
+      rc = proc.wait(timeout=None if self.projectTimeout < 0 else self.projectTimeout)
+    except subprocess.TimeoutExpired:
+      self._kill(proc)
+      self._cleanUpAfter(proc.pid, tmpRegexPath)
+      libLF.log('Timed out after {} seconds: {}'.format(self.projectTimeout, ghpKey(self.ghp)))
+      self.ghp.regexPath = libLF.GitHubProject.NoRegexPath
+      self.ghp.extractStatus = 'timedOut'
+      return self.ghp
+
+    elapsed = time.time() - startTime
+    if rc == 0:
+      os.replace(tmpRegexPath, self.regexPath)
+      libLF.log('Extracted from {} in {:.1f} seconds'.format(ghpKey(self.ghp), elapsed))
+      self.ghp.regexPath = self.regexPath
+      self.ghp.extractStatus = 'ok'
+    else:
+      self._cleanUpAfter(proc.pid, tmpRegexPath)
+      libLF.log('regex-extractor.py returned {} for {}'.format(rc, ghpKey(self.ghp)))
+      self.ghp.regexPath = libLF.GitHubProject.NoRegexPath
+      self.ghp.extractStatus = 'failed'
+    return self.ghp
+
+  def _kill(self, proc):
+    """Kill regex-extractor.py's process group, and the extractor daemons it started in their own sessions
+
+    SIGTERM first: regex-extractor.py and its workers kill their daemons on the way out.
+    Then SIGKILL for whatever is left of the group.
+    """
+    try:
+      os.killpg(proc.pid, signal.SIGTERM)
+    except OSError:
+      pass
+    deadline = time.time() + PROJECT_KILL_GRACE_SEC
+    while time.time() < deadline:
+      if proc.poll() is not None and not self._groupExists(proc.pid):
+        break
+      time.sleep(0.05)
+    try:
+      os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+      pass
+    proc.wait()
+
+  def _groupExists(self, pgid):
+    try:
+      os.killpg(pgid, 0)
+      return True
+    except ProcessLookupError:
+      return False
+    except OSError:
+      return True
+
+  def _cleanUpAfter(self, pid, tmpRegexPath):
+    """Remove what a regex-extractor.py that did not finish left behind"""
+    if os.path.exists(tmpRegexPath):
+      os.remove(tmpRegexPath)
+    for parent in EXTRACTOR_SCRATCH_PARENT_DIRS:
+      shutil.rmtree(os.path.join(parent, 'regex-extractor', str(pid)), ignore_errors=True)
+
+def getGHPs(ghpFile):
+  """Return a list of GHPs"""
+  ghps = []
+  with open(ghpFile, 'r') as inStream:
+    for line in inStream:
+      line = line.strip()
+      if len(line) == 0:
+        continue
+
+      try:
+        ghp = libLF.GitHubProject()
+        ghp.initFromJSON(line)
+        ghps.append(ghp)
+      except KeyboardInterrupt:
+        raise
+      except BaseException as err:
+        libLF.log('Exception parsing line:\n  {}\n  {}'.format(line, err))
+
+  libLF.log('Loaded {} ghps from {}'.format(len(ghps), ghpFile))
+  return ghps
+
+def tarballSize(ghp):
+  try:
+    return os.path.getsize(ghp.tarballPath)
+  except OSError:
+    return -1
+
+def getTasks(ghps, regexDir, regexExtractor, filesParallelism, noDaemons, resultCache, projectTimeout):
+  """One task per GHP with a tarball, largest tarball first
+
+  imap_unordered hands out tasks in order, so the largest projects start first.
+
+  @returns tasks, noTarballGHPs
+  """
+  tasks = []
+  noTarballGHPs = []
+  for ghp in ghps:
+    if ghp.tarballPath == libLF.GitHubProject.NoTarballPath or not os.path.isfile(ghp.tarballPath):
+      libLF.log('No tarball for {}, skipping'.format(ghpKey(ghp)))
+      noTarballGHPs.append(ghp)
+      continue
+    tasks.append(ExtractProjectTask(ghp, defaultRegexPath(ghp, regexDir), regexExtractor, filesParallelism, noDaemons, resultCache, projectTimeout))
+  tasks.sort(key=lambda t: tarballSize(t.ghp), reverse=True)
+  return tasks, noTarballGHPs
+
+################
+
+def main(ghpFile, outFile, regexDir, regexExtractor, parallelism, filesParallelism, noDaemons, projectTimeout, resume, resultCache):
+  libLF.log('ghpFile {} outFile {} regexDir {} regexExtractor {} parallelism {} filesParallelism {} noDaemons {} projectTimeout {} resume {} resultCache {}' \
+    .format(ghpFile, outFile, regexDir, regexExtractor, parallelism, filesParallelism, noDaemons, projectTimeout, resume, resultCache))
+
+  #### Load data
+  ghps = getGHPs(ghpFile)
+  tasks, noTarballGHPs = getTasks(ghps, regexDir, regexExtractor, filesParallelism, noDaemons, resultCache, projectTimeout)
+
+  # Skip the projects we finished last time
+  journal = libLF.ResumeJournal(outFile, resume)
+  tasks = [t for t in tasks if not journal.isDone(ghpKey(t.ghp))]
+  noTarballGHPs = [ghp for ghp in noTarballGHPs if not journal.isDone(ghpKey(ghp))]
+  libLF.log('{} projects to do ({} already done)'.format(len(tasks), journal.nDone()))
+
+  cache = None
+  if resultCache is not None:
+    # The workers' regex-extractor.py's fill it. We just report on it.
+    cache = libLF.ResultCache(resultCache)
+    # Workers only put, so keep the cache within its size here
+    cache.evict()
+    cacheStatsBefore = cache.stats()
+
+  #### Process data
+  libLF.log('Extracting regexes from {} projects, {} at a time'.format(len(tasks), parallelism))
+  results = libLF.parallel.imap_unordered(tasks, parallelism,
+    libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
+    jitter=False)
+
+  #### Emit results
+  nOK = 0
+  nFailed = 0
+  nTimedOut = 0
+  nExceptions = 0
+  with journal:
+    # Pass these through unchanged, so that OUT_FILE has every GHP
+    for ghp in noTarballGHPs:
+      journal.write(ghpKey(ghp), ghp.toNDJSON())
+
+    for ghp in results:
+      if type(ghp) is libLF.GitHubProject:
+        if ghp.extractStatus == 'ok':
+          nOK += 1
+        elif ghp.extractStatus == 'timedOut':
+          nTimedOut += 1
+        else:
+          nFailed += 1
+        # Failed and timed-out projects are done too: we do not retry them on --resume
+        journal.write(ghpKey(ghp), ghp.toNDJSON())
+      else:
+        # Not journaled, so --resume will try it again
+        nExceptions += 1
+        libLF.log('Exception: {}'.format(ghp))
+
+  libLF.log('{} projects: {} extracted, {} failed, {} timed out, {} exceptions' \
+    .format(len(tasks), nOK, nFailed, nTimedOut, nExceptions))
+  if cache is not None:
+    cache.logStats(cacheStatsBefore)
+    cache.evict()
+
+#####################################################
+
+# Parse args
+parser = argparse.ArgumentParser(description='Extract regexes from each libLF.GitHubProject in a list, using regex-extractor.py')
+parser.add_argument('--ghp-file', type=str, help='In: NDJSON of libLF.GitHubProject objects with tarballPath populated', required=True,
+  dest='ghpFile')
+parser.add_argument('--out-file', type=str, help='Out: NDJSON of the same libLF.GitHubProject objects, with regexPath populated (NoRegexPath if there was no tarball, or extraction failed or timed out)', required=True,
+  dest='outFile')
+parser.add_argument('--regex-dir', type=str, help='Write each project\'s RegexUsage objects to REGEX_DIR/<registry>/<owner>-<name>.json (default: next to its tarball)', required=False, default=None,
+  dest='regexDir')
+parser.add_argument('--regex-extractor', type=str, help='Run this instead of regex-extractor.py, e.g. another checkout\'s. Must take the same arguments (default: the regex-extractor.py next to this script)', required=False, default=REGEX_EXTRACTOR,
+  dest='regexExtractor')
+parser.add_argument('--parallelism', type=int, help='Extract from this many projects at a time (default: one per core)', required=False, default=libLF.parallel.CPUCount.CPU_BOUND,
+  dest='parallelism')
+parser.add_argument('--files-parallelism', type=int, help='Each project\'s regex-extractor.py extracts from this many files at a time (default 1). Up to PARALLELISM * FILES_PARALLELISM extractors run at once', required=False, default=1,
+  dest='filesParallelism')
+parser.add_argument('--no-daemons', help='Passed to regex-extractor.py: launch the extractor once per file', required=False, default=False, action='store_true',
+  dest='noDaemons')
+parser.add_argument('--project-timeout', type=float, help='Kill the extraction of a project after T seconds, and record it without a regexPath (default 3600, give -1 for no limit)', required=False, default=60 * 60,
+  dest='projectTimeout')
+parser.add_argument('--resume', help='Resume an interrupted run: keep the projects already journaled in OUT_FILE.journal and skip them', required=False, action='store_true', default=False,
+  dest='resume')
+parser.add_argument('--result-cache', type=str, help='Passed to regex-extractor.py: cache each file\'s extraction result in this SQLite file (libLF.ResultCache), shared across projects (default: no cache)', required=False, default=None,
+  dest='resultCache')
+args = parser.parse_args()
+
+# Here we go!
+main(args.ghpFile, args.outFile, args.regexDir, args.regexExtractor, args.parallelism, args.filesParallelism, args.noDaemons, args.projectTimeout, args.resume, args.resultCache)
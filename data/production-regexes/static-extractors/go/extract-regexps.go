@@ -3,6 +3,7 @@
 //   fileName is the path provided
 //   regexes is an array of objects, each with keys: pattern flags
 //   pattern and flags are each either a string or 'DYNAMIC-{PATTERN|FLAGS}'
+// With --daemon, reads one file path per line on stdin and prints one such object per path, until EOF.
 
 package main
 
@@ -11,6 +12,7 @@ package main
 ///////////
 
 import (
+  "bufio"
   "fmt"
   "os"
   "encoding/json"
@@ -133,17 +135,13 @@ func tryToGetRegexUsageFromCallExpr(node *ast.CallExpr) (regexUsage RegexUsage,
 // main
 ///////////
 
-func main() {
-  if len(os.Args) <= 1 {
-	fmt.Printf("Usage: extract-regexps source.go\n")
-	os.Exit(1)
-  }
-
-  // Load file contents
-  sourceFileToParse := os.Args[1]
+// Fill in allRegexes from the source file
+func extractFile(sourceFileToParse string) {
   myLog("Extracting regexps from " + sourceFileToParse)
 
-  // Initialize allRegexes
+  // Initialize allRegexes. A daemon extracts from many files.
+  FOUND_REGEXP_IMPORT = false
+  allRegexes = AllRegexes{}
   allRegexes.Language = "go"
   allRegexes.Filename = sourceFileToParse
   // Empty array, not nil, for consistency with other extractors
@@ -180,8 +178,40 @@ func main() {
   } else {
 	allRegexes.CouldParse = false
   }
+}
 
-  // Emit
+func emit(out *bufio.Writer) {
   str, _ := json.Marshal(allRegexes)
-  fmt.Println(string(str))
+  out.Write(str)
+  out.WriteString("\n")
+  out.Flush()
+}
+
+///////////
+// main
+///////////
+
+func main() {
+  if len(os.Args) <= 1 {
+	fmt.Printf("Usage: extract-regexps source.go | --daemon\n")
+	os.Exit(1)
+  }
+
+  out := bufio.NewWriter(os.Stdout)
+  if os.Args[1] == "--daemon" {
+    // One file path per line on stdin, one result per line on stdout, until EOF
+    scanner := bufio.NewScanner(os.Stdin)
+    for scanner.Scan() {
+      sourceFileToParse := scanner.Text()
+      if sourceFileToParse == "" {
+        continue
+      }
+      extractFile(sourceFileToParse)
+      emit(out)
+    }
+    return
+  }
+
+  extractFile(os.Args[1])
+  emit(out)
 }
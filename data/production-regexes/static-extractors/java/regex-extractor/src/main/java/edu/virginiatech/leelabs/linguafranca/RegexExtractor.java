@@ -20,8 +20,10 @@ import com.github.javaparser.resolution.UnsolvedSymbolException;
 
 import com.google.common.base.Strings;
 
+import java.io.BufferedReader;
 import java.io.File;
 import java.io.IOException;
+import java.io.InputStreamReader;
 
 import java.util.regex.Pattern;
 import java.util.regex.Matcher;
@@ -234,26 +236,43 @@ public class RegexExtractor {
     return replacement;
   }
 
-  public static void main(String[] args) {
-    if (args.length == 1) {
-      String fileName = args[0];
-      File fileToAnalyze = new File(fileName);
-      Output_SimpleFileWithRegexes out = null;
-      try {
-        List<MyRegex> regexes = extractRegexes(fileToAnalyze);
-        out =
-          new Output_SimpleFileWithRegexes(fileName, "java", true, regexes);
-        System.err.println("Got " + regexes.size() + " regexes");
-      } catch (Exception e) {
-        System.err.println("main: Exception: " + e);
-        e.printStackTrace(System.err);
-        out =
-          new Output_SimpleFileWithRegexes(fileName, "java", false, null);
+  /**
+   * @returns: the SimpleFileWithRegexes for fileName, as JSON
+   */
+  private static String extractFile(String fileName, Gson gson) {
+    File fileToAnalyze = new File(fileName);
+    Output_SimpleFileWithRegexes out = null;
+    try {
+      List<MyRegex> regexes = extractRegexes(fileToAnalyze);
+      out =
+        new Output_SimpleFileWithRegexes(fileName, "java", true, regexes);
+      System.err.println("Got " + regexes.size() + " regexes");
+    } catch (Exception | StackOverflowError e) {
+      System.err.println("main: Exception: " + e);
+      e.printStackTrace(System.err);
+      out =
+        new Output_SimpleFileWithRegexes(fileName, "java", false, null);
+    }
+    return gson.toJson(out);
+  }
+
+  public static void main(String[] args) throws IOException {
+    Gson gson = new Gson();
+    if (args.length == 1 && args[0].equals("--daemon")) {
+      // One file path per line on stdin, one result per line on stdout, until EOF
+      BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+      String fileName;
+      while ((fileName = in.readLine()) != null) {
+        if (fileName.isEmpty()) {
+          continue;
+        }
+        System.out.println(extractFile(fileName, gson));
+        System.out.flush();
       }
-      Gson gson = new Gson();
-      System.out.println(gson.toJson(out));
+    } else if (args.length == 1) {
+      System.out.println(extractFile(args[0], gson));
     } else {
-      System.out.println("Usage: INVOCATION file-to-analyze.java");
+      System.out.println("Usage: INVOCATION file-to-analyze.java | --daemon");
       System.exit(-1);
     }
   }
@@ -10,6 +10,9 @@
  *                     regexes is an array of objects, each with keys: pattern flags
  *                       pattern and flags are each either a string or 'DYNAMIC-{PATTERN|FLAGS}' 
  *
+ *              With --daemon, read one file path per line on stdin,
+ *              and print one such object per path, until EOF.
+ *
  * Requirements:
  *   - run npm install
  *   - ECOSYSTEM_REGEXP_PROJECT_ROOT must be defined
@@ -18,11 +21,12 @@
 "use strict";
 
 const traverse = require("./traverse").traverse,
-  fs = require("fs");
+  fs = require("fs"),
+  readline = require("readline");
 
 // Usage
 if (process.argv.length != 3) {
-  console.log('Usage: ' + process.argv[1] + ' source-to-analyze.js');
+  console.log('Usage: ' + process.argv[1] + ' source-to-analyze.js | --daemon');
   console.error(`You gave ${JSON.stringify(process.argv)}`);
   process.exit(0);
 }
@@ -33,15 +37,35 @@ if (!process.env.ECOSYSTEM_REGEXP_PROJECT_ROOT) {
   process.exit(1);
 }
 
-const sourceF = process.argv[2];
-const source = fs.readFileSync(sourceF, { encoding: 'utf8' });
-
-traverse(source, sourceF).catch((e) => {
-  const result = {
-    fileName: sourceF,
-    language: 'JavaScript',
-    couldParse: 0,
-    regexes: []
-  };
-  console.log(JSON.stringify(result));
-});
+if (process.argv[2] === '--daemon') {
+  daemon();
+} else {
+  extract(process.argv[2]);
+}
+
+// Print the regexes in sourceF. Resolves once they are printed.
+function extract(sourceF) {
+  return new Promise((resolve) => {
+    resolve(traverse(fs.readFileSync(sourceF, { encoding: 'utf8' }), sourceF));
+  }).catch((e) => {
+    const result = {
+      fileName: sourceF,
+      language: 'JavaScript',
+      couldParse: 0,
+      regexes: []
+    };
+    console.log(JSON.stringify(result));
+  });
+}
+
+// Answer one file path per line on stdin until EOF.
+// One file at a time, so the output is in the same order as the input.
+async function daemon() {
+  const rl = readline.createInterface({ input: process.stdin, terminal: false });
+  for await (const line of rl) {
+    if (line.length === 0) {
+      continue;
+    }
+    await extract(line);
+  }
+}
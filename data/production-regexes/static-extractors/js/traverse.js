@@ -114,5 +114,6 @@ module.exports.traverse = function(source, sourceF, instrumentFile) {
       };
       console.log(JSON.stringify(fullObj));
     }
+    resolve();
   });
 }
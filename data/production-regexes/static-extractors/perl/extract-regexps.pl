@@ -44,33 +44,51 @@ $str =~ m{a};
 
 # Load a document
 if (not @ARGV) {
-  die "Usage: $0 perl-source-file\n";
+  die "Usage: $0 perl-source-file | --daemon\n";
 }
-my $sourceFile = $ARGV[0];
-
-eval {
-  # Create a document
-  my $doc = PPI::Document->new($sourceFile);
-
-  #&dumpAll($doc);
-  my @regexesWithFlags = extractRegexesWithFlags($doc);
-  my $simpleFileWithRegexesObj = {
-    "fileName" => $sourceFile,
-    "language" => "Perl",
-    "couldParse" => 1,
-    "regexes"  => \@regexesWithFlags
-  };
-  print encode_json($simpleFileWithRegexesObj) . "\n";
+
+if ($ARGV[0] eq "--daemon") {
+  # One file path per line on stdin, one result per line on stdout, until EOF
+  $| = 1;
+  while (my $sourceFile = <STDIN>) {
+    chomp $sourceFile;
+    next if not length($sourceFile);
+    print encode_json(&extractFile($sourceFile)) . "\n";
+  }
   exit 0;
-};
-if ($@) {
-  my $simpleFileWithRegexesObj = {
-    "fileName" => $sourceFile,
-    "language" => "Perl",
-    "couldParse" => 0,
+}
+
+print encode_json(&extractFile($ARGV[0])) . "\n";
+exit 0;
+
+##################################
+
+# @param $sourceFile: path to a Perl file
+# @returns $simpleFileWithRegexesObj
+sub extractFile {
+  my ($sourceFile) = @_;
+
+  my $simpleFileWithRegexesObj = eval {
+    # Create a document
+    my $doc = PPI::Document->new($sourceFile);
+
+    #&dumpAll($doc);
+    my @regexesWithFlags = extractRegexesWithFlags($doc);
+    return {
+      "fileName" => $sourceFile,
+      "language" => "Perl",
+      "couldParse" => 1,
+      "regexes"  => \@regexesWithFlags
+    };
   };
-  print encode_json($simpleFileWithRegexesObj) . "\n";
-  exit 0;
+  if ($@ or not $simpleFileWithRegexesObj) {
+    $simpleFileWithRegexesObj = {
+      "fileName" => $sourceFile,
+      "language" => "Perl",
+      "couldParse" => 0,
+    };
+  }
+  return $simpleFileWithRegexesObj;
 }
 
 ##################################
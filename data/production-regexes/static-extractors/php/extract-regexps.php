@@ -105,33 +105,29 @@ function findRegexes($ast) {
   return $regexes;
 }
 
-function main() {
-  global $argc, $argv;
-
-  // Usage
-  if ($argc != "2") {
-    echo "Usage: " . $argv[0] . " file-to-analyze.php\n";
-    exit(1);
-  }
-
+# @returns SimpleFileWithRegexes, as an array
+function extractFile($sourceFile) {
   # Read file
-  $sourceFile = $argv[1];
-  $FH = fopen($sourceFile, "r") or die("Unable to open file!");
-  $phpCode = fread($FH, filesize($argv[1]));
-  fclose($FH);
+  $phpCode = @file_get_contents($sourceFile);
+  if ($phpCode === false) {
+    my_log("Unable to open file: $sourceFile");
+    return array(
+      "fileName" => $sourceFile,
+      "language" => "PHP",
+      "couldParse" => 0,
+    );
+  }
 
   # Parser -- Default to PHP7 but will fall back to PHP 5.
   $parser = (new ParserFactory)->create(ParserFactory::PREFER_PHP7);
   try {
     $ast = $parser->parse($phpCode);
   } catch (Error $error) {
-    $sfwr = array(
+    return array(
       "fileName" => $sourceFile,
       "language" => "PHP",
-      "couldParse" => 1,
+      "couldParse" => 0,
     );
-    fwrite(STDOUT, json_encode($sfwr) . "\n");
-    exit(1);
   }
 
   # Parsing succeeded.
@@ -158,7 +154,36 @@ function main() {
     array_push($sfwr['regexes'], $simpleRegexObj);
   }
 
+  return $sfwr;
+}
+
+function main() {
+  global $argc, $argv;
+
+  // Usage
+  if ($argc != "2") {
+    echo "Usage: " . $argv[0] . " file-to-analyze.php | --daemon\n";
+    exit(1);
+  }
+
+  if ($argv[1] === '--daemon') {
+    // One file path per line on stdin, one result per line on stdout, until EOF
+    while (($line = fgets(STDIN)) !== false) {
+      $sourceFile = rtrim($line, "\r\n");
+      if ($sourceFile === '') {
+        continue;
+      }
+      fwrite(STDOUT, json_encode(extractFile($sourceFile)) . "\n");
+      fflush(STDOUT);
+    }
+    exit(0);
+  }
+
+  $sfwr = extractFile($argv[1]);
   fwrite(STDOUT, json_encode($sfwr) . "\n");
+  if (!$sfwr['couldParse']) {
+    exit(1);
+  }
 }
 
 ///////////////////
@@ -33,6 +33,9 @@
 #       funcName is the re module function being invoked
 #       pattern and flags are each either a string or 'DYNAMIC-{PATTERN|FLAGS}'
 #       If the regexp invocation cannot have flags, the flags string will be 'FLAGLESS' instead
+#
+#   With --daemon, reads one file path per line on stdin and prints one such object per path, until EOF.
+#   A file we cannot parse yields { fileName, couldParse: false }, so the caller can try another interpreter.
 
 import os
 import subprocess
@@ -296,10 +299,47 @@ def countLOC(sourcefile):
   else:
     return -1
 
+def extractFile(sourcefile):
+  """Returns the fileInfo object for sourcefile. Raises on trouble, e.g. a syntax error."""
+  # Count LoC
+  LoC = countLOC(sourcefile)
+  log('{} has {} LoC'.format(sourcefile, LoC))
+
+  # Read file and prep an AST.
+  with open(sourcefile, 'r') as FH:
+    content = FH.read()
+    root = ast.parse(content, sourcefile)
+
+    walker = ASTWalkerForRegexps()
+    walker.visit(root)
+
+    return { 'fileName': sourcefile,
+             'couldParse': True,
+             'regexes': [regexp.__dict__ for regexp in walker.getRegexps()],
+             'language': 'python'
+           }
+
+def daemon():
+  # readline, not iteration: python2 reads ahead on 'for line in sys.stdin'
+  for line in iter(sys.stdin.readline, ''):
+    sourcefile = line.rstrip('\r\n')
+    if not sourcefile:
+      continue
+    try:
+      fileInfo = extractFile(sourcefile)
+    except Exception as e:
+      log('Could not extract regexps from {}: {}'.format(sourcefile, e))
+      fileInfo = { 'fileName': sourcefile,
+                   'couldParse': False,
+                   'language': 'python'
+                 }
+    sys.stdout.write(json.dumps(fileInfo) + '\n')
+    sys.stdout.flush()
+
 def main():
   # Usage
   if len(sys.argv) != 2:
-    log('Usage: {} python-file.py'.format(sys.argv[0]))
+    log('Usage: {} python-file.py | --daemon'.format(sys.argv[0]))
     sys.exit(1)
 
   # Check for dependencies
@@ -315,29 +355,14 @@ def main():
     log('Error, could not find cloc in PATH')
     sys.exit(1)
 
-  sourcefile = sys.argv[1]
-
-  # Count LoC
-  LoC = countLOC(sourcefile)
-  log('{} has {} LoC'.format(sourcefile, LoC))
+  if sys.argv[1] == '--daemon':
+    daemon()
+    return
 
-  # Read file and prep an AST.
+  sourcefile = sys.argv[1]
   try:
-    with open(sourcefile, 'r') as FH:
-      content = FH.read()
-      root = ast.parse(content, sourcefile)
-  
-      walker = ASTWalkerForRegexps()
-      walker.visit(root)
-      
-      fileInfo = { 'fileName': sourcefile,
-                   'couldParse': True,
-                   'regexes': [regexp.__dict__ for regexp in walker.getRegexps()],
-                   'language': 'python'
-                 }
-      
-      sys.stdout.write(json.dumps(fileInfo) + '\n')
-      
+    fileInfo = extractFile(sourcefile)
+    sys.stdout.write(json.dumps(fileInfo) + '\n')
   except Exception as e:
     # Easy-to-parse to stdout
     errMsg = 'Something went wrong, perhaps try with a different Python interpreter'
@@ -2,11 +2,14 @@
 # Author: Jamie Davis <davisjam@vt.edu>
 # Description: Attempt to extract regexps from a python program, using first python2 and then python3.
 #   Same dependencies, usage, and restrictions as extract-regexps.py.
+#   With --daemon, keeps one 'extract-regexps.py --daemon' per interpreter
+#   and answers one file path per line on stdin until EOF.
 
 use strict;
 use warnings;
 
 use IPC::Cmd qw[can_run]; # Check PATH
+use IPC::Open2;
 use JSON::PP; # I/O
 
 # Check dependencies.
@@ -30,7 +33,12 @@ if (not can_run("python3")) {
 
 # Check args.
 if (scalar(@ARGV) != 1) {
-  die "Usage: $0 python-filename.py\n";
+  die "Usage: $0 python-filename.py | --daemon\n";
+}
+
+if ($ARGV[0] eq "--daemon") {
+  &daemon();
+  exit 0;
 }
 
 my $pythonFile = $ARGV[0];
@@ -64,6 +72,65 @@ else {
 
 ########
 
+sub daemon {
+  $| = 1;
+  my %python2child; # python => { pid, in, out }
+  while (my $pythonFile = <STDIN>) {
+    chomp $pythonFile;
+    next if not length($pythonFile);
+
+    my $result;
+    for my $python ("python2", "python3") {
+      my $out = &askChild(\%python2child, $python, $pythonFile);
+      if (defined $out) {
+        my $obj = eval { decode_json($out) };
+        if ($obj and $obj->{couldParse}) {
+          $result = $out;
+          last;
+        }
+      }
+      print STDERR "Could not extract regexes from $pythonFile using $python\n";
+    }
+
+    if (not defined $result) {
+      $result = encode_json({ "fileName"   => $pythonFile,
+                              "couldParse" => 0
+                            }) . "\n";
+    }
+    print STDOUT $result;
+  }
+
+  for my $child (values %python2child) {
+    close($child->{in});
+    waitpid($child->{pid}, 0);
+  }
+}
+
+# Returns the child's response line, or undef if it died. Restarts a dead child next time.
+sub askChild {
+  my ($python2child, $python, $pythonFile) = @_;
+
+  if (not $python2child->{$python}) {
+    my ($out, $in);
+    my $pid = open2($out, $in, $python, $extractRegexps, "--daemon");
+    $python2child->{$python} = { "pid" => $pid, "in" => $in, "out" => $out };
+  }
+  my $child = $python2child->{$python};
+
+  local $SIG{PIPE} = "IGNORE";
+  my $line;
+  if (print { $child->{in} } "$pythonFile\n" and $child->{in}->flush()) {
+    $line = readline($child->{out});
+  }
+  if (not defined $line) {
+    close($child->{in});
+    close($child->{out});
+    waitpid($child->{pid}, 0);
+    delete $python2child->{$python};
+  }
+  return $line;
+}
+
 sub cmd {
   my ($cmd) = @_;
   my $out = `$cmd`;
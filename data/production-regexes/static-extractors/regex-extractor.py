@@ -2,6 +2,8 @@
 # Extract regexes from a tarball of a GitHubProject.
 # Only extracts regexes from source code in the "target language"
 # as identified by the registry from which the GHP was referenced.
+# Source files are streamed out of the tarball one at a time (see libLF.lf_sourceFiles),
+# so the rest of the tarball is never written out.
 
 # TODO Consistency on language capitalization: Ruby vs rust vs Perl vs javascript vs etc.
 
@@ -16,6 +18,11 @@ import tarfile
 import re
 import subprocess
 import shutil
+import json
+import threading
+import collections
+import hashlib
+import signal
 
 #######
 # Globals
@@ -23,69 +30,25 @@ import shutil
 
 CLEAN_TMP_DIR = True # TODO
 
-registryToExtensionLists = {
-    'crates.io': [r'\.rs', r'\.rlib'],
-    'cpan': [r'\.pl', r'\.pm'],
-    'npm': [r'\.js', r'\.ts'],
-    'pypi': [r'\.py'],
-    'maven': [r'\.java'],
-    'rubygems': [r'\.rb'],
-    'packagist': [r'\.php'],
-    'nuget': [r'\.cs'],
-    'godoc': [r'\.go']
-}
+# When streaming a tarball, source files wait here for the extractors.
+# tmpfs if we have it: the files are small and short-lived.
+SCRATCH_PARENT_DIRS = [os.path.join(os.sep, 'dev', 'shm'), os.path.join(os.sep, 'tmp')]
 
-extensionToLang = {
-    r'\.rs': 'rust',
-    r'\.rlib': 'rust',
-    r'\.pl': 'Perl',
-    r'\.pm': 'Perl',
-    r'\.js': 'javascript',
-    r'\.ts': 'typescript',
-    r'\.py': 'python',
-    r'\.java': 'Java',
-    r'\.rb': 'Ruby',
-    r'\.php': 'PHP',
-    r'\.cs': 'c#',
-    r'\.go': 'go'
-}
+# When streaming a tarball, have at most this many files per worker in the scratch area at a time
+FILES_IN_FLIGHT_PER_WORKER = 4
 
-registryToFileOutputRE = {
-    'cpan': ['Perl'],
-    'npm': [r'Node\.js', 'javascript'], # `file` does not support typescript
-    'pypi': ['python'],
-    'rubygems': ['Ruby'],
-    'packagist': ['PHP'],
-    # `file` does not correctly identify Java, Golang, etc. files.
-    # `cloc` does but is much slower.
-    # I think it unlikely that people would name source code
-    # in a *compiled* language with a non-traditional suffix.
-    # The use of `file` is really more for executables, which might have no suffix,
-    # but these are only source code when they are in an interpreted language.
-    'nuget': [], # `file` does not support C#
-    'godoc': [], # `file` does not support Go
-    'crates.io': [], # `file` does not support rust
-    'maven': []
-}
-
-fileOutputREToLang = {
-    'Perl': 'Perl',
-    r'Node\.js' : 'javascript',
-    'javascript': 'javascript', 
-    'python': 'python',
-    'Ruby': 'Ruby',
-    'PHP': 'PHP'
-    # No compiled languages here
-}
+# An extractor daemon that takes longer than this on one file is killed, and we skip the file
+EXTRACTOR_DAEMON_TIMEOUT_SEC = 10 * 60
 
+# Language names as in libLF.extensionToLang
 registryToLangs = {
     'crates.io': ['rust'],  
-    'cpan': ['Perl'],
+    'cpan': ['perl'],
     'npm': ['javascript', 'typescript'], 
     'pypi': ['python'],
-    'maven': ['Java'],
-    'rubygems': ['Ruby'],
-    'packagist': ['PHP'],
+    'maven': ['java'],
+    'rubygems': ['ruby'],
+    'packagist': ['php'],
     'nuget': ['c#'], 
     'godoc': ['go'] 
 }
@@ -93,17 +56,29 @@ registryToLangs = {
 extractorDir = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin')
 langToExtractorPath = {
     'rust': os.path.join(extractorDir,'extract-rust-regexes.py'),
-    'Perl': os.path.join(extractorDir, 'extract-perl-regexps.pl'),
+    'perl': os.path.join(extractorDir, 'extract-perl-regexps.pl'),
     'javascript': os.path.join(extractorDir, 'extract-js-regexps.js'),
     'typescript': os.path.join(extractorDir, 'extract-ts-regexes.py'), 
     'python': os.path.join(extractorDir, 'extract-python-regexes-wrapper.pl'),
     'java': os.path.join(extractorDir, 'extract-java-regexps.jar'),
-    'Ruby': os.path.join(extractorDir, 'extract-ruby-regexps.rb'),
-    'PHP': os.path.join(extractorDir, 'extract-php-regexps.php'),
+    'ruby': os.path.join(extractorDir, 'extract-ruby-regexps.rb'),
+    'php': os.path.join(extractorDir, 'extract-php-regexps.php'),
     'go': os.path.join(extractorDir, 'extract-go-regexps'),
     'c#': '', 
 }
 
+# The code each extractor runs besides itself, so that editing it invalidates the cache (--result-cache).
+# The extractors in bin/ are installed from these sources.
+extractorSrcDir = os.path.dirname(os.path.abspath(__file__))
+langToExtractorDependencies = {
+    'javascript': [os.path.join(extractorSrcDir, 'js', 'traverse.js')],
+    'typescript': [os.path.join(extractorSrcDir, 'ts', 'transpile-ts2js-tsc.js'),
+                   os.path.join(extractorSrcDir, 'js', 'extract-regexps.js'),
+                   os.path.join(extractorSrcDir, 'js', 'traverse.js')],
+    'python': [os.path.join(extractorSrcDir, 'python', 'extract-regexps.py')],
+    'php': [os.path.join(extractorSrcDir, 'php', 'composer.json')],
+}
+
 def cleanUp(tmpDir):
     if CLEAN_TMP_DIR:
         libLF.log('cleanUp: Wiping {}'.format(tmpDir))
@@ -113,48 +88,247 @@ def cleanUp(tmpDir):
         except:
             pass
 
-def runExtractor(sourceFile, extractor, registry):
-    libLF.log('Extracting regexes from {} using {}'.format(sourceFile['name'], extractor))
-
+def extractorCmd(extractor):
+    """Command to run this extractor: str[]"""
     # Any special invocation recipe?
     if extractor.endswith(".jar"):
-        invocationPrefix = "java -jar"
-    else:
-        invocationPrefix = ""
+        return ['java', '-jar', extractor]
+    return [extractor]
+
+class ExtractorDaemons:
+  """One warm 'EXTRACTOR --daemon' per extractor
+
+  Each daemon reads one file path per line and answers with one SimpleFileWithRegexes per line.
+  This saves an interpreter (or JVM) startup per file.
+
+  An extractor that does not answer for the file we asked about
+  (e.g. an old build without --daemon) is not used again.
+  A pool belongs to the process that created it; use extractorDaemons().
+  """
+  def __init__(self):
+    self.pid = os.getpid()
+    self.daemonPool = libLF.DaemonPool()
+    self.extractor2nAnswered = {}
+    self.brokenExtractors = set()
+
+  def extract(self, extractor, fileName):
+    """Returns the extractor's output for fileName (str),
+    or None if there is no working daemon for it. Then use the CLI.
 
+    Raises TimeoutError if the daemon took too long. It is killed, and restarted next time.
+    """
+    if extractor in self.brokenExtractors or '\n' in fileName:
+      return None
+
+    self.daemonPool.add(extractor, extractorCmd(extractor) + ['--daemon'])
     try:
-        # Extract
-        cmd = "{} '{}' '{}' 2>/dev/null".format(invocationPrefix, extractor, sourceFile['name'])
-        out = libLF.chkcmd(cmd)
+      out = self.daemonPool.query(extractor, fileName, EXTRACTOR_DAEMON_TIMEOUT_SEC)
+    except TimeoutError:
+      raise
+    except OSError as err:
+      # Died, perhaps on this file. It is restarted on the next query.
+      libLF.log('Extractor daemon {} failed on {}: {}'.format(extractor, fileName, err))
+      if self.extractor2nAnswered.get(extractor, 0) == 0:
+        self._giveUp(extractor)
+      return None
+
+    try:
+      answeredFor = json.loads(out).get('fileName')
+    except (ValueError, AttributeError):
+      answeredFor = None
+    if answeredFor != fileName:
+      libLF.log('Extractor daemon {} answered for {}, not {}'.format(extractor, answeredFor, fileName))
+      self._giveUp(extractor)
+      return None
+
+    self.extractor2nAnswered[extractor] = self.extractor2nAnswered.get(extractor, 0) + 1
+    return out
+
+  def stop(self):
+    self.daemonPool.stop()
+
+  def _giveUp(self, extractor):
+    libLF.log('Not using extractor daemon {} any more'.format(extractor))
+    self.brokenExtractors.add(extractor)
+    self.daemonPool.name2daemon[extractor].stop()
+
+_extractorDaemons = None
+_extractorDaemonsLock = threading.Lock()
+def extractorDaemons():
+  """Returns the ExtractorDaemons for the current process"""
+  global _extractorDaemons
+  with _extractorDaemonsLock:
+    if _extractorDaemons is None or _extractorDaemons.pid != os.getpid():
+      _extractorDaemons = ExtractorDaemons()
+    return _extractorDaemons
+
+def stopDaemonsOnSIGTERM(signum, frame):
+  """Kill this process's extractor daemons, then exit
+
+  The daemons have their own sessions, so killing our process group (e.g. ghp-extract-regexes.py on a timeout)
+  would leave them running, perhaps stuck on the file that made us time out.
+  The workers inherit this handler, and each stops its own daemons.
+  """
+  daemons = _extractorDaemons
+  if daemons is not None and daemons.pid == os.getpid():
+    daemons.stop()
+  os._exit(128 + signum)
+
+def extractorVersion(extractor, dependencies):
+    """libLF.ResultCache toolVersion for an extractor: its contents and those of the code it runs
+
+    A dependency that is missing is left out. The extractor will fail without it, and nothing is cached.
+    """
+    return libLF.fileVersion(extractor, *[d for d in dependencies if os.path.exists(d)])
+
+def extractCacheArgs(sourceFile, extractor, dependencies):
+    """libLF.ResultCache key for the extractor's output on sourceFile: (kind, pattern, language, toolVersion, params)
+
+    Keyed by the file's contents, not its name, so that every copy of e.g. jquery.js shares an entry.
+    """
+    with open(sourceFile['name'], 'rb') as inStream:
+        contentHash = hashlib.sha256(inStream.read()).hexdigest()
+    return ('extract', contentHash, os.path.basename(extractor), extractorVersion(extractor, dependencies), {})
+
+def extractSFWR(sourceFile, extractor, dependencies, useDaemon, cache):
+    """Returns the libLF.SimpleFileWithRegexes for sourceFile: from the cache, a daemon, or the extractor's CLI
+
+    Raises if the extractor fails, or its output is not a SFWR.
+    """
+    # Extract, unless we have seen a file with the same contents
+    out = None
+    cacheArgs = None
+    if cache is not None:
         try:
-            sfwr = libLF.SimpleFileWithRegexes()
-            sfwr.initFromNDJSON(out)
-            if not sfwr.couldParse:
-              libLF.log('Could not parse: {}'.format(sourceFile['name']))
-
-            # TODO ruList = libLF.sfwrToRegexUsageList(sfwr)
-            ruList = []
-            for regex in sfwr.regexes:
-                ru = libLF.RegexUsage()
-                basePath = os.path.basename(sourceFile['name'])
-                ru.initFromRaw(regex['pattern'], regex['flags'], None, None, sourceFile['name'], basePath)
-                ruList.append(ru)
-            libLF.log('Got {} regexes from {}'.format(len(ruList), sourceFile['name']))
-            return ruList
-        except KeyboardInterrupt:
-            raise
+            cacheArgs = extractCacheArgs(sourceFile, extractor, dependencies)
+            cached = cache.get(*cacheArgs)
         except Exception as err:
-            libLF.log('Error converting output from SFWR to RU: {}\n  {}'.format(out, err))
+            # The cache is only a shortcut
+            libLF.log('Not using the cache for {}: {}'.format(sourceFile['name'], err))
+            cacheArgs = None
+            cached = None
+        if cached is not None:
+            # Cached under whichever copy we saw first
+            cached['fileName'] = sourceFile['name']
+            out = json.dumps(cached)
+            cacheArgs = None
+    if out is None and useDaemon:
+        out = extractorDaemons().extract(extractor, sourceFile['name'])
+    if out is None:
+        cmd = "{} 2>/dev/null".format(' '.join(["'{}'".format(w) for w in extractorCmd(extractor) + [sourceFile['name']]]))
+        out = libLF.chkcmd(cmd)
+
+    sfwr = libLF.SimpleFileWithRegexes()
+    sfwr.initFromNDJSON(out)
+    if cacheArgs is not None:
+        cache.put(*cacheArgs, json.loads(out))
+    return sfwr
+
+def runExtractor(sourceFile, extractor, dependencies, registry, useDaemon, cache):
+    libLF.log('Extracting regexes from {} using {}'.format(sourceFile['name'], extractor))
+
+    try:
+        sfwr = extractSFWR(sourceFile, extractor, dependencies, useDaemon, cache)
+        if not sfwr.couldParse:
+          libLF.log('Could not parse: {}'.format(sourceFile['name']))
+
+        # TODO ruList = libLF.sfwrToRegexUsageList(sfwr)
+        ruList = []
+        # A file streamed from a tarball sits in the scratch area. Report where it was in the project.
+        relPath = sourceFile.get('relPath', sourceFile['name'])
+        for regex in sfwr.regexes:
+            ru = libLF.RegexUsage()
+            basePath = os.path.basename(relPath)
+            ru.initFromRaw(regex['pattern'], regex['flags'], None, None, relPath, basePath)
+            ruList.append(ru)
+        libLF.log('Got {} regexes from {}'.format(len(ruList), sourceFile['name']))
+        return ruList
     except KeyboardInterrupt:
         raise 
     except BaseException as err:
         libLF.log('Error extracting regexes from {} using {}: {}'.format(sourceFile['name'], extractor, err))
 
-def extractRegexes(registry, lang, sourceFile):
+def extractRegexes(registry, lang, sourceFile, useDaemon, cache):
     """Extract regexes from this sourceFile."""
-    output = runExtractor(sourceFile, langToExtractorPath[lang], registry)
+    output = runExtractor(sourceFile, langToExtractorPath[lang], langToExtractorDependencies.get(lang, []), registry, useDaemon, cache)
     return output
 
+class ExtractTask(libLF.parallel.ParallelTask):
+  """Extract the regexes from one source file"""
+  def __init__(self, registry, lang, sourceFile, useDaemon, cache):
+    self.registry = registry
+    self.lang = lang
+    self.sourceFile = sourceFile
+    self.useDaemon = useDaemon
+    self.cache = cache
+
+  def run(self):
+    try:
+      return extractRegexes(self.registry, self.lang, self.sourceFile, self.useDaemon, self.cache)
+    finally:
+      # Record this file's lookup now: ghp-extract-regexes.py may kill us on --project-timeout
+      if self.cache is not None:
+        self.cache.flush()
+
+def getTasks(registry, lang2sourceFiles, useDaemon, cache):
+  for lang, sourceFiles in lang2sourceFiles.items():
+    for sourceFile in sourceFiles:
+      yield ExtractTask(registry, lang, sourceFile, useDaemon, cache)
+
+def getStreamedTasks(registry, tarball, scratchDir, useDaemon, cache):
+  """Like getTasks, for the source files in tarball.
+
+  Each file is written to scratchDir as its task is yielded.
+  The sourceFile of each task has keys name (the scratch copy) and relPath (its path in the tarball).
+  """
+  for i, (lang, memberName, contents) in enumerate(libLF.iterUnvendoredTarballSourceFiles(tarball, registry)):
+    # Keep the basename: some extractors care about the extension
+    scratchFile = os.path.join(scratchDir, '{}-{}'.format(i, os.path.basename(memberName)))
+    with open(scratchFile, 'wb') as outStream:
+      outStream.write(contents)
+    yield ExtractTask(registry, lang, { 'name': scratchFile, 'relPath': memberName }, useDaemon, cache)
+
+def makeScratchDir():
+  """A fresh directory for streamed source files, on tmpfs if possible"""
+  for parent in SCRATCH_PARENT_DIRS:
+    if os.path.isdir(parent) and os.access(parent, os.W_OK):
+      scratchDir = os.path.join(parent, 'regex-extractor', str(os.getpid()))
+      os.makedirs(scratchDir, exist_ok=True)
+      return scratchDir
+  raise OSError('No writable scratch directory among {}'.format(SCRATCH_PARENT_DIRS))
+
+def extractAll(tasks, parallelism):
+  """Yield (task, ruList or None) in the order of tasks
+
+  At most FILES_IN_FLIGHT_PER_WORKER * parallelism tasks are drawn from tasks before their results are yielded.
+  """
+  if parallelism <= 1:
+    for task in tasks:
+      yield task, task.run()
+    return
+
+  # imap yields results in the same order as the tasks.
+  # Hold each task until its result comes back, and only draw more tasks as results do.
+  inFlight = collections.deque()
+  slots = threading.Semaphore(FILES_IN_FLIGHT_PER_WORKER * parallelism)
+  def admit(tasks):
+    for task in tasks:
+      slots.acquire()
+      inFlight.append(task)
+      yield task
+
+  results = libLF.parallel.imap(admit(tasks), parallelism,
+    libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT,
+    jitter=False)
+  for result in results:
+    task = inFlight.popleft()
+    slots.release()
+    if isinstance(result, BaseException):
+      # runExtractor handles its own errors, so this is unexpected. Lose just this file.
+      libLF.log('Error extracting regexes from {}: {}'.format(task.sourceFile['name'], result))
+      result = None
+    yield task, result
+
 def checkRegistryDeps(registry):
     dependenciesToCheck = []
     for l in registryToLangs[registry]:
@@ -171,51 +345,85 @@ def unpackTarball(tarball):
        tar.extractall(path=tmpDir) 
        return tmpDir
 
-def main(projectCodePath, registry, outFile):
+def main(projectCodePath, registry, outFile, parallelism, noDaemons, unpack, resultCache):
+  libLF.log('projectCodePath {} registry {} outFile {} parallelism {} noDaemons {} unpack {} resultCache {}' \
+    .format(projectCodePath, registry, outFile, parallelism, noDaemons, unpack, resultCache))
   checkRegistryDeps(registry)
+  signal.signal(signal.SIGTERM, stopDaemonsOnSIGTERM)
+
+  cache = None
+  if resultCache is not None:
+    cache = libLF.ResultCache(resultCache)
+    # Workers only put, so keep the cache within its size here
+    cache.evict()
+    cacheStatsBefore = cache.stats()
 
+  # We should clean up tmpDir later
+  tmpDir = None
   if os.path.isdir(projectCodePath):
-    wasTarball = False
-    srcDir = projectCodePath
-  else:
-    wasTarball = True
+    tasks = getTasks(registry, libLF.getUnvendoredSourceFiles(projectCodePath, registry), not noDaemons, cache)
+  elif unpack:
     try:
-      # We should clean up srcDir later
-      srcDir = unpackTarball(projectCodePath)
+      tmpDir = unpackTarball(projectCodePath)
     except BaseException as err:
       libLF.log("Error while unpacking {}: {}".format(projectCodePath, err))
       raise err
-
-  lang2sourceFiles = libLF.getUnvendoredSourceFiles(srcDir, registry)
+    tasks = getTasks(registry, libLF.getUnvendoredSourceFiles(tmpDir, registry), not noDaemons, cache)
+  else:
+    tmpDir = makeScratchDir()
+    libLF.log('Streaming source files from {} through {}'.format(projectCodePath, tmpDir))
+    tasks = getStreamedTasks(registry, projectCodePath, tmpDir, not noDaemons, cache)
 
   # TODO Project metrics: nFiles, cloc, ...
 
   nFilesAnalyzed = 0
   nRegexesFound = 0
-  with open(outFile, 'w') as outStream:
-    for lang, sourceFiles in lang2sourceFiles.items():
-      for sourceFile in sourceFiles:
-        output = extractRegexes(registry, lang, sourceFile)
+  try:
+    with open(outFile, 'w') as outStream:
+      # Results arrive in file order however many workers there are, so the output is deterministic
+      for task, output in extractAll(tasks, parallelism):
         nFilesAnalyzed += 1
+        if 'relPath' in task.sourceFile:
+          # Done with the scratch copy
+          os.remove(task.sourceFile['name'])
         if output is not None:
           for ru in output:
             nRegexesFound += 1
             ru.regexes = registry
             outStream.write(ru.toNDJSON() + '\n')
+  except (tarfile.TarError, OSError) as err:
+    libLF.log("Error while reading {}: {}".format(projectCodePath, err))
+    raise err
+  finally:
+    # Workers' daemons see EOF and exit when the workers do. These are ours, from a serial run.
+    extractorDaemons().stop()
+    if tmpDir is not None:
+      cleanUp(tmpDir)
   libLF.log('Extracted a total of {} regexes from {} files'.format(nRegexesFound, nFilesAnalyzed))
-
-  if wasTarball:
-    cleanUp(srcDir)
+  if cache is not None:
+    # 'extract' hits are files whose contents we had already extracted from, here or in another project
+    cache.logStats(cacheStatsBefore)
+    cache.evict()
 
 ###############################################
 
-# Parse args
-parser = argparse.ArgumentParser(description='Statically extract regexes from a module\'s GitHub project. Only regexes in the primary language of the module will be extracted. cf. ghp-extract-regexes.py')
-parser.add_argument('--registry', '-r',  help='What registry did the module associated with this libLF.GitHub project come from?', required=True)
-parser.add_argument('--src-path', '-t', help='GitHub project (tarball or root dir)', required=True, dest='srcPath')
-parser.add_argument('--out-file', '-o', help='Where to write RegexUsage objects as NDJSON?', required=True, dest='outFile')
+# test-regex-extractor.py imports us
+if __name__ == '__main__':
+  # Parse args
+  parser = argparse.ArgumentParser(description='Statically extract regexes from a module\'s GitHub project. Only regexes in the primary language of the module will be extracted. cf. ghp-extract-regexes.py')
+  parser.add_argument('--registry', '-r',  help='What registry did the module associated with this libLF.GitHub project come from?', required=True)
+  parser.add_argument('--src-path', '-t', help='GitHub project (tarball or root dir)', required=True, dest='srcPath')
+  parser.add_argument('--out-file', '-o', help='Where to write RegexUsage objects as NDJSON?', required=True, dest='outFile')
+  parser.add_argument('--parallelism', type=int, help='Extract from this many files at a time (default 1)', required=False, default=1,
+    dest='parallelism')
+  parser.add_argument('--no-daemons', help='Launch the extractor once per file (default: keep one warm extractor per language per worker, in its --daemon mode)', required=False, default=False, action='store_true',
+    dest='noDaemons')
+  parser.add_argument('--unpack', help='Unpack a tarball to /tmp and walk it (default: stream the source files out of it, skipping everything else)', required=False, default=False, action='store_true',
+    dest='unpack')
+  parser.add_argument('--result-cache', type=str, help='Cache each file\'s extraction result by its contents in this SQLite file (libLF.ResultCache), and reuse those from earlier runs (default: no cache)', required=False, default=None,
+    dest='resultCache')
 
-args = parser.parse_args()
+  args = parser.parse_args()
 
-# Here we go!
-main(args.srcPath, args.registry, args.outFile)
+  # Here we go!
+  main(args.srcPath, args.registry, args.outFile, args.parallelism, args.noDaemons, args.unpack, args.resultCache)
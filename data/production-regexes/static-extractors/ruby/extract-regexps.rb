@@ -263,15 +263,13 @@ def walk_sexp(sexp, visitF)
   end
 end
 
-def main
-  # Check usage
-  if ARGV.length != 1
-    puts("Usage: #{$0} file-to-analyze.rb")
-    exit(1)
-  end
+# Extract the regexes from rubyFile.
+# Returns a SimpleFileWithRegexes.
+def extractFile(rubyFile)
+  # Start afresh: a daemon extracts from many files
+  $regexes = []
 
   # Read in the file
-	rubyFile = ARGV[0]
   file = File.open(rubyFile, "r")
   contents = file.read
   file.close()
@@ -303,8 +301,34 @@ def main
 			"flags"   => re.flags
 		})
   end
-  sfwr = SimpleFileWithRegexes.new(rubyFile, "Ruby", 1, regexArray)
-	sfwr.emitJSON()
+  return SimpleFileWithRegexes.new(rubyFile, "Ruby", 1, regexArray)
+end
+
+def main
+  # Check usage
+  if ARGV.length != 1
+    puts("Usage: #{$0} file-to-analyze.rb | --daemon")
+    exit(1)
+  end
+
+  if ARGV[0] == '--daemon'
+    # One file path per line on stdin, one result per line on stdout, until EOF
+    STDOUT.sync = true
+    STDIN.each_line do |line|
+      rubyFile = line.chomp
+      next if rubyFile.empty?
+      begin
+        sfwr = extractFile(rubyFile)
+      rescue StandardError, SystemStackError => e
+        my_log("Error extracting from #{rubyFile}: #{e}")
+        sfwr = SimpleFileWithRegexes.new(rubyFile, "Ruby", 0, [])
+      end
+      sfwr.emitJSON()
+    end
+    return
+  end
+
+  extractFile(ARGV[0]).emitJSON()
 end
 
 ################
@@ -185,19 +185,24 @@ class FrontierVisitor:
           pass
 
 def fileMightContainRegexes(rustFile):
-  """Fast grep-based check on whether a regex is possible.
+  """Fast check on whether a regex is possible.
 
-  True if grep finds 'Regex' in the file, else false.
+  True if 'Regex' appears in the file, else false.
   Our token tree analysis only finds regexes that involve the string "Regex", so...
   """
-  _, out = libLF.runcmd("grep Regex '{}'".format(rustFile))
-  if 0 <= out.find('Regex'):
-    return True
-  return False
+  try:
+    with open(rustFile, 'rb') as inStream:
+      return b'Regex' in inStream.read()
+  except OSError:
+    return False
 
-def main(rustc, rustFile, dumpTokenTree):
-  libLF.checkShellDependencies([rustc])
+def extractFile(rustc, rustFile, dumpTokenTree):
+  """Extract the regexes from rustFile.
 
+  @returns sfwr - libLF.SimpleFileWithRegexes
+  @raises on trouble getting or walking the token tree
+  """
+  tokenTree = None
   if fileMightContainRegexes(rustFile):
     libLF.log('File might contain regexes, proceeding...')
     try:
@@ -205,7 +210,7 @@ def main(rustc, rustFile, dumpTokenTree):
       tokenTree = getTokenTree(rustc, rustFile)
     except BaseException as err:
       libLF.log('Error getting token tree: {}'.format(err))
-      sys.exit(1)
+      raise
   
     try:
       libLF.log('Walking token tree')
@@ -215,7 +220,7 @@ def main(rustc, rustFile, dumpTokenTree):
       libLF.log('Extracted {} patterns'.format(len(patterns)))
     except BaseException as err:
       libLF.log('Error walking token tree: {}'.format(err))
-      sys.exit(1)
+      raise
   else:
     libLF.log('File does not contain "Regex", no regexes possible')
     patterns = []
@@ -223,21 +228,52 @@ def main(rustc, rustFile, dumpTokenTree):
   regexes = [{'pattern': p, 'flags': ''} for p in patterns]
   sfwr = libLF.SimpleFileWithRegexes()
   sfwr.initFromRaw(fileName=rustFile, language='rust', couldParse=1, regexes=regexes)
-  print(sfwr.toNDJSON())
 
-  if dumpTokenTree:
+  if dumpTokenTree and tokenTree is not None:
     # "Pretty" JSON makes it easier for humans to decode
     asJSON = json.dumps(tokenTree, indent=2, separators=(',', ':'))
     libLF.log('\n' + asJSON)
 
+  return sfwr
+
+def daemon(rustc, dumpTokenTree):
+  """One file path per line on stdin, one SimpleFileWithRegexes per line on stdout, until EOF"""
+  for line in sys.stdin:
+    rustFile = line.rstrip('\r\n')
+    if not rustFile:
+      continue
+    try:
+      sfwr = extractFile(rustc, rustFile, dumpTokenTree)
+    except Exception:
+      sfwr = libLF.SimpleFileWithRegexes()
+      sfwr.initFromRaw(fileName=rustFile, language='rust', couldParse=0, regexes=[])
+    print(sfwr.toNDJSON(), flush=True)
+
+def main(rustc, rustFile, dumpTokenTree, daemonMode):
+  libLF.checkShellDependencies([rustc])
+
+  if daemonMode:
+    daemon(rustc, dumpTokenTree)
+    return
+
+  try:
+    sfwr = extractFile(rustc, rustFile, dumpTokenTree)
+  except BaseException:
+    sys.exit(1)
+  print(sfwr.toNDJSON())
+
 ###############################################
 
 # Parse args
 parser = argparse.ArgumentParser(description='Extract the regexes from a Rust source file.')
-parser.add_argument('rustFile', help='Rust file')
+parser.add_argument('rustFile', nargs='?', help='Rust file')
 parser.add_argument('--rustc', help='Which rustc to use? Default is whatever is in the PATH. Must be a "nightly" because we need -Z to work', required=False, default='rustc', dest='rustc')
 parser.add_argument('--dumpTokenTree', help='Dump the token tree to stderr. It is large.', required=False, default=False, action='store_true')
+parser.add_argument('--daemon', help='Instead of rustFile, read one file path per line on stdin and print one result per line, until EOF', required=False, default=False, action='store_true',
+  dest='daemon')
 
 args = parser.parse_args()
+if args.rustFile is None and not args.daemon:
+  parser.error('rustFile is required unless --daemon')
 # Here we go!
-main(args.rustc, args.rustFile, args.dumpTokenTree)
+main(args.rustc, args.rustFile, args.dumpTokenTree, args.daemon)
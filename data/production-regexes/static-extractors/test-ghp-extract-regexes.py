@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# Tests for ghp-extract-regexes.py, with a stub in place of regex-extractor.py
+
+# Import our lib
+import os
+import sys
+sys.path.append('{}/lib'.format(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT']))
+import libLF
+
+import shutil
+import subprocess
+import tempfile
+import time
+
+import unittest
+
+GHP_EXTRACT_REGEXES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ghp-extract-regexes.py')
+
+# Takes regex-extractor.py's arguments. Logs each tarball it is run on, and writes one line of output.
+# On a tarball whose name contains 'slow', starts a stand-in extractor daemon in its own session,
+# records its pid, and hangs. On SIGTERM it kills the daemon, as regex-extractor.py does.
+STUB_EXTRACTOR = '''#!/usr/bin/env python3
+import os, signal, subprocess, sys, time
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+with open({logFile!r}, 'a') as outStream:
+  outStream.write(os.path.basename(args['--src-path']) + '\\n')
+if 'slow' in args['--src-path']:
+  daemon = subprocess.Popen(['sleep', '60'], start_new_session=True)
+  with open({daemonPidFile!r}, 'w') as outStream:
+    outStream.write(str(daemon.pid))
+  def onTERM(signum, frame):
+    os.killpg(daemon.pid, signal.SIGKILL)
+    os._exit(1)
+  signal.signal(signal.SIGTERM, onTERM)
+  time.sleep(60)
+with open(args['--out-file'], 'w') as outStream:
+  outStream.write('{{}}\\n')
+'''
+
+class GHPExtractRegexesTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp(prefix='test-ghp-extract-regexes-')
+    self.logFile = os.path.join(self.dir, 'stub.log')
+    self.daemonPidFile = os.path.join(self.dir, 'daemon.pid')
+    self.stub = os.path.join(self.dir, 'stub-extractor.py')
+    libLF.writeToFile(self.stub, STUB_EXTRACTOR.format(logFile=self.logFile, daemonPidFile=self.daemonPidFile))
+    os.chmod(self.stub, 0o755)
+    self.outFile = os.path.join(self.dir, 'out.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _ghp(self, name, tarballSize):
+    """A GHP with a tarball of this many bytes"""
+    tarball = os.path.join(self.dir, 'owner-{}.tgz'.format(name))
+    libLF.writeToFile(tarball, 'x' * tarballSize)
+    return libLF.GitHubProject().initFromRaw('owner', name, 'npm', [name], tarballPath=tarball)
+
+  def _run(self, ghps, extraArgs=[]):
+    ghpFile = os.path.join(self.dir, 'ghps.json')
+    libLF.writeToFile(ghpFile, ''.join(ghp.toNDJSON() + '\n' for ghp in ghps))
+    cmd = [sys.executable, GHP_EXTRACT_REGEXES, '--ghp-file', ghpFile, '--out-file', self.outFile,
+      '--regex-extractor', self.stub, '--parallelism', '1'] + extraArgs
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    with open(self.outFile, 'r') as inStream:
+      return { ghp.name: ghp for ghp in [libLF.GitHubProject().initFromJSON(line) for line in inStream] }
+
+  def _extracted(self):
+    """The tarballs the stub was run on, in order"""
+    if not os.path.exists(self.logFile):
+      return []
+    with open(self.logFile, 'r') as inStream:
+      return [line.strip() for line in inStream]
+
+  def test_largestFirst(self):
+    ghps = [self._ghp('small', 10), self._ghp('large', 1000), self._ghp('medium', 100)]
+    name2ghp = self._run(ghps)
+    self.assertEqual(self._extracted(), ['owner-large.tgz', 'owner-medium.tgz', 'owner-small.tgz'])
+    for name in ['small', 'medium', 'large']:
+      self.assertEqual(name2ghp[name].regexPath, os.path.join(self.dir, 'owner-{}.json'.format(name)))
+      self.assertTrue(os.path.isfile(name2ghp[name].regexPath))
+
+  def test_resumeSkipsDone(self):
+    a, b = self._ghp('a', 10), self._ghp('b', 20)
+    self._run([a])
+    # As if the first run had been interrupted after a
+    name2ghp = self._run([a, b], ['--resume'])
+    self.assertEqual(self._extracted(), ['owner-a.tgz', 'owner-b.tgz'])
+    self.assertEqual(sorted(name2ghp.keys()), ['a', 'b'])
+
+  def test_timeout(self):
+    ghps = [self._ghp('slow', 1000), self._ghp('fast', 10)]
+    startTime = time.time()
+    name2ghp = self._run(ghps, ['--project-timeout', '1'])
+    self.assertLess(time.time() - startTime, 30)
+    self.assertEqual(name2ghp['slow'].regexPath, libLF.GitHubProject.NoRegexPath)
+    self.assertFalse(os.path.exists(os.path.join(self.dir, 'owner-slow.json.tmp')))
+    self.assertTrue(os.path.isfile(name2ghp['fast'].regexPath))
+
+    # The daemon, in its own session, was stopped too
+    with open(self.daemonPidFile, 'r') as inStream:
+      daemonPid = int(inStream.read())
+    self.assertFalse(_isRunning(daemonPid))
+
+def _isRunning(pid):
+  """True if pid is a live process (not a zombie that no one has reaped)"""
+  try:
+    with open('/proc/{}/stat'.format(pid), 'r') as inStream:
+      # pid (comm) state ...
+      return inStream.read().rsplit(')', 1)[1].split()[0] != 'Z'
+  except OSError:
+    return False
+
+###########################################################
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Tests for regex-extractor.py, with a stub extractor
+
+# Import our lib
+import os
+import sys
+sys.path.append('{}/lib'.format(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT']))
+import libLF
+
+import importlib.util
+import shutil
+import tempfile
+
+import unittest
+
+# regex-extractor.py is not a legal module name
+_spec = importlib.util.spec_from_file_location('regexExtractor',
+  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regex-extractor.py'))
+regexExtractor = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(regexExtractor)
+
+# Logs each file it is run on, and reports one regex: the file's first line
+STUB_EXTRACTOR = '''#!/bin/sh
+echo "$1" >> {logFile}
+pattern=$(head -n 1 "$1")
+echo "{{\\"fileName\\": \\"$1\\", \\"language\\": \\"javascript\\", \\"couldParse\\": 1, \\"regexes\\": [{{\\"pattern\\": \\"$pattern\\", \\"flags\\": \\"\\"}}]}}"
+'''
+
+class ExtractCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp(prefix='test-regex-extractor-')
+    self.logFile = os.path.join(self.dir, 'stub.log')
+    self.stub = os.path.join(self.dir, 'stub-extractor.sh')
+    libLF.writeToFile(self.stub, STUB_EXTRACTOR.format(logFile=self.logFile))
+    os.chmod(self.stub, 0o755)
+    self.dependency = os.path.join(self.dir, 'stub-lib.js')
+    libLF.writeToFile(self.dependency, 'v1')
+    self.cache = libLF.ResultCache(os.path.join(self.dir, 'cache.sqlite'))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def _sourceFile(self, name, contents):
+    path = os.path.join(self.dir, name)
+    libLF.writeToFile(path, contents)
+    return { 'name': path }
+
+  def _extract(self, sourceFile, dependencies=None):
+    if dependencies is None:
+      dependencies = [self.dependency]
+    return regexExtractor.extractSFWR(sourceFile, self.stub, dependencies, False, self.cache)
+
+  def _nRuns(self):
+    if not os.path.exists(self.logFile):
+      return 0
+    with open(self.logFile, 'r') as inStream:
+      return len(inStream.readlines())
+
+  def test_missThenPut(self):
+    sfwr = self._extract(self._sourceFile('a.js', 'abc+\n'))
+    self.assertEqual(self._nRuns(), 1)
+    self.assertEqual([r['pattern'] for r in sfwr.regexes], ['abc+'])
+    self.assertEqual(self.cache.stats()['extract']['nEntries'], 1)
+
+  def test_hitRewritesFileName(self):
+    a = self._sourceFile('a.js', 'abc+\n')
+    b = self._sourceFile('b.js', 'abc+\n')
+    self._extract(a)
+    sfwr = self._extract(b)
+    # Same contents: not run again, but reported under its own name
+    self.assertEqual(self._nRuns(), 1)
+    self.assertEqual(sfwr.fileName, b['name'])
+    self.assertEqual([r['pattern'] for r in sfwr.regexes], ['abc+'])
+
+  def test_dependencyChangeMisses(self):
+    a = self._sourceFile('a.js', 'abc+\n')
+    self._extract(a)
+    libLF.writeToFile(self.dependency, 'v2')
+    self._extract(a)
+    self.assertEqual(self._nRuns(), 2)
+
+  def test_missingDependency(self):
+    a = self._sourceFile('a.js', 'abc+\n')
+    sfwr = self._extract(a, [os.path.join(self.dir, 'no-such-lib.js')])
+    self.assertEqual([r['pattern'] for r in sfwr.regexes], ['abc+'])
+
+  def test_unversionableExtractorRuns(self):
+    # A cache key we cannot compute (fileVersion cannot read a directory) means no cache, not no regexes
+    sfwr = self._extract(self._sourceFile('a.js', 'abc+\n'), [self.dir])
+    self.assertEqual(self._nRuns(), 1)
+    self.assertEqual([r['pattern'] for r in sfwr.regexes], ['abc+'])
+
+  def test_taskFlushesLookups(self):
+    a = self._sourceFile('a.js', 'abc+\n')
+    b = self._sourceFile('b.js', 'abc+\n')
+    self.cache._FLUSH_INTERVAL_SEC = 60
+    lang2extractor = regexExtractor.langToExtractorPath
+    regexExtractor.langToExtractorPath = { 'javascript': self.stub }
+    try:
+      for sourceFile in [a, b]:
+        regexExtractor.ExtractTask('npm', 'javascript', sourceFile, False, self.cache).run()
+    finally:
+      regexExtractor.langToExtractorPath = lang2extractor
+    # As another process (e.g. after we are killed) would see them
+    stats = libLF.ResultCache(self.cache.path).stats()['extract']
+    self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+###########################################################
+
+if __name__ == '__main__':
+  unittest.main()
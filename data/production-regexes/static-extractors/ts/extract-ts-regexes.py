@@ -3,6 +3,8 @@
 # Approach:
 # 1. Use tsc to transpile to a JS file.
 # 2. Use our JS regex extractor on the resulting JS.
+# With --daemon, read one file path per line on stdin and print one result per line, until EOF.
+# The JS extractor then stays warm in its own --daemon mode.
 
 # Import libLF
 import os
@@ -45,47 +47,75 @@ def transpile(tsSrc, jsDest):
     cmd = "'{}' '{}' > '{}'".format(transpiler, tsSrc, jsDest)
     libLF.chkcmd(cmd)
 
-def extractRegexesFromJS(jsFile):
+def extractRegexesFromJS(jsFile, jsDaemon=None):
     """Extract regexes from this JS file.
 
+    jsDaemon: a libLF.Daemon running the JS extractor with --daemon. None means run it once.
+
     Returns a libLF.SimpleFileWithRegexes object.
     """
 
     # Extract
-    cmd = "'{}' '{}'".format(regexExtractor, jsFile)
-    out = libLF.chkcmd(cmd)
+    if jsDaemon is not None:
+        out = jsDaemon.query(jsFile)
+    else:
+        cmd = "'{}' '{}'".format(regexExtractor, jsFile)
+        out = libLF.chkcmd(cmd)
 
     # Object-ify
     sfwr = libLF.SimpleFileWithRegexes()
     sfwr.initFromNDJSON(out)
     return sfwr
 
-def main(tsFile):
-    checkDependencies([transpiler, regexExtractor])
+def extractFile(tsFile, jsDaemon=None):
+    """Returns a libLF.SimpleFileWithRegexes object for tsFile"""
     _, jsTmpFile = tempfile.mkstemp(suffix='.js')
 
     sfwr = libLF.SimpleFileWithRegexes()
     try:
         # Get regexes from JS version
         transpile(tsFile, jsTmpFile)
-        sfwr = extractRegexesFromJS(jsTmpFile)
+        sfwr = extractRegexesFromJS(jsTmpFile, jsDaemon)
 
         # Tweak result a bit -- real file name, not temp file
         sfwr.fileName = tsFile
-
-        # Clean up
-        os.remove(jsTmpFile)
     except BaseException as err:
         libLF.log('Error: {}'.format(err))
         sfwr.initFromRaw(fileName=tsFile, language='typescript', couldParse=0, regexes=[])
-    print(sfwr.toNDJSON())
+    finally:
+        # Clean up
+        os.remove(jsTmpFile)
+    return sfwr
+
+def daemon():
+    # In our process group: regex-extractor.py kills that group to stop us, and this goes with us
+    jsDaemon = libLF.Daemon([regexExtractor, '--daemon'], newSession=False)
+    try:
+        for line in sys.stdin:
+            tsFile = line.rstrip('\r\n')
+            if not tsFile:
+                continue
+            print(extractFile(tsFile, jsDaemon).toNDJSON(), flush=True)
+    finally:
+        jsDaemon.stop()
+
+def main(tsFile, daemonMode):
+    checkDependencies([transpiler, regexExtractor])
+    if daemonMode:
+        daemon()
+    else:
+        print(extractFile(tsFile).toNDJSON())
 
 ###############################################
 
 # Parse args
 parser = argparse.ArgumentParser(description='Extract regexes from a TypeScript file')
-parser.add_argument('file_to_extract', help='TypeScript file from which to extract regexes')
+parser.add_argument('file_to_extract', nargs='?', help='TypeScript file from which to extract regexes')
+parser.add_argument('--daemon', help='Instead of file_to_extract, read one file path per line on stdin and print one result per line, until EOF', required=False, default=False, action='store_true',
+  dest='daemon')
 
 args = parser.parse_args()
+if args.file_to_extract is None and not args.daemon:
+    parser.error('file_to_extract is required unless --daemon')
 # Here we go!
-main(args.file_to_extract)
+main(args.file_to_extract, args.daemon)
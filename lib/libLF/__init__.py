@@ -7,4 +7,12 @@ from libLF.lf_ndjson import *
 from libLF.lf_module import *
 from libLF.lf_github import *
 from libLF.lf_superLinear import *
-import libLF.lf_parallel as parallel
\ No newline at end of file
+import libLF.lf_parallel as parallel
+from libLF.lf_daemon import *
+from libLF.lf_regexTesters import *
+from libLF.lf_resume import *
+from libLF.lf_resultCache import *
+from libLF.lf_generatorServer import *
+from libLF.lf_structuralInputs import *
+from libLF.lf_inputReduction import *
+from libLF.lf_sourceFiles import *
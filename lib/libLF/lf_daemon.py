@@ -0,0 +1,234 @@
+"""Lingua Franca: Daemons
+
+Long-running child processes that answer one line of output per line of input.
+Use these to avoid paying interpreter/JVM startup costs once per query.
+"""
+
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import libLF.lf_utils as lf_utils
+
+class Daemon:
+  """A child process speaking a line-oriented protocol on stdin/stdout.
+
+  The child is started lazily on the first query, and restarted
+  on the next query if it dies or is killed after a timeout.
+  """
+
+  READ_CHUNK_SIZE = 64 * 1024
+
+  def __init__(self, cmd, name=None, newSession=True):
+    """cmd: str[]: command to launch the child, e.g. ['node', 'tester.js', '--daemon']
+       name: str: for log messages
+       newSession: bool: if True, the child gets its own session, and stop() kills its process group.
+         If False, it stays in our process group, so that whoever kills our group kills it too,
+         but stop() kills only the child itself.
+    """
+    self.cmd = cmd
+    self.name = name if name is not None else os.path.basename(cmd[0])
+    self.newSession = newSession
+    self.proc = None
+    self._buf = b''
+
+  def isAlive(self):
+    return self.proc is not None and self.proc.poll() is None
+
+  def start(self):
+    """Start the child (if it is not already running)."""
+    if self.isAlive():
+      return
+    lf_utils.log('Daemon {}: starting {}'.format(self.name, self.cmd))
+    # New session so that stop() also reaps any grandchildren (e.g. the JVM behind a wrapper script).
+    self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+      stderr=subprocess.DEVNULL, start_new_session=self.newSession, close_fds=True)
+    self._buf = b''
+
+  def stop(self):
+    """Kill the child. Safe to call repeatedly."""
+    if self.proc is None:
+      return
+    if self.proc.poll() is None:
+      try:
+        if self.newSession:
+          os.killpg(self.proc.pid, signal.SIGKILL)
+        else:
+          os.kill(self.proc.pid, signal.SIGKILL)
+      except OSError:
+        pass
+      self.proc.wait()
+    for stream in [self.proc.stdin, self.proc.stdout]:
+      try:
+        stream.close()
+      except OSError:
+        pass
+    self.proc = None
+    self._buf = b''
+
+  def query(self, line, timeout=None):
+    """Send this line and return the child's one-line response.
+
+    Args:
+      line (str): the query. Must not contain a newline.
+      timeout (float): seconds to wait for the response. None means forever.
+
+    Returns:
+      response (str): without the trailing newline
+
+    Raises:
+      TimeoutError: no response in time. The child is killed.
+      OSError: the child died.
+    """
+    assert('\n' not in line)
+    self.start()
+    try:
+      self.proc.stdin.write(line.encode('utf-8') + b'\n')
+      self.proc.stdin.flush()
+    except BrokenPipeError:
+      self.stop()
+      raise OSError('Daemon {} died before reading the query'.format(self.name))
+    return self._readLine(timeout)
+
+  def _readLine(self, timeout):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    fd = self.proc.stdout.fileno()
+    while b'\n' not in self._buf:
+      remaining = None
+      if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+          self.stop()
+          raise TimeoutError('Daemon {} did not respond within {} seconds'.format(self.name, timeout))
+      ready, _, _ = select.select([fd], [], [], remaining)
+      if not ready:
+        continue # Re-check the deadline
+      chunk = os.read(fd, self.READ_CHUNK_SIZE)
+      if len(chunk) == 0:
+        self.stop()
+        raise OSError('Daemon {} died while answering the query'.format(self.name))
+      self._buf += chunk
+
+    response, self._buf = self._buf.split(b'\n', 1)
+    return response.decode('utf-8')
+
+class ForkedDaemon(Daemon):
+  """A Daemon whose child is a fork of this process, running serve().
+
+  Use this to run Python code that might not finish (e.g. a catastrophic-backtracking match)
+  under a timeout, without paying interpreter startup or re-importing anything.
+  Whatever serve() needs should be loaded before the first query, so the child inherits it.
+
+  A lock that another thread holds at the fork stays held forever in the child.
+  So we only fork from the main thread of a process with no other threads (canFork());
+  otherwise start() raises RuntimeError, and the caller should use a Daemon instead.
+  """
+
+  def __init__(self, serve, name):
+    """serve: function(inStream, outStream): reads query lines from inStream (binary)
+              and writes one response line per query to outStream (binary), flushing each.
+              Returns at EOF.
+       name: str: for log messages
+    """
+    super().__init__([name], name)
+    self.serve = serve
+
+  @staticmethod
+  def canFork():
+    """True if we may fork here: on the main thread, with no other threads running"""
+    return threading.current_thread() is threading.main_thread() and threading.active_count() == 1
+
+  def start(self):
+    """Start the child (if it is not already running)."""
+    if self.isAlive():
+      return
+    if not self.canFork():
+      raise RuntimeError('Daemon {}: will not fork with other threads running'.format(self.name))
+    lf_utils.log('Daemon {}: forking'.format(self.name))
+    toChild, childStdin = os.pipe()
+    childStdout, fromChild = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+      # Child. Never return into the caller's code.
+      rc = 0
+      try:
+        os.setpgid(0, 0)
+        os.close(childStdin)
+        os.close(childStdout)
+        sys.stderr = open(os.devnull, 'w')
+        self.serve(os.fdopen(toChild, 'rb'), os.fdopen(fromChild, 'wb'))
+      except BaseException:
+        rc = 1
+      os._exit(rc)
+
+    # Also from the parent, so that stop() can kill the group even if the child has not run yet
+    try:
+      os.setpgid(pid, pid)
+    except OSError:
+      pass
+    os.close(toChild)
+    os.close(fromChild)
+    self.proc = _ForkedChild(pid, os.fdopen(childStdin, 'wb'), os.fdopen(childStdout, 'rb'))
+    self._buf = b''
+
+class _ForkedChild:
+  """Just enough of subprocess.Popen for Daemon"""
+  def __init__(self, pid, stdin, stdout):
+    self.pid = pid
+    self.stdin = stdin
+    self.stdout = stdout
+    self.returncode = None
+
+  def poll(self):
+    if self.returncode is None:
+      pid, status = os.waitpid(self.pid, os.WNOHANG)
+      if pid != 0:
+        self.returncode = _exitCode(status)
+    return self.returncode
+
+  def wait(self):
+    if self.returncode is None:
+      _, status = os.waitpid(self.pid, 0)
+      self.returncode = _exitCode(status)
+    return self.returncode
+
+def _exitCode(status):
+  """As in Popen.returncode: negative for death by signal"""
+  if os.WIFSIGNALED(status):
+    return -os.WTERMSIG(status)
+  return os.WEXITSTATUS(status)
+
+class DaemonPool:
+  """A set of named Daemon's owned by the current process.
+
+  A pool must not be shared across a fork; each process should build its own.
+  """
+  def __init__(self):
+    self.name2daemon = {}
+
+  def add(self, name, cmd):
+    """Register a daemon. It will be started on its first query."""
+    if name not in self.name2daemon:
+      self.name2daemon[name] = Daemon(cmd, name)
+    return self.name2daemon[name]
+
+  def addForked(self, name, serve):
+    """Register a ForkedDaemon. It will be started on its first query."""
+    if name not in self.name2daemon:
+      self.name2daemon[name] = ForkedDaemon(serve, name)
+    return self.name2daemon[name]
+
+  def has(self, name):
+    return name in self.name2daemon
+
+  def query(self, name, line, timeout=None):
+    """Daemon.query on the daemon called name"""
+    return self.name2daemon[name].query(line, timeout)
+
+  def stop(self):
+    for daemon in self.name2daemon.values():
+      daemon.stop()
@@ -0,0 +1,193 @@
+"""Lingua Franca: Client for the JVM input-generator server
+
+The jar-based input generators (Brics, ReScue, MutRex) can be hosted by one long-lived JVM,
+analysis/semantic/input-generation/generators/jvm-server/generator-server.pl,
+instead of paying JVM startup on every 'java -jar'.
+runJarGenerator() uses that server if it is running, and the CLI otherwise.
+"""
+
+import libLF.lf_utils as lf_utils
+
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+
+class GeneratorServerClient:
+  """Send requests to the generator server over a pool of localhost connections
+
+  Each connection carries one request at a time. Threads may share a client.
+  A client belongs to the process that created it; use generatorServerClient().
+  """
+
+  DEFAULT_HOST = '127.0.0.1'
+  DEFAULT_PORT = 7349
+
+  # The server enforces the generator's timeout itself. Allow this long on top for the round trip.
+  RESPONSE_SLACK_SEC = 10
+  CONNECT_TIMEOUT_SEC = 1
+
+  def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, maxIdleConnections=8):
+    self.host = host
+    self.port = port
+    self.maxIdleConnections = maxIdleConnections
+    self.pid = os.getpid()
+    self._idle = [] # (socket, file) pairs
+    self._lock = threading.Lock()
+
+  def run(self, generator, argv, timeout=None):
+    """Run a generator in the server, as if by 'java -jar GENERATOR.jar argv...'
+
+    Args:
+      generator (str): 'brics', 'rescue', or 'mutrex'
+      argv (str[]): the generator's command-line arguments
+      timeout (float): seconds the generator may run. None or negative means forever.
+
+    Returns:
+      response (dict): keys exitCode, timedOut, stdout, stderr.
+        On a timeout, stdout and stderr hold what the generator printed before it was stopped.
+
+    Raises:
+      OSError: the server is not running, or hung up
+      TimeoutError: the server did not respond in time
+      ValueError: the server could not run the request (e.g. unknown generator)
+    """
+    assert(os.getpid() == self.pid)
+    if timeout is not None and timeout < 0:
+      timeout = None
+    request = {
+      'generator': generator,
+      'argv': argv,
+      'timeout': -1 if timeout is None else timeout,
+    }
+
+    line = json.dumps(request).encode('utf-8') + b'\n'
+    conn, reused = self._checkout()
+    try:
+      response = self._exchange(conn, line, timeout)
+    except TimeoutError:
+      raise
+    except OSError:
+      if not reused:
+        raise
+      # An idle connection may be stale, e.g. if the server restarted. Try a fresh one.
+      conn, _ = self._checkout(fresh=True)
+      response = self._exchange(conn, line, timeout)
+
+    if response.get('error') is not None:
+      raise ValueError('Generator server: {}'.format(response['error']))
+    return response
+
+  def isRunning(self):
+    """True if the server accepts connections"""
+    try:
+      conn, _ = self._checkout()
+      self._checkin(conn)
+      return True
+    except OSError:
+      return False
+
+  def close(self):
+    """Close the idle connections"""
+    with self._lock:
+      idle, self._idle = self._idle, []
+    for conn in idle:
+      self._close(conn)
+
+  # Internals
+
+  def _exchange(self, conn, line, timeout):
+    """Send one request line on conn and return the decoded response. Returns conn to the pool."""
+    sock, stream = conn
+    try:
+      sock.settimeout(None if timeout is None else timeout + self.RESPONSE_SLACK_SEC)
+      sock.sendall(line)
+      response = stream.readline()
+    except socket.timeout:
+      self._close(conn)
+      raise TimeoutError('Generator server did not answer within {} seconds'.format(timeout))
+    except OSError:
+      self._close(conn)
+      raise
+    if not response.endswith(b'\n'):
+      self._close(conn)
+      raise OSError('Generator server hung up mid-request')
+    self._checkin(conn)
+    return json.loads(response.decode('utf-8'))
+
+  def _checkout(self, fresh=False):
+    """Returns (conn, reused): an idle connection if there is one (and not fresh), else a new one"""
+    with self._lock:
+      if self._idle and not fresh:
+        return (self._idle.pop(), True)
+    sock = socket.create_connection((self.host, self.port), timeout=self.CONNECT_TIMEOUT_SEC)
+    return ((sock, sock.makefile('rb')), False)
+
+  def _checkin(self, conn):
+    with self._lock:
+      if len(self._idle) < self.maxIdleConnections:
+        self._idle.append(conn)
+        return
+    self._close(conn)
+
+  def _close(self, conn):
+    for c in reversed(conn):
+      try:
+        c.close()
+      except OSError:
+        pass
+
+_generatorServerClient = None
+_generatorServerClientLock = threading.Lock()
+def generatorServerClient():
+  """Returns the GeneratorServerClient for the current process"""
+  global _generatorServerClient
+  with _generatorServerClientLock:
+    if _generatorServerClient is None or _generatorServerClient.pid != os.getpid():
+      _generatorServerClient = GeneratorServerClient()
+    return _generatorServerClient
+
+def runJarGenerator(generator, jar, argv, timeout=None, client=None):
+  """Run a jar-based input generator: in the generator server if it is running, else 'java -jar jar argv...'
+
+  Args:
+    generator (str): the server's name for it: 'brics', 'rescue', or 'mutrex'
+    jar (str): path to the generator jar, for the CLI
+    argv (str[]): the generator's command-line arguments
+    timeout (float): seconds the generator may run. None or negative means forever.
+    client (GeneratorServerClient): defaults to generatorServerClient()
+
+  Returns:
+    (rc, stdout, stderr, timedOut): as from the CLI.
+      On a timeout, rc is None, and stdout and stderr hold what the generator printed before then.
+  """
+  if client is None:
+    client = generatorServerClient()
+  tmo = None if timeout is None or timeout < 0 else timeout
+  startTime = time.time()
+  try:
+    response = client.run(generator, argv, timeout)
+    rc = None if response['timedOut'] else response['exitCode']
+    return (rc, response['stdout'], response['stderr'], response['timedOut'])
+  except TimeoutError as err:
+    # The server is wedged, and the generator has had its time. Running it again would double the wait.
+    lf_utils.log('runJarGenerator: {} timed out in the server: {}'.format(generator, err))
+    return (None, '', '', True)
+  except (OSError, ValueError) as err:
+    # The CLI will do
+    if not isinstance(err, ConnectionRefusedError):
+      lf_utils.log('runJarGenerator: falling back to the CLI for {}: {}'.format(generator, err))
+
+  # The CLI gets what is left of the timeout, e.g. if the server died mid-request
+  if tmo is not None:
+    tmo -= time.time() - startTime
+    if tmo <= 0:
+      return (None, '', '', True)
+  cmd = ['java', '-jar', jar] + argv
+  try:
+    completedProcess = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=tmo)
+    return (completedProcess.returncode, completedProcess.stdout.decode('utf-8'), completedProcess.stderr.decode('utf-8'), False)
+  except subprocess.TimeoutExpired as to:
+    return (None, (to.stdout or b'').decode('utf-8'), (to.stderr or b'').decode('utf-8'), True)
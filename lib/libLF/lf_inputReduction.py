@@ -0,0 +1,152 @@
+"""Lingua Franca: Input reduction
+
+The input generators propose many inputs that exercise a regex in the same way,
+e.g. Rex in its ASCII and Unicode modes.
+Before testing inputs in every language, group them by a cheap "behavioral signature"
+and keep a few representatives of each group.
+
+An input's signature combines:
+  - How Python's re matches it: whether, where, and which groups participate
+  - Which of the regex's character classes each of its characters belongs to,
+    and the kind of each character (ASCII letter, newline, non-BMP, ...)
+  - Its length, on a log scale
+"""
+
+import libLF.lf_structuralInputs as lf_structuralInputs
+import libLF.lf_utils as lf_utils
+
+import math
+import random
+import re
+import signal
+import threading
+import unicodedata
+
+# Seconds of Python matching to spend on the signatures for one regex.
+# A super-linear regex may exceed this, and then we do not use match features.
+DEFAULT_MATCH_BUDGET_SEC = 1
+
+# Only report on this many capture groups
+_MAX_GROUPS = 16
+
+def inputSignatures(pattern, inputs, matchBudget=DEFAULT_MATCH_BUDGET_SEC):
+  """Compute the behavioral signature of each input
+
+  pattern: str: the regex
+  inputs: str[]
+  matchBudget: float: seconds of Python matching to spend, in total.
+    Python match features are used only if the pattern compiles in Python,
+    we are on the main thread (so that we can interrupt a slow match), and every match finishes in time.
+
+  @returns dict: input -> signature (hashable)
+  """
+  try:
+    classes = lf_structuralInputs.characterClasses(pattern)
+  except ValueError:
+    classes = []
+
+  input2matchSig = _matchSignatures(pattern, inputs, matchBudget)
+
+  input2sig = {}
+  for s in inputs:
+    charSigs = frozenset(_charSignature(ch, classes) for ch in s)
+    lengthBucket = 0 if not s else 1 + int(math.log2(len(s)))
+    input2sig[s] = (input2matchSig.get(s), charSigs, lengthBucket)
+  return input2sig
+
+def reduceInputs(pattern, inputs, perClass=3, seed=None, matchBudget=DEFAULT_MATCH_BUDGET_SEC):
+  """Keep at most perClass inputs with each behavioral signature
+
+  pattern: str: the regex
+  inputs: str[]: unique
+  perClass: int: representatives per signature. Each class keeps its shortest and longest input,
+    then random others.
+  seed: int: for the choice of representatives. None means random.
+  matchBudget: see inputSignatures
+
+  @returns str[]: the representatives, in the order of inputs
+  """
+  rng = random.Random(seed)
+  sig2inputs = {}
+  for s, sig in inputSignatures(pattern, inputs, matchBudget).items():
+    sig2inputs.setdefault(sig, []).append(s)
+
+  keep = set()
+  for members in sig2inputs.values():
+    if len(members) <= perClass:
+      keep.update(members)
+      continue
+    byLength = sorted(members, key=lambda s: (len(s), s))
+    reps = [byLength[0], byLength[-1]][:perClass]
+    rest = byLength[1:-1]
+    reps += rng.sample(rest, max(0, min(perClass - len(reps), len(rest))))
+    keep.update(reps)
+
+  lf_utils.log('reduceInputs: /{}/: {} inputs in {} classes, keeping {}'.format(pattern, len(inputs), len(sig2inputs), len(keep)))
+  return [s for s in inputs if s in keep]
+
+def _matchSignatures(pattern, inputs, matchBudget):
+  """Returns dict: input -> match signature, or {} if we cannot match safely"""
+  try:
+    regex = re.compile(pattern)
+  except Exception:
+    # re.error, or e.g. OverflowError
+    return {}
+  if threading.current_thread() is not threading.main_thread():
+    return {}
+
+  def onTimeout(signum, frame):
+    raise TimeoutError()
+
+  # re checks for signals as it matches, so an alarm interrupts a runaway match
+  oldHandler = signal.signal(signal.SIGALRM, onTimeout)
+  signal.setitimer(signal.ITIMER_REAL, matchBudget)
+  try:
+    return { s: _matchSignature(regex, s) for s in inputs }
+  except TimeoutError:
+    lf_utils.log('reduceInputs: /{}/: Python matching exceeded {} seconds; not using match features'.format(pattern, matchBudget))
+    return {}
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, oldHandler)
+
+def _matchSignature(regex, s):
+  m = regex.search(s)
+  if m is None:
+    return None
+  start, end = m.span()
+  groups = tuple(_spanKind(m.span(g), start, end) for g in range(1, min(regex.groups, _MAX_GROUPS) + 1))
+  return (start == 0, end == len(s), start == end, groups)
+
+def _spanKind(span, start, end):
+  """How a capture group participated in a match"""
+  gStart, gEnd = span
+  if gStart == -1:
+    return 'none'
+  if gStart == gEnd:
+    return 'empty'
+  return (gStart == start, gEnd == end)
+
+def _charSignature(ch, classes):
+  return (_charKind(ch),) + tuple(c(ch) for c in classes)
+
+def _charKind(ch):
+  """A coarse category: the distinctions regex engines tend to disagree on"""
+  c = ord(ch)
+  if ch in '\r\n':
+    return ch
+  if c < 0x80:
+    if ch.isalpha():
+      return 'lower' if ch.islower() else 'upper'
+    if ch.isdigit():
+      return 'digit'
+    if ch.isspace():
+      return 'space'
+    if c < 0x20 or c == 0x7F:
+      return 'control'
+    return 'punct'
+  if 0xFFFF < c:
+    # Surrogate pairs in UTF-16 languages
+    return 'astral'
+  # Letters, digits, spaces etc. outside ASCII: Unicode-awareness differs by language
+  return 'U' + unicodedata.category(ch)
@@ -5,12 +5,17 @@ Classes and methods to help with parallelizing a set of tasks.
 
 import multiprocessing
 
+import errno
+import fcntl
 import os
+import tempfile
+import threading
 
 import time
 import random
 
 import libLF.lf_utils as lf_utils
+import libLF.lf_resultCache as lf_resultCache
 
 ####
 # Public API.
@@ -26,19 +31,66 @@ def map(tasks, nWorkers, rateLimit, limitUnits, jitter):
     @param jitter: if true, inject some jitter to avoid lockstepped tasks
     @return results[]: in same order as tasks. If any task.run() throws then we put the exception in the list
     """
+    return list(imap(tasks, nWorkers, rateLimit, limitUnits, jitter))
 
-    # Build an RLWT
-    rlwt = _RateLimitedParallelTasks(tasks, rateLimit, limitUnits)
+def imap(tasks, nWorkers, rateLimit, limitUnits, jitter):
+    """Like map, but yield each result as soon as it and its predecessors are done.
 
-    # Which _runWorkerTask to use?
-    runParallelTask = _runParallelTask
-    if jitter:
-        runParallelTask = _runParallelTaskJitter
+    Results are yielded in the same order as tasks.
+    A slow task holds back the results of the tasks after it;
+    use imap_unordered if you do not need the order.
+    """
+    return _imap(tasks, nWorkers, rateLimit, limitUnits, jitter, ordered=True)
 
-    with multiprocessing.Pool(nWorkers) as pool:
-        # TODO Can we return an iterable or yield or something?
-        results = list(pool.imap(runParallelTask, rlwt))
-    return results
+def imap_unordered(tasks, nWorkers, rateLimit, limitUnits, jitter):
+    """Like map, but yield each result as soon as it is done.
+
+    Results are yielded in completion order, not task order.
+    Use this to emit results incrementally, e.g. so that a crash does not lose
+    the work already done, and so that completed results need not be kept in memory.
+    """
+    return _imap(tasks, nWorkers, rateLimit, limitUnits, jitter, ordered=False)
+
+def imap_pipeline(tasks, nPrepareWorkers, nRunWorkers, queueSize):
+    """Run each task's prepare() and then its run(), in two pools sized separately.
+
+    Use this when tasks have two phases with different bottlenecks,
+    e.g. waiting on subprocesses and then computing.
+    A prepared task waits in a bounded queue until a run worker is free:
+    at most nPrepareWorkers + queueSize + nRunWorkers tasks are in flight,
+    so the prepare pool runs ahead of the run pool, but not arbitrarily far.
+
+    @param tasks: An iterable that returns PipelineTask's
+    @param nPrepareWorkers, nRunWorkers: Number of workers in each pool
+    @param queueSize: Prepared tasks that may wait for a run worker
+    @return: yields run() results in completion order.
+      If prepare() or run() throws then we yield the exception.
+    """
+    nSlots = nPrepareWorkers + queueSize + nRunWorkers
+    slots = threading.Semaphore(nSlots)
+    stopped = threading.Event()
+
+    # admit runs in preparePool's task-handler thread, which the pool joins on exit.
+    # If our caller stops early, it must not be left blocked on a slot.
+    def admit(tasks):
+        for task in tasks:
+            slots.acquire()
+            if stopped.is_set():
+                return
+            yield task
+
+    with multiprocessing.Pool(nPrepareWorkers) as preparePool, \
+         multiprocessing.Pool(nRunWorkers) as runPool:
+        prepared = preparePool.imap_unordered(_preparePipelineTask, admit(tasks))
+        try:
+            for result in runPool.imap_unordered(_runPipelineTask, prepared):
+                slots.release()
+                yield result
+        finally:
+            # Done, closed early, or the caller raised. Wake admit so it can return.
+            stopped.set()
+            for _ in range(nSlots):
+                slots.release()
 
 class CPUCount():
     """Estimates of number of CPUs you want. {CPU | IO | NETWORK}_BOUND"""
@@ -58,6 +110,80 @@ class RateLimitEnums():
     PER_MINUTE = 'PER_MINUTE'
     PER_HOUR = 'PER_HOUR'
 
+class NodeSemaphore():
+    """A counting semaphore shared by every process on this node.
+
+    Use it to cap the number of concurrent heavy activities (e.g. regex validators)
+    across the workers of one or more maps, and the threads within them.
+
+    Backed by nSlots lock files under the temp dir; holding a slot means holding an flock on its file.
+    A process that dies releases its slots.
+    Instances are cheap and picklable, so pass one to your ParallelTask's.
+
+    with sem:
+        ...
+    """
+    _POLL_INTERVAL_SEC = 0.05
+
+    def __init__(self, name, nSlots):
+        """
+        @param name: Processes using the same name share the slots
+        @param nSlots: Number of concurrent holders. Processes sharing a name should agree on it.
+        """
+        if nSlots < 1:
+            raise ValueError('NodeSemaphore needs at least 1 slot, got {}'.format(nSlots))
+        self.name = name
+        self.nSlots = nSlots
+        self.slotDir = os.path.join(tempfile.gettempdir(), 'LinguaFranca-NodeSemaphore-{}'.format(name))
+        self._local = threading.local()
+
+    def acquire(self, timeout=None):
+        """Block until we get a slot, or for at most timeout seconds (None: forever).
+
+        Returns a token for release(), or None if the timeout expired first.
+        """
+        os.makedirs(self.slotDir, exist_ok=True)
+        startTime = time.time()
+        while True:
+            for i in range(self.nSlots):
+                fd = os.open(os.path.join(self.slotDir, 'slot-{}'.format(i)), os.O_RDWR | os.O_CREAT, 0o666)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except OSError as err:
+                    os.close(fd)
+                    if err.errno not in [errno.EAGAIN, errno.EACCES]:
+                        raise
+            if timeout is not None and timeout <= time.time() - startTime:
+                return None
+            time.sleep(self._POLL_INTERVAL_SEC)
+
+    def release(self, token):
+        fcntl.flock(token, fcntl.LOCK_UN)
+        os.close(token)
+
+    def __enter__(self):
+        # Per-thread stack of tokens, so one instance can be shared by threads and nested
+        self._tokens().append(self.acquire())
+        return self
+
+    def __exit__(self, *args):
+        self.release(self._tokens().pop())
+
+    def _tokens(self):
+        if not hasattr(self._local, 'tokens'):
+            self._local.tokens = []
+        return self._local.tokens
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
 class ParallelTask():
     """Sub-class this. Override the run() method."""
     def __init__(self):
@@ -65,10 +191,41 @@ class ParallelTask():
     def run(self):
         pass
 
+class PipelineTask(ParallelTask):
+    """Sub-class this for imap_pipeline. Override prepare() and run().
+
+    prepare() runs first, in a separate pool. It may set fields for run() to use.
+    """
+    def prepare(self):
+        pass
+
 ####
 # Helpers
 ####
 
+def _imap(tasks, nWorkers, rateLimit, limitUnits, jitter, ordered):
+    """Generator behind imap and imap_unordered.
+
+    The pool lives as long as the generator. If the caller stops early,
+    closing the generator terminates the pool.
+    """
+
+    # Build an RLWT
+    rlwt = _RateLimitedParallelTasks(tasks, rateLimit, limitUnits)
+
+    # Which _runWorkerTask to use?
+    runParallelTask = _runParallelTask
+    if jitter:
+        runParallelTask = _runParallelTaskJitter
+
+    with multiprocessing.Pool(nWorkers) as pool:
+        if ordered:
+            results = pool.imap(runParallelTask, rlwt)
+        else:
+            results = pool.imap_unordered(runParallelTask, rlwt)
+        for result in results:
+            yield result
+
 def _runParallelTask(parallelTask):
     """Return the result of parallelTask.run(), or the exception generated when we attempt."""
     ret = None
@@ -76,15 +233,34 @@ def _runParallelTask(parallelTask):
         ret = parallelTask.run()
     except BaseException as err:
         ret = err
+    # The task's copy of a ResultCache goes away with it. Record its lookups first.
+    try:
+        lf_resultCache.flushAll()
+    except BaseException as err:
+        lf_utils.log('Could not flush result cache lookups: {}'.format(err))
     return ret 
 
+def _preparePipelineTask(pipelineTask):
+    """Return pipelineTask, prepared, or the exception generated when we attempt."""
+    try:
+        pipelineTask.prepare()
+        return pipelineTask
+    except BaseException as err:
+        return err
+
+def _runPipelineTask(pipelineTask):
+    """Return the result of pipelineTask.run(). Pass along an exception from prepare()."""
+    if isinstance(pipelineTask, BaseException):
+        return pipelineTask
+    return _runParallelTask(pipelineTask)
+
 def _runParallelTaskJitter(parallelTask):
     """_runWorkerTask with some pre-run jitter (O(fractions of a second))."""
     time.sleep(0.1 * random.random()) # TODO Sleep <= 0.1 seconds.
     return _runParallelTask(parallelTask)
 
 class _RateLimitedParallelTasks():
-    """Wrap a list of ParallelTasks.
+    """Wrap an iterable of ParallelTasks.
     
     This is an iterable that returns only within a rate limit.
     For use with multiprocessing.
@@ -96,7 +272,7 @@ class _RateLimitedParallelTasks():
     cf. https://stackoverflow.com/a/26521507
     """
     def __init__(self, tasks, rateLimit, limitUnits):
-        self.tasks = tasks
+        self.tasks = iter(tasks)
         self.firstEmission = True
         self.rateLimit = rateLimit
         self.limitUnits = limitUnits
@@ -105,8 +281,6 @@ class _RateLimitedParallelTasks():
         self._beginWindow()
         self.windowLengthInSeconds = self._windowLengthInSeconds()
 
-        self.ix = 0
-
     def __iter__(self):
         return self
     
@@ -116,11 +290,8 @@ class _RateLimitedParallelTasks():
             self.firstEmission = False
             self._beginWindow()
 
-        # Get the next task
-        if len(self.tasks) <= self.ix:
-            raise StopIteration
-        nextTask = self.tasks[self.ix]
-        self.ix += 1
+        # Get the next task. Raises StopIteration when we run out.
+        nextTask = next(self.tasks)
 
         if self.rateLimit != RateLimitEnums.NO_RATE_LIMIT:
             # Apply rate limiting
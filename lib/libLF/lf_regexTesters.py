@@ -0,0 +1,220 @@
+"""Lingua Franca: Regex testers
+
+Wrappers for the per-language regex testers in analysis/test-regex-behavior-in-language/.
+"""
+
+import libLF.lf_utils as lf_utils
+import libLF.lf_daemon as lf_daemon
+import libLF.lf_resultCache as lf_resultCache
+
+import functools
+import importlib.util
+import json
+import os
+import re
+import signal
+import subprocess
+import threading
+
+class RegexTesterPool:
+  """Query regexes using one warm tester daemon per language
+
+  Each tester is launched as 'TESTER --daemon' on its first query and kept alive.
+  A daemon that times out (e.g. super-linear behavior) is killed,
+  and a fresh one is launched on the next query.
+
+  A pool belongs to the process that created it.
+  In a libLF.parallel worker, use regexTesterPool() to get one.
+  Threads may share a pool as long as they query different languages.
+
+  Python is the language we are running in, so Python queries may instead be answered
+  in-process (inProcessLangs; off by default), by the evaluateQuery() of the Python tester CLI
+  in a ForkedDaemon, so that catastrophic backtracking can still be timed out.
+  The ForkedDaemon only forks in a single-threaded process. Elsewhere, such as in
+  a thread of a multi-threaded worker, Python queries go to the CLI tester daemon.
+  """
+
+  LANG_CLI_DIR = os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'bin')
+  LANG2CLI = {
+    'go':         os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-go'),
+    'java':       os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-java.pl'),
+    'javascript': os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-node.js'),
+    'perl':       os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-perl.pl'),
+    'php':        os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-php.php'),
+    'python':     os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-python.py'),
+    'ruby':       os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-ruby.rb'),
+    'rust':       os.path.join(LANG_CLI_DIR, 'check-regex-behavior-in-rust'),
+  }
+
+  SUPPORTED_IN_PROCESS_LANGS = ['python']
+
+  def __init__(self, lang2cli=LANG2CLI, inProcessLangs=[]):
+    """lang2cli: { lang: tester CLI }
+       inProcessLangs: str[]: answer queries in these languages in-process. Only 'python' is supported.
+    """
+    self.lang2cli = lang2cli
+    self.inProcessLangs = [lang for lang in inProcessLangs if lang in lang2cli and lang in self.SUPPORTED_IN_PROCESS_LANGS]
+    self.pid = os.getpid()
+    self.daemonPool = lf_daemon.DaemonPool()
+
+  def query(self, lang, pattern, inputs, timeout=None, timeoutPerInput=None):
+    """Match pattern against each of inputs in lang
+
+    Args:
+      lang (str): a key of LANG2CLI
+      pattern (str): regex pattern
+      inputs (str[]): strings to try
+      timeout (float): seconds to wait for the whole query. None means forever.
+        If it expires, the tester is killed and we get no results at all.
+      timeoutPerInput (float): seconds the tester may spend matching each input. None means forever.
+        An input that takes longer gets a result with timedOut set, and the tester moves on.
+        (PHP cannot enforce this; it reports hitting PCRE's backtracking limits as timedOut.
+        Go and Rust match in linear time and never time out.)
+
+    Returns:
+      result (dict): the tester output: the query plus keys validPattern and results[]
+
+    Raises:
+      ValueError: unsupported lang
+      TimeoutError: the tester did not finish in time
+      OSError: the tester died
+    """
+    lang = lang.lower()
+    if lang not in self.lang2cli:
+      raise ValueError('Unsupported language {}'.format(lang))
+    assert(os.getpid() == self.pid)
+
+    query = {
+      'pattern': pattern,
+      'inputs': inputs,
+    }
+    if timeoutPerInput is not None:
+      query['timeoutPerInput'] = timeoutPerInput
+    if self.isInProcess(lang) and lf_daemon.ForkedDaemon.canFork():
+      return self._queryPythonInProcess(lang, query, timeout)
+    self.daemonPool.add(lang, [self.lang2cli[lang], '--daemon'])
+    return json.loads(self.daemonPool.query(lang, json.dumps(query), timeout))
+
+  def isInProcess(self, lang):
+    """True if queries in lang are answered in-process (where we can fork)"""
+    return lang.lower() in self.inProcessLangs
+
+  def _queryPythonInProcess(self, lang, query, timeout):
+    # Load the tester before the fork, so the child inherits it
+    tester = _loadPythonTester(self.lang2cli[lang])
+    name = '{}-forked'.format(lang)
+    self.daemonPool.addForked(name, functools.partial(_servePython, tester))
+    return json.loads(self.daemonPool.query(name, json.dumps(query), timeout))
+
+  def stop(self):
+    """Kill all of the daemons"""
+    self.daemonPool.stop()
+
+# In-process Python testing
+
+PYTHON_COMPILED_PATTERN_CACHE_SIZE = 1024
+
+# Used in the forked child, which lives across queries until one times out
+@functools.lru_cache(maxsize=PYTHON_COMPILED_PATTERN_CACHE_SIZE)
+def _compilePython(pattern):
+  return re.compile(pattern)
+
+_path2pythonTester = {}
+def _loadPythonTester(cli):
+  """Import the Python tester CLI as a module, for its evaluateQuery()"""
+  path = os.path.realpath(cli)
+  if path not in _path2pythonTester:
+    spec = importlib.util.spec_from_file_location('lf_pythonTester', path)
+    tester = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tester)
+    # Its per-query log messages are for the CLI
+    tester.log = lambda msg: None
+    _path2pythonTester[path] = tester
+  return _path2pythonTester[path]
+
+def _servePython(tester, inStream, outStream):
+  """ForkedDaemon serve(): the Python tester's --daemon loop"""
+  for line in inStream:
+    line = line.strip()
+    if len(line) == 0:
+      continue
+    result = tester.evaluateQuery(json.loads(line.decode('utf-8')), compile=_compilePython)
+    outStream.write(json.dumps(result).encode('utf-8') + b'\n')
+    outStream.flush()
+
+_regexTesterPool = None
+_regexTesterPoolLock = threading.Lock()
+_inProcessTesterLangs = []
+def regexTesterPool():
+  """Returns the RegexTesterPool for the current process
+
+  The daemons of a pool inherited across a fork belong to the parent,
+  so a child gets a fresh pool of its own.
+  """
+  global _regexTesterPool
+  with _regexTesterPoolLock:
+    if _regexTesterPool is None or _regexTesterPool.pid != os.getpid():
+      _regexTesterPool = RegexTesterPool(inProcessLangs=_inProcessTesterLangs)
+    return _regexTesterPool
+
+def setInProcessTesterLangs(langs):
+  """Have regexTesterPool() answer queries in these languages in-process (see RegexTesterPool)
+
+  Call this before starting libLF.parallel workers, so that they inherit it.
+  """
+  global _regexTesterPool, _inProcessTesterLangs
+  with _regexTesterPoolLock:
+    _inProcessTesterLangs = list(langs)
+    if _regexTesterPool is not None and _regexTesterPool.pid == os.getpid():
+      _regexTesterPool.stop()
+    _regexTesterPool = None
+
+def queryTesterBatch(lang, queries, timeout=None, lang2cli=RegexTesterPool.LANG2CLI):
+  """Run many queries through one fresh tester process
+
+  Feeds the queries to 'TESTER --daemon' on stdin and closes it.
+
+  Args:
+    lang (str): a key of lang2cli
+    queries (dict[]): each with keys pattern and inputs
+    timeout (float): seconds for the whole batch. None means forever.
+
+  Returns:
+    results (dict[]): tester output for each query, in order.
+      Shorter than queries if the tester died or timed out partway through:
+      results[i] is valid for i < len(results), and queries[len(results)] is the likely culprit.
+  """
+  lang = lang.lower()
+  if lang not in lang2cli:
+    raise ValueError('Unsupported language {}'.format(lang))
+
+  stdin = ''.join([json.dumps(q) + '\n' for q in queries]).encode('utf-8')
+  proc = subprocess.Popen([lang2cli[lang], '--daemon'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    stderr=subprocess.DEVNULL, start_new_session=True)
+  try:
+    out, _ = proc.communicate(stdin, timeout=timeout)
+  except subprocess.TimeoutExpired:
+    lf_utils.log('queryTesterBatch: {} timed out after {} seconds'.format(lang, timeout))
+    os.killpg(proc.pid, signal.SIGKILL)
+    out, _ = proc.communicate()
+
+  # Keep the complete lines. The last element is '' or a partial line.
+  results = []
+  for line in out.decode('utf-8').split('\n')[:-1]:
+    try:
+      results.append(json.loads(line))
+    except ValueError:
+      break
+  if len(results) < len(queries):
+    lf_utils.log('queryTesterBatch: {} answered {} of {} queries (rc {})'.format(lang, len(results), len(queries), proc.returncode))
+  return results[:len(queries)]
+
+def testerVersion(lang, lang2cli=RegexTesterPool.LANG2CLI):
+  """A libLF.ResultCache toolVersion for the tester for lang"""
+  cli = lang2cli[lang.lower()]
+  files = [cli]
+  # The Java CLI is a wrapper around the jar
+  jar = os.path.join(os.path.dirname(os.path.realpath(cli)), 'target', 'query-java-1.0-shaded.jar')
+  if lang.lower() == 'java' and os.path.isfile(jar):
+    files.append(jar)
+  return lf_resultCache.fileVersion(*files)
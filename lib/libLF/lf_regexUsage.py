@@ -148,10 +148,15 @@ class Regex:
     nUniqueInputsTested: int
     semanticDifferenceWitnesses: SemanticDifferenceWitness[]
       These are populated by test-for-semantic-portability.py
+    lang2timedOutInputs: { lang: str[] }
+      Inputs whose match exceeded the per-input deadline in that language.
+      Also populated by test-for-semantic-portability.py.
   """
 
   DEFAULT_VULN_REGEX_DETECTOR_ROOT = \
     os.path.join(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT'], 'analysis', 'performance', 'vuln-regex-detector')
+  SUPPORT_QUERY_TIMEOUT_SEC = 30 # A single short input; this only catches a wedged tester.
+  SYNTAX_CACHE_KIND = 'syntax' # libLF.ResultCache kind
 
   def __init__(self):
     """Declare an object and then initialize using JSON or "Raw" input."""
@@ -160,13 +165,15 @@ class Regex:
     self.supportedLangs = []
     self.nUniqueInputsTested = -1
     self.semanticDifferenceWitnesses = []
+    self.lang2timedOutInputs = {}
 
   def initFromRaw(self, pattern, 
       useCount_registry_to_nModules, 
       useCount_IStype_to_nPosts,
       supportedLangs=None,
       nUniqueInputsTested=None,
-      semanticDifferenceWitnesses=None):
+      semanticDifferenceWitnesses=None,
+      lang2timedOutInputs=None):
     self.initialized = True
 
     self.pattern = pattern
@@ -188,6 +195,11 @@ class Regex:
     else:
       self.semanticDifferenceWitnesses = semanticDifferenceWitnesses
 
+    if lang2timedOutInputs is None:
+      self.lang2timedOutInputs = {}
+    else:
+      self.lang2timedOutInputs = lang2timedOutInputs
+
     return self
   
   def initFromDict(self, obj):
@@ -214,6 +226,11 @@ class Regex:
     else:
       self.semanticDifferenceWitnesses = []
 
+    if 'lang2timedOutInputs' in obj:
+      self.lang2timedOutInputs = obj['lang2timedOutInputs']
+    else:
+      self.lang2timedOutInputs = {}
+
     return self
 
   def initFromNDJSON(self, jsonStr):
@@ -236,7 +253,8 @@ class Regex:
             "semanticDifferenceWitnesses": [
               sdw.toNDJSON()
               for sdw in self.semanticDifferenceWitnesses
-            ]
+            ],
+            "lang2timedOutInputs": self.lang2timedOutInputs,
     }
     return obj
 
@@ -261,38 +279,125 @@ class Regex:
     return self.useCount_IStype_to_nPosts.keys()
   
   # TODO We have our own versions of the testers, no particular need to use vrdPath
-  def isSupportedInLanguage(self, lang, vrdPath=DEFAULT_VULN_REGEX_DETECTOR_ROOT):
+  def isSupportedInLanguage(self, lang, vrdPath=DEFAULT_VULN_REGEX_DETECTOR_ROOT, testerPool=None, cache=None):
     """Returns True if regex can be used in lang
     
+    If testerPool (a libLF.RegexTesterPool) is given, query its warm tester daemon
+    instead of launching a check-regex-support.pl process.
+    Languages that regexTesterPool() tests in-process (libLF.setInProcessTesterLangs) always use it.
+    If cache (a libLF.ResultCache) is given, consult it first.
+
     Also updates internal member."""
     checkRegexSupportScript = os.path.join(vrdPath, 'src', 'validate', 'check-regex-support.pl')
+    if testerPool is None and libLF.regexTesterPool().isInProcess(lang):
+      testerPool = libLF.regexTesterPool()
+    if testerPool is not None:
+      toolVersion = libLF.testerVersion(lang)
+    else:
+      toolVersion = libLF.fileVersion(checkRegexSupportScript)
 
-    # Build query
-    query = {
-      "language": lang,
-      "pattern": self.pattern
-    }
-    libLF.log('Query: {}'.format(json.dumps(query)))
-
-    # Query from tempfile
-    with tempfile.NamedTemporaryFile(prefix='SyntaxAnalysis-queryLangs-', suffix='.json', delete=True) as ntf:
-      libLF.writeToFile(ntf.name, json.dumps(query))
-      rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}'" \
-        .format(vrdPath, checkRegexSupportScript, ntf.name))
-      out = out.strip()
-
-    libLF.log('Got rc {} out\n{}'.format(rc, out))
-    # TODO Not sure if this can go wrong.
-    assert(rc == 0)
+    if cache is not None:
+      obj = cache.get(self.SYNTAX_CACHE_KIND, self.pattern, lang, toolVersion, {})
+      if obj is not None:
+        return self._recordSupport(lang, obj)
 
-    obj = json.loads(out)
-    if bool(obj['validPattern']):
+    if testerPool is not None:
+      obj = testerPool.query(lang, self.pattern, ["a"], timeout=self.SUPPORT_QUERY_TIMEOUT_SEC)
+    else:
+      # Build query
+      query = {
+        "language": lang,
+        "pattern": self.pattern
+      }
+      libLF.log('Query: {}'.format(json.dumps(query)))
+
+      # Query from tempfile
+      with tempfile.NamedTemporaryFile(prefix='SyntaxAnalysis-queryLangs-', suffix='.json', delete=True) as ntf:
+        libLF.writeToFile(ntf.name, json.dumps(query))
+        rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}'" \
+          .format(vrdPath, checkRegexSupportScript, ntf.name))
+        out = out.strip()
+
+      libLF.log('Got rc {} out\n{}'.format(rc, out))
+      # TODO Not sure if this can go wrong.
+      assert(rc == 0)
+
+      obj = json.loads(out)
+
+    if cache is not None:
+      cache.put(self.SYNTAX_CACHE_KIND, self.pattern, lang, toolVersion, {}, { 'validPattern': obj['validPattern'] })
+    return self._recordSupport(lang, obj)
+
+  def _recordSupport(self, lang, testerOutput):
+    if bool(testerOutput['validPattern']):
       if lang not in self.supportedLangs:
         self.supportedLangs.append(lang)
       return True
     else:
       return False
 
+def regexesSupportedInLanguage(regexes, lang, timeoutPerRegex=1, cache=None):
+  """Batched Regex.isSupportedInLanguage
+
+  Checks all of the regexes with one tester process for lang
+  (more if a pattern crashes or wedges the tester),
+  or one query at a time if regexTesterPool() tests lang in-process (libLF.setInProcessTesterLangs).
+  Updates each regex's supportedLangs.
+
+  Args:
+    regexes (Regex[])
+    lang (str)
+    timeoutPerRegex (float): the batch gets Regex.SUPPORT_QUERY_TIMEOUT_SEC plus this much per regex
+    cache (libLF.ResultCache): if given, only query the regexes it has not seen
+
+  Returns:
+    res[]: in the same order as regexes: True or False, or the exception if we could not tell
+  """
+  toolVersion = libLF.testerVersion(lang)
+  res = [None] * len(regexes)
+  remaining = []
+  for i, regex in enumerate(regexes):
+    obj = None
+    if cache is not None:
+      obj = cache.get(Regex.SYNTAX_CACHE_KIND, regex.pattern, lang, toolVersion, {})
+    if obj is not None:
+      res[i] = regex._recordSupport(lang, obj)
+    else:
+      remaining.append(i)
+
+  def record(i, out):
+    res[i] = regexes[i]._recordSupport(lang, out)
+    if cache is not None:
+      cache.put(Regex.SYNTAX_CACHE_KIND, regexes[i].pattern, lang, toolVersion, {}, { 'validPattern': out['validPattern'] })
+
+  testerPool = libLF.regexTesterPool()
+  if testerPool.isInProcess(lang):
+    # No tester process to amortize
+    for i in remaining:
+      try:
+        record(i, testerPool.query(lang, regexes[i].pattern, ["a"], timeout=Regex.SUPPORT_QUERY_TIMEOUT_SEC))
+      except OSError as err:
+        # Includes TimeoutError
+        libLF.log('regexesSupportedInLanguage: in-process tester for {} failed on /{}/: {}'.format(lang, regexes[i].pattern, err))
+        res[i] = err
+    return res
+
+  queries = [{ "pattern": regex.pattern, "inputs": ["a"] } for regex in regexes]
+  while len(remaining):
+    timeout = Regex.SUPPORT_QUERY_TIMEOUT_SEC + timeoutPerRegex * len(remaining)
+    outs = libLF.queryTesterBatch(lang, [queries[i] for i in remaining], timeout)
+    for i, out in zip(remaining, outs):
+      record(i, out)
+    if len(outs) == len(remaining):
+      break
+
+    # The tester died or hung on the next one. Blame it and carry on with the rest.
+    culprit = remaining[len(outs)]
+    libLF.log('regexesSupportedInLanguage: tester for {} failed on /{}/'.format(lang, regexes[culprit].pattern))
+    res[culprit] = OSError('Tester for {} failed on this pattern'.format(lang))
+    remaining = remaining[len(outs) + 1:]
+  return res
+
 #####
 # RegexPatternAndInputs
 #####
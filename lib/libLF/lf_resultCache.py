@@ -0,0 +1,264 @@
+"""Lingua Franca: Result cache
+
+A local on-disk cache of analysis results, so that re-analyzing a pattern
+(e.g. in a re-exported or subsetted regex file) need not re-query
+the detectors, generators, and testers.
+
+Backed by SQLite. Safe to share among the processes of a libLF.parallel map,
+and among threads.
+"""
+
+import libLF.lf_utils as lf_utils
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+
+class ResultCache:
+  """Content-addressed cache: (kind, pattern, language, toolVersion, params) -> JSON-able value
+
+  kind: str: the analysis, e.g. 'syntax', 'detectors', 'validate', 'semantic'
+  pattern: str: the regex pattern
+  language: str: or '' if not language-specific
+  toolVersion: str: changes whenever the tool's behavior might. See fileVersion().
+  params: JSON-able: anything else that affects the result (inputs, timeouts, ...)
+
+  Values may be stored zlib-compressed (put(..., compress=True)), e.g. for bulky generated inputs.
+  evict() removes entries least-recently-used first until the cache holds at most maxBytes (as stored).
+  put() does not evict: a driver should evict() from its main process when it opens and closes the cache.
+  Hits and misses are counted per kind, in the cache itself, so stats() covers all processes.
+
+  get() does not write. Each process keeps its hit/miss counts and the hit entries' lastUsed in memory,
+  and flush()es them in one transaction every _FLUSH_INTERVAL_SEC, and before stats() and evict().
+  libLF.parallel workers flushAll() after each task. A process that is killed loses its unflushed counts.
+  """
+
+  DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'LinguaFranca', 'results.sqlite')
+  DEFAULT_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+  _BUSY_TIMEOUT_SEC = 60
+  _FLUSH_INTERVAL_SEC = 1
+  _FLUSH_INTERVAL = 1000 # lookups
+
+  def __init__(self, path=DEFAULT_PATH, maxBytes=DEFAULT_MAX_BYTES):
+    self.path = path
+    self.maxBytes = maxBytes
+
+    # Opened lazily, once per process and thread
+    self._local = threading.local()
+    self._resetPending()
+
+  def __getstate__(self):
+    """Do not pickle the connections (e.g. when passing to a libLF.parallel worker), nor our unflushed lookups"""
+    state = dict(self.__dict__)
+    del state['_local']
+    for field in self._PENDING_FIELDS:
+      del state[field]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._local = threading.local()
+    self._resetPending()
+
+  def get(self, kind, pattern, language, toolVersion, params):
+    """Returns the cached value, or None"""
+    key = self._key(kind, pattern, language, toolVersion, params)
+    row = self._db().execute('SELECT value, compressed FROM results WHERE key = ?', (key,)).fetchone()
+    self._noteLookup(kind, key, row is not None)
+    if row is None:
+      return None
+    value, compressed = row
+    if compressed:
+      value = zlib.decompress(value).decode('utf-8')
+    return json.loads(value)
+
+  def put(self, kind, pattern, language, toolVersion, params, value, compress=False):
+    """Cache this value (JSON-able) under this key
+
+    compress: bool: store the value zlib-compressed
+    """
+    key = self._key(kind, pattern, language, toolVersion, params)
+    valueStr = json.dumps(value)
+    if compress:
+      valueStr = zlib.compress(valueStr.encode('utf-8'))
+    now = time.time()
+    db = self._db()
+    with db:
+      db.execute('INSERT OR REPLACE INTO results (key, kind, value, compressed, nBytes, created, lastUsed, nHits) VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+        (key, kind, valueStr, int(compress), len(valueStr), now, now))
+
+  def evict(self, maxBytes=None):
+    """Evict least-recently-used entries until the cache holds at most maxBytes of values
+
+    Returns the number of entries evicted.
+    """
+    if maxBytes is None:
+      maxBytes = self.maxBytes
+    # Recent hits must count as uses
+    self.flush()
+    db = self._db()
+    totalBytes = db.execute('SELECT COALESCE(SUM(nBytes), 0) FROM results').fetchone()[0]
+    if totalBytes <= maxBytes:
+      return 0
+
+    nEvicted = 0
+    with db:
+      for key, nBytes in db.execute('SELECT key, nBytes FROM results ORDER BY lastUsed ASC').fetchall():
+        if totalBytes <= maxBytes:
+          break
+        db.execute('DELETE FROM results WHERE key = ?', (key,))
+        totalBytes -= nBytes
+        nEvicted += 1
+    lf_utils.log('ResultCache: evicted {} entries from {}'.format(nEvicted, self.path))
+    return nEvicted
+
+  def stats(self):
+    """Returns { kind: { nEntries, nBytes, hits, misses } }"""
+    self.flush()
+    db = self._db()
+    kind2stats = {}
+    for kind, nEntries, nBytes in db.execute('SELECT kind, COUNT(*), SUM(nBytes) FROM results GROUP BY kind'):
+      kind2stats[kind] = { 'nEntries': nEntries, 'nBytes': nBytes, 'hits': 0, 'misses': 0 }
+    for kind, hits, misses in db.execute('SELECT kind, hits, misses FROM counters'):
+      if kind not in kind2stats:
+        kind2stats[kind] = { 'nEntries': 0, 'nBytes': 0 }
+      kind2stats[kind]['hits'] = hits
+      kind2stats[kind]['misses'] = misses
+    return kind2stats
+
+  def logStats(self, before=None):
+    """Log stats(). If before (an earlier stats()) is given, report hits and misses since then."""
+    for kind, s in sorted(self.stats().items()):
+      hits, misses = s['hits'], s['misses']
+      if before is not None and kind in before:
+        hits -= before[kind]['hits']
+        misses -= before[kind]['misses']
+      lf_utils.log('ResultCache {}: {} entries ({} bytes); {} hits, {} misses ({:.1f}% hit rate)' \
+        .format(kind, s['nEntries'], s['nBytes'], hits, misses, 100 * hits / max(hits + misses, 1)))
+
+  def flush(self):
+    """Write this process's unflushed hit/miss counts and lastUsed times to the cache"""
+    with self._pendingLock():
+      kind2counts, key2hits = self._pendingCounts, self._pendingHits
+      self._pendingCounts, self._pendingHits, self._nPending = {}, {}, 0
+      self._lastFlush = time.time()
+    if not kind2counts:
+      return
+    db = self._db()
+    with db:
+      db.executemany('UPDATE results SET lastUsed = MAX(lastUsed, ?), nHits = nHits + ? WHERE key = ?',
+        [(lastUsed, nHits, key) for key, (lastUsed, nHits) in key2hits.items()])
+      for kind, (hits, misses) in kind2counts.items():
+        db.execute('INSERT OR IGNORE INTO counters (kind, hits, misses) VALUES (?, 0, 0)', (kind,))
+        db.execute('UPDATE counters SET hits = hits + ?, misses = misses + ? WHERE kind = ?', (hits, misses, kind))
+
+  def clear(self):
+    with self._pendingLock():
+      self._pendingCounts, self._pendingHits, self._nPending = {}, {}, 0
+    db = self._db()
+    with db:
+      db.execute('DELETE FROM results')
+      db.execute('DELETE FROM counters')
+
+  # Internals
+
+  def _key(self, kind, pattern, language, toolVersion, params):
+    return lf_utils.hashString(json.dumps([kind, pattern, language, toolVersion, params], sort_keys=True))
+
+  _PENDING_FIELDS = ['_pendingPid', '_pendingLockObj', '_pendingCounts', '_pendingHits', '_nPending', '_lastFlush']
+
+  def _resetPending(self):
+    self._pendingPid = os.getpid()
+    self._pendingLockObj = threading.Lock()
+    self._pendingCounts = {} # kind -> [hits, misses]
+    self._pendingHits = {} # key -> [lastUsed, nHits]
+    self._nPending = 0
+    self._lastFlush = time.time()
+
+  def _pendingLock(self):
+    # A forked child must not flush its parent's lookups a second time
+    if self._pendingPid != os.getpid():
+      self._resetPending()
+    return self._pendingLockObj
+
+  def _noteLookup(self, kind, key, hit):
+    """Count a lookup in memory. Flush now and then."""
+    now = time.time()
+    with self._pendingLock():
+      counts = self._pendingCounts.setdefault(kind, [0, 0])
+      if hit:
+        counts[0] += 1
+        hits = self._pendingHits.setdefault(key, [now, 0])
+        hits[0] = now
+        hits[1] += 1
+      else:
+        counts[1] += 1
+      self._nPending += 1
+      with _unflushedCachesLock:
+        _unflushedCaches.add(self)
+      flushNow = self._FLUSH_INTERVAL <= self._nPending or self._FLUSH_INTERVAL_SEC <= now - self._lastFlush
+    if flushNow:
+      self.flush()
+
+  def _db(self):
+    # A connection may not be used from another thread, nor from a forked child
+    conn = getattr(self._local, 'conn', None)
+    if conn is None or self._local.pid != os.getpid():
+      dirName = os.path.dirname(self.path)
+      if dirName:
+        os.makedirs(dirName, exist_ok=True)
+      conn = sqlite3.connect(self.path, timeout=self._BUSY_TIMEOUT_SEC)
+      self._local.conn = conn
+      self._local.pid = os.getpid()
+      # WAL lets readers proceed while another process writes
+      conn.execute('PRAGMA journal_mode=WAL')
+      with conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS results ('
+          'key TEXT PRIMARY KEY, kind TEXT, value TEXT, nBytes INTEGER, created REAL, lastUsed REAL, nHits INTEGER, compressed INTEGER DEFAULT 0)')
+        # Caches from before compression was supported lack the column
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(results)')]
+        if 'compressed' not in columns:
+          try:
+            conn.execute('ALTER TABLE results ADD COLUMN compressed INTEGER DEFAULT 0')
+          except sqlite3.OperationalError as err:
+            # Another process beat us to it
+            if 'duplicate column' not in str(err):
+              raise
+        conn.execute('CREATE INDEX IF NOT EXISTS results_lastUsed ON results (lastUsed)')
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (kind TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)')
+    return conn
+
+# The caches in this process with lookups that may not be flushed
+_unflushedCaches = weakref.WeakSet()
+_unflushedCachesLock = threading.Lock()
+
+def flushAll():
+  """flush() every ResultCache in this process, e.g. before a worker moves on from a task"""
+  with _unflushedCachesLock:
+    caches = list(_unflushedCaches)
+    _unflushedCaches.clear()
+  for cache in caches:
+    cache.flush()
+
+_path2version = {}
+def fileVersion(*paths):
+  """A toolVersion for ResultCache: a digest of the contents of these files
+
+  Follows symlinks. Memoized per process by (path, mtime, size).
+  """
+  digests = []
+  for path in paths:
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    memoKey = (path, st.st_mtime, st.st_size)
+    if memoKey not in _path2version:
+      with open(path, 'rb') as inStream:
+        _path2version[memoKey] = hashlib.md5(inStream.read()).hexdigest()
+    digests.append(_path2version[memoKey])
+  return lf_utils.hashString(' '.join(digests))
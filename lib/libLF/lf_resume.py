@@ -0,0 +1,136 @@
+"""Lingua Franca: Resuming and sharding long-running analyses
+
+A ResumeJournal records which patterns already have results in an out-file,
+so that a killed run can pick up where it left off.
+Sharding splits a set of patterns across several invocations.
+"""
+
+import libLF.lf_utils as lf_utils
+
+import os
+
+#####
+# ResumeJournal
+#####
+
+class ResumeJournal:
+  """Write NDJSON results to outFile, journaling each completed pattern
+
+  The journal lives next to outFile, as outFile.journal.
+  Each journal line is: hashString(pattern) <space> size of outFile after writing its result
+
+  A result counts as done only once its journal line is written.
+  On resume, anything in outFile beyond the last journaled result
+  (e.g. a half-written line from a crash) is truncated away, and will be redone.
+
+  The constructor only reads. Use as a context manager to write:
+    journal = libLF.ResumeJournal(outFile, resume)
+    tasks = [t for t in tasks if not journal.isDone(t.regex.pattern)]
+    ...
+    with journal:
+      for result in results:
+        journal.write(result.pattern, result.toNDJSON())
+  """
+
+  def __init__(self, outFile, resume):
+    """outFile: str: path to NDJSON results
+       resume: bool: if True, keep the results already in outFile. Else start over.
+    """
+    self.outFile = outFile
+    self.journalFile = outFile + '.journal'
+    self.resume = resume
+
+    self.doneHashes = set()
+    self.outFileSize = 0
+    self.journalLines = []
+    if self.resume:
+      self._load()
+      lf_utils.log('ResumeJournal: resuming with {} completed patterns in {}'.format(len(self.doneHashes), self.outFile))
+
+    self.outStream = None
+    self.journalStream = None
+
+  def __enter__(self):
+    self.open()
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def open(self):
+    if self.resume:
+      # Trim anything the journal does not vouch for
+      with open(self.outFile, 'a') as outStream:
+        outStream.truncate(self.outFileSize)
+      with open(self.journalFile, 'w') as outStream:
+        outStream.writelines(self.journalLines)
+    else:
+      for f in [self.outFile, self.journalFile]:
+        open(f, 'w').close()
+    self.outStream = open(self.outFile, 'a')
+    self.journalStream = open(self.journalFile, 'a')
+
+  def close(self):
+    for stream in [self.outStream, self.journalStream]:
+      if stream is not None:
+        stream.close()
+    self.outStream = None
+    self.journalStream = None
+
+  def isDone(self, pattern):
+    return lf_utils.hashString(pattern) in self.doneHashes
+
+  def nDone(self):
+    return len(self.doneHashes)
+
+  def write(self, pattern, ndjson):
+    """Emit this result for pattern, then journal it"""
+    self.outStream.write(ndjson + '\n')
+    self.outStream.flush()
+    h = lf_utils.hashString(pattern)
+    self.journalStream.write('{} {}\n'.format(h, self.outStream.tell()))
+    self.journalStream.flush()
+    self.doneHashes.add(h)
+
+  def _load(self):
+    """Populate doneHashes, outFileSize, and journalLines from the journal"""
+    if not os.path.isfile(self.journalFile) or not os.path.isfile(self.outFile):
+      return
+
+    with open(self.journalFile, 'r') as inStream:
+      for line in inStream:
+        # The last line may be partial if we crashed mid-write. Drop it.
+        fields = line.split()
+        if not line.endswith('\n') or len(fields) != 2:
+          break
+        self.doneHashes.add(fields[0])
+        self.outFileSize = int(fields[1])
+        self.journalLines.append(line)
+
+#####
+# Sharding
+#####
+
+def parseShard(shardStr):
+  """Parse 'i/N' into (i, N), with 0 <= i < N
+
+  Suitable as an argparse type.
+  """
+  try:
+    i, n = [int(x) for x in shardStr.split('/')]
+  except ValueError:
+    raise ValueError('Shard must look like i/N, got {}'.format(shardStr))
+  if not (0 <= i and i < n):
+    raise ValueError('Shard i/N must have 0 <= i < N, got {}'.format(shardStr))
+  return (i, n)
+
+def isInShard(pattern, shard):
+  """True if pattern belongs to shard (i, N)
+
+  Stable across runs and machines: based on hashString(pattern).
+  shard=None means "no sharding".
+  """
+  if shard is None:
+    return True
+  i, n = shard
+  return int(lf_utils.hashString(pattern), 16) % n == i
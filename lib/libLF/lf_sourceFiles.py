@@ -0,0 +1,179 @@
+"""Lingua Franca: Source files
+
+Find a project's source files in the language(s) of the registry it came from,
+skipping vendored code: dependencies checked into the project (node_modules/, vendor/, ...)
+are someone else's regexes.
+
+Works on a directory, or streams the members of a tarball without unpacking it.
+"""
+
+import os
+import re
+import tarfile
+
+registryToExtensionLists = {
+  'crates.io': [r'\.rs', r'\.rlib'],
+  'cpan': [r'\.pl', r'\.pm'],
+  'npm': [r'\.js', r'\.ts'],
+  'pypi': [r'\.py'],
+  'maven': [r'\.java'],
+  'rubygems': [r'\.rb'],
+  'packagist': [r'\.php'],
+  'nuget': [r'\.cs'],
+  'godoc': [r'\.go']
+}
+
+extensionToLang = {
+  r'\.rs': 'rust',
+  r'\.rlib': 'rust',
+  r'\.pl': 'perl',
+  r'\.pm': 'perl',
+  r'\.js': 'javascript',
+  r'\.ts': 'typescript',
+  r'\.py': 'python',
+  r'\.java': 'java',
+  r'\.rb': 'ruby',
+  r'\.php': 'php',
+  r'\.cs': 'c#',
+  r'\.go': 'go'
+}
+
+# A file without one of these extensions may still be a script in an interpreted language,
+# e.g. an executable with no suffix. We recognize these by their '#!' line.
+# I think it unlikely that people would name source code
+# in a *compiled* language with a non-traditional suffix.
+registryToInterpreterREs = {
+  'cpan': [r'perl'],
+  'npm': [r'node(js)?'],
+  'pypi': [r'python[0-9.]*'],
+  'rubygems': [r'ruby'],
+  'packagist': [r'php'],
+  'nuget': [],
+  'godoc': [],
+  'crates.io': [],
+  'maven': []
+}
+
+interpreterREToLang = {
+  r'perl': 'perl',
+  r'node(js)?': 'javascript',
+  r'python[0-9.]*': 'python',
+  r'ruby': 'ruby',
+  r'php': 'php'
+}
+
+# Directories that hold other people's code, or copies of it
+VENDORED_DIR_NAMES = set([
+  'node_modules', 'bower_components', 'jspm_packages', # JavaScript
+  'vendor', 'vendors', 'third_party', 'third-party', 'thirdparty', '3rdparty', 'external', 'externals', # Generic
+  'site-packages', 'dist-packages', '.tox', 'venv', '.venv', '__pycache__', # Python
+  'Godeps', '_vendor', # Go
+  'local', 'blib', # Perl
+  '.bundle', # Ruby
+  '.git', '.hg', '.svn',
+])
+
+# Minified or bundled copies of code
+VENDORED_FILE_RE = re.compile(r'\.min\.js$|-min\.js$|\.bundle\.js$')
+
+# Read this much of a file to find its '#!' line
+SHEBANG_HEAD_BYTES = 256
+
+def isVendoredPath(relPath):
+  """True if relPath (relative to the project root) looks like vendored code"""
+  parts = relPath.replace(os.sep, '/').split('/')
+  if any(part in VENDORED_DIR_NAMES for part in parts[:-1]):
+    return True
+  return VENDORED_FILE_RE.search(parts[-1]) is not None
+
+def sourceFileLang(path, registry, head=None):
+  """The language of this file, if it is source code in one of registry's languages
+
+  path: str: only the basename matters
+  head: bytes: the start of the file, to check for a '#!' line if the extension is not telling.
+    None means do not check.
+
+  @returns str: e.g. 'javascript', or None
+  """
+  baseName = os.path.basename(path)
+  for ext in registryToExtensionLists[registry]:
+    if re.search(ext + '$', baseName):
+      return extensionToLang[ext]
+  if head is not None and '.' not in baseName:
+    return _shebangLang(head, registry)
+  return None
+
+def getUnvendoredSourceFiles(srcDir, registry):
+  """Find the unvendored source files under srcDir in registry's languages
+
+  Does not follow symlinks.
+
+  @returns lang2sourceFiles: { lang: [{ 'name': path }, ...] }, each list sorted by path
+  """
+  lang2sourceFiles = {}
+  for dirPath, dirNames, fileNames in os.walk(srcDir):
+    # Prune in place so that os.walk does not descend
+    dirNames[:] = sorted(d for d in dirNames if d not in VENDORED_DIR_NAMES)
+    for fileName in fileNames:
+      path = os.path.join(dirPath, fileName)
+      if not os.path.isfile(path) or os.path.islink(path) or isVendoredPath(os.path.relpath(path, srcDir)):
+        continue
+      lang = sourceFileLang(path, registry, _readHead(path) if '.' not in fileName else None)
+      if lang is not None:
+        lang2sourceFiles.setdefault(lang, []).append({ 'name': path })
+  for sourceFiles in lang2sourceFiles.values():
+    sourceFiles.sort(key=lambda sf: sf['name'])
+  return lang2sourceFiles
+
+def iterUnvendoredTarballSourceFiles(tarball, registry):
+  """Stream the unvendored source files in registry's languages out of tarball
+
+  Reads the tarball once, front to back, without writing anything to disk.
+  Skips members that are not regular files, and members with absolute paths or '..'.
+
+  @returns generator of (lang, memberName, contents): contents is bytes
+  @raises tarfile.TarError, OSError if tarball is unreadable
+  """
+  # 'r|*': a stream of blocks with any compression. No seeking back.
+  with tarfile.open(tarball, 'r|*') as tar:
+    for member in tar:
+      if not member.isfile() or not _isSafeMemberName(member.name) or isVendoredPath(member.name):
+        continue
+      lang = sourceFileLang(member.name, registry)
+      head = b''
+      if lang is None and '.' not in os.path.basename(member.name):
+        inStream = tar.extractfile(member)
+        head = inStream.read(SHEBANG_HEAD_BYTES)
+        lang = sourceFileLang(member.name, registry, head)
+        if lang is None:
+          continue
+        yield (lang, member.name, head + inStream.read())
+      elif lang is not None:
+        yield (lang, member.name, tar.extractfile(member).read())
+
+def _shebangLang(head, registry):
+  firstLine = head.split(b'\n', 1)[0].decode('utf-8', errors='replace')
+  if not firstLine.startswith('#!'):
+    return None
+  # '#!/usr/bin/perl -w' or '#!/usr/bin/env node'
+  words = firstLine[2:].split()
+  if words and os.path.basename(words[0]) == 'env':
+    words = [w for w in words[1:] if not w.startswith('-')]
+  if not words:
+    return None
+  interpreter = os.path.basename(words[0])
+  for interpreterRE in registryToInterpreterREs[registry]:
+    if re.fullmatch(interpreterRE, interpreter):
+      return interpreterREToLang[interpreterRE]
+  return None
+
+def _readHead(path):
+  try:
+    with open(path, 'rb') as inStream:
+      return inStream.read(SHEBANG_HEAD_BYTES)
+  except OSError:
+    return b''
+
+def _isSafeMemberName(name):
+  parts = name.split('/')
+  return not name.startswith('/') and '..' not in parts
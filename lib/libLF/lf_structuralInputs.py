@@ -0,0 +1,296 @@
+"""Lingua Franca: Structural input generation
+
+Generate inputs for a regex by walking Python's parse tree for it.
+There are no external processes, so this takes microseconds, not seconds.
+
+For each node we emit boundary strings:
+  - literals: the character, a different one, and nothing
+  - character classes: each member, the edges of each range, and the characters just outside them
+  - quantifiers: min-1, min, min+1, max-1, max, and max+1 repetitions
+  - alternations: each branch
+  - anchors: with and without a newline (and other text) on the anchored side
+Each boundary string is set in a canonical match of the rest of the pattern,
+so we get matching inputs and near misses that differ from a match in one place.
+"""
+
+import random
+
+try:
+  # Python 3.11+
+  import re._parser as _sre_parse
+  import re._constants as _sre_constants
+except ImportError:
+  import sre_parse as _sre_parse
+  import sre_constants as _sre_constants
+
+_C = _sre_constants
+
+# Not every version has these
+_ATOMIC_GROUP = getattr(_C, 'ATOMIC_GROUP', None)
+_POSSESSIVE_REPEAT = getattr(_C, 'POSSESSIVE_REPEAT', None)
+
+# Opcodes we generate inputs for completely.
+# Backreferences, lookaround, and conditionals are approximated.
+_COVERED_OPS = set([
+  _C.LITERAL, _C.NOT_LITERAL, _C.ANY, _C.IN, _C.BRANCH, _C.SUBPATTERN,
+  _C.MAX_REPEAT, _C.MIN_REPEAT, _C.AT,
+] + [op for op in [_ATOMIC_GROUP, _POSSESSIVE_REPEAT] if op is not None])
+_COVERED_IN_OPS = set([_C.LITERAL, _C.RANGE, _C.NEGATE, _C.CATEGORY])
+
+# Representatives of the \d, \s, \w categories, and of their complements
+_CATEGORY2CHARS = {
+  _C.CATEGORY_DIGIT: ['0', '9'],
+  _C.CATEGORY_NOT_DIGIT: ['a', ' '],
+  _C.CATEGORY_SPACE: [' ', '\t', '\n'],
+  _C.CATEGORY_NOT_SPACE: ['a', '0'],
+  _C.CATEGORY_WORD: ['a', 'Z', '0', '_'],
+  _C.CATEGORY_NOT_WORD: [' ', '-'],
+}
+_CATEGORY2TEST = {
+  _C.CATEGORY_DIGIT: lambda ch: ch.isdigit(),
+  _C.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdigit(),
+  _C.CATEGORY_SPACE: lambda ch: ch.isspace(),
+  _C.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+  _C.CATEGORY_WORD: lambda ch: ch.isalnum() or ch == '_',
+  _C.CATEGORY_NOT_WORD: lambda ch: not (ch.isalnum() or ch == '_'),
+}
+
+# Candidates for "some character that (does not) match"
+_FILLER_CHARS = ['a', 'b', 'z', 'A', '0', '5', '_', '-', ' ', '.', '!', '\n', '\t', 'é']
+
+# Repeat bodies at most this often, e.g. for a{1000}. Inputs stay small.
+MAX_REPETITIONS = 64
+# Drop any input longer than this
+MAX_INPUT_LEN = 1024
+
+def structuralInputs(pattern, seed=None, maxInputs=-1):
+  """Generate inputs for pattern from its Python parse tree
+
+  pattern: str: a regex in Python syntax
+  seed: int: seeds the choice of interior characters of classes, and sampling down to maxInputs. None means random.
+  maxInputs: int: return at most this many (a random subset). -1 means no limit.
+
+  @returns str[]: sorted
+  @raises ValueError if Python cannot parse pattern
+  """
+  rng = random.Random(seed)
+  walker = _Walker(_parse(pattern), rng)
+  inputs = set([walker.canonical] + walker.variants)
+  inputs = sorted(i for i in inputs if len(i) <= MAX_INPUT_LEN)
+  if 0 <= maxInputs and maxInputs < len(inputs):
+    inputs = sorted(rng.sample(inputs, maxInputs))
+  return inputs
+
+def isStructurallyCovered(pattern):
+  """True if structuralInputs() handles every feature of pattern completely
+
+  False for backreferences, lookaround, and conditionals, and if Python cannot parse pattern.
+  False for a repetition we would have to truncate, e.g. a{1000}: no input would match.
+  """
+  try:
+    return _isCovered(_parse(pattern))
+  except ValueError:
+    return False
+
+def characterClasses(pattern, maxClasses=32):
+  """The character classes of pattern, as predicates: ch -> bool
+
+  Each [...] (and \\d, \\w, ...) is a class, as is each literal character.
+  Duplicates are dropped. At most maxClasses, in the order they appear.
+
+  @raises ValueError if Python cannot parse pattern
+  """
+  keys = []
+  _collectClasses(_parse(pattern), keys)
+  keys = list(dict.fromkeys(keys))[:maxClasses]
+  return [_classPredicate(key) for key in keys]
+
+def _collectClasses(subpattern, keys):
+  for op, av in subpattern:
+    if op in [_C.LITERAL, _C.NOT_LITERAL]:
+      keys.append(((_C.LITERAL, av),))
+    elif op == _C.IN:
+      keys.append(tuple((inOp, tuple(inAv) if isinstance(inAv, list) else inAv) for inOp, inAv in av))
+    for child in _children(op, av):
+      _collectClasses(child, keys)
+
+def _classPredicate(items):
+  negated = any(op == _C.NEGATE for op, _ in items)
+  return lambda ch: _inClass(items, ch) != negated
+
+def _parse(pattern):
+  try:
+    return _sre_parse.parse(pattern, 0)
+  except Exception as err:
+    # re.error, or e.g. RecursionError for deep nesting
+    raise ValueError('Cannot parse /{}/: {}'.format(pattern, err))
+
+def _isCovered(subpattern):
+  for op, av in subpattern:
+    if op not in _COVERED_OPS:
+      return False
+    if op == _C.IN:
+      if any(inOp not in _COVERED_IN_OPS for inOp, _ in av):
+        return False
+    if op in [_C.MAX_REPEAT, _C.MIN_REPEAT, _POSSESSIVE_REPEAT] and MAX_REPETITIONS < av[0]:
+      return False
+    for child in _children(op, av):
+      if not _isCovered(child):
+        return False
+  return True
+
+def _children(op, av):
+  """The SubPatterns directly under this node"""
+  if op == _C.BRANCH:
+    return av[1]
+  if op == _C.SUBPATTERN:
+    return [av[-1]]
+  if op in [_C.MAX_REPEAT, _C.MIN_REPEAT, _POSSESSIVE_REPEAT]:
+    return [av[2]]
+  if op == _ATOMIC_GROUP:
+    return [av]
+  if op in [_C.ASSERT, _C.ASSERT_NOT]:
+    return [av[1]]
+  if op == _C.GROUPREF_EXISTS:
+    return [p for p in av[1:] if p is not None]
+  return []
+
+class _Walker:
+  """Computes a canonical match of a SubPattern, and its boundary variants"""
+
+  def __init__(self, subpattern, rng):
+    self.rng = rng
+    # Canonical match of each group so far, for backreferences
+    self.group2canonical = {}
+    self.canonical, self.variants = self._sequence(subpattern)
+
+  def _sequence(self, subpattern):
+    """Returns (canonical, variants) for a sequence of nodes
+
+    Each variant of a node appears once, in the canonical match of the other nodes.
+    """
+    nodes = [self._node(op, av) for op, av in subpattern]
+    canonicals = [c for c, _ in nodes]
+    variants = []
+    for i, (_, nodeVariants) in enumerate(nodes):
+      prefix = ''.join(canonicals[:i])
+      suffix = ''.join(canonicals[i+1:])
+      variants += [prefix + v + suffix for v in nodeVariants]
+    return ''.join(canonicals), variants
+
+  def _node(self, op, av):
+    if op == _C.LITERAL:
+      ch = chr(av)
+      return ch, [ch, self._other(ch), ch.swapcase(), '']
+    if op == _C.NOT_LITERAL:
+      ch = chr(av)
+      other = self._other(ch)
+      return other, [other, ch]
+    if op == _C.ANY:
+      return 'a', ['a', '\n', '']
+    if op == _C.IN:
+      return self._in(av)
+    if op == _C.BRANCH:
+      canonical = None
+      variants = []
+      for branch in av[1]:
+        c, vs = self._sequence(branch)
+        if canonical is None:
+          canonical = c
+        variants += [c] + vs
+      return canonical, variants
+    if op == _C.SUBPATTERN:
+      group = av[0]
+      canonical, variants = self._sequence(av[-1])
+      if group is not None:
+        self.group2canonical[group] = canonical
+      return canonical, variants
+    if op == _ATOMIC_GROUP:
+      return self._sequence(av)
+    if op in [_C.MAX_REPEAT, _C.MIN_REPEAT, _POSSESSIVE_REPEAT]:
+      return self._repeat(*av)
+    if op == _C.AT:
+      return self._at(av)
+    if op == _C.GROUPREF:
+      # Approximate: repeat the group's canonical match, or not
+      c = self.group2canonical.get(av, '')
+      return c, [c, '', c + c]
+    if op in [_C.ASSERT, _C.ASSERT_NOT]:
+      # Approximate: what the lookaround looks for, as a variant
+      c, _ = self._sequence(av[1])
+      return '', [c]
+    if op == _C.GROUPREF_EXISTS:
+      # Approximate: either arm
+      arms = [self._sequence(p) for p in av[1:] if p is not None]
+      return arms[0][0], [c for c, _ in arms] + [v for _, vs in arms for v in vs]
+    # Something newer than we know. It contributes nothing.
+    return '', []
+
+  def _repeat(self, lo, hi, body):
+    bodyCanonical, bodyVariants = self._sequence(body)
+    unbounded = (hi == _C.MAXREPEAT)
+    counts = set([lo - 1, lo, lo + 1])
+    if unbounded:
+      counts.add(lo + 2)
+    else:
+      counts.update([hi - 1, hi, hi + 1])
+    counts = sorted(n for n in counts if 0 <= n and n <= MAX_REPETITIONS)
+    variants = [bodyCanonical * n for n in counts]
+
+    # One repetition is a variant of the body
+    n = max(lo, 1)
+    if n <= MAX_REPETITIONS:
+      variants += [v + bodyCanonical * (n - 1) for v in bodyVariants]
+    canonical = bodyCanonical * min(n, MAX_REPETITIONS) if (unbounded or 1 <= hi) else ''
+    return canonical, variants
+
+  def _at(self, where):
+    if where in [_C.AT_BEGINNING, _C.AT_BEGINNING_STRING]:
+      # ^abc vs. \nabc (multiline) and xabc
+      return '', ['', '\n', 'x']
+    if where in [_C.AT_END, _C.AT_END_STRING]:
+      # abc$ vs. abc\n (Python and Perl allow it, others do not) and abcx
+      return '', ['', '\n', '\r\n', 'x']
+    if where in [_C.AT_BOUNDARY, _C.AT_NON_BOUNDARY]:
+      return '', ['', ' ', 'a']
+    return '', ['']
+
+  def _in(self, items):
+    """Members and edges of a character class"""
+    negated = any(op == _C.NEGATE for op, _ in items)
+    chars = []
+    for op, av in items:
+      if op == _C.LITERAL:
+        chars += [chr(av), self._other(chr(av))]
+      elif op == _C.RANGE:
+        lo, hi = av
+        chars += [chr(c) for c in [lo, hi, lo - 1, hi + 1] if 0 <= c and c <= 0x10FFFF]
+        # And one from the middle
+        chars.append(chr(self.rng.randint(lo, hi)))
+      elif op == _C.CATEGORY:
+        chars += _CATEGORY2CHARS.get(av, [])
+    chars += _FILLER_CHARS
+    chars = list(dict.fromkeys(chars)) # Unique, in order
+
+    members = [ch for ch in chars if _inClass(items, ch) != negated]
+    canonical = members[0] if members else chars[0]
+    return canonical, chars
+
+  def _other(self, ch):
+    """A character like ch but different"""
+    for candidate in ['a', 'b', '0']:
+      if candidate != ch.lower():
+        return candidate
+    return 'b'
+
+def _inClass(items, ch):
+  """True if ch matches one of the (non-NEGATE) items of a character class"""
+  c = ord(ch)
+  for op, av in items:
+    if op == _C.LITERAL and av == c:
+      return True
+    if op == _C.RANGE and av[0] <= c and c <= av[1]:
+      return True
+    if op == _C.CATEGORY and av in _CATEGORY2TEST and _CATEGORY2TEST[av](ch):
+      return True
+  return False
@@ -6,8 +6,12 @@ These are wrappers for the scripts in vuln-regex-detector/.
 import libLF
 import json
 
+import concurrent.futures
+import contextlib
+import math
 import os
 import tempfile
+import time
 
 class PumpPair:
   """Represents a prefix + pump pair as part of a libLF.EvilInput"""
@@ -35,9 +39,19 @@ class PumpPair:
       'pump': self.pump
     }
     return json.dumps(_dict)
+
+  def __eq__(self, other):
+    return isinstance(other, PumpPair) and (self.prefix, self.pump) == (other.prefix, other.pump)
+
+  def __hash__(self):
+    return hash((self.prefix, self.pump))
   
 class EvilInput:
-  """Represents regex input intended to trigger super-linear behavior"""
+  """Represents regex input intended to trigger super-linear behavior
+
+  EvilInputs are equal if they describe the same attack strings,
+  so the proposals of several detectors can be deduplicated with a set or dict.
+  """
   def __init__(self):
     self.couldParse = False
     self.pumpPairs = None
@@ -76,6 +90,17 @@ class EvilInput:
     
     return json.dumps(_dict)
 
+  def _canonical(self):
+    if not self.couldParse:
+      return (False,)
+    return (True, tuple(self.pumpPairs), self.suffix)
+
+  def __eq__(self, other):
+    return isinstance(other, EvilInput) and self._canonical() == other._canonical()
+
+  def __hash__(self):
+    return hash(self._canonical())
+
 class SLRegexDetectorOpinion:
   """Represents an SL regex detector's opinion
 
@@ -89,6 +114,9 @@ class SLRegexDetectorOpinion:
     patternVariant: str: pattern analyzed by this detector
     if isVuln:
       evilInputs: EvilInput[]
+
+  After SLRegexAnalysis.validateDetectorOpinionsInLang (not serialized):
+    lang_validations{} : { 'javascript' -> SLRegexValidation[] for evilInputs, ... }
   """
   def __init__(self):
     self.pattern = 'UNINITIALIZED'
@@ -96,6 +124,7 @@ class SLRegexDetectorOpinion:
     self.timedOut = False
     self.canAnalyze = False
     self.isVuln = False
+    self.lang_validations = {}
  
   def initFromRaw(self, pattern=None, rawOpinion=None):
     libLF.log('SLRDO: rawOpinion {}'.format(rawOpinion))
@@ -106,7 +135,9 @@ class SLRegexDetectorOpinion:
       self.timedOut = True
       self.canAnalyze = False
       self.isVuln = False
-    elif rawOpinion['opinion'] == 'INTERNAL-ERROR':
+    elif rawOpinion['opinion'] in ['INTERNAL-ERROR', 'CANCELLED']:
+      # CANCELLED: another detector already found an evil input (firstVulnWins)
+      self.patternVariant = rawOpinion.get('patternVariant', pattern)
       self.timedOut = False
       self.canAnalyze = False
       self.isVuln = False
@@ -217,6 +248,10 @@ class SLRegexAnalysis:
       and for exp-time behavior:
         lang_validPattern[lang] and lang_pump2timedOut[lang][SLRegexAnalysis.EXP_PUMPS]
 
+    With measureGrowth, lang_pump2timedOut holds the outcome predicted at EXP_PUMPS and powerPumps
+    from the measured growth curves, and the measurements are in:
+      lang_growth{} : { 'JavaScript' -> [ { evilInput, nPumps2sec, performance, degree }, ... ], ... }
+
   If you are using this to represent analysis:
     The SLRA analysis must have been completely performed.
     If so, use initFromNDJSON() and access the members described above.
@@ -249,7 +284,14 @@ class SLRegexAnalysis:
 
   INVALID_PATTERN = 'INVALID PATTERN'
 
-  def __init__(self, regex=None, slTimeout=MATCH_TIMEOUT_SEC, powerPumps=POW_PUMPS, vrdPath=DEFAULT_VULN_REGEX_DETECTOR_ROOT):
+  DETECTOR_TIME_LIMIT_SEC = 60
+
+  # measureGrowth: time matches at GROWTH_FIRST_PUMPS, x GROWTH_FACTOR, ..., up to powerPumps
+  GROWTH_FIRST_PUMPS = 1
+  GROWTH_FACTOR = 2
+
+  def __init__(self, regex=None, slTimeout=MATCH_TIMEOUT_SEC, powerPumps=POW_PUMPS, vrdPath=DEFAULT_VULN_REGEX_DETECTOR_ROOT, testerPool=None, cache=None,
+               detectorBudget=None, firstVulnWins=False, measureGrowth=False, detectorParallelism=None):
     """Two purposes: (1) performing analysis, (2) understanding results
     
     Args:
@@ -257,6 +299,19 @@ class SLRegexAnalysis:
       slTimeout: int: Threshold to declare a match super-linear (seconds)
       powerPumps: int: Number of pumps to use to identify power SL behavior (e.g. quadratic)
       VRD_PATH: str: Where to find .../vuln-regex-detector/ ?
+      testerPool: libLF.RegexTesterPool: if provided, validate evil inputs
+        using its warm tester daemons instead of a validate-vuln.pl process per query.
+      cache: libLF.ResultCache: if provided, consult it before querying detectors or validating.
+      detectorBudget: int: wall-clock seconds for all of the detectors on this regex.
+        Those still running (or not yet started) then count as timed out.
+        None means each detector gets DETECTOR_TIME_LIMIT_SEC.
+      firstVulnWins: bool: stop querying detectors once one reports a vulnerability
+        with a parseable evil input. Saves time at the cost of the other detectors' evil inputs.
+      measureGrowth: bool: instead of waiting for evil inputs with EXP_PUMPS and powerPumps to time out,
+        time them at a geometric series of pumps and classify the growth curve (see classifyGrowth).
+        Uses testerPool, or the regexTesterPool() of this process.
+      detectorParallelism: int: number of detectors to run at once.
+        None means one at a time. Each may use the query's memoryLimit.
     
     If you already did analysis and want to understand results,
       call this with defaults and use initFromNDJSON().
@@ -265,6 +320,12 @@ class SLRegexAnalysis:
     self.slTimeout = slTimeout
     self.powerPumps = powerPumps
     self.vrdPath = vrdPath
+    self.testerPool = testerPool
+    self.cache = cache
+    self.detectorBudget = detectorBudget
+    self.firstVulnWins = firstVulnWins
+    self.measureGrowth = measureGrowth
+    self.detectorParallelism = detectorParallelism
 
     self.queryDetectorsScript = os.path.join(vrdPath, 'src', 'detect', 'detect-vuln.pl')
     self.testInLanguageScript = os.path.join(vrdPath, 'src', 'validate', 'validate-vuln.pl')
@@ -273,6 +334,7 @@ class SLRegexAnalysis:
     self.lang_validPattern = {}
     # TODO Instead of tracking pumps we should just say "EXP" or "LIN" directly.
     self.lang_pump2timedOut = {}
+    self.lang_growth = {}
 
   def toNDJSON(self):
     _dict = {
@@ -283,6 +345,8 @@ class SLRegexAnalysis:
       'lang_validPattern': self.lang_validPattern,
       'lang_pump2timedOut': self.lang_pump2timedOut
     }
+    if self.lang_growth:
+      _dict['lang_growth'] = self.lang_growth
     return json.dumps(_dict)
   
   def initFromNDJSON(self, jsonStr):
@@ -312,10 +376,13 @@ class SLRegexAnalysis:
     self.lang_pump2timedOut = obj['lang_pump2timedOut']
     for lang in self.lang_pump2timedOut:
       pump2timedOut = self.lang_pump2timedOut[lang]
-      for k in pump2timedOut:
+      for k in list(pump2timedOut):
         if type(k) is str:
           pump2timedOut[int(k)] = pump2timedOut[k]
           del pump2timedOut[k]
+
+    # Only present with measureGrowth
+    self.lang_growth = obj.get('lang_growth', {})
   
   def queryDetectors(self):
     """Query detectors. Returns self"""
@@ -323,20 +390,43 @@ class SLRegexAnalysis:
     # Build query
     query = {
       'pattern': self.regex.pattern,
-      'timeLimit': 60, # Num seconds each detector gets to make a decision about this regex.
+      'timeLimit': self.DETECTOR_TIME_LIMIT_SEC, # Num seconds each detector gets to make a decision about this regex.
       'memoryLimit': 2048*1024, # KB each detector gets to use to make a decision. TODO Update VRD docs which say 'in MB'? But cf. detect-vuln.pl:59
+      'firstVulnWins': self.firstVulnWins,
     }
+    if self.detectorBudget is not None:
+      query['budget'] = self.detectorBudget
+    if self.detectorParallelism is not None:
+      query['parallelism'] = self.detectorParallelism
+
+    cacheParams = { 'timeLimit': query['timeLimit'], 'memoryLimit': query['memoryLimit'] }
+    # Keep the keys of the default query as they were, so earlier cache entries still hit
+    if self.detectorBudget is not None:
+      cacheParams['budget'] = self.detectorBudget
+    if self.firstVulnWins:
+      cacheParams['firstVulnWins'] = True
+    # Within a budget, more detectors finish if more run at once
+    if self.detectorBudget is not None and self.detectorParallelism is not None:
+      cacheParams['parallelism'] = self.detectorParallelism
+    out = None
+    if self.cache is not None:
+      toolVersion = libLF.fileVersion(self.queryDetectorsScript)
+      out = self.cache.get('detectors', self.regex.pattern, '', toolVersion, cacheParams)
+
+    if out is None:
+      # Query from tempfile
+      with tempfile.NamedTemporaryFile(prefix='SLRegexAnalysis-queryDetectors-', suffix='.json', delete=True) as ntf:
+        libLF.writeToFile(ntf.name, json.dumps(query))
+        rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err" \
+          .format(self.vrdPath, self.queryDetectorsScript, ntf.name))
+        out = out.strip()
+      libLF.log('Got rc {} out\n{}'.format(rc, out))
 
-    # Query from tempfile
-    with tempfile.NamedTemporaryFile(prefix='SLRegexAnalysis-queryDetectors-', suffix='.json', delete=True) as ntf:
-      libLF.writeToFile(ntf.name, json.dumps(query))
-      rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err" \
-        .format(self.vrdPath, self.queryDetectorsScript, ntf.name))
-      out = out.strip()
-    libLF.log('Got rc {} out\n{}'.format(rc, out))
-
-    # TODO Not sure if this can go wrong.
-    assert(rc == 0)
+      # TODO Not sure if this can go wrong.
+      assert(rc == 0)
+    
+      if self.cache is not None and self._qd_convOutput2DetectorOpinions(out) is not None:
+        self.cache.put('detectors', self.regex.pattern, '', toolVersion, cacheParams, out)
 
     self.detectorOpinions = self._qd_convOutput2DetectorOpinions(out)
     # TODO Not sure if this can go wrong.
@@ -373,20 +463,102 @@ class SLRegexAnalysis:
       libLF.log('Could not parse queryDetectorsOutput: <{}> --> {}'.format(err, queryDetectorsOutput))
       return None
 
-  def validateDetectorOpinionsInLang(self, lang):
-    """Test the DOs in this language. Returns self"""
+  def distinctEvilInputs(self):
+    """Returns [ (EvilInput, SLRegexDetectorOpinion[] that proposed it), ... ]
+
+    The parseable EvilInputs of the vulnerable DOs, each once, in the order first proposed.
+    Detectors often agree, and the pattern variants often yield the same attack strings.
+    """
+    ei2dos = {}
+    for do in self.detectorOpinions:
+      if do.isVuln:
+        for ei in do.evilInputs:
+          if ei.couldParse:
+            ei2dos.setdefault(ei, [])
+            if do not in ei2dos[ei]:
+              ei2dos[ei].append(do)
+    return list(ei2dos.items())
+
+  def validateDetectorOpinionsInLangs(self, langs, validatorSemaphore=None):
+    """Test the DOs in each of these languages, concurrently. Returns self
+
+    Validation mostly waits on matches to time out, so each language gets a thread.
+    Except a language tested in-process (libLF.setInProcessTesterLangs): its matches run in a child
+    forked from this process, which may fork only while it has no other threads (libLF.ForkedDaemon).
+    So we test those languages first, on this thread, and then the rest concurrently.
+    Equivalent to calling validateDetectorOpinionsInLang on each of langs.
+
+    Args:
+      langs: str[]: languages to test in
+      validatorSemaphore: libLF.parallel.NodeSemaphore: if provided, hold a slot
+        while running each validator, to cap the validators running on this node at once.
+
+    Raises:
+      the first exception raised for any language, once they have all finished.
+    """
+    langs = [lang.lower() for lang in langs]
+    for lang in langs:
+      if lang not in self.SUPPORTED_LANGS:
+        raise ValueError('Unsupported language {}'.format(lang))
+
+    testerPool = self.testerPool if self.testerPool is not None else libLF.regexTesterPool()
+    inProcessLangs = [lang for lang in langs if testerPool.isInProcess(lang)]
+    futures = []
+    for lang in inProcessLangs:
+      future = concurrent.futures.Future()
+      try:
+        future.set_result(self.validateDetectorOpinionsInLang(lang, validatorSemaphore))
+      except KeyboardInterrupt:
+        raise
+      except BaseException as err:
+        future.set_exception(err)
+      futures.append(future)
+
+    threadLangs = [lang for lang in langs if lang not in inProcessLangs]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(threadLangs), 1)) as executor:
+      futures += [executor.submit(self.validateDetectorOpinionsInLang, lang, validatorSemaphore) for lang in threadLangs]
+      concurrent.futures.wait(futures)
+
+    # Languages finish in any order. Keep the output in the order we were asked.
+    for attr in ['lang_validPattern', 'lang_pump2timedOut', 'lang_growth']:
+      lang2val = getattr(self, attr)
+      setattr(self, attr, { lang: lang2val[lang]
+        for lang in sorted(lang2val, key=lambda l: langs.index(l) if l in langs else -1) })
+
+    for future in futures:
+      future.result()
+    return self
+
+  def validateDetectorOpinionsInLang(self, lang, validatorSemaphore=None):
+    """Test the DOs in this language. Returns self
+
+    validatorSemaphore: see validateDetectorOpinionsInLangs
+    """
     lang = lang.lower()
     if lang not in self.SUPPORTED_LANGS:
       raise ValueError('Unsupported language {}'.format(lang))
     libLF.log('Validating detector opinions for <{}> in {}'.format(self.regex.pattern, lang))
 
+    # Validate each distinct EvilInput once, however many DOs proposed it
+    ei2slrvs = {}
+    for ei, dos in self.distinctEvilInputs():
+      libLF.log('Validating evil input {} in {} (proposed by {})'.format(ei.toNDJSON(), lang, [do.detectorName for do in dos]))
+      with validatorSemaphore if validatorSemaphore is not None else contextlib.nullcontext():
+        if self.measureGrowth:
+          ei2slrvs[ei] = self._measureEvilInputGrowthInLang(ei, lang)
+        else:
+          ei2slrvs[ei] = self._testEvilInputInLang(ei, lang)
+
+    # Fan the results back out to every DO that proposed them
     self.lang_pump2timedOut[lang] = {}
     for do in self.detectorOpinions:
       if do.isVuln:
+        do.lang_validations[lang] = []
         for ei in do.evilInputs:
           if ei.couldParse:
-            # Try this EvilInput from this SLRegexDetectorOpinion
-            slrvs = self._testEvilInputInLang(ei, lang)
+            # The results for this EvilInput from this SLRegexDetectorOpinion
+            slrvs = ei2slrvs[ei]
+            do.lang_validations[lang] += slrvs
             for slrv in slrvs:
               # Is this a valid pattern?
               if slrv.validPattern:
@@ -409,7 +581,15 @@ class SLRegexAnalysis:
     return self
   
   def _testEvilInputInLang(self, evilInput, lang):
-    """Returns an SLRegexValidation[] with EXP and POW pumps"""
+    """Returns an SLRegexValidation[] with EXP and POW pumps
+
+    Uses testerPool, or regexTesterPool() if it tests lang in-process (libLF.setInProcessTesterLangs),
+    else validate-vuln.pl.
+    """
+    testerPool = self.testerPool
+    if testerPool is None and libLF.regexTesterPool().isInProcess(lang):
+      testerPool = libLF.regexTesterPool()
+
     # Build query
     query = {
       'language': lang.lower(),
@@ -419,20 +599,158 @@ class SLRegexAnalysis:
       'timeLimit': self.slTimeout,
     }
 
+    if self.cache is not None:
+      if testerPool is not None:
+        toolVersion = libLF.testerVersion(lang)
+      else:
+        toolVersion = libLF.fileVersion(self.testInLanguageScript)
+
     slRegexVals = []
     for nPumps in [self.EXP_PUMPS, self.powerPumps]:
       query['nPumps'] = nPumps
-      libLF.log('query: {}'.format(json.dumps(query)))
-      with tempfile.NamedTemporaryFile(prefix='SLRegexAnalysis-validateOpinion-', suffix='.json', delete=True) as ntf:
-        libLF.writeToFile(ntf.name, json.dumps(query))
-        rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err" \
-          .format(self.vrdPath, self.testInLanguageScript, ntf.name))
-        out = out.strip()
-      libLF.log('Got rc {} out\n{}'.format(rc, out))
-      slRegexVals.append(SLRegexValidation(self.regex.pattern, evilInput, json.loads(out)))
+      cacheParams = {
+        'evilInput': query['evilInput'],
+        'nPumps': nPumps,
+        'timeLimit': query['timeLimit'],
+        'viaTesterPool': testerPool is not None
+      }
+      rawValidationResult = None
+      if self.cache is not None:
+        rawValidationResult = self.cache.get('validate', self.regex.pattern, query['language'], toolVersion, cacheParams)
+
+      if rawValidationResult is None:
+        if testerPool is not None:
+          rawValidationResult = self._testEvilInputWithTesterPool(testerPool, query, evilInput)
+        else:
+          libLF.log('query: {}'.format(json.dumps(query)))
+          with tempfile.NamedTemporaryFile(prefix='SLRegexAnalysis-validateOpinion-', suffix='.json', delete=True) as ntf:
+            libLF.writeToFile(ntf.name, json.dumps(query))
+            rc, out = libLF.runcmd("VULN_REGEX_DETECTOR_ROOT={} '{}' '{}' 2>>/tmp/err" \
+              .format(self.vrdPath, self.testInLanguageScript, ntf.name))
+            out = out.strip()
+          libLF.log('Got rc {} out\n{}'.format(rc, out))
+          rawValidationResult = json.loads(out)
+
+        if self.cache is not None:
+          self.cache.put('validate', self.regex.pattern, query['language'], toolVersion, cacheParams, rawValidationResult)
+
+      slRegexVals.append(SLRegexValidation(self.regex.pattern, evilInput, rawValidationResult))
 
     return slRegexVals
 
+  def _measureEvilInputGrowthInLang(self, evilInput, lang):
+    """Returns an SLRegexValidation[] with EXP and POW pumps, predicted from a growth curve
+
+    Times the match of the attack string (built from all of the pumpPairs)
+    at a geometric series of pumps, stopping once classifyGrowth is confident,
+    a match times out, or we reach powerPumps.
+    The measurements are appended to lang_growth[lang].
+    """
+    lang = lang.lower()
+    evilInputDict = json.loads(evilInput.toNDJSON())
+    cacheParams = {
+      'evilInput': evilInputDict,
+      'timeLimit': self.slTimeout,
+      'maxPumps': self.powerPumps,
+    }
+    growth = None
+    if self.cache is not None:
+      toolVersion = libLF.testerVersion(lang)
+      growth = self.cache.get('growth', self.regex.pattern, lang, toolVersion, cacheParams)
+
+    if growth is None:
+      growth = self._measureGrowth(evilInput, lang)
+      growth['evilInput'] = evilInputDict
+      if self.cache is not None:
+        self.cache.put('growth', self.regex.pattern, lang, toolVersion, cacheParams, growth)
+    libLF.log('Growth of /{}/ in {}: {}'.format(self.regex.pattern, lang, growth))
+
+    if growth['validPattern']:
+      self.lang_growth.setdefault(lang, []).append(growth)
+
+    # Express the classification as the outcome of the EXP and POW queries
+    pump2timedOut = {
+      self.EXP_PUMPS: growth['performance'] == self.PREDICTED_PERFORMANCE['EXP'],
+      self.powerPumps: growth['performance'] != self.PREDICTED_PERFORMANCE['LIN'],
+    }
+    slRegexVals = []
+    for nPumps, timedOut in pump2timedOut.items():
+      rawValidationResult = {
+        'language': lang,
+        'validPattern': growth['validPattern'],
+        'nPumps': nPumps,
+        'timeLimit': self.slTimeout,
+        'timedOut': 1 if timedOut else 0,
+      }
+      slRegexVals.append(SLRegexValidation(self.regex.pattern, evilInput, rawValidationResult))
+    return slRegexVals
+
+  def _measureGrowth(self, evilInput, lang):
+    """Returns { validPattern, nPumps2sec: [[nPumps, sec], ...], performance, degree }
+
+    sec is None if the match timed out.
+    """
+    testerPool = self.testerPool if self.testerPool is not None else libLF.regexTesterPool()
+    growth = { 'validPattern': True, 'nPumps2sec': [], 'performance': None, 'degree': None }
+
+    # Check the pattern, and warm up the tester so that its startup is not timed
+    out = testerPool.query(lang, self.regex.pattern, [evilInput.suffix], timeout=self.slTimeout)
+    if not out['validPattern']:
+      growth['validPattern'] = False
+      return growth
+
+    nPumps = self.GROWTH_FIRST_PUMPS
+    while nPumps <= self.powerPumps:
+      attackString = ''.join([pp.prefix + pp.pump * nPumps for pp in evilInput.pumpPairs]) + evilInput.suffix
+      try:
+        # Cheap matches are noisy. Take the best of a few.
+        bestSec = None
+        for _ in range(GROWTH_REPETITIONS):
+          start = time.time()
+          out = testerPool.query(lang, self.regex.pattern, [attackString], timeout=self.slTimeout)
+          sec = time.time() - start
+          bestSec = sec if bestSec is None else min(bestSec, sec)
+          if GROWTH_MIN_MEASURABLE_SEC <= bestSec:
+            break
+        growth['nPumps2sec'].append([nPumps, bestSec])
+      except TimeoutError:
+        growth['nPumps2sec'].append([nPumps, None])
+
+      performance, degree = classifyGrowth(growth['nPumps2sec'], self.EXP_PUMPS)
+      growth['performance'], growth['degree'] = performance, degree
+      if performance is not None:
+        return growth
+      nPumps *= self.GROWTH_FACTOR
+
+    # Ran out of pumps without a confident fit. Go with the best guess.
+    performance, degree = classifyGrowth(growth['nPumps2sec'], self.EXP_PUMPS, final=True)
+    growth['performance'], growth['degree'] = performance, degree
+    return growth
+
+  def _testEvilInputWithTesterPool(self, testerPool, query, evilInput):
+    """Returns a raw validation result, as validate-vuln.pl would for this query
+
+    Like validate-vuln.pl, try the attack string built from the first 1, 2, ... pumpPairs,
+    and report the outcome of the last attempt.
+    """
+    result = dict(query)
+    result['timedOut'] = 0
+    for nPumpPairsToTry in range(1, len(evilInput.pumpPairs) + 1):
+      attackString = ''
+      for pumpPair in evilInput.pumpPairs[0:nPumpPairsToTry]:
+        attackString += pumpPair.prefix + pumpPair.pump * query['nPumps']
+      attackString += evilInput.suffix
+
+      try:
+        out = testerPool.query(query['language'], query['pattern'], [attackString], timeout=self.slTimeout)
+        result['timedOut'] = 0
+        result['validPattern'] = out['validPattern']
+      except TimeoutError:
+        # If it timed out, it was a valid regex pattern.
+        result['timedOut'] = 1
+        result['validPattern'] = 1
+    return result
+
   def predictedPerformanceInLang(self, lang):
     """PREDICTED_PERFORMANCE in this lang
 
@@ -518,3 +836,58 @@ class SLRegexAnalysis:
     #          self.predictedPerformanceInLang(destLang),
     #          score))
     return score
+
+#####
+# Growth curves
+#####
+
+GROWTH_MIN_MEASURABLE_SEC = 0.01 # Below this, match times are dominated by query overhead
+GROWTH_REPETITIONS = 3
+GROWTH_DEGREE_TOLERANCE = 0.4 # Consecutive local degrees this close are "stable"
+GROWTH_LIN_MAX_DEGREE = 1.5
+GROWTH_EXP_MIN_DEGREE = 4
+
+def classifyGrowth(nPumps2sec, expPumps=SLRegexAnalysis.EXP_PUMPS, final=False):
+  """Classify a growth curve as LIN, POW, or EXP
+
+  Args:
+    nPumps2sec: [[nPumps, sec], ...]: increasing nPumps. sec is None if the match timed out.
+    expPumps: int: a timeout at or below this many pumps means EXP, above it POW
+    final: bool: if True there are no more measurements coming, so give a best guess
+
+  Returns:
+    (performance, degree): performance is a SLRegexAnalysis.PREDICTED_PERFORMANCE value,
+      or None if not yet confident.
+      degree is the estimated polynomial degree (None if unknown).
+
+  The local degree between consecutive measurable points is log(t2/t1) / log(n2/n1).
+  Polynomial growth has a stable local degree (~1 for LIN);
+  exponential growth has a local degree that keeps climbing.
+  """
+  perf = SLRegexAnalysis.PREDICTED_PERFORMANCE
+
+  points = [(n, sec) for n, sec in nPumps2sec if sec is not None and GROWTH_MIN_MEASURABLE_SEC <= sec]
+  degrees = []
+  for (n1, t1), (n2, t2) in zip(points, points[1:]):
+    degrees.append(math.log(t2 / t1) / math.log(n2 / n1))
+  degree = degrees[-1] if degrees else None
+
+  # A timeout settles it
+  if nPumps2sec and nPumps2sec[-1][1] is None:
+    if nPumps2sec[-1][0] <= expPumps:
+      return (perf['EXP'], degree)
+    return (perf['POW'], degree)
+
+  if 2 <= len(degrees):
+    d1, d2 = degrees[-2], degrees[-1]
+    if GROWTH_EXP_MIN_DEGREE <= d2 and d1 + GROWTH_DEGREE_TOLERANCE < d2:
+      return (perf['EXP'], degree)
+    if abs(d2 - d1) <= GROWTH_DEGREE_TOLERANCE:
+      return (perf['LIN'] if d2 < GROWTH_LIN_MAX_DEGREE else perf['POW'], degree)
+
+  if final:
+    # Never slow enough to measure, or never stable: call it by the last local degree
+    if degree is None or degree < GROWTH_LIN_MAX_DEGREE:
+      return (perf['LIN'], degree)
+    return (perf['POW'], degree)
+  return (None, degree)
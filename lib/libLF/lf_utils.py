@@ -6,6 +6,7 @@ import sys
 import platform
 import os
 import hashlib
+import signal
 import subprocess
 import shutil
 
@@ -33,19 +34,37 @@ def hashString(string):
 # Shelling out
 #####
 
-def runcmd(cmd):
+def runcmd(cmd, timeout=None):
   """Run this command
 
   Args:
     cmd (str): Command to run
+    timeout (float): seconds to wait. None means forever.
   
   Returns:
     rc (int)
     stdout (str)
+
+  Raises:
+    TimeoutError: cmd did not finish in time. It is killed, along with its children.
   """
   log('CMD: {}'.format(cmd))
-  completedProcess = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, close_fds=True)
-  return completedProcess.returncode, completedProcess.stdout.decode('utf-8')
+  if timeout is None:
+    completedProcess = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, close_fds=True)
+    return completedProcess.returncode, completedProcess.stdout.decode('utf-8')
+
+  # Own session, so that we can kill whatever the shell started
+  proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, close_fds=True, start_new_session=True)
+  try:
+    out, _ = proc.communicate(timeout=max(timeout, 0))
+  except subprocess.TimeoutExpired:
+    try:
+      os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+      pass
+    proc.communicate()
+    raise TimeoutError('Command did not finish within {} seconds: {}'.format(timeout, cmd))
+  return proc.returncode, out.decode('utf-8')
 
 def chkcmd(cmd):
   """Run this command and confirm rc is 0.
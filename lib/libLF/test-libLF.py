@@ -6,8 +6,14 @@ import sys
 sys.path.append('{}/lib'.format(os.environ['ECOSYSTEM_REGEXP_PROJECT_ROOT']))
 import libLF
 
+import io
 import json
 import re
+import socketserver
+import sqlite3
+import tarfile
+import tempfile
+import threading
 
 import time
 
@@ -39,6 +45,14 @@ class UtilTest(unittest.TestCase):
     rc, out = libLF.runcmd(destroyCmd)
     self.assertEqual(rc, 0)
 
+  def test_runcmdTimeout(self):
+    rc, out = libLF.runcmd('echo hi', timeout=30)
+    self.assertEqual((rc, out), (0, 'hi\n'))
+    start = time.time()
+    with self.assertRaises(TimeoutError):
+      libLF.runcmd('sleep 30; echo no', timeout=0.5)
+    self.assertLess(time.time() - start, 10)
+
   def test_pathSplitAll(self):
     expPathAll = [os.sep, 'tmp', 'foo', 'bar', 'baz']
     absPath = os.path.join(expPathAll)
@@ -542,6 +556,798 @@ class ParallelTest(unittest.TestCase):
     minSecElapsed = int(len(self.tasks)/nPerSec) - 1
     self.assertGreaterEqual(elapsedSec, minSecElapsed)
 
+  def test_parallelImap_ordered(self):
+    res = libLF.parallel.imap(self.tasks, libLF.parallel.CPUCount.CPU_BOUND, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, False)
+    self.assertFalse(type(res) is list)
+    self.assertEqual(self.exp, list(res))
+
+  def test_parallelImap_unordered(self):
+    res = libLF.parallel.imap_unordered(self.tasks, libLF.parallel.CPUCount.CPU_BOUND, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, False)
+    self.assertEqual(self.exp, sorted(res))
+
+  def test_parallelImap_generatorTasks(self):
+    tasks = (Task(i) for i in self.exp)
+    res = libLF.parallel.imap(tasks, libLF.parallel.CPUCount.CPU_BOUND, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, False)
+    self.assertEqual(self.exp, list(res))
+
+  def test_parallelImap_stopEarly(self):
+    res = libLF.parallel.imap(self.tasks, libLF.parallel.CPUCount.CPU_BOUND, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, False)
+    self.assertEqual(self.exp[0], next(res))
+    res.close()
+
+class PipeTask(libLF.parallel.PipelineTask):
+  def __init__(self, x):
+    self.x = x
+    self.prepared = None
+
+  def prepare(self):
+    if self.x % 5 == 0:
+      raise SyntaxError(self.x)
+    self.prepared = 2 * self.x
+
+  def run(self):
+    return self.prepared
+
+class PipelineTest(unittest.TestCase):
+  def test_imapPipeline(self):
+    xs = list(range(1, 30))
+    res = list(libLF.parallel.imap_pipeline([PipeTask(x) for x in xs], 2, 3, 2))
+    self.assertEqual(sorted(r for r in res if type(r) is int), [2 * x for x in xs if x % 5 != 0])
+    self.assertEqual(sorted(str(r) for r in res if type(r) is SyntaxError), sorted(str(x) for x in xs if x % 5 == 0))
+
+  def test_imapPipeline_bounded(self):
+    nAdmitted = [0]
+    def tasks():
+      for x in range(1, 30):
+        nAdmitted[0] += 1
+        yield PipeTask(x)
+
+    nPrepare, nRun, queueSize = 1, 1, 2
+    nResults = 0
+    for _ in libLF.parallel.imap_pipeline(tasks(), nPrepare, nRun, queueSize):
+      nResults += 1
+      # The tasks admitted are those done, plus at most one full pipeline (and one blocked waiting to enter)
+      self.assertLessEqual(nAdmitted[0], nResults + nPrepare + queueSize + nRun + 1)
+    self.assertEqual(nResults, 29)
+
+  def test_imapPipeline_stopEarly(self):
+    res = libLF.parallel.imap_pipeline([PipeTask(x) for x in range(1, 200)], 1, 1, 1)
+    self.assertIsNotNone(next(res))
+    # Must not hang with the task handler blocked on a slot
+    res.close()
+
+class NodeSemaphoreTest(unittest.TestCase):
+  def test_nodeSemaphore(self):
+    import threading
+    sem = libLF.parallel.NodeSemaphore('test-{}'.format(os.getpid()), 2)
+    tokens = [sem.acquire(), sem.acquire()]
+
+    # A third holder must wait for a slot
+    acquired = threading.Event()
+    def third():
+      with sem:
+        acquired.set()
+    t = threading.Thread(target=third)
+    t.start()
+    self.assertFalse(acquired.wait(0.3))
+    sem.release(tokens.pop())
+    self.assertTrue(acquired.wait(5))
+    t.join()
+    sem.release(tokens.pop())
+
+  def test_nodeSemaphore_acquireTimeout(self):
+    sem = libLF.parallel.NodeSemaphore('test-timeout-{}'.format(os.getpid()), 1)
+    token = sem.acquire(timeout=0)
+    self.assertIsNotNone(token)
+    startTime = time.time()
+    self.assertIsNone(sem.acquire(timeout=0.2))
+    self.assertGreaterEqual(time.time() - startTime, 0.2)
+    sem.release(token)
+    sem.release(sem.acquire(timeout=0.2))
+
+  def test_nodeSemaphore_badSlots(self):
+    with self.assertRaises(ValueError):
+      libLF.parallel.NodeSemaphore('test', 0)
+
+#####
+# Daemons and regex testers
+#####
+
+class DaemonTest(unittest.TestCase):
+  def test_query(self):
+    daemon = libLF.Daemon(['cat'])
+    self.assertEqual(daemon.query('abc', 5), 'abc')
+    self.assertEqual(daemon.query('def', 5), 'def')
+    daemon.stop()
+
+  def test_timeoutRestarts(self):
+    daemon = libLF.Daemon(['sh', '-c', 'read line; sleep 60'])
+    with self.assertRaises(TimeoutError):
+      daemon.query('abc', 0.5)
+    self.assertFalse(daemon.isAlive())
+    daemon.stop()
+
+  def test_sameSession(self):
+    daemon = libLF.Daemon(['cat'], newSession=False)
+    self.assertEqual(daemon.query('abc', 5), 'abc')
+    self.assertEqual(os.getpgid(daemon.proc.pid), os.getpgid(0))
+    daemon.stop()
+    self.assertFalse(daemon.isAlive())
+
+  def test_deathRaises(self):
+    daemon = libLF.Daemon(['true'])
+    with self.assertRaises(OSError):
+      daemon.query('abc', 5)
+    daemon.stop()
+
+def _echoServe(inStream, outStream):
+  for line in inStream:
+    if line.strip() == b'hang':
+      time.sleep(60)
+    outStream.write(line)
+    outStream.flush()
+
+class ForkedDaemonTest(unittest.TestCase):
+  def test_query(self):
+    daemon = libLF.ForkedDaemon(_echoServe, 'echo')
+    self.assertEqual(daemon.query('abc', 5), 'abc')
+    pid = daemon.proc.pid
+    self.assertEqual(daemon.query('def', 5), 'def')
+    self.assertEqual(pid, daemon.proc.pid)
+    daemon.stop()
+    self.assertFalse(daemon.isAlive())
+
+  def test_timeoutRestarts(self):
+    daemon = libLF.ForkedDaemon(_echoServe, 'echo')
+    with self.assertRaises(TimeoutError):
+      daemon.query('hang', 0.5)
+    self.assertFalse(daemon.isAlive())
+    self.assertEqual(daemon.query('abc', 5), 'abc')
+    daemon.stop()
+
+  def test_noForkWithOtherThreads(self):
+    daemon = libLF.ForkedDaemon(_echoServe, 'echo')
+    done = threading.Event()
+    thread = threading.Thread(target=done.wait)
+    thread.start()
+    try:
+      with self.assertRaises(RuntimeError):
+        daemon.query('abc', 5)
+    finally:
+      done.set()
+      thread.join()
+    self.assertFalse(daemon.isAlive())
+
+class RegexTesterPoolTest(unittest.TestCase):
+  def setUp(self):
+    self.pool = libLF.RegexTesterPool()
+
+  def tearDown(self):
+    self.pool.stop()
+
+  def test_query(self):
+    res = self.pool.query('python', 'a(b)?', ['ab', 'a', 'c'], timeout=30)
+    self.assertTrue(res['validPattern'])
+    self.assertEqual([r['matched'] for r in res['results']], [1, 1, 0])
+    self.assertEqual(res['results'][0]['matchContents']['captureGroups'], ['b'])
+    self.assertEqual(res['results'][1]['matchContents']['captureGroups'], [''])
+
+  def test_queryInvalidPattern(self):
+    res = self.pool.query('python', '(', ['a'], timeout=30)
+    self.assertFalse(res['validPattern'])
+
+  def test_queryReusesDaemon(self):
+    self.pool.query('python', 'a', ['a'], timeout=30)
+    pid = self.pool.daemonPool.name2daemon['python'].proc.pid
+    self.pool.query('python', 'b', ['a'], timeout=30)
+    self.assertEqual(pid, self.pool.daemonPool.name2daemon['python'].proc.pid)
+
+  def test_unsupportedLang(self):
+    with self.assertRaises(ValueError):
+      self.pool.query('cobol', 'a', ['a'])
+
+  def test_perProcessPool(self):
+    self.assertIs(libLF.regexTesterPool(), libLF.regexTesterPool())
+
+  def test_inProcessIsOptIn(self):
+    self.assertFalse(self.pool.isInProcess('python'))
+    self.assertFalse(libLF.regexTesterPool().isInProcess('python'))
+    libLF.setInProcessTesterLangs(['python'])
+    try:
+      self.assertTrue(libLF.regexTesterPool().isInProcess('python'))
+    finally:
+      libLF.setInProcessTesterLangs([])
+    self.assertFalse(libLF.regexTesterPool().isInProcess('python'))
+
+  def test_pythonInProcessMatchesCLI(self):
+    inProcessPool = libLF.RegexTesterPool(inProcessLangs=['python'])
+    try:
+      self.assertTrue(inProcessPool.isInProcess('python'))
+      for pattern, inputs in [('a(b)?', ['ab', 'a', 'c']), ('(', ['a']), ('(?P<x>é+)', ['éé', 'x']), ('a|', [])]:
+        self.assertEqual(inProcessPool.query('python', pattern, inputs, timeout=30),
+                         self.pool.query('python', pattern, inputs, timeout=30))
+      self.assertTrue(inProcessPool.daemonPool.has('python-forked'))
+    finally:
+      inProcessPool.stop()
+
+  def test_pythonInProcessTimeout(self):
+    inProcessPool = libLF.RegexTesterPool(inProcessLangs=['python'])
+    try:
+      with self.assertRaises(TimeoutError):
+        inProcessPool.query('python', '(a+)+$', ['a' * 50 + '!'], timeout=0.5)
+      # Recovers
+      self.assertTrue(inProcessPool.query('python', 'a', ['a'], timeout=30)['validPattern'])
+    finally:
+      inProcessPool.stop()
+
+  def test_pythonInProcessFromThreadUsesCLI(self):
+    inProcessPool = libLF.RegexTesterPool(inProcessLangs=['python'])
+    res = []
+    thread = threading.Thread(target=lambda: res.append(inProcessPool.query('python', 'a', ['a'], timeout=30)))
+    try:
+      thread.start()
+      thread.join()
+      self.assertTrue(res[0]['validPattern'])
+      self.assertFalse(inProcessPool.daemonPool.has('python-forked'))
+      self.assertTrue(inProcessPool.daemonPool.has('python'))
+    finally:
+      inProcessPool.stop()
+
+  def test_timeoutPerInput(self):
+    inProcessPool = libLF.RegexTesterPool(inProcessLangs=['python'])
+    try:
+      for pool in [inProcessPool, self.pool]:
+        res = pool.query('python', '^(a|a)+$', ['aa', 'a' * 40 + '!', 'b'], timeout=30, timeoutPerInput=0.2)
+        # The slow input times out. The others still get results.
+        self.assertEqual([r['timedOut'] for r in res['results']], [0, 1, 0])
+        self.assertEqual([r['matched'] for r in res['results']], [1, 0, 0])
+    finally:
+      inProcessPool.stop()
+
+class QueryTesterBatchTest(unittest.TestCase):
+  def test_batch(self):
+    queries = [{'pattern': p, 'inputs': ['a']} for p in ['a', 'b', '(']]
+    res = libLF.queryTesterBatch('python', queries, timeout=30)
+    self.assertEqual([r['pattern'] for r in res], ['a', 'b', '('])
+    self.assertEqual([bool(r['validPattern']) for r in res], [True, True, False])
+
+  def test_batchTesterDies(self):
+    # A tester that answers until it sees the pattern 'die'
+    fakeTester = os.path.join(os.sep, 'tmp', 'testFakeTester-{}.sh'.format(os.getpid()))
+    libLF.writeToFile(fakeTester, '#!/bin/sh\nwhile read line; do case "$line" in *die*) exit 1;; esac; echo "$line"; done\n')
+    os.chmod(fakeTester, 0o755)
+    queries = [{'pattern': p, 'inputs': ['a']} for p in ['a', 'die', 'b']]
+    res = libLF.queryTesterBatch('fake', queries, timeout=30, lang2cli={'fake': fakeTester})
+    os.remove(fakeTester)
+    self.assertEqual([r['pattern'] for r in res], ['a'])
+
+  def test_regexesSupportedInLanguage(self):
+    regexes = [libLF.Regex().initFromRaw(p, {}, {}) for p in ['a', '(', '(?P<x>a)']]
+    res = libLF.regexesSupportedInLanguage(regexes, 'python')
+    self.assertEqual(res, [True, False, True])
+    self.assertEqual([r.supportedLangs for r in regexes], [['python'], [], ['python']])
+
+class _FakeGeneratorServer(socketserver.ThreadingTCPServer):
+  """Speaks the generator server protocol. Echoes argv on stdout."""
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self):
+    self.nConnections = 0
+    super().__init__(('127.0.0.1', 0), _FakeGeneratorHandler)
+
+class _FakeGeneratorHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    self.server.nConnections += 1
+    for line in self.rfile:
+      req = json.loads(line.decode('utf-8'))
+      if req['generator'] == 'wedged':
+        time.sleep(2)
+        continue
+      if req['generator'] != 'echo':
+        res = { 'generator': req['generator'], 'error': 'Unknown generator' }
+      else:
+        res = { 'generator': 'echo', 'exitCode': 0, 'timedOut': False, 'stdout': ' '.join(req['argv']), 'stderr': '' }
+      self.wfile.write(json.dumps(res).encode('utf-8') + b'\n')
+
+class GeneratorServerClientTest(unittest.TestCase):
+  def setUp(self):
+    self.server = _FakeGeneratorServer()
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    self.client = libLF.GeneratorServerClient(port=self.server.server_address[1])
+
+  def tearDown(self):
+    self.client.close()
+    self.server.shutdown()
+    self.server.server_close()
+
+  def test_run(self):
+    res = self.client.run('echo', ['a', 'b'], timeout=5)
+    self.assertEqual(res['stdout'], 'a b')
+    self.assertFalse(res['timedOut'])
+
+  def test_reusesConnections(self):
+    for i in range(5):
+      self.assertEqual(self.client.run('echo', [str(i)], timeout=5)['stdout'], str(i))
+    self.assertEqual(self.server.nConnections, 1)
+
+  def test_unknownGenerator(self):
+    with self.assertRaises(ValueError):
+      self.client.run('nope', [], timeout=5)
+
+  def test_runJarGenerator(self):
+    self.assertEqual(libLF.runJarGenerator('echo', '/no/such.jar', ['x'], 5, client=self.client), (0, 'x', '', False))
+
+  def test_runJarGenerator_serverTimeout(self):
+    # A request that times out in the server is not run again through the CLI
+    self.client.RESPONSE_SLACK_SEC = 0.1
+    startTime = time.time()
+    self.assertEqual(libLF.runJarGenerator('wedged', '/no/such.jar', [], 0.2, client=self.client), (None, '', '', True))
+    self.assertLess(time.time() - startTime, 1.5)
+
+  def test_notRunning(self):
+    port = self.server.server_address[1]
+    self.server.shutdown()
+    self.server.server_close()
+    self.assertFalse(libLF.GeneratorServerClient(port=port).isRunning())
+
+#####
+# Result cache
+#####
+
+class ResultCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.path = os.path.join(os.sep, 'tmp', 'testResultCache-{}.sqlite'.format(os.getpid()))
+    self.cache = libLF.ResultCache(self.path)
+
+  def tearDown(self):
+    for suffix in ['', '-wal', '-shm']:
+      if os.path.exists(self.path + suffix):
+        os.remove(self.path + suffix)
+
+  def test_getPut(self):
+    self.assertIsNone(self.cache.get('syntax', 'a+', 'python', 'v1', {}))
+    self.cache.put('syntax', 'a+', 'python', 'v1', {}, { 'validPattern': True })
+    self.assertEqual(self.cache.get('syntax', 'a+', 'python', 'v1', {}), { 'validPattern': True })
+
+  def test_keyIncludesEverything(self):
+    self.cache.put('syntax', 'a+', 'python', 'v1', { 'x': 1 }, True)
+    self.assertTrue(self.cache.get('syntax', 'a+', 'python', 'v1', { 'x': 1 }))
+    self.assertIsNone(self.cache.get('semantic', 'a+', 'python', 'v1', { 'x': 1 }))
+    self.assertIsNone(self.cache.get('syntax', 'a*', 'python', 'v1', { 'x': 1 }))
+    self.assertIsNone(self.cache.get('syntax', 'a+', 'perl', 'v1', { 'x': 1 }))
+    self.assertIsNone(self.cache.get('syntax', 'a+', 'python', 'v2', { 'x': 1 }))
+    self.assertIsNone(self.cache.get('syntax', 'a+', 'python', 'v1', { 'x': 2 }))
+
+  def test_stats(self):
+    self.cache.get('syntax', 'a', 'python', 'v1', {})
+    self.cache.put('syntax', 'a', 'python', 'v1', {}, True)
+    self.cache.get('syntax', 'a', 'python', 'v1', {})
+    self.cache.get('syntax', 'a', 'python', 'v1', {})
+    stats = self.cache.stats()['syntax']
+    self.assertEqual(stats['nEntries'], 1)
+    self.assertEqual(stats['hits'], 2)
+    self.assertEqual(stats['misses'], 1)
+
+  def test_evictLRU(self):
+    for p in ['a', 'b', 'c']:
+      self.cache.put('syntax', p, 'python', 'v1', {}, 'x' * 100)
+      time.sleep(0.01)
+    # Touch 'a' so that 'b' is the least recently used
+    self.cache.get('syntax', 'a', 'python', 'v1', {})
+    self.assertEqual(self.cache.evict(250), 1)
+    self.assertIsNone(self.cache.get('syntax', 'b', 'python', 'v1', {}))
+    self.assertIsNotNone(self.cache.get('syntax', 'a', 'python', 'v1', {}))
+    self.assertIsNotNone(self.cache.get('syntax', 'c', 'python', 'v1', {}))
+
+  def test_getDoesNotWrite(self):
+    self.cache.put('syntax', 'a', 'python', 'v1', {}, True)
+    self.cache.flush()
+    # With another process mid-write, a lookup that tried to write would fail
+    self.cache._BUSY_TIMEOUT_SEC = 0.1
+    self.cache._FLUSH_INTERVAL_SEC = 60
+    writer = sqlite3.connect(self.path)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+      self.assertTrue(self.cache.get('syntax', 'a', 'python', 'v1', {}))
+      self.assertIsNone(self.cache.get('syntax', 'b', 'python', 'v1', {}))
+    finally:
+      writer.rollback()
+      writer.close()
+    stats = self.cache.stats()['syntax']
+    self.assertEqual(stats['hits'], 1)
+    self.assertEqual(stats['misses'], 1)
+
+  def test_compressed(self):
+    inputs = { 'Rex-Rex': ['a' * i for i in range(100)] }
+    self.cache.put('inputs', 'a+', '', 'v1', {}, inputs, compress=True)
+    self.assertEqual(self.cache.get('inputs', 'a+', '', 'v1', {}), inputs)
+    self.assertLess(self.cache.stats()['inputs']['nBytes'], len(json.dumps(inputs)))
+
+  def test_addsCompressedColumn(self):
+    # A cache from before compression was supported
+    conn = sqlite3.connect(self.path)
+    with conn:
+      conn.execute('DROP TABLE IF EXISTS results')
+      conn.execute('CREATE TABLE results ('
+        'key TEXT PRIMARY KEY, kind TEXT, value TEXT, nBytes INTEGER, created REAL, lastUsed REAL, nHits INTEGER)')
+    conn.close()
+    cache = libLF.ResultCache(self.path)
+    cache.put('syntax', 'a', 'python', 'v1', {}, True)
+    cache.put('inputs', 'a', '', 'v1', {}, ['a'], compress=True)
+    self.assertTrue(cache.get('syntax', 'a', 'python', 'v1', {}))
+    self.assertEqual(cache.get('inputs', 'a', '', 'v1', {}), ['a'])
+
+  def test_parallelWorkers(self):
+    self.cache.put('syntax', 'a', 'python', 'v1', {}, True)
+    self.cache._FLUSH_INTERVAL_SEC = 60
+    tasks = [CacheTask(self.cache, i) for i in range(20)]
+    res = libLF.parallel.map(tasks, 4, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, False)
+    self.assertEqual(res, [True for _ in tasks])
+    self.assertEqual(self.cache.stats()['syntax']['nEntries'], 21)
+    # Each worker's lookups were flushed after its task, not left to a later lookup
+    self.assertEqual(self.cache.stats()['syntax']['hits'], 20)
+    self.assertEqual(self.cache.stats()['syntax']['misses'], 0)
+
+  def test_parallelWorkersUpdateLastUsed(self):
+    self.cache.put('syntax', 'a', 'python', 'v1', {}, 'x' * 100)
+    time.sleep(0.01)
+    self.cache.put('syntax', 'b', 'python', 'v1', {}, 'x' * 100)
+    # Lookups of 'a' in the workers make 'b' the least recently used
+    self.cache._FLUSH_INTERVAL_SEC = 60
+    tasks = [CacheTask(self.cache, i) for i in range(4)]
+    libLF.parallel.map(tasks, 2, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, libLF.parallel.RateLimitEnums.NO_RATE_LIMIT, False)
+    # 2 * 102 bytes, and 4 * 1 from the tasks
+    self.assertEqual(self.cache.evict(110), 1)
+    self.assertIsNotNone(self.cache.get('syntax', 'a', 'python', 'v1', {}))
+    self.assertIsNone(self.cache.get('syntax', 'b', 'python', 'v1', {}))
+
+  def test_regexesSupportedInLanguage(self):
+    regexes = [libLF.Regex().initFromRaw(p, {}, {}) for p in ['a', '(']]
+    self.assertEqual(libLF.regexesSupportedInLanguage(regexes, 'python', cache=self.cache), [True, False])
+    self.assertEqual(libLF.regexesSupportedInLanguage(regexes, 'python', cache=self.cache), [True, False])
+    stats = self.cache.stats()[libLF.Regex.SYNTAX_CACHE_KIND]
+    self.assertEqual(stats['hits'], 2)
+    self.assertEqual(stats['misses'], 2)
+
+class CacheTask(libLF.parallel.ParallelTask):
+  def __init__(self, cache, x):
+    self.cache = cache
+    self.x = x
+
+  def run(self):
+    self.cache.put('syntax', str(self.x), 'python', 'v1', {}, self.x)
+    return self.cache.get('syntax', 'a', 'python', 'v1', {})
+
+#####
+# Resume and shard
+#####
+
+class ResumeJournalTest(unittest.TestCase):
+  def setUp(self):
+    self.outFile = os.path.join(os.sep, 'tmp', 'testResumeJournal-{}.json'.format(os.getpid()))
+
+  def tearDown(self):
+    for f in [self.outFile, self.outFile + '.journal']:
+      if os.path.exists(f):
+        os.remove(f)
+
+  def _writeAll(self, patterns, resume):
+    journal = libLF.ResumeJournal(self.outFile, resume)
+    with journal:
+      for p in patterns:
+        journal.write(p, json.dumps({'pattern': p}))
+    return journal
+
+  def test_freshRun(self):
+    self._writeAll(['a', 'b'], False)
+    journal = libLF.ResumeJournal(self.outFile, True)
+    self.assertTrue(journal.isDone('a'))
+    self.assertTrue(journal.isDone('b'))
+    self.assertFalse(journal.isDone('c'))
+
+  def test_noResumeStartsOver(self):
+    self._writeAll(['a', 'b'], False)
+    self._writeAll(['c'], False)
+    journal = libLF.ResumeJournal(self.outFile, True)
+    self.assertFalse(journal.isDone('a'))
+    self.assertTrue(journal.isDone('c'))
+
+  def test_resumeAppends(self):
+    self._writeAll(['a'], False)
+    self._writeAll(['b'], True)
+    with open(self.outFile, 'r') as inStream:
+      patterns = [json.loads(l)['pattern'] for l in inStream]
+    self.assertEqual(patterns, ['a', 'b'])
+
+  def test_resumeTrimsUnjournaledOutput(self):
+    self._writeAll(['a'], False)
+    # Simulate a crash partway through emitting the next result
+    with open(self.outFile, 'a') as outStream:
+      outStream.write('{"pattern": "b", "trunc')
+    with open(self.outFile + '.journal', 'a') as outStream:
+      outStream.write('abc')
+
+    journal = self._writeAll(['c'], True)
+    self.assertFalse(journal.isDone('b'))
+    with open(self.outFile, 'r') as inStream:
+      patterns = [json.loads(l)['pattern'] for l in inStream]
+    self.assertEqual(patterns, ['a', 'c'])
+
+    journal = libLF.ResumeJournal(self.outFile, True)
+    self.assertEqual(journal.nDone(), 2)
+
+class ShardTest(unittest.TestCase):
+  def test_parseShard(self):
+    self.assertEqual(libLF.parseShard('0/4'), (0, 4))
+    self.assertEqual(libLF.parseShard('3/4'), (3, 4))
+    for bad in ['4/4', '-1/4', '1', 'a/b']:
+      with self.assertRaises(ValueError):
+        libLF.parseShard(bad)
+
+  def test_isInShard(self):
+    patterns = ['a{}'.format(i) for i in range(100)]
+    n = 3
+    shards = [ [p for p in patterns if libLF.isInShard(p, (i, n))] for i in range(n) ]
+    # Every pattern is in exactly one shard
+    self.assertEqual(sorted(sum(shards, [])), sorted(patterns))
+    self.assertTrue(all(libLF.isInShard(p, None) for p in patterns))
+
+#####
+# SLRegexDetectorOpinion
+#####
+
+class SLRegexDetectorOpinionTest(unittest.TestCase):
+  def test_initFromRaw(self):
+    vuln = { 'name': 'd1', 'hasOpinion': 1, 'patternVariant': '^(.*?)(a+)+$',
+             'opinion': { 'canAnalyze': 1, 'isSafe': 0,
+                          'evilInput': [ { 'pumpPairs': [ { 'prefix': 'x', 'pump': 'a' } ], 'suffix': '!' }, 'COULD-NOT-PARSE' ] } }
+    do = libLF.SLRegexDetectorOpinion().initFromRaw('(a+)+$', vuln)
+    self.assertTrue(do.isVuln)
+    self.assertEqual([ei.couldParse for ei in do.evilInputs], [True, False])
+
+    timedOut = { 'name': 'd2', 'hasOpinion': 0, 'opinion': 'TIMEOUT' }
+    do = libLF.SLRegexDetectorOpinion().initFromRaw('(a+)+$', timedOut)
+    self.assertTrue(do.timedOut)
+
+  def test_initFromRaw_cancelled(self):
+    # detect-vuln.pl with firstVulnWins
+    cancelled = { 'name': 'd3', 'hasOpinion': 0, 'opinion': 'CANCELLED', 'patternVariant': '(a+)+$' }
+    do = libLF.SLRegexDetectorOpinion().initFromRaw('(a+)+$', cancelled)
+    self.assertFalse(do.timedOut)
+    self.assertFalse(do.isVuln)
+    # Round-trips
+    do2 = libLF.SLRegexDetectorOpinion().initFromNDJSON(do.toNDJSON())
+    self.assertEqual(do2.patternVariant, '(a+)+$')
+
+class EvilInputTest(unittest.TestCase):
+  def _ei(self, prefix, pump, suffix):
+    return libLF.EvilInput().initFromRaw(True, [libLF.PumpPair().initFromRaw(prefix, pump)], suffix)
+
+  def test_eqHash(self):
+    self.assertEqual(self._ei('x', 'a', '!'), self._ei('x', 'a', '!'))
+    self.assertNotEqual(self._ei('x', 'a', '!'), self._ei('x', 'b', '!'))
+    self.assertNotEqual(self._ei('x', 'a', '!'), self._ei('x', 'a', '?'))
+    self.assertEqual(len(set([self._ei('x', 'a', '!'), self._ei('x', 'a', '!'), self._ei('', 'a', '!')])), 2)
+    self.assertEqual(libLF.EvilInput().initFromRaw(False), libLF.EvilInput().initFromRaw(False))
+    # Survives a round trip
+    ei = self._ei('x', 'a', '!')
+    self.assertEqual(ei, libLF.EvilInput().initFromNDJSON(ei.toNDJSON()))
+
+class CountingSLRegexAnalysis(libLF.SLRegexAnalysis):
+  """Fakes validation: the evil input with pump 'a' times out at every nPumps"""
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.nValidations = 0
+    # lang -> whether each validation could have forked
+    self.lang2canFork = {}
+
+  def _testEvilInputInLang(self, evilInput, lang):
+    self.nValidations += 1
+    self.lang2canFork.setdefault(lang, []).append(libLF.ForkedDaemon.canFork())
+    timedOut = 1 if evilInput.pumpPairs[0].pump == 'a' else 0
+    return [libLF.SLRegexValidation(self.regex.pattern, evilInput,
+              { 'language': lang, 'validPattern': 1, 'nPumps': nPumps, 'timeLimit': 1, 'timedOut': timedOut })
+            for nPumps in [self.EXP_PUMPS, self.powerPumps]]
+
+class SLRegexAnalysisDedupTest(unittest.TestCase):
+  def _rawDO(self, name, patternVariant, pumps):
+    return { 'name': name, 'hasOpinion': 1, 'patternVariant': patternVariant,
+             'opinion': { 'canAnalyze': 1, 'isSafe': 0,
+                          'evilInput': [ { 'pumpPairs': [ { 'prefix': '', 'pump': p } ], 'suffix': '!' } for p in pumps ] } }
+
+  def test_validateOncePerEvilInput(self):
+    pattern = '(a+)+$'
+    slra = CountingSLRegexAnalysis(libLF.Regex().initFromRaw(pattern, {}, {}))
+    slra.detectorOpinions = [
+      libLF.SLRegexDetectorOpinion().initFromRaw(pattern, self._rawDO('d1', pattern, ['a', 'b'])),
+      libLF.SLRegexDetectorOpinion().initFromRaw(pattern, self._rawDO('d2', pattern, ['a'])),
+      libLF.SLRegexDetectorOpinion().initFromRaw(pattern, self._rawDO('d1', '^(.*?)' + pattern, ['b', 'a'])),
+    ]
+    self.assertEqual(len(slra.distinctEvilInputs()), 2)
+
+    slra.validateDetectorOpinionsInLang('python')
+    self.assertEqual(slra.nValidations, 2)
+    self.assertEqual(slra.predictedPerformanceInLang('python'), libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['EXP'])
+    # Every DO gets the results for each of its evil inputs
+    self.assertEqual([len(do.lang_validations['python']) for do in slra.detectorOpinions], [4, 2, 4])
+    self.assertTrue(all(v.timedOut for v in slra.detectorOpinions[1].lang_validations['python']))
+
+  def test_inProcessLangOnThisThread(self):
+    pattern = '(a+)+$'
+    testerPool = libLF.RegexTesterPool(inProcessLangs=['python'])
+    slra = CountingSLRegexAnalysis(libLF.Regex().initFromRaw(pattern, {}, {}), testerPool=testerPool)
+    slra.detectorOpinions = [libLF.SLRegexDetectorOpinion().initFromRaw(pattern, self._rawDO('d1', pattern, ['a']))]
+    slra.validateDetectorOpinionsInLangs(['javascript', 'python', 'ruby'])
+    # Python may fork its matches. The others ran on threads.
+    self.assertEqual(slra.lang2canFork, { 'python': [True], 'javascript': [False], 'ruby': [False] })
+    self.assertEqual(list(slra.lang_pump2timedOut.keys()), ['javascript', 'python', 'ruby'])
+
+class ClassifyGrowthTest(unittest.TestCase):
+  def _curve(self, f, nPumpsList):
+    return [[n, f(n)] for n in nPumpsList]
+
+  def test_lin(self):
+    curve = self._curve(lambda n: 1e-6 * n, [2**k for k in range(10, 18)])
+    self.assertEqual(libLF.classifyGrowth(curve)[0], libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['LIN'])
+
+  def test_pow(self):
+    perf, degree = libLF.classifyGrowth(self._curve(lambda n: 1e-8 * n**2, [2**k for k in range(10, 14)]))
+    self.assertEqual(perf, libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['POW'])
+    self.assertAlmostEqual(degree, 2, places=3)
+
+  def test_exp(self):
+    curve = self._curve(lambda n: 1e-7 * 2**n, [20, 22, 24, 26])
+    self.assertEqual(libLF.classifyGrowth(curve, expPumps=1)[0], libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['EXP'])
+
+  def test_timeout(self):
+    self.assertEqual(libLF.classifyGrowth([[16, 0.001], [32, None]], expPumps=100)[0],
+      libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['EXP'])
+    self.assertEqual(libLF.classifyGrowth([[1024, 0.5], [2048, None]], expPumps=100)[0],
+      libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['POW'])
+
+  def test_notYetConfident(self):
+    # Too fast to measure
+    curve = self._curve(lambda n: 1e-9 * n, [1, 2, 4])
+    self.assertEqual(libLF.classifyGrowth(curve)[0], None)
+    self.assertEqual(libLF.classifyGrowth(curve, final=True)[0], libLF.SLRegexAnalysis.PREDICTED_PERFORMANCE['LIN'])
+
+#####
+# Structural inputs
+#####
+
+class StructuralInputsTest(unittest.TestCase):
+  def test_quantifierBoundaries(self):
+    inputs = libLF.structuralInputs('a{2,3}', seed=1)
+    for n in range(1, 5):
+      self.assertIn('a' * n, inputs)
+
+  def test_matchesAndNearMisses(self):
+    pattern = '^(foo|ba?r)[0-9]$'
+    inputs = libLF.structuralInputs(pattern, seed=1)
+    for s in ['foo0', 'bar0', 'br0', 'foo9']:
+      self.assertIn(s, inputs)
+    # The class edges, just outside
+    self.assertIn('foo/', inputs)
+    self.assertIn('foo:', inputs)
+    # Anchors, with a newline
+    self.assertIn('foo0\n', inputs)
+    self.assertIn('\nfoo0', inputs)
+    matches = [s for s in inputs if re.search(pattern, s)]
+    self.assertTrue(0 < len(matches) < len(inputs))
+
+  def test_seeded(self):
+    pattern = '[a-z]+@[a-z]+\\.com'
+    self.assertEqual(libLF.structuralInputs(pattern, seed=7), libLF.structuralInputs(pattern, seed=7))
+    sampled = libLF.structuralInputs(pattern, seed=7, maxInputs=5)
+    self.assertEqual(len(sampled), 5)
+    self.assertEqual(sampled, libLF.structuralInputs(pattern, seed=7, maxInputs=5))
+
+  def test_isStructurallyCovered(self):
+    self.assertTrue(libLF.isStructurallyCovered('^a[b-d]+\\s*(x|y)?$'))
+    self.assertFalse(libLF.isStructurallyCovered('(a)\\1'))
+    self.assertFalse(libLF.isStructurallyCovered('a(?=b)'))
+    self.assertFalse(libLF.isStructurallyCovered('('))
+
+  def test_isStructurallyCovered_longRepetition(self):
+    n = libLF.lf_structuralInputs.MAX_REPETITIONS
+    self.assertTrue(libLF.isStructurallyCovered('a{{{}}}'.format(n)))
+    self.assertTrue(any(re.fullmatch('a{{{}}}'.format(n), s) for s in libLF.structuralInputs('a{{{}}}'.format(n))))
+    # The inputs are truncated, and none would match
+    self.assertFalse(libLF.isStructurallyCovered('a{{{}}}'.format(n + 1)))
+    self.assertFalse(libLF.isStructurallyCovered('x(ab){1000,}'))
+
+  def test_unparseable(self):
+    with self.assertRaises(ValueError):
+      libLF.structuralInputs('(')
+
+class InputReductionTest(unittest.TestCase):
+  def test_collapsesRedundantInputs(self):
+    pattern = '^[a-z]+$'
+    inputs = ['abc', 'abd', 'xyz', 'qrs', 'ABC', 'ab1', '', 'ab\n']
+    kept = libLF.reduceInputs(pattern, inputs, perClass=1, seed=1)
+    self.assertLess(len(kept), len(inputs))
+    # One lowercase word survives; every other behavior is kept
+    self.assertEqual(len([s for s in kept if s in ['abc', 'abd', 'xyz', 'qrs']]), 1)
+    for s in ['ABC', 'ab1', '', 'ab\n']:
+      self.assertIn(s, kept)
+
+  def test_capturesDistinguish(self):
+    sigs = libLF.inputSignatures('(a)?b', ['ab', 'b'])
+    self.assertNotEqual(sigs['ab'], sigs['b'])
+
+  def test_seeded(self):
+    inputs = ['a' * n for n in range(4, 8)]
+    self.assertEqual(libLF.reduceInputs('a+', inputs, perClass=3, seed=3), libLF.reduceInputs('a+', inputs, perClass=3, seed=3))
+    self.assertEqual(len(libLF.reduceInputs('a+', inputs, perClass=3, seed=3)), 3)
+
+  def test_slowMatch(self):
+    # Python cannot finish this in time, so the signatures ignore match features
+    inputs = ['a' * 30 + '!', 'a' * 31 + '!']
+    sigs = libLF.inputSignatures('^(a|a)+$', inputs, matchBudget=0.1)
+    self.assertIsNone(sigs[inputs[0]][0])
+
+#####
+# Source files
+#####
+
+class SourceFilesTest(unittest.TestCase):
+  FILES = {
+    'proj/lib/a.js': b'var r = /a/;',
+    'proj/lib/b.ts': b'let r = /b/;',
+    'proj/lib/c.min.js': b'var r=/c/;',
+    'proj/node_modules/dep/index.js': b'var r = /dep/;',
+    'proj/bin/tool': b'#!/usr/bin/env node\nvar r = /tool/;',
+    'proj/bin/other': b'#!/usr/bin/perl\n$x =~ /other/;',
+    'proj/README': b'Not code',
+    'proj/lib/d.py': b'import re',
+  }
+
+  def test_isVendoredPath(self):
+    self.assertTrue(libLF.isVendoredPath('proj/node_modules/dep/index.js'))
+    self.assertTrue(libLF.isVendoredPath('proj/lib/c.min.js'))
+    self.assertFalse(libLF.isVendoredPath('proj/lib/a.js'))
+    self.assertFalse(libLF.isVendoredPath('vendor.js'))
+
+  def test_sourceFileLang(self):
+    self.assertEqual(libLF.sourceFileLang('x/a.js', 'npm'), 'javascript')
+    self.assertEqual(libLF.sourceFileLang('x/a.ts', 'npm'), 'typescript')
+    self.assertIsNone(libLF.sourceFileLang('x/a.py', 'npm'))
+    self.assertEqual(libLF.sourceFileLang('tool', 'npm', b'#!/usr/bin/env node\n'), 'javascript')
+    self.assertEqual(libLF.sourceFileLang('tool', 'pypi', b'#!/usr/bin/python3 -u\n'), 'python')
+    self.assertIsNone(libLF.sourceFileLang('tool', 'npm', b'#!/usr/bin/perl\n'))
+    # Compiled languages go by extension only
+    self.assertIsNone(libLF.sourceFileLang('tool', 'maven', b'#!/usr/bin/env node\n'))
+
+  def test_getUnvendoredSourceFiles(self):
+    with tempfile.TemporaryDirectory() as tmpDir:
+      for name, contents in self.FILES.items():
+        path = os.path.join(tmpDir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as outStream:
+          outStream.write(contents)
+      lang2sourceFiles = libLF.getUnvendoredSourceFiles(tmpDir, 'npm')
+      lang2relPaths = { lang: [os.path.relpath(sf['name'], tmpDir) for sf in sourceFiles] for lang, sourceFiles in lang2sourceFiles.items() }
+    self.assertEqual(lang2relPaths, {
+      'javascript': ['proj/bin/tool', 'proj/lib/a.js'],
+      'typescript': ['proj/lib/b.ts'],
+    })
+
+  def test_iterUnvendoredTarballSourceFiles(self):
+    with tempfile.TemporaryDirectory() as tmpDir:
+      tarball = os.path.join(tmpDir, 'proj.tgz')
+      with tarfile.open(tarball, 'w:gz') as tar:
+        for name, contents in list(self.FILES.items()) + [('../escape.js', b'var r = /escape/;')]:
+          info = tarfile.TarInfo(name)
+          info.size = len(contents)
+          tar.addfile(info, io.BytesIO(contents))
+      streamed = list(libLF.iterUnvendoredTarballSourceFiles(tarball, 'npm'))
+    self.assertEqual(sorted(streamed), [
+      ('javascript', 'proj/bin/tool', self.FILES['proj/bin/tool']),
+      ('javascript', 'proj/lib/a.js', self.FILES['proj/lib/a.js']),
+      ('typescript', 'proj/lib/b.ts', self.FILES['proj/lib/b.ts']),
+    ])
+
 ###########################################################
 
 if __name__ == '__main__':